@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from ..models import Alerte
+from ..models import Alerte, traiter_alertes
 
 
 @admin.register(Alerte)
@@ -101,8 +101,8 @@ class AlerteAdmin(admin.ModelAdmin):
     def marquer_comme_traitees(self, request, queryset):
         """Action pour marquer les alertes comme traitées"""
         from django.utils import timezone
-        count = queryset.filter(statut__in=['NON_LU', 'LU']).update(
-            statut='TRAITEE',
+        count = traiter_alertes(
+            queryset.filter(statut__in=['NON_LU', 'LU']),
             lue_par=request.user,
             date_lecture=timezone.now()
         )
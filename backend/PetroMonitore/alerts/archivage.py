@@ -0,0 +1,266 @@
+# PteroMonitore/alerts/archivage.py
+"""
+Rétention des alertes traitées : archivage puis suppression par tranches.
+
+Les alertes à supprimer sont parcourues par plages d'identifiants bornées,
+chacune dans une transaction courte. Chaque tranche est d'abord écrite dans
+des archives compressées partitionnées par date (une ligne JSON par alerte,
+avec les occurrences de ses incidents), synchronisées sur disque avant la
+suppression. Une tranche écrite puis annulée est simplement archivée deux
+fois : la restauration ignore les alertes déjà présentes.
+
+Arborescence : <répertoire>/AAAA/MM/alertes-AAAA-MM-JJ.jsonl.gz (date locale
+de l'alerte). Chaque tranche ajoute un membre gzip au fichier du jour.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import Alerte, OccurrenceIncident, Operation, Phase, Projet, Utilisateur
+
+logger = logging.getLogger(__name__)
+
+CHAMPS_ALERTE = [champ.attname for champ in Alerte._meta.concrete_fields]
+CHAMPS_OCCURRENCE = [champ.attname for champ in OccurrenceIncident._meta.concrete_fields
+                     if champ.attname != 'incident_id']
+
+
+def repertoire_archives():
+    """
+    Répertoire des archives d'alertes (PETROMONITORE_ARCHIVES_ALERTES)
+    """
+    return Path(getattr(settings, 'PETROMONITORE_ARCHIVES_ALERTES', settings.BASE_DIR / 'archives' / 'alertes'))
+
+
+def _taille_tranche():
+    return getattr(settings, 'PETROMONITORE_TAILLE_TRANCHE_RETENTION', 1000)
+
+
+def _iso(valeur):
+    # Dates sérialisées à la microseconde près
+    return valeur.isoformat()
+
+
+def chemin_archive(repertoire, jour):
+    """
+    Fichier d'archive des alertes d'un jour
+    """
+    return Path(repertoire) / f"{jour:%Y}" / f"{jour:%m}" / f"alertes-{jour:%Y-%m-%d}.jsonl.gz"
+
+
+def _ecrire_archives(repertoire, lignes):
+    """
+    Ajoute des alertes sérialisées aux archives de leur jour, et synchronise
+    chaque fichier sur disque
+    
+    Returns:
+        Les fichiers écrits
+    """
+    par_jour = {}
+    for ligne in lignes:
+        jour = timezone.localtime(ligne['date_alerte']).date()
+        par_jour.setdefault(jour, []).append(ligne)
+    
+    fichiers = []
+    for jour, alertes in sorted(par_jour.items()):
+        chemin = chemin_archive(repertoire, jour)
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        contenu = ''.join(json.dumps(alerte, default=_iso, ensure_ascii=False) + '\n'
+                          for alerte in alertes)
+        with open(chemin, 'ab') as brut:
+            with gzip.GzipFile(fileobj=brut, mode='ab') as archive:
+                archive.write(contenu.encode('utf-8'))
+            brut.flush()
+            os.fsync(brut.fileno())
+        fichiers.append(chemin)
+    return fichiers
+
+
+def archiver_alertes(jours=30, taille_tranche=None, repertoire=None):
+    """
+    Archive puis supprime les alertes traitées de plus de `jours` jours, par
+    tranches d'au plus taille_tranche alertes, une transaction par tranche
+    
+    Args:
+        jours: Ancienneté minimale des alertes supprimées
+        taille_tranche: Nombre maximal d'alertes par tranche
+                        (PETROMONITORE_TAILLE_TRANCHE_RETENTION par défaut)
+        repertoire: Répertoire des archives (repertoire_archives() par défaut)
+    
+    Returns:
+        Bilan : nombres d'alertes et d'occurrences archivées, de tranches,
+        fichiers écrits, durée totale, débit (alertes par seconde) et durée
+        maximale de verrouillage d'une tranche (secondes)
+    """
+    taille_tranche = taille_tranche or _taille_tranche()
+    repertoire = Path(repertoire or repertoire_archives())
+    retenues = Alerte.objects.filter(statut='TRAITEE', date_alerte__lt=timezone.now() - timedelta(days=jours))
+    
+    bilan = {'alertes': 0, 'occurrences': 0, 'tranches': 0, 'fichiers': set(), 'duree': 0.0,
+             'debit': 0.0, 'verrou_max': 0.0}
+    debut = time.monotonic()
+    curseur = 0
+    while True:
+        # Bornes de la tranche, lues hors transaction
+        identifiants = list(retenues.filter(pk__gt=curseur).order_by('pk')
+                            .values_list('pk', flat=True)[:taille_tranche])
+        if not identifiants:
+            break
+        tranche = retenues.filter(pk__gt=curseur, pk__lte=identifiants[-1])
+        curseur = identifiants[-1]
+        
+        debut_tranche = time.monotonic()
+        with transaction.atomic():
+            alertes = list(tranche.select_for_update().order_by('pk').values(*CHAMPS_ALERTE))
+            occurrences = {}
+            incidents = [alerte['id'] for alerte in alertes if alerte['incident']]
+            if incidents:
+                for occurrence in OccurrenceIncident.objects.filter(incident_id__in=incidents).order_by('pk').values(
+                    'incident_id', *CHAMPS_OCCURRENCE
+                ):
+                    occurrences.setdefault(occurrence.pop('incident_id'), []).append(occurrence)
+            for alerte in alertes:
+                alerte['occurrences'] = occurrences.get(alerte['id'], [])
+            
+            bilan['fichiers'].update(_ecrire_archives(repertoire, alertes))
+            # Exactement les alertes archivées (une alerte traitée depuis la lecture n'est pas
+            # archivée) ; occurrences et notifications supprimées en cascade
+            Alerte.objects.filter(pk__in=[alerte['id'] for alerte in alertes]).delete()
+        verrou = time.monotonic() - debut_tranche
+        
+        nombre_occurrences = sum(len(liste) for liste in occurrences.values())
+        bilan['alertes'] += len(alertes)
+        bilan['occurrences'] += nombre_occurrences
+        bilan['tranches'] += 1
+        bilan['verrou_max'] = max(bilan['verrou_max'], verrou)
+        logger.info(
+            f"Tranche {bilan['tranches']} (alertes {identifiants[0]} à {curseur}): {len(alertes)} alertes "
+            f"et {nombre_occurrences} occurrences archivées, verrou {verrou * 1000:.1f} ms, "
+            f"{len(alertes) / verrou if verrou else 0:.0f} alertes/s"
+        )
+    
+    bilan['duree'] = time.monotonic() - debut
+    bilan['debit'] = bilan['alertes'] / bilan['duree'] if bilan['duree'] else 0.0
+    bilan['fichiers'] = sorted(str(chemin) for chemin in bilan['fichiers'])
+    return bilan
+
+
+def _fichiers_archives(chemins):
+    fichiers = []
+    for chemin in map(Path, chemins):
+        fichiers.extend(sorted(chemin.rglob('*.jsonl.gz')) if chemin.is_dir() else [chemin])
+    return fichiers
+
+
+def _lire_archives(fichiers):
+    for fichier in fichiers:
+        # Les membres gzip successifs d'un fichier sont lus à la suite
+        with gzip.open(fichier, 'rt', encoding='utf-8') as archive:
+            for ligne in archive:
+                if ligne.strip():
+                    yield json.loads(ligne)
+
+
+def _existants(modele, identifiants):
+    identifiants = {identifiant for identifiant in identifiants if identifiant}
+    if not identifiants:
+        return set()
+    return set(modele.objects.filter(pk__in=identifiants).values_list('pk', flat=True))
+
+
+def _retablir_dates(modele, champ, dates):
+    # Les dates auto_now_add sont réécrites par l'insertion : une requête par lot pour les rétablir
+    if dates:
+        modele.objects.filter(pk__in=list(dates)).update(**{champ: Case(
+            *[When(pk=pk, then=Value(date)) for pk, date in dates.items()], output_field=DateTimeField()
+        )})
+
+
+def _restaurer_lot(lignes, bilan):
+    occurrences_lues = [occurrence for ligne in lignes for occurrence in ligne.get('occurrences', [])]
+    existantes = _existants(Alerte, (ligne['id'] for ligne in lignes))
+    existantes_occurrences = _existants(OccurrenceIncident, (occurrence['id'] for occurrence in occurrences_lues))
+    projets = _existants(Projet, (ligne['projet_id'] for ligne in lignes))
+    phases = _existants(Phase, [ligne['phase_id'] for ligne in lignes]
+                        + [occurrence['phase_id'] for occurrence in occurrences_lues])
+    operations = _existants(Operation, [ligne['operation_id'] for ligne in lignes]
+                            + [occurrence['operation_id'] for occurrence in occurrences_lues])
+    utilisateurs = _existants(Utilisateur, (ligne['lue_par_id'] for ligne in lignes))
+    
+    def orpheline(valeurs):
+        # Entité supprimée depuis l'archivage : l'alerte l'aurait été avec elle
+        return any(valeurs[champ] and valeurs[champ] not in cibles
+                   for champ, cibles in (('projet_id', projets), ('phase_id', phases), ('operation_id', operations))
+                   if champ in valeurs)
+    
+    alertes, occurrences = [], []
+    for ligne in lignes:
+        if ligne['id'] in existantes:
+            bilan['existantes'] += 1
+            continue
+        if orpheline(ligne):
+            bilan['ignorees'] += 1
+            continue
+        champs = {champ: ligne[champ] for champ in CHAMPS_ALERTE}
+        if champs['lue_par_id'] not in utilisateurs:
+            champs['lue_par_id'] = None
+        # Alerte close : son empreinte de dédoublonnage est libérée
+        champs['empreinte'] = None
+        alertes.append(Alerte(**champs))
+        occurrences.extend(
+            OccurrenceIncident(incident_id=ligne['id'], **{**occurrence, 'empreinte': None})
+            for occurrence in ligne.get('occurrences', [])
+            if occurrence['id'] not in existantes_occurrences and not orpheline(occurrence)
+        )
+    
+    if alertes:
+        dates = {alerte.pk: parse_datetime(alerte.date_alerte) for alerte in alertes}
+        Alerte.objects.bulk_create(alertes)
+        _retablir_dates(Alerte, 'date_alerte', dates)
+    if occurrences:
+        dates = {occurrence.pk: parse_datetime(occurrence.date_occurrence) for occurrence in occurrences}
+        OccurrenceIncident.objects.bulk_create(occurrences)
+        _retablir_dates(OccurrenceIncident, 'date_occurrence', dates)
+    bilan['alertes'] += len(alertes)
+    bilan['occurrences'] += len(occurrences)
+
+
+def restaurer_archives(chemins, taille_lot=None):
+    """
+    Réimporte des archives d'alertes, par lots, une transaction par lot. Les
+    alertes déjà présentes sont ignorées (restauration idempotente), comme
+    celles dont le projet, la phase ou l'opération a été supprimé depuis
+    
+    Args:
+        chemins: Fichiers d'archive ou répertoires (parcourus récursivement)
+        taille_lot: Nombre d'alertes par lot (PETROMONITORE_TAILLE_TRANCHE_RETENTION par défaut)
+    
+    Returns:
+        Bilan : nombres de fichiers lus, d'alertes et d'occurrences restaurées,
+        d'alertes déjà présentes et d'alertes ignorées
+    """
+    taille_lot = taille_lot or _taille_tranche()
+    fichiers = _fichiers_archives(chemins)
+    bilan = {'fichiers': len(fichiers), 'alertes': 0, 'occurrences': 0, 'existantes': 0, 'ignorees': 0}
+    
+    lot = []
+    for ligne in _lire_archives(fichiers):
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            with transaction.atomic():
+                _restaurer_lot(lot, bilan)
+            lot = []
+    if lot:
+        with transaction.atomic():
+            _restaurer_lot(lot, bilan)
+    return bilan
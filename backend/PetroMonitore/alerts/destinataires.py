@@ -0,0 +1,137 @@
+# PteroMonitore/alerts/destinataires.py
+"""
+Résolution des destinataires des notifications d'alertes.
+
+Les tables de routage (responsable et membres notifiés de chaque projet,
+utilisateurs actifs d'un rôle global) sont mises en cache : un lot d'alertes
+est résolu en un nombre fixe de requêtes, quel que soit son nombre d'alertes.
+Elles sont invalidées par les sauvegardes et suppressions d'EquipeProjet et
+d'Utilisateur, et par le changement de responsable d'un Projet.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import EquipeProjet, Projet, Utilisateur
+
+# Rôles d'équipe notifiés des alertes de leur projet
+ROLES_EQUIPE_NOTIFIES = ('CHEF_PROJET', 'RESPONSABLE_TECHNIQUE')
+
+# Rôle global notifié des alertes critiques
+ROLE_ALERTES_CRITIQUES = 'EXPERT'
+
+def _cle_projet(projet_id):
+    return f"petromonitore:destinataires:projet:{projet_id}"
+
+
+def _cle_role(role):
+    return f"petromonitore:destinataires:role:{role}"
+
+
+def _duree_cache():
+    return getattr(settings, 'PETROMONITORE_CACHE_DESTINATAIRES', 3600)
+
+
+def routage_projets(projet_ids):
+    """
+    Tables de routage de plusieurs projets ; celles absentes du cache sont
+    chargées ensemble, en deux requêtes
+    
+    Returns:
+        Dictionnaire projet_id -> {'responsable': email, rôle d'équipe: [emails]}
+    """
+    cles = {_cle_projet(projet_id): projet_id for projet_id in set(projet_ids)}
+    routage = {cles[cle]: table for cle, table in cache.get_many(list(cles)).items()}
+    manquants = set(cles.values()) - routage.keys()
+    if not manquants:
+        return routage
+    
+    charges = {projet_id: {'responsable': None, **{role: [] for role in ROLES_EQUIPE_NOTIFIES}}
+               for projet_id in manquants}
+    for projet_id, email in Projet.objects.filter(pk__in=manquants).values_list('pk', 'responsable__email'):
+        charges[projet_id]['responsable'] = email
+    membres = EquipeProjet.objects.filter(
+        projet_id__in=manquants, role_projet__in=ROLES_EQUIPE_NOTIFIES
+    ).order_by('pk').values_list('projet_id', 'role_projet', 'utilisateur__email')
+    for projet_id, role, email in membres:
+        charges[projet_id][role].append(email)
+    
+    cache.set_many({_cle_projet(projet_id): table for projet_id, table in charges.items()}, _duree_cache())
+    routage.update(charges)
+    return routage
+
+
+def utilisateurs_role(role):
+    """
+    Emails des utilisateurs actifs d'un rôle (mis en cache)
+    """
+    cle = _cle_role(role)
+    emails = cache.get(cle)
+    if emails is None:
+        emails = list(Utilisateur.objects.filter(role=role, statut='ACTIF').order_by('pk')
+                      .values_list('email', flat=True))
+        cache.set(cle, emails, _duree_cache())
+    return emails
+
+
+def resoudre_destinataires(alertes):
+    """
+    Destinataires des notifications de plusieurs alertes : responsable du
+    projet, chefs de projet et responsables techniques de son équipe,
+    responsable de l'opération et, pour une alerte critique, experts actifs
+    
+    Args:
+        alertes: Alertes chargées avec operation__responsable
+    
+    Returns:
+        Dictionnaire identifiant d'alerte -> ensemble d'emails
+    """
+    routage = routage_projets(alerte.projet_id for alerte in alertes if alerte.projet_id)
+    experts = []
+    if any(alerte.niveau == 'CRITIQUE' for alerte in alertes):
+        experts = utilisateurs_role(ROLE_ALERTES_CRITIQUES)
+    
+    destinataires = {}
+    for alerte in alertes:
+        emails = set()
+        if alerte.projet_id:
+            table = routage[alerte.projet_id]
+            emails.add(table['responsable'])
+            for role in ROLES_EQUIPE_NOTIFIES:
+                emails.update(table[role])
+        if alerte.operation_id and alerte.operation.responsable:
+            emails.add(alerte.operation.responsable.email)
+        if alerte.niveau == 'CRITIQUE':
+            emails.update(experts)
+        # Nettoyer les emails vides
+        destinataires[alerte.pk] = {email for email in emails if email}
+    return destinataires
+
+
+def _invalider(cles):
+    cles = list(cles)
+    if not cles:
+        return
+    cache.delete_many(cles)
+    # Une lecture concurrente avant la validation a pu remettre en cache l'ancienne table
+    transaction.on_commit(lambda: cache.delete_many(cles))
+
+
+def invalider_projets(projet_ids):
+    """
+    Invalide les tables de routage de projets
+    """
+    _invalider(_cle_projet(projet_id) for projet_id in set(projet_ids) if projet_id)
+
+
+def invalider_utilisateur(utilisateur, roles=(), projets=True):
+    """
+    Invalide les tables de routage où figure un utilisateur : utilisateurs des
+    rôles donnés et, si projets, projets dont il est responsable ou membre
+    """
+    _invalider(_cle_role(role) for role in set(roles) if role)
+    if not projets:
+        return
+    projet_ids = set(Projet.objects.filter(responsable_id=utilisateur.pk).values_list('pk', flat=True))
+    projet_ids.update(EquipeProjet.objects.filter(utilisateur_id=utilisateur.pk).values_list('projet_id', flat=True))
+    invalider_projets(projet_ids)
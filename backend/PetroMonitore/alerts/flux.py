@@ -0,0 +1,221 @@
+# PteroMonitore/alerts/flux.py
+"""
+Diffusion en temps réel des nouvelles alertes (flux Server-Sent Events).
+
+Un seul diffuseur par boucle d'événements (donc par processus ASGI) interroge
+la base à intervalle régulier, en une requête quel que soit le nombre de
+clients, et répartit les nouvelles alertes dans la file de chaque abonné
+selon ses filtres. Aucun broker externe n'est nécessaire : les alertes créées
+par les workers Celery sont vues au passage suivant, celles créées dans le
+processus réveillent immédiatement le diffuseur (reveiller_flux).
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from ..models import Alerte
+from .serializers import AlerteSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def charger_alertes(apres_id, projet_ids=None, niveaux=None, limite=None, exclues=None):
+    """
+    Alertes d'identifiant supérieur à apres_id, sérialisées, par identifiant croissant
+    
+    Args:
+        apres_id: Curseur (identifiant de la dernière alerte reçue)
+        projet_ids: Projets optionnels des alertes
+        niveaux: Niveaux optionnels des alertes
+        limite: Nombre maximal d'alertes
+        exclues: Identifiants optionnels d'alertes déjà reçues
+    """
+    alertes = Alerte.objects.filter(pk__gt=apres_id).select_related(
+        'projet', 'phase', 'operation', 'lue_par'
+    ).order_by('pk')
+    if exclues:
+        alertes = alertes.exclude(pk__in=exclues)
+    if projet_ids:
+        alertes = alertes.filter(projet_id__in=projet_ids)
+    if niveaux:
+        alertes = alertes.filter(niveau__in=niveaux)
+    if limite:
+        alertes = alertes[:limite]
+    return AlerteSerializer(alertes, many=True).data
+
+
+def etat_initial(recouvrement):
+    """
+    Curseur de départ du diffuseur (dernière alerte existante) et identifiants
+    des alertes existantes dans la plage de recouvrement, considérées comme publiées
+    """
+    curseur = Alerte.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    return curseur, set(Alerte.objects.filter(pk__gt=curseur - recouvrement).values_list('pk', flat=True))
+
+
+class Abonnement:
+    """
+    Client abonné au flux : file des alertes qui passent ses filtres
+    """
+    
+    def __init__(self, projet_ids=None, niveaux=None):
+        self.projet_ids = set(projet_ids or ())
+        self.niveaux = set(niveaux or ())
+        self.file = asyncio.Queue(maxsize=_parametre('PETROMONITORE_FLUX_TAILLE_FILE', 1000))
+        # Client trop lent, déconnecté : il reprendra depuis son dernier identifiant
+        self.debordement = False
+    
+    def accepte(self, alerte):
+        if self.projet_ids and (alerte['projet'] or {}).get('id') not in self.projet_ids:
+            return False
+        return not self.niveaux or alerte['niveau'] in self.niveaux
+    
+    def publier(self, alerte):
+        if self.debordement or not self.accepte(alerte):
+            return
+        try:
+            self.file.put_nowait(alerte)
+        except asyncio.QueueFull:
+            self.debordement = True
+            self.file = asyncio.Queue()
+            self.file.put_nowait(None)
+
+
+class DiffuseurAlertes:
+    """
+    Diffuseur des nouvelles alertes aux abonnés d'une boucle d'événements ; sa
+    tâche d'interrogation ne tourne que tant qu'il a des abonnés
+    """
+    
+    def __init__(self, boucle):
+        self.boucle = boucle
+        self.abonnes = set()
+        self.curseur = None
+        # Identifiants récents déjà publiés : une alerte validée après une alerte
+        # d'identifiant supérieur est rattrapée par le recouvrement des requêtes
+        self.publies = set()
+        self.reveil = asyncio.Event()
+        self.tache = None
+    
+    def abonner(self, abonnement):
+        if self.tache is None or self.tache.done():
+            # Diffusion (re)lancée : elle part des alertes existantes
+            self.curseur = None
+            self.tache = self.boucle.create_task(self._diffuser())
+        self.abonnes.add(abonnement)
+    
+    def desabonner(self, abonnement):
+        self.abonnes.discard(abonnement)
+    
+    def reveiller(self):
+        self.boucle.call_soon_threadsafe(self.reveil.set)
+    
+    async def interroger(self):
+        """
+        Une requête pour tous les abonnés : publie les alertes créées depuis le dernier passage
+        """
+        recouvrement = _parametre('PETROMONITORE_FLUX_RECOUVREMENT', 100)
+        alertes = await sync_to_async(charger_alertes)(self.curseur - recouvrement, exclues=list(self.publies))
+        for alerte in alertes:
+            self.publies.add(alerte['id'])
+            for abonnement in list(self.abonnes):
+                abonnement.publier(alerte)
+        if alertes:
+            self.curseur = max(self.curseur, alertes[-1]['id'])
+        self.publies = {identifiant for identifiant in self.publies if identifiant > self.curseur - recouvrement}
+    
+    async def _diffuser(self):
+        intervalle = _parametre('PETROMONITORE_FLUX_INTERVALLE', 2)
+        self.curseur, self.publies = await sync_to_async(etat_initial)(
+            _parametre('PETROMONITORE_FLUX_RECOUVREMENT', 100)
+        )
+        while self.abonnes:
+            try:
+                await asyncio.wait_for(self.reveil.wait(), timeout=intervalle)
+            except asyncio.TimeoutError:
+                pass
+            self.reveil.clear()
+            try:
+                await self.interroger()
+            except Exception as e:
+                logger.error(f"Erreur lors de la diffusion des alertes: {str(e)}")
+        self.tache = None
+
+
+_diffuseurs = weakref.WeakKeyDictionary()
+
+
+def diffuseur():
+    """
+    Diffuseur de la boucle d'événements courante
+    """
+    boucle = asyncio.get_running_loop()
+    if boucle not in _diffuseurs:
+        _diffuseurs[boucle] = DiffuseurAlertes(boucle)
+    return _diffuseurs[boucle]
+
+
+def reveiller_flux():
+    """
+    Réveille les diffuseurs du processus après la création d'alertes
+    (appelable depuis n'importe quel thread)
+    """
+    for instance in list(_diffuseurs.values()):
+        if instance.abonnes and not instance.boucle.is_closed():
+            instance.reveiller()
+
+
+def evenement(alerte):
+    """
+    Événement SSE d'une alerte, identifié par l'identifiant de l'alerte (Last-Event-ID)
+    """
+    donnees = json.dumps(alerte, default=str, ensure_ascii=False)
+    return f"id: {alerte['id']}\nevent: alerte\ndata: {donnees}\n\n"
+
+
+async def flux_evenements(apres_id=None, projet_ids=None, niveaux=None):
+    """
+    Générateur du flux SSE d'un client : rattrapage des alertes postérieures
+    à apres_id (Last-Event-ID), puis alertes nouvelles au fil de l'eau, et un
+    commentaire périodique pour maintenir la connexion ouverte
+    """
+    instance = diffuseur()
+    abonnement = Abonnement(projet_ids, niveaux)
+    # Abonnement avant le rattrapage : aucune alerte n'est perdue entre les deux
+    instance.abonner(abonnement)
+    try:
+        yield f"retry: {_parametre('PETROMONITORE_FLUX_RECONNEXION', 3000)}\n\n"
+        
+        rattrapees = set()
+        if apres_id is not None:
+            limite = _parametre('PETROMONITORE_FLUX_RATTRAPAGE', 500)
+            rattrapage = await sync_to_async(charger_alertes)(apres_id, projet_ids, niveaux, limite)
+            for alerte in rattrapage:
+                rattrapees.add(alerte['id'])
+                yield evenement(alerte)
+            if len(rattrapage) == limite:
+                # Rattrapage incomplet : le client se reconnecte depuis la dernière alerte reçue
+                return
+        
+        while True:
+            try:
+                alerte = await asyncio.wait_for(abonnement.file.get(),
+                                                timeout=_parametre('PETROMONITORE_FLUX_MAINTIEN', 15))
+            except asyncio.TimeoutError:
+                yield ": maintien\n\n"
+                continue
+            if alerte is None:
+                # File saturée : le client se reconnecte avec son Last-Event-ID
+                return
+            if alerte['id'] not in rattrapees:
+                yield evenement(alerte)
+    finally:
+        instance.desabonner(abonnement)
@@ -0,0 +1,131 @@
+# PteroMonitore/alerts/limitation.py
+"""
+Limitation de débit des alertes et des notifications.
+
+Les compteurs sont en base (CompteurFenetre) et non dans le cache : ils sont
+partagés par tous les workers, et annulés avec la transaction qui les incrémente.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from ..models import CompteurFenetre
+
+
+def duree_fenetre():
+    """
+    Durée (en secondes) des fenêtres de limitation (PETROMONITORE_FENETRE_LIMITATION)
+    """
+    return getattr(settings, 'PETROMONITORE_FENETRE_LIMITATION', 3600)
+
+
+class FenetreGlissante:
+    """
+    Compteur d'événements à fenêtre glissante approchée : deux compteurs de
+    fenêtre fixe par clé (courante et précédente) ; le nombre d'événements sur
+    la dernière durée est estimé en pondérant la fenêtre précédente par la part
+    qui en est encore couverte. Mémoire constante par clé, et une requête pour
+    lire les compteurs d'un lot de clés
+    
+    Args:
+        nom: Préfixe des clés du compteur
+        duree: Durée de la fenêtre en secondes (duree_fenetre() par défaut)
+    """
+    
+    def __init__(self, nom, duree=None):
+        self.nom = nom
+        self.duree = duree or duree_fenetre()
+    
+    def _position(self, instant):
+        secondes = (instant or timezone.now()).timestamp()
+        return int(secondes // self.duree), (secondes % self.duree) / self.duree
+    
+    def _cle(self, cle):
+        return f"{self.nom}:{cle}"
+    
+    def compter(self, cles, instant=None):
+        """
+        Nombre estimé d'événements de chaque clé sur la dernière fenêtre
+        
+        Returns:
+            Dictionnaire clé -> nombre estimé (flottant)
+        """
+        fenetre, part = self._position(instant)
+        cles = {self._cle(cle): cle for cle in cles}
+        comptes = dict.fromkeys(cles.values(), 0.0)
+        if not cles:
+            return comptes
+        
+        compteurs = CompteurFenetre.objects.filter(
+            cle__in=list(cles), fenetre__in=[fenetre, fenetre - 1]
+        ).values_list('cle', 'fenetre', 'nombre')
+        for cle, fenetre_compteur, nombre in compteurs:
+            poids = 1.0 if fenetre_compteur == fenetre else 1.0 - part
+            comptes[cles[cle]] += nombre * poids
+        return comptes
+    
+    def ajouter(self, increments, instant=None):
+        """
+        Ajoute des événements aux compteurs de la fenêtre courante, en un nombre
+        fixe de requêtes quel que soit le nombre de clés
+        
+        Args:
+            increments: Dictionnaire clé -> nombre d'événements
+        """
+        fenetre, _ = self._position(instant)
+        increments = {self._cle(cle): nombre for cle, nombre in increments.items() if nombre}
+        if not increments:
+            return
+        # Le compteur sert encore de fenêtre précédente pendant la fenêtre suivante
+        expiration = datetime.fromtimestamp((fenetre + 2) * self.duree, tz=dt_timezone.utc)
+        
+        # Cas courant : tous les compteurs existent déjà, une seule requête
+        if self._incrementer(increments, fenetre) == len(increments):
+            return
+        existants = set(CompteurFenetre.objects.filter(cle__in=list(increments), fenetre=fenetre)
+                        .values_list('cle', flat=True))
+        manquants = [cle for cle in increments if cle not in existants]
+        try:
+            with transaction.atomic():
+                CompteurFenetre.objects.bulk_create([
+                    CompteurFenetre(cle=cle, fenetre=fenetre, nombre=increments[cle], expiration=expiration)
+                    for cle in manquants
+                ])
+        except IntegrityError:
+            # Compteur créé entre-temps par un worker concurrent
+            for cle in manquants:
+                _, cree = CompteurFenetre.objects.get_or_create(
+                    cle=cle, fenetre=fenetre, defaults={'nombre': increments[cle], 'expiration': expiration}
+                )
+                if not cree:
+                    self._incrementer({cle: increments[cle]}, fenetre)
+    
+    def _incrementer(self, increments, fenetre):
+        # Une seule requête, atomique pour chaque compteur ; renvoie le nombre de compteurs incrémentés
+        return CompteurFenetre.objects.filter(cle__in=list(increments), fenetre=fenetre).update(
+            nombre=F('nombre') + Case(
+                *[When(cle=cle, then=Value(nombre)) for cle, nombre in increments.items()],
+                default=Value(0), output_field=PositiveIntegerField()
+            )
+        )
+    
+    def fin_fenetre(self, instant=None):
+        """
+        Début de la prochaine fenêtre fixe
+        """
+        fenetre, _ = self._position(instant)
+        return datetime.fromtimestamp((fenetre + 1) * self.duree, tz=dt_timezone.utc)
+
+
+def purger_compteurs():
+    """
+    Supprime les compteurs des fenêtres expirées
+    
+    Returns:
+        Le nombre de compteurs supprimés
+    """
+    supprimes, _ = CompteurFenetre.objects.filter(expiration__lt=timezone.now()).delete()
+    return supprimes
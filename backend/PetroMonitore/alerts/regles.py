@@ -0,0 +1,295 @@
+# PteroMonitore/alerts/regles.py
+"""
+Registre déclaratif des règles d'alerte.
+
+Chaque règle déclare en expressions ORM les valeurs qu'elle calcule, son prédicat
+de violation, son type et son niveau d'alerte (éventuellement conditionnels) et
+le modèle de son message. Elle est compilée en un seul queryset annoté qui ne
+renvoie que les lignes en violation : les règles sont évaluées par la base, sans
+charger les projets ni les opérations en mémoire.
+"""
+from string import Formatter
+
+from django.db.models import (
+    Avg, Case, CharField, DateField, DecimalField, ExpressionWrapper, F, FloatField, Func, IntegerField,
+    OuterRef, Q, Subquery, Value, When
+)
+from django.db.models.functions import Cast
+
+from ..models import Alerte, Operation, Phase, Projet, Seuil
+
+# Statuts des projets et opérations surveillés
+STATUTS_ACTIFS = ['EN_COURS', 'PLANIFIE']
+
+# Objets surveillés par les règles de chaque modèle, et cibles de leurs alertes
+SURVEILLANCE = {
+    Projet: Q(statut__in=STATUTS_ACTIFS),
+    Operation: Q(statut__in=STATUTS_ACTIFS, phase__projet__statut__in=STATUTS_ACTIFS),
+}
+CIBLES = {
+    Projet: {'projet_id': 'id'},
+    Operation: {'projet_id': 'phase__projet_id', 'phase_id': 'phase_id', 'operation_id': 'id'},
+}
+
+
+class JoursEntre(Func):
+    """
+    Nombre entier de jours entre deux dates (fin - début), calculé par la base
+    """
+    arity = 2
+    output_field = IntegerField()
+    
+    def __init__(self, fin, debut, **extra):
+        super().__init__(_date(fin), _date(debut), **extra)
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL : la différence de deux dates est un nombre de jours
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ',
+                              **extra_context)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection,
+                              template='CAST(ROUND(julianday(%(expressions)s)) AS INTEGER)',
+                              arg_joiner=') - julianday(', **extra_context)
+    
+    def as_oracle(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='FLOOR(%(expressions)s)', arg_joiner=' - ',
+                              **extra_context)
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+def _date(valeur):
+    if isinstance(valeur, str):
+        return F(valeur)
+    if hasattr(valeur, 'resolve_expression'):
+        return valeur
+    return Cast(Value(valeur, output_field=DateField()), DateField())
+
+
+def _expression(valeur):
+    if hasattr(valeur, 'resolve_expression'):
+        return valeur
+    return Value(valeur, output_field=CharField())
+
+
+class RegleAlerte:
+    """
+    Règle d'alerte déclarative
+    
+    Args:
+        nom: Identifiant de la règle (l'un des REGLES_ALERTES_PROJET ou REGLES_ALERTES_OPERATION)
+        modele: Projet ou Operation
+        predicat: Fonction (aujourd_hui) -> Q des lignes en violation, sur les champs et annotations
+        type_alerte: Type d'alerte, ou fonction (aujourd_hui) -> expression ORM s'il dépend de la ligne
+        niveau: Niveau d'alerte, ou fonction (aujourd_hui) -> expression ORM
+        message: Modèle du message, formaté avec les valeurs de la ligne,
+                 ou dictionnaire type_alerte -> modèle
+        annotations: Fonction (aujourd_hui) -> expressions ORM calculées par ligne,
+                     annotées dans l'ordre (une annotation peut utiliser les précédentes)
+    """
+    
+    def __init__(self, nom, modele, predicat, type_alerte, niveau, message, annotations=None):
+        self.nom = nom
+        self.modele = modele
+        self.predicat = predicat
+        self.type_alerte = type_alerte
+        self.niveau = niveau
+        self.message = message
+        self.annotations = annotations
+    
+    @property
+    def cible(self):
+        return 'projet' if self.modele is Projet else 'operation'
+    
+    @property
+    def champs_message(self):
+        modeles = self.message.values() if isinstance(self.message, dict) else [self.message]
+        return sorted({champ for modele in modeles for _, champ, _, _ in Formatter().parse(modele) if champ})
+    
+    def compiler(self, aujourd_hui, filtre=None):
+        """
+        Queryset des seules lignes en violation, avec les cibles de l'alerte,
+        son type, son niveau et les valeurs de son message
+        
+        Args:
+            aujourd_hui: Date de référence des règles de délai
+            filtre: Q optionnel restreignant les objets évalués
+        """
+        queryset = self.modele.objects.filter(SURVEILLANCE[self.modele])
+        if filtre is not None:
+            queryset = queryset.filter(filtre)
+        for nom, expression in (self.annotations(aujourd_hui) if self.annotations else {}).items():
+            queryset = queryset.annotate(**{nom: expression})
+        
+        def evaluer(valeur):
+            return _expression(valeur(aujourd_hui) if callable(valeur) else valeur)
+        
+        queryset = queryset.filter(self.predicat(aujourd_hui)).annotate(
+            alerte_type=evaluer(self.type_alerte),
+            alerte_niveau=evaluer(self.niveau),
+        )
+        return queryset.order_by().values(
+            *sorted(set(CIBLES[self.modele].values())), 'alerte_type', 'alerte_niveau', *self.champs_message
+        )
+    
+    def alertes(self, aujourd_hui, filtre=None):
+        """
+        Évalue la règle en une requête
+        
+        Returns:
+            La liste des couples (identifiant de la cible, Alerte non enregistrée)
+        """
+        alertes = []
+        for ligne in self.compiler(aujourd_hui, filtre):
+            modele = self.message[ligne['alerte_type']] if isinstance(self.message, dict) else self.message
+            alerte = Alerte(
+                type_alerte=ligne['alerte_type'],
+                niveau=ligne['alerte_niveau'],
+                message=modele.format(**ligne),
+                **{champ: ligne[valeur] for champ, valeur in CIBLES[self.modele].items()}
+            )
+            alertes.append((ligne['id'], alerte))
+        return alertes
+
+
+# Registre des règles, dans leur ordre d'évaluation
+REGLES = {}
+
+
+def enregistrer_regle(regle):
+    """
+    Ajoute une règle au registre (une règle de même nom est remplacée)
+    """
+    REGLES[regle.nom] = regle
+    return regle
+
+
+def _pourcentage_budget(aujourd_hui):
+    return {
+        'pourcentage': ExpressionWrapper(
+            Cast('cout_actuel', FloatField()) * 100 / Cast('budget_initial', FloatField()),
+            output_field=FloatField()
+        ),
+    }
+
+
+enregistrer_regle(RegleAlerte(
+    nom='BUDGET_PROJET',
+    modele=Projet,
+    annotations=_pourcentage_budget,
+    predicat=lambda aujourd_hui: (
+        Q(budget_initial__isnull=False, cout_actuel__isnull=False)
+        & ~Q(budget_initial=0) & ~Q(cout_actuel=0) & ~Q(seuil_alerte_cout=0)
+        & Q(pourcentage__gte=F('seuil_alerte_cout'))
+    ),
+    type_alerte='DEPASSEMENT_BUDGET',
+    niveau=lambda aujourd_hui: Case(
+        When(pourcentage__gte=100, then=Value('CRITIQUE')), default=Value('WARNING'), output_field=CharField()
+    ),
+    message="Budget utilisé à {pourcentage:.1f}% ({cout_actuel:.2f}€ / {budget_initial:.2f}€)",
+))
+
+
+def _echeance_projet(aujourd_hui):
+    return {
+        'jours_restants': JoursEntre('date_fin_prevue', aujourd_hui),
+        'jours_retard': JoursEntre(aujourd_hui, 'date_fin_prevue'),
+    }
+
+
+enregistrer_regle(RegleAlerte(
+    nom='DELAI_PROJET',
+    modele=Projet,
+    annotations=_echeance_projet,
+    # Dépassement, ou échéance dans les 7 jours
+    predicat=lambda aujourd_hui: Q(date_fin_prevue__isnull=False, jours_restants__lte=7),
+    type_alerte=lambda aujourd_hui: Case(
+        When(jours_restants__lte=0, then=Value('DEPASSEMENT_DELAI')),
+        default=Value('ECHEANCE_PROCHE'), output_field=CharField()
+    ),
+    niveau=lambda aujourd_hui: Case(
+        When(jours_restants__lte=0, then=Value('CRITIQUE')), default=Value('WARNING'), output_field=CharField()
+    ),
+    message={
+        'DEPASSEMENT_DELAI': "Projet en retard de {jours_retard} jour(s)",
+        'ECHEANCE_PROCHE': "Échéance dans {jours_restants} jour(s)",
+    },
+))
+
+
+def _progression_projet(aujourd_hui):
+    moyenne_phases = Phase.objects.filter(projet=OuterRef('pk')).order_by().values('projet').annotate(
+        moyenne=Avg('progression')
+    ).values('moyenne')
+    return {
+        'progression_reelle': Subquery(moyenne_phases, output_field=FloatField()),
+        'duree_totale': JoursEntre('date_fin_prevue', 'date_debut'),
+        'duree_ecoulee': JoursEntre(aujourd_hui, 'date_debut'),
+        'progression_attendue': ExpressionWrapper(
+            Cast('duree_ecoulee', FloatField()) * 100 / Cast('duree_totale', FloatField()),
+            output_field=FloatField()
+        ),
+    }
+
+
+enregistrer_regle(RegleAlerte(
+    nom='PROGRESSION_PROJET',
+    modele=Projet,
+    annotations=_progression_projet,
+    # Progression moyenne des phases inférieure de plus de 20 points à la part du temps écoulé
+    predicat=lambda aujourd_hui: (
+        Q(progression_reelle__isnull=False, date_debut__isnull=False, date_fin_prevue__isnull=False,
+          duree_totale__gt=0)
+        & Q(progression_reelle__lt=F('progression_attendue') - 20)
+    ),
+    type_alerte='PROGRESSION_FAIBLE',
+    niveau='WARNING',
+    message="Progression faible: {progression_reelle:.1f}% (attendu: {progression_attendue:.1f}%)",
+))
+
+
+def _seuil_operation(aujourd_hui):
+    # Premier seuil de l'opération
+    premier_seuil = Seuil.objects.filter(operation=OuterRef('pk')).order_by('pk')
+    valeur = DecimalField(max_digits=10, decimal_places=2)
+    return {
+        'valeur_jaune': Subquery(premier_seuil.values('valeur_jaune')[:1], output_field=valeur),
+        'valeur_rouge': Subquery(premier_seuil.values('valeur_rouge')[:1], output_field=valeur),
+        'couleur_seuil': Case(
+            When(cout_reel__gte=F('valeur_rouge'), then=Value('ROUGE')),
+            default=Value('JAUNE'), output_field=CharField()
+        ),
+        'valeur_seuil': Case(
+            When(cout_reel__gte=F('valeur_rouge'), then=F('valeur_rouge')),
+            default=F('valeur_jaune'), output_field=valeur
+        ),
+    }
+
+
+enregistrer_regle(RegleAlerte(
+    nom='SEUIL_OPERATION',
+    modele=Operation,
+    annotations=_seuil_operation,
+    predicat=lambda aujourd_hui: (
+        Q(cout_reel__isnull=False, valeur_jaune__isnull=False) & ~Q(cout_reel=0)
+        & (Q(cout_reel__gte=F('valeur_rouge')) | Q(cout_reel__gte=F('valeur_jaune')))
+    ),
+    type_alerte='DEPASSEMENT_SEUIL',
+    niveau=lambda aujourd_hui: Case(
+        When(couleur_seuil='ROUGE', then=Value('CRITIQUE')), default=Value('WARNING'), output_field=CharField()
+    ),
+    message="Seuil {couleur_seuil} dépassé: {cout_reel:.2f}€ (Seuil: {valeur_seuil:.2f}€)",
+))
+
+
+enregistrer_regle(RegleAlerte(
+    nom='DELAI_OPERATION',
+    modele=Operation,
+    annotations=lambda aujourd_hui: {'jours_retard': JoursEntre(aujourd_hui, 'date_fin_prevue')},
+    predicat=lambda aujourd_hui: Q(date_fin_prevue__isnull=False, jours_retard__gte=0),
+    type_alerte='OPERATION_RETARD',
+    niveau='CRITIQUE',
+    message="Opération en retard de {jours_retard} jour(s)",
+))
@@ -1,6 +1,6 @@
 # PteroMonitore/alerts/serializers.py
 from rest_framework import serializers
-from ..models import Alerte, Projet, Phase, Operation, Utilisateur
+from ..models import Alerte, DetectionAlertes, Projet, Phase, Operation, Utilisateur
 
 
 class UtilisateurSimpleSerializer(serializers.ModelSerializer):
@@ -61,7 +61,7 @@ class AlerteSerializer(serializers.ModelSerializer):
             'id', 'projet', 'phase', 'operation', 'type_alerte',
             'niveau', 'niveau_display', 'message', 'date_alerte',
             'statut', 'statut_display', 'lue_par', 'date_lecture',
-            'temps_ecoule'
+            'temps_ecoule', 'incident', 'nombre_occurrences'
         ]
     
     def get_temps_ecoule(self, obj):
@@ -159,6 +159,45 @@ class AlerteHistoriqueSerializer(serializers.ModelSerializer):
         ]
 
 
+class DetectionAlertesSerializer(serializers.ModelSerializer):
+    """
+    Serializer de l'état d'une détection d'alertes en tâche de fond
+    """
+    demandee_par = UtilisateurSimpleSerializer(read_only=True)
+    statut_display = serializers.CharField(source='get_statut_display', read_only=True)
+    
+    # Champs calculés
+    progression = serializers.SerializerMethodField()
+    duree = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DetectionAlertes
+        fields = [
+            'id', 'statut', 'statut_display', 'demandee_par', 'nombre_demandes',
+            'tranches', 'tranches_terminees', 'progression', 'alertes_creees',
+            'statistiques', 'erreur', 'date_demande', 'date_debut', 'date_fin', 'duree'
+        ]
+    
+    def get_progression(self, obj):
+        """
+        Pourcentage des tranches terminées
+        """
+        if obj.statut == 'TERMINEE':
+            return 100.0
+        if not obj.tranches:
+            return 0.0
+        return round(obj.tranches_terminees * 100 / obj.tranches, 1)
+    
+    def get_duree(self, obj):
+        """
+        Durée de la détection (secondes), jusqu'à maintenant si elle est en cours
+        """
+        if not obj.date_debut:
+            return None
+        from django.utils import timezone
+        return round(((obj.date_fin or timezone.now()) - obj.date_debut).total_seconds(), 3)
+
+
 class AlerteStatistiquesSerializer(serializers.Serializer):
     """
     Serializer pour les statistiques d'alertes
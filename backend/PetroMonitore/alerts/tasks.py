@@ -1,31 +1,165 @@
 # PteroMonitore/alerts/tasks.py
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.backends.base import DisabledBackend
 from django.utils import timezone
 from datetime import timedelta
 import logging
+import time
 
-from .utils import detecter_toutes_alertes, nettoyer_anciennes_alertes, generer_rapport_alertes
+from .limitation import purger_compteurs
+from .utils import (
+    detecter_toutes_alertes, decouper_detection, envoyer_notifications_en_attente, evaluer_alertes_en_attente,
+    executer_detection,
+    nettoyer_anciennes_alertes, generer_rapport_alertes
+)
 from ..models import Alerte
 
 logger = logging.getLogger(__name__)
 
 
+@shared_task
+def evaluer_alertes_modifiees():
+    """
+    Évaluer les règles d'alerte des projets et opérations modifiés depuis le
+    dernier passage (planifiée après chaque écriture, et périodiquement)
+    """
+    try:
+        statistiques = {}
+        alertes_creees = evaluer_alertes_en_attente(statistiques=statistiques)
+        if alertes_creees:
+            logger.info(f"Évaluation incrémentale: {len(alertes_creees)} nouvelles alertes créées")
+        return f"Évaluation incrémentale: {len(alertes_creees)} alertes créées"
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de l'évaluation incrémentale des alertes: {str(e)}")
+        return f"Erreur: {str(e)}"
+
+
 @shared_task
 def detecter_alertes_periodique():
     """
-    Tâche périodique pour détecter les alertes automatiquement
+    Réconciliation nocturne : détection complète des alertes, y compris celles
+    qui ne dépendent que du temps écoulé (échéances, retards, progression).
+    La détection est découpée en tranches (par nombre d'opérations) réparties
+    sur les workers, un callback agrège ensuite les alertes créées et les
+    durées de chaque tranche
     """
     try:
         logger.info("Début de la détection périodique des alertes")
-        alertes_creees = detecter_toutes_alertes()
-        logger.info(f"Détection terminée: {len(alertes_creees)} nouvelles alertes créées")
-        return f"Détection terminée: {len(alertes_creees)} alertes créées"
+        tranches = decouper_detection()
+        
+        if len(tranches) <= 1:
+            statistiques = {}
+            alertes_creees = detecter_toutes_alertes(statistiques=statistiques)
+            logger.info(f"Détection terminée: {len(alertes_creees)} nouvelles alertes créées")
+            durees = ", ".join(f"{regle}={entree['duree'] * 1000:.0f}ms" for regle, entree in statistiques.items())
+            return f"Détection terminée: {len(alertes_creees)} alertes créées ({durees})"
+        
+        taches = group(detecter_alertes_tranche.s(tranche) for tranche in tranches)
+        sans_resultats = isinstance(detecter_alertes_tranche.backend, DisabledBackend)
+        if sans_resultats and not detecter_alertes_tranche.app.conf.task_always_eager:
+            # Sans backend de résultats, pas de chord : chaque tranche journalise son propre bilan
+            taches.apply_async()
+        else:
+            chord(taches)(agreger_detection_alertes.s())
+        
+        logger.info(f"Détection répartie en {len(tranches)} tranches")
+        return f"Détection répartie en {len(tranches)} tranches"
         
     except Exception as e:
         logger.error(f"Erreur lors de la détection périodique: {str(e)}")
         return f"Erreur: {str(e)}"
 
 
+@shared_task
+def executer_detection_alertes(detection_id):
+    """
+    Exécuter une détection complète demandée depuis l'API (voir
+    PetroMonitore.alerts.utils.demander_detection), sa progression étant
+    enregistrée après chaque tranche
+    """
+    detection = executer_detection(detection_id)
+    if detection is None:
+        return f"Détection {detection_id} déjà exécutée"
+    
+    logger.info(f"Détection {detection_id} {detection.statut}: {detection.alertes_creees} alertes créées "
+                f"en {detection.tranches_terminees}/{detection.tranches} tranches")
+    return f"Détection {detection_id} {detection.statut}: {detection.alertes_creees} alertes créées"
+
+
+@shared_task
+def detecter_alertes_tranche(tranche):
+    """
+    Détecter les alertes d'une tranche (voir decouper_detection)
+    
+    Returns:
+        Le bilan de la tranche : nombre d'alertes créées, durée totale et par règle
+    """
+    debut = time.perf_counter()
+    statistiques = {}
+    alertes_creees = detecter_toutes_alertes(statistiques=statistiques, tranche=tranche)
+    duree = time.perf_counter() - debut
+    
+    logger.info(f"Tranche {tranche['type']} terminée: {len(alertes_creees)} alertes créées en {duree * 1000:.0f}ms")
+    return {
+        'tranche': tranche,
+        'alertes': len(alertes_creees),
+        'duree': duree,
+        'statistiques': statistiques,
+    }
+
+
+@shared_task
+def agreger_detection_alertes(resultats):
+    """
+    Callback de la détection répartie : agrège les bilans des tranches
+    
+    Returns:
+        Le nombre de tranches, d'alertes créées, la durée de la tranche la plus
+        longue et le bilan de chaque tranche
+    """
+    total = sum(resultat['alertes'] for resultat in resultats)
+    duree_max = max((resultat['duree'] for resultat in resultats), default=0.0)
+    
+    for index, resultat in enumerate(resultats):
+        logger.info(
+            f"Détection - tranche {index} ({resultat['tranche']['type']}): "
+            f"{resultat['alertes']} alerte(s), {resultat['duree'] * 1000:.0f}ms"
+        )
+    logger.info(f"Détection répartie terminée: {total} alertes créées, tranche la plus longue {duree_max * 1000:.0f}ms")
+    return {
+        'tranches': len(resultats),
+        'alertes': total,
+        'duree_max': duree_max,
+        'resultats': resultats,
+    }
+
+
+@shared_task
+def envoyer_notifications_alertes():
+    """
+    Vider la boîte d'envoi des notifications d'alertes, lot par lot (une
+    connexion email par lot, un message par destinataire). Routée vers la
+    file 'notifications' (worker dédié, voir backend/celery.py)
+    """
+    try:
+        bilan = {'messages': 0, 'notifications': 0, 'echecs': 0, 'differees': 0}
+        while True:
+            lot = envoyer_notifications_en_attente()
+            for cle, valeur in lot.items():
+                bilan[cle] += valeur
+            # Les notifications en échec ou différées sont reprogrammées plus tard : le lot suivant ne les reprend pas
+            if not lot['notifications'] and not lot['echecs'] and not lot['differees']:
+                break
+        
+        return (f"Notifications: {bilan['messages']} email(s) envoyé(s) pour {bilan['notifications']} "
+                f"notification(s), {bilan['echecs']} échec(s), {bilan['differees']} différée(s)")
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de l'envoi des notifications: {str(e)}")
+        return f"Erreur: {str(e)}"
+
+
 @shared_task
 def nettoyer_alertes_periodique():
     """
@@ -35,6 +169,9 @@ def nettoyer_alertes_periodique():
         logger.info("Début du nettoyage des anciennes alertes")
         count = nettoyer_anciennes_alertes(jours=60)  # Supprimer après 60 jours
         logger.info(f"Nettoyage terminé: {count} alertes supprimées")
+        
+        # Compteurs de limitation des fenêtres expirées
+        logger.info(f"{purger_compteurs()} compteurs de limitation expirés supprimés")
         return f"Nettoyage terminé: {count} alertes supprimées"
         
     except Exception as e:
@@ -45,12 +182,14 @@ def nettoyer_alertes_periodique():
 @shared_task
 def generer_rapport_hebdomadaire():
     """
-    Générer un rapport hebdomadaire des alertes
+    Générer le rapport hebdomadaire des alertes de la semaine terminée
+    (lundi 0h à lundi 0h), dont les agrégats sont alors enregistrés
     """
     try:
         logger.info("Génération du rapport hebdomadaire des alertes")
         
-        date_fin = timezone.now()
+        local = timezone.localtime()
+        date_fin = (local - timedelta(days=local.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
         date_debut = date_fin - timedelta(days=7)
         
         rapport = generer_rapport_alertes(date_debut, date_fin)
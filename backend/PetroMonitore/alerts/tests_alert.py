@@ -1,14 +1,49 @@
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail import get_connection
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.contrib import admin
+from django.test import AsyncClient, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
+import asyncio
+import gzip
+import io
+import json
+import shutil
+import tempfile
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
-from ..models import Projet, Phase, Operation, Alerte, Seuil
-from .utils import verifier_seuils_projet, verifier_seuils_operation, creer_alerte
+from ..models import (
+    Projet, Phase, Operation, Alerte, Seuil, EquipeProjet, EvaluationAlerteEnAttente, NotificationAlerte,
+    OccurrenceIncident, SemaineAlertesAgregee, DetectionAlertes
+)
+from ..recalculs import differer_recalculs
+from .utils import (
+    verifier_seuils_projet, verifier_seuils_operation, creer_alerte, detecter_toutes_alertes, upsert_alertes,
+    decouper_detection, evaluer_alertes_en_attente, notifier_alertes, envoyer_notifications_en_attente,
+    generer_rapport_alertes
+)
+from . import archivage
+from .archivage import archiver_alertes, chemin_archive, restaurer_archives
+from .destinataires import resoudre_destinataires
+from .flux import charger_alertes, diffuseur, flux_evenements
+from .limitation import FenetreGlissante
+from .regles import REGLES
+from .tasks import (
+    detecter_alertes_periodique, detecter_alertes_tranche, agreger_detection_alertes, executer_detection_alertes
+)
 
 User = get_user_model()
 
@@ -124,7 +159,8 @@ class AlerteUtilsTest(TestCase):
     def test_verifier_seuils_projet_budget(self):
         """Test de vérification des seuils de budget"""
         # Le projet a un coût de 85000€ pour un budget de 100000€ avec seuil à 80%
-        # Cela devrait déclencher une alerte
+        # Cela devrait déclencher une alerte (coût fixé sans passer par les recalculs d'agrégats)
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('85000.00'))
         alertes = verifier_seuils_projet(self.projet)
         
         self.assertTrue(len(alertes) > 0)
@@ -154,6 +190,760 @@ class AlerteUtilsTest(TestCase):
         self.assertEqual(alerte_seuil.type_alerte, 'DEPASSEMENT_SEUIL')
         self.assertEqual(alerte_seuil.niveau, 'WARNING')
 
+    
+    def test_detecter_toutes_alertes_ensembliste(self):
+        """Test de la détection ensembliste, de son dédoublonnage et de ses statistiques"""
+        Operation.objects.create(
+            phase=self.phase,
+            nom='Operation En Retard',
+            statut='EN_COURS',
+            date_fin_prevue=date.today() - timedelta(days=2)
+        )
+        # Coût et progression fixés sans passer par les recalculs d'agrégats
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('85000.00'))
+        Phase.objects.filter(pk=self.phase.pk).update(progression=Decimal('50.00'))
+        
+        statistiques = {}
+        alertes = detecter_toutes_alertes(statistiques=statistiques)
+        
+        self.assertEqual(
+            sorted(alerte.type_alerte for alerte in alertes),
+            ['DEPASSEMENT_BUDGET', 'DEPASSEMENT_SEUIL', 'OPERATION_RETARD', 'PROGRESSION_FAIBLE']
+        )
+        self.assertTrue(all(alerte.pk for alerte in alertes))
+        self.assertEqual(statistiques['seuil_operation']['alertes'], 1)
+        self.assertEqual(statistiques['ecriture']['alertes'], 4)
+        self.assertIn('duree', statistiques['budget_projet'])
+        
+        alerte_seuil = next(a for a in alertes if a.type_alerte == 'DEPASSEMENT_SEUIL')
+        self.assertEqual(alerte_seuil.niveau, 'WARNING')
+        self.assertEqual(alerte_seuil.projet_id, self.projet.id)
+        self.assertEqual(alerte_seuil.operation_id, self.operation.id)
+        
+        # Les alertes encore ouvertes ne sont pas recréées
+        self.assertEqual(detecter_toutes_alertes(), [])
+    
+    @override_settings(PETROMONITORE_INCIDENT_SEUIL=1000)
+    def test_detecter_toutes_alertes_nombre_de_requetes_constant(self):
+        """Test que la détection ne fait pas une requête par opération"""
+        def compter_requetes():
+            Alerte.objects.all().delete()
+            with CaptureQueriesContext(connection) as requetes:
+                detecter_toutes_alertes(notifier=False)
+            return len(requetes)
+        
+        avant = compter_requetes()
+        for i in range(10):
+            operation = Operation.objects.create(phase=self.phase, nom=f'Op {i}', statut='EN_COURS',
+                                                 cout_reel=Decimal('20000.00'))
+            Seuil.objects.create(operation=operation, valeur_verte=Decimal('1.00'),
+                                 valeur_jaune=Decimal('2.00'), valeur_rouge=Decimal('3.00'))
+        self.assertEqual(compter_requetes(), avant)
+    
+    def test_regles_evaluees_par_la_base(self):
+        """Test que chaque règle du registre ne renvoie, en une requête, que les objets en violation"""
+        Operation.objects.create(phase=self.phase, nom='Operation Sous Seuil', statut='EN_COURS',
+                                 cout_reel=Decimal('100.00'))
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('105000.00'))
+        aujourd_hui = date.today()
+        
+        with self.assertNumQueries(1):
+            budget = REGLES['BUDGET_PROJET'].alertes(aujourd_hui)
+        self.assertEqual([(cible, alerte.niveau) for cible, alerte in budget], [(self.projet.id, 'CRITIQUE')])
+        self.assertEqual(budget[0][1].message, 'Budget utilisé à 105.0% (105000.00€ / 100000.00€)')
+        
+        with self.assertNumQueries(1):
+            seuils = REGLES['SEUIL_OPERATION'].alertes(aujourd_hui)
+        self.assertEqual([cible for cible, _ in seuils], [self.operation.id])
+        self.assertEqual(seuils[0][1].message, 'Seuil JAUNE dépassé: 15000.00€ (Seuil: 12000.00€)')
+        self.assertEqual(seuils[0][1].phase_id, self.phase.id)
+        
+        self.assertEqual(REGLES['DELAI_PROJET'].alertes(aujourd_hui), [])
+        Projet.objects.filter(pk=self.projet.pk).update(date_fin_prevue=aujourd_hui + timedelta(days=3))
+        with self.assertNumQueries(1):
+            delais = REGLES['DELAI_PROJET'].alertes(aujourd_hui)
+        self.assertEqual([alerte.type_alerte for _, alerte in delais], ['ECHEANCE_PROCHE'])
+        self.assertEqual(delais[0][1].message, 'Échéance dans 3 jour(s)')
+        
+        # Une règle restreinte à d'autres objets ne renvoie rien
+        self.assertEqual(REGLES['BUDGET_PROJET'].alertes(aujourd_hui, Q(pk=0)), [])
+    
+    def test_upsert_alerte_dedoublonnee_par_empreinte(self):
+        """Test du dédoublonnage des alertes ouvertes par leur empreinte"""
+        premiere = creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget à 85%', projet=self.projet)
+        self.assertEqual(premiere.empreinte, f'projet:{self.projet.id}:DEPASSEMENT_BUDGET')
+        
+        # Une seconde détection met à jour l'alerte ouverte au lieu d'en créer une
+        seconde = creer_alerte('DEPASSEMENT_BUDGET', 'CRITIQUE', 'Budget à 105%', projet=self.projet)
+        self.assertEqual(seconde.pk, premiere.pk)
+        premiere.refresh_from_db()
+        self.assertEqual(premiere.niveau, 'CRITIQUE')
+        self.assertEqual(Alerte.objects.filter(type_alerte='DEPASSEMENT_BUDGET').count(), 1)
+        
+        # L'empreinte est un index unique
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Alerte.objects.create(projet=self.projet, type_alerte='DEPASSEMENT_BUDGET', niveau='INFO',
+                                  message='Doublon', empreinte=premiere.empreinte)
+        
+        # Une alerte traitée libère son empreinte
+        premiere.statut = 'TRAITEE'
+        premiere.save(update_fields=['statut'])
+        premiere.refresh_from_db()
+        self.assertIsNone(premiere.empreinte)
+        troisieme = creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget à 90%', projet=self.projet)
+        self.assertNotEqual(troisieme.pk, premiere.pk)
+    
+    def test_upsert_alertes_en_lot_avec_conflit(self):
+        """Test de l'upsert en lot quand une empreinte est déjà ouverte"""
+        existante = creer_alerte('OPERATION_RETARD', 'CRITIQUE', 'Retard de 1 jour(s)',
+                                 projet=self.projet, phase=self.phase, operation=self.operation)
+        
+        with CaptureQueriesContext(connection) as contexte:
+            creees, mises_a_jour = upsert_alertes([
+                Alerte(projet=self.projet, type_alerte='DEPASSEMENT_DELAI', niveau='CRITIQUE', message='Retard'),
+                Alerte(projet=self.projet, phase=self.phase, operation=self.operation,
+                       type_alerte='OPERATION_RETARD', niveau='CRITIQUE', message='Retard de 2 jour(s)'),
+            ])
+        
+        # Empreinte déjà ouverte mise à jour, sans conflit d'insertion ni insertion ligne à ligne
+        requetes = [requete['sql'] for requete in contexte.captured_queries]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "PetroMonitore_alerte"') for sql in requetes), 1)
+        self.assertFalse(any(sql.startswith('ROLLBACK TO SAVEPOINT') for sql in requetes))
+        self.assertEqual([alerte.type_alerte for alerte in creees], ['DEPASSEMENT_DELAI'])
+        self.assertEqual([alerte.pk for alerte in mises_a_jour], [existante.pk])
+        existante.refresh_from_db()
+        self.assertEqual(existante.message, 'Retard de 2 jour(s)')
+        self.assertEqual(Alerte.objects.count(), 2)
+
+    def test_decouper_detection_par_nombre_operations(self):
+        """Test du découpage de la détection en tranches d'opérations"""
+        operations = [self.operation] + [
+            Operation.objects.create(phase=self.phase, nom=f'Op {i}', statut='EN_COURS') for i in range(4)
+        ]
+        Operation.objects.create(phase=self.phase, nom='Op terminée', statut='TERMINE')
+        
+        tranches = decouper_detection(taille_tranche=2)
+        
+        self.assertEqual(tranches[0], {'type': 'projets', 'ids': [self.projet.id]})
+        # Un seul projet, mais ses cinq opérations actives sont réparties sur trois tranches
+        self.assertEqual(tranches[1:], [
+            {'type': 'operations', 'debut': operations[0].id, 'fin': operations[1].id},
+            {'type': 'operations', 'debut': operations[2].id, 'fin': operations[3].id},
+            {'type': 'operations', 'debut': operations[4].id, 'fin': operations[4].id},
+        ])
+    
+    def test_detection_par_tranches_equivalente(self):
+        """Test que l'union des tranches détecte les mêmes alertes que la détection complète"""
+        Operation.objects.create(phase=self.phase, nom='Operation En Retard', statut='EN_COURS',
+                                 date_fin_prevue=date.today() - timedelta(days=2))
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('85000.00'))
+        Phase.objects.filter(pk=self.phase.pk).update(progression=Decimal('50.00'))
+        
+        resultats = [detecter_alertes_tranche(tranche) for tranche in decouper_detection(taille_tranche=1)]
+        self.assertEqual([resultat['alertes'] for resultat in resultats], [2, 1, 1])
+        self.assertIn('seuil_operation', resultats[1]['statistiques'])
+        self.assertNotIn('budget_projet', resultats[1]['statistiques'])
+        
+        bilan = agreger_detection_alertes(resultats)
+        self.assertEqual(bilan['tranches'], 3)
+        self.assertEqual(bilan['alertes'], 4)
+        self.assertEqual(bilan['duree_max'], max(resultat['duree'] for resultat in resultats))
+        self.assertEqual(
+            sorted(Alerte.objects.values_list('type_alerte', flat=True)),
+            ['DEPASSEMENT_BUDGET', 'DEPASSEMENT_SEUIL', 'OPERATION_RETARD', 'PROGRESSION_FAIBLE']
+        )
+        
+        # Les tranches ne recréent pas les alertes encore ouvertes
+        self.assertEqual(detecter_toutes_alertes(), [])
+    
+    def test_detection_periodique_repartie(self):
+        """Test de la détection périodique répartie en chord (exécution eager)"""
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('85000.00'))
+        
+        with self.settings(PETROMONITORE_TAILLE_TRANCHE_ALERTES=1):
+            app = detecter_alertes_tranche.app
+            eager = app.conf.task_always_eager
+            app.conf.task_always_eager = True
+            try:
+                resultat = detecter_alertes_periodique()
+            finally:
+                app.conf.task_always_eager = eager
+        
+        self.assertEqual(resultat, "Détection répartie en 2 tranches")
+        self.assertTrue(Alerte.objects.filter(type_alerte='DEPASSEMENT_BUDGET').exists())
+        self.assertTrue(Alerte.objects.filter(type_alerte='DEPASSEMENT_SEUIL').exists())
+
+
+class AlerteIncrementaleTest(TestCase):
+    """Tests de l'évaluation incrémentale des alertes à l'écriture"""
+    
+    def setUp(self):
+        self.projet = Projet.objects.create(
+            nom='Projet Test',
+            statut='EN_COURS',
+            budget_initial=Decimal('100000.00'),
+            date_debut=date.today() - timedelta(days=30),
+            date_fin_prevue=date.today() + timedelta(days=60)
+        )
+        self.phase = Phase.objects.create(projet=self.projet, nom='Phase Test', statut='EN_COURS', ordre=1)
+        self.operation = Operation.objects.create(phase=self.phase, nom='Operation Test', statut='EN_COURS')
+        Seuil.objects.create(operation=self.operation, valeur_verte=Decimal('10000.00'),
+                             valeur_jaune=Decimal('12000.00'), valeur_rouge=Decimal('18000.00'))
+        EvaluationAlerteEnAttente.objects.all().delete()
+    
+    def marques(self):
+        return set(EvaluationAlerteEnAttente.objects.values_list('regle', 'objet_id'))
+    
+    def test_seules_les_regles_des_champs_modifies_sont_marquees(self):
+        """Test du marquage des règles dépendant des champs modifiés"""
+        operation = Operation.objects.get(pk=self.operation.pk)
+        operation.nom = 'Renommée'
+        operation.save()
+        self.assertEqual(self.marques(), set())
+        
+        operation.date_fin_prevue = date.today() - timedelta(days=1)
+        operation.save(update_fields=['date_fin_prevue'])
+        self.assertEqual(self.marques(), {('DELAI_OPERATION', self.operation.id)})
+        
+        projet = Projet.objects.get(pk=self.projet.pk)
+        projet.seuil_alerte_cout = Decimal('50.00')
+        projet.save()
+        self.assertIn(('BUDGET_PROJET', self.projet.id), self.marques())
+        self.assertNotIn(('DELAI_PROJET', self.projet.id), self.marques())
+    
+    def test_recalculs_d_agregats_marquent_les_regles_du_projet(self):
+        """Test que les coûts et progressions recalculés marquent les règles du projet"""
+        with differer_recalculs():
+            operation = Operation.objects.get(pk=self.operation.pk)
+            operation.cout_reel = Decimal('95000.00')
+            operation.progression = Decimal('40.00')
+            operation.save()
+        
+        self.assertEqual(self.marques(), {
+            ('SEUIL_OPERATION', self.operation.id),
+            ('BUDGET_PROJET', self.projet.id),
+            ('PROGRESSION_PROJET', self.projet.id),
+        })
+    
+    def test_evaluation_limitee_aux_objets_marques(self):
+        """Test que l'évaluation ne porte que sur les objets marqués puis vide la file"""
+        autre = Projet.objects.create(nom='Autre', statut='EN_COURS', budget_initial=Decimal('100.00'))
+        Projet.objects.filter(pk=autre.pk).update(cout_actuel=Decimal('500.00'))
+        EvaluationAlerteEnAttente.objects.all().delete()
+        
+        with differer_recalculs():
+            operation = Operation.objects.get(pk=self.operation.pk)
+            operation.cout_reel = Decimal('95000.00')
+            operation.save()
+        
+        alertes = evaluer_alertes_en_attente(notifier=False)
+        
+        self.assertEqual(
+            sorted((alerte.type_alerte, alerte.projet_id) for alerte in alertes),
+            [('DEPASSEMENT_BUDGET', self.projet.id), ('DEPASSEMENT_SEUIL', self.projet.id)]
+        )
+        self.assertFalse(Alerte.objects.filter(projet=autre).exists())
+        self.assertFalse(EvaluationAlerteEnAttente.objects.exists())
+        self.assertEqual(evaluer_alertes_en_attente(), [])
+
+
+class RapportAlertesTest(TestCase):
+    """Tests du rapport des alertes (agrégation groupée et agrégats hebdomadaires)"""
+    
+    def setUp(self):
+        self.projets = [Projet.objects.create(nom=f'Projet {i}', statut='EN_COURS') for i in range(2)]
+        for projet, type_alerte, niveau, statut in [
+            (self.projets[0], 'DEPASSEMENT_BUDGET', 'CRITIQUE', 'NON_LU'),
+            (self.projets[0], 'ECHEANCE_PROCHE', 'WARNING', 'LU'),
+            (self.projets[1], 'DEPASSEMENT_BUDGET', 'WARNING', 'TRAITEE'),
+            (None, 'SYSTEME', 'INFO', 'NON_LU'),
+        ]:
+            Alerte.objects.create(projet=projet, type_alerte=type_alerte, niveau=niveau, statut=statut,
+                                  message=f'{type_alerte} {niveau}')
+        self.attendu = {
+            'total': 4,
+            'par_niveau': {'INFO': 1, 'WARNING': 2, 'CRITIQUE': 1},
+            'par_type': {'DEPASSEMENT_BUDGET': 2, 'ECHEANCE_PROCHE': 1, 'SYSTEME': 1},
+            'par_statut': {'NON_LU': 2, 'LU': 1, 'TRAITEE': 1},
+            'par_projet': {'Projet 0': 2, 'Projet 1': 1},
+        }
+    
+    def debut_semaine(self):
+        local = timezone.localtime()
+        return (local - timedelta(days=local.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def test_rapport_en_une_agregation(self):
+        """Test du rapport, en un nombre de requêtes indépendant des projets et des types"""
+        # Agrégation groupée, statuts, puis alertes critiques
+        with self.assertNumQueries(3):
+            rapport = generer_rapport_alertes(self.debut_semaine(), timezone.now())
+        self.assertEqual(rapport['statistiques'], self.attendu)
+        self.assertEqual([alerte['projet__nom'] for alerte in rapport['alertes_critiques']], ['Projet 0'])
+        
+        for i in range(5):
+            projet = Projet.objects.create(nom=f'Autre {i}', statut='EN_COURS')
+            creer_alerte(f'TYPE_{i}', 'INFO', 'Info', projet=projet)
+        with self.assertNumQueries(3):
+            rapport = generer_rapport_alertes(self.debut_semaine(), timezone.now())
+        self.assertEqual(rapport['statistiques']['total'], 9)
+    
+    def test_semaines_terminees_persistees(self):
+        """Test que les agrégats d'une semaine terminée sont enregistrés et jamais recalculés"""
+        semaine_passee = self.debut_semaine() - timedelta(days=14)
+        Alerte.objects.update(date_alerte=semaine_passee + timedelta(days=2))
+        Alerte.objects.create(projet=self.projets[1], type_alerte='PROGRESSION_FAIBLE', niveau='WARNING',
+                              message='Cette semaine')
+        debut = semaine_passee - timedelta(days=3)
+        
+        rapport = generer_rapport_alertes(debut, timezone.now())
+        self.assertEqual(rapport['statistiques']['total'], 5)
+        self.assertEqual(rapport['statistiques']['par_projet'], {'Projet 0': 2, 'Projet 1': 2})
+        self.assertEqual(SemaineAlertesAgregee.objects.count(), 2)
+        
+        # Statut courant des alertes des semaines terminées
+        Alerte.objects.filter(statut='NON_LU', date_alerte__lt=self.debut_semaine()).update(statut='TRAITEE')
+        rapport = generer_rapport_alertes(debut, timezone.now())
+        self.assertEqual(rapport['statistiques']['par_statut'], {'NON_LU': 1, 'LU': 1, 'TRAITEE': 3})
+        
+        # Semaines terminées lues depuis leurs agrégats, même après suppression des alertes
+        Alerte.objects.filter(date_alerte__lt=self.debut_semaine()).delete()
+        with self.assertNumQueries(5):
+            nouveau = generer_rapport_alertes(debut, timezone.now())
+        self.assertEqual({cle: valeur for cle, valeur in nouveau['statistiques'].items() if cle != 'par_statut'},
+                         {cle: valeur for cle, valeur in rapport['statistiques'].items() if cle != 'par_statut'})
+        self.assertEqual(nouveau['statistiques']['par_statut'], {'NON_LU': 1, 'LU': 0, 'TRAITEE': 0})
+
+
+class ArchivageAlerteTest(TestCase):
+    """Tests de la rétention des alertes (archivage par tranches et restauration)"""
+    
+    def setUp(self):
+        self.repertoire = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repertoire, ignore_errors=True)
+        self.projet = Projet.objects.create(nom='Projet Archivé', statut='EN_COURS')
+        self.autre_projet = Projet.objects.create(nom='Autre Projet', statut='EN_COURS')
+        self.ancienne = timezone.now() - timedelta(days=90)
+        
+        self.incident = Alerte.objects.create(projet=self.projet, type_alerte='DEPASSEMENT_BUDGET', niveau='CRITIQUE',
+                                              message='Incident', statut='TRAITEE', incident=True)
+        self.occurrence = OccurrenceIncident.objects.create(incident=self.incident, niveau='CRITIQUE',
+                                                            message='Occurrence')
+        self.simple = Alerte.objects.create(projet=self.projet, type_alerte='ECHEANCE_PROCHE', niveau='WARNING',
+                                            message='Échéance', statut='TRAITEE')
+        NotificationAlerte.objects.create(alerte=self.simple, destinataire='chef@example.com', statut='ENVOYEE')
+        self.autre = Alerte.objects.create(projet=self.autre_projet, type_alerte='SYSTEME', niveau='INFO',
+                                           message='Système', statut='TRAITEE')
+        # Conservées : alerte ancienne non traitée et alerte traitée récente
+        self.ouverte = Alerte.objects.create(projet=self.projet, type_alerte='SYSTEME', niveau='INFO',
+                                             message='Ouverte')
+        self.recente = Alerte.objects.create(projet=self.projet, type_alerte='SYSTEME', niveau='INFO',
+                                             message='Récente', statut='TRAITEE')
+        Alerte.objects.exclude(pk=self.recente.pk).update(date_alerte=self.ancienne)
+        OccurrenceIncident.objects.update(date_occurrence=self.ancienne)
+    
+    def test_archivage_par_tranches(self):
+        """Test que les alertes traitées anciennes sont archivées par date puis supprimées par tranches"""
+        bilan = archiver_alertes(jours=30, taille_tranche=2, repertoire=self.repertoire)
+        
+        self.assertEqual((bilan['alertes'], bilan['occurrences'], bilan['tranches']), (3, 1, 2))
+        self.assertGreaterEqual(bilan['verrou_max'], 0)
+        self.assertEqual(set(Alerte.objects.values_list('pk', flat=True)), {self.ouverte.pk, self.recente.pk})
+        self.assertFalse(OccurrenceIncident.objects.exists())
+        self.assertFalse(NotificationAlerte.objects.exists())
+        
+        chemin = chemin_archive(self.repertoire, timezone.localtime(self.ancienne).date())
+        self.assertEqual(bilan['fichiers'], [str(chemin)])
+        with gzip.open(chemin, 'rt', encoding='utf-8') as archive:
+            lignes = [json.loads(ligne) for ligne in archive]
+        self.assertEqual([ligne['id'] for ligne in lignes], [self.incident.pk, self.simple.pk, self.autre.pk])
+        self.assertEqual([occurrence['message'] for occurrence in lignes[0]['occurrences']], ['Occurrence'])
+    
+    def test_alerte_traitee_pendant_la_tranche_conservee(self):
+        """Test qu'une alerte traitée après la lecture de sa tranche n'est pas supprimée sans être archivée"""
+        Alerte.objects.filter(pk=self.simple.pk).update(statut='LU')
+        ecrire = archivage._ecrire_archives
+        
+        def ecrire_puis_traiter(repertoire, lignes):
+            # Transaction concurrente : l'alerte passe à TRAITEE dans la plage d'identifiants de la tranche
+            Alerte.objects.filter(pk=self.simple.pk).update(statut='TRAITEE')
+            return ecrire(repertoire, lignes)
+        
+        with mock.patch.object(archivage, '_ecrire_archives', side_effect=ecrire_puis_traiter):
+            bilan = archiver_alertes(jours=30, repertoire=self.repertoire)
+        
+        self.assertEqual(bilan['alertes'], 2)
+        self.assertTrue(Alerte.objects.filter(pk=self.simple.pk).exists())
+    
+    def test_restauration(self):
+        """Test de la restauration des archives, idempotente"""
+        archiver_alertes(jours=30, repertoire=self.repertoire)
+        self.autre_projet.delete()
+        
+        bilan = restaurer_archives([self.repertoire])
+        self.assertEqual((bilan['alertes'], bilan['occurrences'], bilan['ignorees']), (2, 1, 1))
+        incident = Alerte.objects.get(pk=self.incident.pk)
+        self.assertEqual((incident.statut, incident.incident, incident.date_alerte),
+                         ('TRAITEE', True, self.ancienne))
+        occurrence = incident.occurrences_incident.get()
+        self.assertEqual((occurrence.pk, occurrence.date_occurrence), (self.occurrence.pk, self.ancienne))
+        self.assertTrue(Alerte.objects.filter(pk=self.simple.pk, date_alerte=self.ancienne).exists())
+        
+        bilan = restaurer_archives([self.repertoire])
+        self.assertEqual((bilan['alertes'], bilan['existantes']), (0, 2))
+    
+    def test_commandes(self):
+        """Test des commandes d'archivage et de restauration"""
+        sortie = io.StringIO()
+        call_command('archiver_alertes', jours=30, repertoire=self.repertoire, stdout=sortie)
+        self.assertIn('3 alerte(s) et 1 occurrence(s) archivées', sortie.getvalue())
+        self.assertIn('alertes/s', sortie.getvalue())
+        
+        sortie = io.StringIO()
+        call_command('restaurer_alertes', self.repertoire, stdout=sortie)
+        self.assertIn('3 alerte(s) et 1 occurrence(s) restaurées', sortie.getvalue())
+        self.assertEqual(Alerte.objects.count(), 5)
+
+
+@override_settings(PETROMONITORE_NOTIFICATIONS_TENTATIVES=2, PETROMONITORE_NOTIFICATIONS_DELAI=60)
+class NotificationAlerteTest(TestCase):
+    """Tests de la boîte d'envoi des notifications d'alertes"""
+    
+    def setUp(self):
+        self.responsable = User.objects.create_user(
+            email='responsable@example.com', password='testpass123', nom='Resp', prenom='User', role='INGENIEUR'
+        )
+        self.chef = User.objects.create_user(
+            email='chef@example.com', password='testpass123', nom='Chef', prenom='User', role='INGENIEUR'
+        )
+        self.projet = Projet.objects.create(nom='Projet Test', statut='EN_COURS', responsable=self.responsable)
+        EquipeProjet.objects.create(projet=self.projet, utilisateur=self.chef, role_projet='CHEF_PROJET')
+        self.alertes = [
+            creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget dépassé', projet=self.projet),
+            creer_alerte('ECHEANCE_PROCHE', 'WARNING', 'Échéance proche', projet=self.projet),
+        ]
+        NotificationAlerte.objects.all().delete()
+        cache.clear()
+    
+    def test_mise_en_file_par_destinataire(self):
+        """Test de l'ajout d'une notification par alerte et par destinataire"""
+        # Alertes, routage du projet (projet et équipe), puis insertion groupée (dans un point de sauvegarde)
+        with self.assertNumQueries(6):
+            notifier_alertes(self.alertes)
+        notifier_alertes(self.alertes[:1])
+        
+        self.assertEqual(NotificationAlerte.objects.count(), 4)
+        self.assertEqual(
+            set(NotificationAlerte.objects.values_list('destinataire', flat=True)),
+            {'responsable@example.com', 'chef@example.com'}
+        )
+        self.assertEqual(len(mail.outbox), 0)
+    
+    def test_envoi_groupe_par_destinataire(self):
+        """Test de l'envoi d'un seul email par destinataire sur une même connexion"""
+        notifier_alertes(self.alertes)
+        
+        connexion = get_connection()
+        with mock.patch.object(connexion, 'open', wraps=connexion.open) as ouverture:
+            bilan = envoyer_notifications_en_attente(connexion=connexion)
+        
+        self.assertEqual(ouverture.call_count, 1)
+        self.assertEqual(bilan, {'messages': 2, 'notifications': 4, 'echecs': 0, 'differees': 0})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['chef@example.com', 'responsable@example.com'])
+        self.assertIn('Budget dépassé', mail.outbox[0].body)
+        self.assertIn('Échéance proche', mail.outbox[0].body)
+        self.assertFalse(NotificationAlerte.objects.exclude(statut='ENVOYEE').exists())
+        self.assertEqual(envoyer_notifications_en_attente(),
+                         {'messages': 0, 'notifications': 0, 'echecs': 0, 'differees': 0})
+    
+    def test_nouvelle_tentative_puis_echec(self):
+        """Test du report d'un envoi échoué puis de son abandon"""
+        notifier_alertes(self.alertes[:1])
+        connexion = get_connection()
+        
+        with mock.patch.object(connexion, 'send_messages', side_effect=OSError('SMTP indisponible')):
+            bilan = envoyer_notifications_en_attente(connexion=connexion)
+        
+        self.assertEqual(bilan['echecs'], 2)
+        notification = NotificationAlerte.objects.first()
+        self.assertEqual((notification.statut, notification.tentatives), ('EN_ATTENTE', 1))
+        self.assertEqual(notification.derniere_erreur, 'SMTP indisponible')
+        self.assertGreater(notification.prochaine_tentative, timezone.now() + timedelta(seconds=50))
+        # Pas de nouvelle tentative avant le délai
+        self.assertEqual(envoyer_notifications_en_attente(connexion=connexion)['echecs'], 0)
+        
+        NotificationAlerte.objects.update(prochaine_tentative=timezone.now())
+        with mock.patch.object(connexion, 'send_messages', side_effect=OSError('SMTP indisponible')):
+            envoyer_notifications_en_attente(connexion=connexion)
+        
+        self.assertEqual(set(NotificationAlerte.objects.values_list('statut', 'tentatives')), {('ECHEC', 2)})
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@override_settings(PETROMONITORE_INCIDENT_SEUIL=3, PETROMONITORE_LIMITE_ALERTES_ENTITE=2,
+                   PETROMONITORE_LIMITE_EMAILS_DESTINATAIRE=1)
+class TempeteAlerteTest(TestCase):
+    """Tests du regroupement des tempêtes d'alertes et des limites de débit"""
+    
+    def setUp(self):
+        cache.clear()
+        self.responsable = User.objects.create_user(
+            email='responsable@example.com', password='testpass123', nom='Resp', prenom='User', role='INGENIEUR'
+        )
+        self.projet = Projet.objects.create(nom='Projet Test', statut='EN_COURS', responsable=self.responsable)
+        self.phase = Phase.objects.create(projet=self.projet, nom='Phase Test', statut='EN_COURS', ordre=1)
+        self.operations = [self.creer_operation(i) for i in range(8)]
+    
+    def creer_operation(self, i):
+        operation = Operation.objects.create(phase=self.phase, nom=f'Op {i}', statut='EN_COURS',
+                                             cout_reel=Decimal('20000.00'))
+        Seuil.objects.create(operation=operation, valeur_verte=Decimal('1.00'),
+                             valeur_jaune=Decimal('2.00'), valeur_rouge=Decimal('30000.00'))
+        return operation
+    
+    def test_tempete_regroupee_en_incident(self):
+        """Test du regroupement des alertes d'un projet et d'un type au-delà du seuil"""
+        alertes = detecter_toutes_alertes(tranche={'type': 'operations', 'regles': ['SEUIL_OPERATION'],
+                                                   'ids': [operation.pk for operation in self.operations]})
+        
+        self.assertEqual(sorted(alerte.incident for alerte in alertes), [False, False, False, True])
+        incident = Alerte.objects.get(incident=True)
+        self.assertEqual((incident.projet_id, incident.type_alerte), (self.projet.id, 'DEPASSEMENT_SEUIL'))
+        self.assertEqual((incident.nombre_occurrences, incident.niveau), (5, 'WARNING'))
+        self.assertIsNone(incident.operation_id)
+        self.assertEqual(OccurrenceIncident.objects.filter(incident=incident).count(), 5)
+        self.assertEqual(Alerte.objects.count(), 4)
+        self.assertEqual(NotificationAlerte.objects.count(), 4)
+        
+        # Les alertes regroupées ne sont pas regroupées à nouveau
+        self.assertEqual(detecter_toutes_alertes(), [])
+        
+        # Une nouvelle alerte du même type rejoint l'incident ouvert, sans notification
+        creer_alerte('DEPASSEMENT_SEUIL', 'CRITIQUE', 'Seuil ROUGE', projet=self.projet, phase=self.phase,
+                     operation=self.creer_operation(8))
+        incident.refresh_from_db()
+        self.assertEqual((incident.nombre_occurrences, incident.niveau), (6, 'CRITIQUE'))
+        self.assertEqual(NotificationAlerte.objects.count(), 4)
+        
+        # Un incident traité libère les empreintes de ses alertes
+        incident.statut = 'TRAITEE'
+        incident.save()
+        self.assertFalse(OccurrenceIncident.objects.filter(empreinte__isnull=False).exists())
+    
+    def test_incident_traite_depuis_admin(self):
+        """Test que l'action d'administration libère aussi les empreintes des alertes regroupées"""
+        detecter_toutes_alertes(tranche={'type': 'operations', 'regles': ['SEUIL_OPERATION'],
+                                         'ids': [operation.pk for operation in self.operations]})
+        self.assertTrue(OccurrenceIncident.objects.filter(empreinte__isnull=False).exists())
+        
+        # Module enregistré sur un site d'administration distinct (Alerte l'est déjà sur le site par défaut)
+        with mock.patch('django.contrib.admin.sites.site', admin.AdminSite()):
+            from .admin import AlerteAdmin
+        requete = RequestFactory().post('/admin/')
+        requete.user = self.responsable
+        modele_admin = AlerteAdmin(Alerte, admin.site)
+        with mock.patch.object(modele_admin, 'message_user'):
+            modele_admin.marquer_comme_traitees(requete, Alerte.objects.all())
+        
+        self.assertFalse(Alerte.objects.exclude(statut='TRAITEE').exists())
+        self.assertFalse(Alerte.objects.filter(empreinte__isnull=False).exists())
+        self.assertFalse(OccurrenceIncident.objects.filter(empreinte__isnull=False).exists())
+    
+    def test_limite_par_entite(self):
+        """Test du regroupement des alertes répétées d'une même entité"""
+        for i in range(2):
+            alerte = creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', f'Budget {i}', projet=self.projet)
+            self.assertFalse(alerte.incident)
+            alerte.statut = 'TRAITEE'
+            alerte.save()
+        
+        alerte = creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget 2', projet=self.projet)
+        self.assertTrue(alerte.incident)
+        self.assertEqual(alerte.nombre_occurrences, 1)
+    
+    def test_limite_par_destinataire(self):
+        """Test du report des emails d'un destinataire au-delà de sa limite"""
+        creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget', projet=self.projet)
+        self.assertEqual(envoyer_notifications_en_attente()['messages'], 1)
+        
+        creer_alerte('ECHEANCE_PROCHE', 'WARNING', 'Échéance', projet=self.projet)
+        creer_alerte('PROGRESSION_FAIBLE', 'WARNING', 'Progression', projet=self.projet)
+        bilan = envoyer_notifications_en_attente()
+        
+        self.assertEqual((bilan['messages'], bilan['differees']), (0, 2))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(NotificationAlerte.objects.filter(statut='EN_ATTENTE', tentatives=0).count(), 2)
+        self.assertFalse(NotificationAlerte.objects.filter(prochaine_tentative__lte=timezone.now()).exists())
+
+
+    def test_differees_hors_echec_connexion(self):
+        """Test que les notifications différées ne sont pas comptées en échec si la connexion échoue"""
+        creer_alerte('DEPASSEMENT_BUDGET', 'WARNING', 'Budget', projet=self.projet)
+        envoyer_notifications_en_attente()
+        creer_alerte('ECHEANCE_PROCHE', 'WARNING', 'Échéance', projet=self.projet)
+        
+        connexion = get_connection()
+        fenetre = FenetreGlissante('destinataire')
+        avant = timezone.now()
+        with mock.patch.object(connexion, 'open', side_effect=OSError('SMTP indisponible')):
+            bilan = envoyer_notifications_en_attente(connexion=connexion)
+        
+        self.assertEqual((bilan['echecs'], bilan['differees']), (0, 1))
+        notification = NotificationAlerte.objects.get(statut='EN_ATTENTE')
+        self.assertEqual((notification.tentatives, notification.derniere_erreur), (0, None))
+        # Reportée à la fin de la fenêtre de limitation, et non au délai de nouvelle tentative
+        self.assertIn(notification.prochaine_tentative, {fenetre.fin_fenetre(avant), fenetre.fin_fenetre(timezone.now())})
+
+
+class DestinatairesAlerteTest(TestCase):
+    """Tests de la résolution mise en cache des destinataires des alertes"""
+    
+    def setUp(self):
+        cache.clear()
+        self.responsable = User.objects.create_user(
+            email='responsable@example.com', password='testpass123', nom='Resp', prenom='User', role='INGENIEUR'
+        )
+        self.expert = User.objects.create_user(
+            email='expert@example.com', password='testpass123', nom='Expert', prenom='User', role='EXPERT'
+        )
+        self.projets = [
+            Projet.objects.create(nom=f'Projet {i}', statut='EN_COURS', responsable=self.responsable)
+            for i in range(2)
+        ]
+        self.alertes = [
+            Alerte.objects.create(projet=self.projets[i % 2], type_alerte='DEPASSEMENT_SEUIL', niveau='CRITIQUE',
+                                  message=f'Alerte {i}')
+            for i in range(20)
+        ]
+    
+    def destinataires(self):
+        return set().union(*resoudre_destinataires(self.alertes).values())
+    
+    def test_lot_resolu_en_requetes_fixes(self):
+        """Test de la résolution d'un lot en un nombre fixe de requêtes, puis depuis le cache"""
+        # Responsables des projets, équipes, experts
+        with self.assertNumQueries(3):
+            destinataires = resoudre_destinataires(self.alertes)
+        with self.assertNumQueries(0):
+            self.assertEqual(resoudre_destinataires(self.alertes), destinataires)
+        
+        self.assertEqual(destinataires[self.alertes[0].pk], {'responsable@example.com', 'expert@example.com'})
+    
+    def test_invalidation_du_routage(self):
+        """Test de l'invalidation du cache par les équipes, utilisateurs et responsables"""
+        self.destinataires()
+        
+        chef = User.objects.create_user(
+            email='chef@example.com', password='testpass123', nom='Chef', prenom='User', role='INGENIEUR'
+        )
+        membre = EquipeProjet.objects.create(projet=self.projets[0], utilisateur=chef, role_projet='CHEF_PROJET')
+        self.assertIn('chef@example.com', self.destinataires())
+        
+        chef.email = 'chef.projet@example.com'
+        chef.save()
+        self.assertIn('chef.projet@example.com', self.destinataires())
+        
+        membre.delete()
+        self.assertNotIn('chef.projet@example.com', self.destinataires())
+        
+        projet = Projet.objects.get(pk=self.projets[1].pk)
+        projet.responsable = chef
+        projet.save()
+        self.assertIn('chef.projet@example.com', self.destinataires())
+        
+        expert = User.objects.get(pk=self.expert.pk)
+        expert.statut = 'INACTIF'
+        expert.save()
+        self.assertNotIn('expert@example.com', self.destinataires())
+        
+        # Sauvegarde sans changement de routage : le cache est conservé
+        self.destinataires()
+        chef = User.objects.get(pk=chef.pk)
+        chef.save()
+        with self.assertNumQueries(0):
+            self.destinataires()
+
+
+@override_settings(PETROMONITORE_FLUX_INTERVALLE=60, PETROMONITORE_FLUX_MAINTIEN=60)
+class FluxAlerteTest(TestCase):
+    """Tests du flux Server-Sent Events des nouvelles alertes"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='flux@example.com', password='testpass123', nom='Flux', prenom='User', role='EXPERT'
+        )
+        self.jeton = str(RefreshToken.for_user(self.user).access_token)
+        self.projet = Projet.objects.create(nom='Projet Flux', statut='EN_COURS')
+        self.autre = Projet.objects.create(nom='Autre Projet', statut='EN_COURS')
+        self.alertes = [
+            Alerte.objects.create(projet=projet, type_alerte='DEPASSEMENT_BUDGET', niveau=niveau, message=message)
+            for projet, niveau, message in [
+                (self.projet, 'WARNING', 'Première'),
+                (self.projet, 'CRITIQUE', 'Deuxième'),
+                (self.autre, 'CRITIQUE', 'Autre projet'),
+                (self.projet, 'CRITIQUE', 'Troisième'),
+            ]
+        ]
+    
+    @staticmethod
+    def donnees(evenement):
+        lignes = dict(ligne.split(': ', 1) for ligne in evenement.strip().split('\n'))
+        return int(lignes['id']), json.loads(lignes['data'])
+    
+    def test_flux_authentification_requise(self):
+        """Test du refus du flux sans jeton valide"""
+        url = reverse('alerts:flux-alertes')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(url, {'token': 'invalide'}).status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    async def test_reprise_depuis_last_event_id_avec_filtres(self):
+        """Test du rattrapage des alertes postérieures au Last-Event-ID, filtrées par projet et niveau"""
+        response = await AsyncClient().get(
+            reverse('alerts:flux-alertes'),
+            {'token': self.jeton, 'projet': str(self.projet.id), 'niveau': 'CRITIQUE'},
+            headers={'Last-Event-ID': str(self.alertes[0].id)},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        contenu = aiter(response.streaming_content)
+        self.assertTrue((await anext(contenu)).startswith(b'retry:'))
+        recues = [self.donnees((await anext(contenu)).decode()) for _ in range(2)]
+        self.assertEqual([identifiant for identifiant, _ in recues], [self.alertes[1].id, self.alertes[3].id])
+        self.assertEqual(recues[1][1]['message'], 'Troisième')
+        await contenu.aclose()
+    
+    async def test_diffusion_unique_aux_abonnes(self):
+        """Test de la diffusion, en une requête, des nouvelles alertes à tous les abonnés filtrés"""
+        tous = flux_evenements()
+        critiques = flux_evenements(projet_ids=[self.autre.id], niveaux=['CRITIQUE'])
+        await anext(tous)
+        await anext(critiques)
+        instance = diffuseur()
+        while instance.curseur is None:
+            await asyncio.sleep(0)
+        self.assertEqual(len(instance.abonnes), 2)
+        
+        nouvelles = [
+            await sync_to_async(Alerte.objects.create)(projet=projet, type_alerte='DEPASSEMENT_SEUIL',
+                                                       niveau='CRITIQUE', message=message)
+            for projet, message in [(self.projet, 'Nouvelle'), (self.autre, 'Nouvelle autre')]
+        ]
+        with mock.patch('PetroMonitore.alerts.flux.charger_alertes', wraps=charger_alertes) as chargement:
+            await instance.interroger()
+        self.assertEqual(chargement.call_count, 1)
+        
+        recues = [self.donnees(await asyncio.wait_for(anext(tous), 1))[0] for _ in range(2)]
+        self.assertEqual(recues, [alerte.id for alerte in nouvelles])
+        self.assertEqual(self.donnees(await asyncio.wait_for(anext(critiques), 1))[0], nouvelles[1].id)
+        
+        # Une alerte n'est publiée qu'une fois malgré le recouvrement des requêtes
+        await instance.interroger()
+        self.assertTrue(all(abonnement.file.empty() for abonnement in instance.abonnes))
+        
+        await tous.aclose()
+        await critiques.aclose()
+        self.assertEqual(instance.abonnes, set())
+
 
 class AlerteAPITest(APITestCase):
     """Tests pour l'API des alertes"""
@@ -277,11 +1067,69 @@ class AlerteAPITest(APITestCase):
         self.projet.save()
         
         url = reverse('alerts:detecter-alertes-automatiques')
-        response = self.client.post(url)
+        app = executer_detection_alertes.app
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url)
+        finally:
+            app.conf.task_always_eager = eager
         
+        # Détection planifiée, exécutée en tâche de fond
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['detection']['statut'], 'EN_ATTENTE')
+        
+        response = self.client.get(response.data['url_statut'])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['statut'], 'TERMINEE')
+        self.assertEqual(response.data['progression'], 100.0)
+        self.assertIsNotNone(response.data['duree'])
         # Vérifier qu'au moins une alerte a été créée
-        self.assertTrue('alertes' in response.data)
+        self.assertGreaterEqual(response.data['alertes_creees'], 1)
+        self.assertIn('violations', response.data['statistiques']['budget_projet'])
+    
+    def test_detections_concurrentes_regroupees(self):
+        """Test que les déclenchements concurrents rejoignent la détection active"""
+        url = reverse('alerts:detecter-alertes-automatiques')
+        premiere = self.client.post(url)
+        seconde = self.client.post(url)
+        
+        self.assertEqual(seconde.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(seconde.data['detection']['id'], premiere.data['detection']['id'])
+        self.assertEqual(seconde.data['detection']['nombre_demandes'], 2)
+        self.assertEqual(DetectionAlertes.objects.count(), 1)
+        
+        # Une fois terminée, une nouvelle demande crée une nouvelle détection
+        executer_detection_alertes(premiere.data['detection']['id'])
+        self.assertEqual(DetectionAlertes.objects.get().statut, 'TERMINEE')
+        troisieme = self.client.post(url)
+        self.assertNotEqual(troisieme.data['detection']['id'], premiere.data['detection']['id'])
+        
+        # Une détection active sans progression est abandonnée
+        DetectionAlertes.objects.filter(pk=troisieme.data['detection']['id']).update(
+            date_maj=timezone.now() - timedelta(hours=2)
+        )
+        quatrieme = self.client.post(url)
+        self.assertNotEqual(quatrieme.data['detection']['id'], troisieme.data['detection']['id'])
+        self.assertEqual(DetectionAlertes.objects.get(pk=troisieme.data['detection']['id']).statut, 'ECHEC')
+        
+        response = self.client.get(reverse('alerts:detection-alertes', kwargs={'pk': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_detection_en_echec(self):
+        """Test qu'une erreur de détection termine la détection en échec"""
+        response = self.client.post(reverse('alerts:detecter-alertes-automatiques'))
+        detection_id = response.data['detection']['id']
+        
+        with mock.patch('PetroMonitore.alerts.utils.upsert_alertes', side_effect=DatabaseError('Table verrouillée')):
+            executer_detection_alertes(detection_id)
+        
+        detection = DetectionAlertes.objects.get(pk=detection_id)
+        self.assertEqual((detection.statut, detection.erreur), ('ECHEC', 'Table verrouillée'))
+        self.assertEqual(detection.tranches_terminees, 0)
+        self.assertIsNone(detection.active)
 
 
 class AlerteAuthenticationTest(APITestCase):
@@ -19,6 +19,10 @@ urlpatterns = [
     path('historique/', views.historique_alertes, name='historique-alertes'),
     path('tableau-bord/', views.alertes_tableau_bord, name='alertes-tableau-bord'),
     
+    # Flux temps réel des nouvelles alertes (Server-Sent Events)
+    path('flux/', views.flux_alertes, name='flux-alertes'),
+    
     # Détection automatique
     path('detecter-automatiques/', views.detecter_alertes_automatiques, name='detecter-alertes-automatiques'),
+    path('detecter-automatiques/<int:pk>/', views.detection_alertes, name='detection-alertes'),
 ]
\ No newline at end of file
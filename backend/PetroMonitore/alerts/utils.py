@@ -1,32 +1,47 @@
 # PteroMonitore/alerts/utils.py
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncWeek
+from contextlib import contextmanager
 from datetime import timedelta
 import logging
+import time
 
-from ..models import Alerte, Projet, Phase, Operation, Seuil
+from ..models import (
+    AgregatAlertesSemaine, Alerte, DetectionAlertes, EvaluationAlerteEnAttente, NotificationAlerte, OccurrenceIncident,
+    Projet, Phase, Operation, SemaineAlertesAgregee, Seuil, REGLES_ALERTES_OPERATION, REGLES_ALERTES_PROJET,
+    valeurs_alertes
+)
+from .archivage import archiver_alertes
+from .destinataires import resoudre_destinataires
+from .flux import reveiller_flux
+from .limitation import FenetreGlissante
+from .regles import REGLES, STATUTS_ACTIFS
 
 logger = logging.getLogger(__name__)
 
 
 def creer_alerte(type_alerte, niveau, message, projet=None, phase=None, operation=None):
     """
-    Créer une nouvelle alerte
+    Créer une nouvelle alerte, ou mettre à jour le niveau et le message de
+    l'alerte ouverte de même empreinte (entité, type)
     """
     try:
-        alerte = Alerte.objects.create(
+        alerte, creee = upsert_alerte(Alerte(
             projet=projet,
             phase=phase,
             operation=operation,
             type_alerte=type_alerte,
             niveau=niveau,
             message=message
-        )
+        ))
         
         # Envoyer notification
-        envoyer_notification_alerte(alerte)
+        if creee:
+            envoyer_notification_alerte(alerte)
         
         return alerte
         
@@ -35,86 +50,43 @@ def creer_alerte(type_alerte, niveau, message, projet=None, phase=None, operatio
         return None
 
 
+# Statuts des alertes encore ouvertes (une nouvelle alerte du même type n'est pas créée)
+STATUTS_ALERTE_OUVERTE = ['NON_LU', 'LU']
+
+TYPES_ALERTES_PROJET = ('DEPASSEMENT_BUDGET', 'DEPASSEMENT_DELAI', 'ECHEANCE_PROCHE', 'PROGRESSION_FAIBLE')
+TYPES_ALERTES_OPERATION = ('DEPASSEMENT_SEUIL', 'OPERATION_RETARD')
+
+
+def _signaler(alerte, alertes_creees):
+    """
+    Enregistre par upsert l'alerte d'une règle déclenchée ; seule une alerte
+    nouvellement créée est notifiée et ajoutée à alertes_creees
+    """
+    alerte, creee = upsert_alerte(alerte)
+    if creee:
+        envoyer_notification_alerte(alerte)
+        alertes_creees.append(alerte)
+
+
+def _appliquer_regles(noms, filtre):
+    """
+    Évalue des règles du registre sur les objets du filtre et enregistre leurs alertes
+    """
+    alertes_creees = []
+    aujourd_hui = timezone.now().date()
+    for nom in noms:
+        for _, alerte in REGLES[nom].alertes(aujourd_hui, filtre):
+            _signaler(alerte, alertes_creees)
+    return alertes_creees
+
+
 def verifier_seuils_projet(projet):
     """
     Vérifier les seuils d'un projet et créer des alertes si nécessaire
     """
-    alertes_creees = []
-    
     try:
-        # Vérification budget
-        if (projet.budget_initial and projet.cout_actuel and 
-            projet.seuil_alerte_cout):
-            
-            pourcentage_utilise = (projet.cout_actuel / projet.budget_initial) * 100
-            
-            if pourcentage_utilise >= projet.seuil_alerte_cout:
-                # Vérifier si une alerte similaire n'existe pas déjà
-                alerte_existante = Alerte.objects.filter(
-                    projet=projet,
-                    type_alerte='DEPASSEMENT_BUDGET',
-                    statut__in=['NON_LU', 'LU']
-                ).exists()
-                
-                if not alerte_existante:
-                    niveau = 'CRITIQUE' if pourcentage_utilise >= 100 else 'WARNING'
-                    message = f"Budget utilisé à {pourcentage_utilise:.1f}% ({projet.cout_actuel}€ / {projet.budget_initial}€)"
-                    
-                    alerte = creer_alerte(
-                        'DEPASSEMENT_BUDGET',
-                        niveau,
-                        message,
-                        projet=projet
-                    )
-                    
-                    if alerte:
-                        alertes_creees.append(alerte)
-        
-        # Vérification délais
-        if projet.date_fin_prevue and projet.statut in ['EN_COURS', 'PLANIFIE']:
-            aujourd_hui = timezone.now().date()
-            jours_restants = (projet.date_fin_prevue - aujourd_hui).days
-            
-            # Alerte si dépassement ou proche du dépassement
-            if jours_restants <= 0:
-                alerte_existante = Alerte.objects.filter(
-                    projet=projet,
-                    type_alerte='DEPASSEMENT_DELAI',
-                    statut__in=['NON_LU', 'LU']
-                ).exists()
-                
-                if not alerte_existante:
-                    message = f"Projet en retard de {abs(jours_restants)} jour(s)"
-                    alerte = creer_alerte(
-                        'DEPASSEMENT_DELAI',
-                        'CRITIQUE',
-                        message,
-                        projet=projet
-                    )
-                    
-                    if alerte:
-                        alertes_creees.append(alerte)
-            
-            elif jours_restants <= 7:  # Alerte 7 jours avant
-                alerte_existante = Alerte.objects.filter(
-                    projet=projet,
-                    type_alerte='ECHEANCE_PROCHE',
-                    statut__in=['NON_LU', 'LU']
-                ).exists()
-                
-                if not alerte_existante:
-                    message = f"Échéance dans {jours_restants} jour(s)"
-                    alerte = creer_alerte(
-                        'ECHEANCE_PROCHE',
-                        'WARNING',
-                        message,
-                        projet=projet
-                    )
-                    
-                    if alerte:
-                        alertes_creees.append(alerte)
-        
-        return alertes_creees
+        # Vérification budget, puis délais (une alerte ouverte identique est mise à jour)
+        return _appliquer_regles(('BUDGET_PROJET', 'DELAI_PROJET'), Q(pk=projet.pk))
         
     except Exception as e:
         logger.error(f"Erreur lors de la vérification des seuils du projet {projet.id}: {str(e)}")
@@ -125,76 +97,9 @@ def verifier_seuils_operation(operation):
     """
     Vérifier les seuils d'une opération
     """
-    alertes_creees = []
-    
     try:
-        # Récupérer les seuils de l'opération
-        seuils = operation.seuils.first()
-        
-        if seuils and operation.cout_reel:
-            niveau_alerte = None
-            couleur_seuil = None
-            
-            # Déterminer le niveau d'alerte basé sur les seuils
-            if operation.cout_reel >= seuils.valeur_rouge:
-                niveau_alerte = 'CRITIQUE'
-                couleur_seuil = 'ROUGE'
-            elif operation.cout_reel >= seuils.valeur_jaune:
-                niveau_alerte = 'WARNING'
-                couleur_seuil = 'JAUNE'
-            elif operation.cout_reel <= seuils.valeur_verte:
-                couleur_seuil = 'VERT'
-            
-            if niveau_alerte:
-                # Vérifier si une alerte similaire n'existe pas déjà
-                alerte_existante = Alerte.objects.filter(
-                    operation=operation,
-                    type_alerte='DEPASSEMENT_SEUIL',
-                    statut__in=['NON_LU', 'LU']
-                ).exists()
-                
-                if not alerte_existante:
-                    message = f"Seuil {couleur_seuil} dépassé: {operation.cout_reel}€ (Seuil: {seuils.valeur_rouge if niveau_alerte == 'CRITIQUE' else seuils.valeur_jaune}€)"
-                    
-                    alerte = creer_alerte(
-                        'DEPASSEMENT_SEUIL',
-                        niveau_alerte,
-                        message,
-                        projet=operation.phase.projet,
-                        phase=operation.phase,
-                        operation=operation
-                    )
-                    
-                    if alerte:
-                        alertes_creees.append(alerte)
-        
-        # Vérifier les délais de l'opération
-        if operation.date_fin_prevue and operation.statut in ['EN_COURS', 'PLANIFIE']:
-            aujourd_hui = timezone.now().date()
-            jours_restants = (operation.date_fin_prevue - aujourd_hui).days
-            
-            if jours_restants <= 0:
-                alerte_existante = Alerte.objects.filter(
-                    operation=operation,
-                    type_alerte='OPERATION_RETARD',
-                    statut__in=['NON_LU', 'LU']
-                ).exists()
-                
-                if not alerte_existante:
-                    message = f"Opération en retard de {abs(jours_restants)} jour(s)"
-                    alerte = creer_alerte(
-                        'OPERATION_RETARD',
-                        'CRITIQUE',
-                        message,
-                        projet=operation.phase.projet,
-                        phase=operation.phase,
-                        operation=operation
-                    )
-                    
-                    if alerte:
-                        alertes_creees.append(alerte)
-        
-        return alertes_creees
+        # Seuil de coût (premier seuil de l'opération), puis délais
+        return _appliquer_regles(('SEUIL_OPERATION', 'DELAI_OPERATION'), Q(pk=operation.pk))
         
     except Exception as e:
         logger.error(f"Erreur lors de la vérification des seuils de l'opération {operation.id}: {str(e)}")
@@ -205,134 +110,674 @@ def verifier_progression_anormale(projet):
     """
     Vérifier les progressions anormales (progression faible par rapport au temps écoulé)
     """
-    alertes_creees = []
-    
     try:
-        if projet.date_debut and projet.date_fin_prevue:
-            aujourd_hui = timezone.now().date()
-            duree_totale = (projet.date_fin_prevue - projet.date_debut).days
-            duree_ecoulee = (aujourd_hui - projet.date_debut).days
-            
-            if duree_totale > 0:
-                progression_attendue = (duree_ecoulee / duree_totale) * 100
-                
-                # Calculer la progression moyenne des phases
-                phases = projet.phases.all()
-                if phases:
-                    progression_reelle = sum(phase.progression for phase in phases) / len(phases)
-                    
-                    # Alerte si la progression réelle est très en retard
-                    if progression_reelle < progression_attendue - 20:  # 20% de retard
-                        alerte_existante = Alerte.objects.filter(
-                            projet=projet,
-                            type_alerte='PROGRESSION_FAIBLE',
-                            statut__in=['NON_LU', 'LU']
-                        ).exists()
-                        
-                        if not alerte_existante:
-                            message = f"Progression faible: {progression_reelle:.1f}% (attendu: {progression_attendue:.1f}%)"
-                            alerte = creer_alerte(
-                                'PROGRESSION_FAIBLE',
-                                'WARNING',
-                                message,
-                                projet=projet
-                            )
-                            
-                            if alerte:
-                                alertes_creees.append(alerte)
-        
-        return alertes_creees
+        return _appliquer_regles(('PROGRESSION_PROJET',), Q(pk=projet.pk))
         
     except Exception as e:
         logger.error(f"Erreur lors de la vérification de progression du projet {projet.id}: {str(e)}")
         return []
 
 
-def detecter_toutes_alertes():
+def charger_cles_alertes_ouvertes(filtre=None):
     """
-    Détecter toutes les alertes automatiquement
+    Clés (cible, identifiant, type_alerte) des alertes ouvertes, en une requête :
+    ('projet', projet_id, type) pour les règles de projet et
+    ('operation', operation_id, type) pour les règles d'opération
+    
+    Args:
+        filtre: Q optionnel restreignant les alertes chargées (tranche de détection)
     """
-    alertes_creees = []
+    cles = set()
+    alertes = Alerte.objects.filter(
+        statut__in=STATUTS_ALERTE_OUVERTE,
+        type_alerte__in=TYPES_ALERTES_PROJET + TYPES_ALERTES_OPERATION
+    )
+    if filtre is not None:
+        alertes = alertes.filter(filtre)
+    alertes = alertes.values_list('projet_id', 'operation_id', 'type_alerte')
+    
+    for projet_id, operation_id, type_alerte in alertes:
+        if type_alerte in TYPES_ALERTES_OPERATION:
+            if operation_id:
+                cles.add(('operation', operation_id, type_alerte))
+        elif projet_id:
+            cles.add(('projet', projet_id, type_alerte))
+    
+    # Alertes regroupées dans un incident ouvert (peu nombreuses : non filtrées)
+    for empreinte in OccurrenceIncident.objects.filter(empreinte__isnull=False).values_list('empreinte', flat=True):
+        cible, identifiant, type_alerte = empreinte.split(':')
+        cles.add((cible, int(identifiant), type_alerte))
+    return cles
+
+
+@contextmanager
+def _mesurer(statistiques, regle):
+    """
+    Cumule la durée d'une étape de la détection dans statistiques[regle]
+    """
+    entree = statistiques.setdefault(regle, {'duree': 0.0, 'alertes': 0})
+    debut = time.perf_counter()
+    try:
+        yield entree
+    finally:
+        entree['duree'] += time.perf_counter() - debut
+
+
+def upsert_alertes(alertes, taille_lot=500):
+    """
+    Enregistre des alertes ouvertes dédoublonnées par leur empreinte (index unique) :
+    insertion en lot, et pour une empreinte déjà ouverte (alerte concurrente),
+    mise à jour du niveau et du message de l'alerte existante. Pendant une
+    tempête, les nouvelles alertes sont regroupées en incidents (regrouper_alertes)
+    
+    Returns:
+        (alertes et incidents créés, alertes existantes mises à jour), avec leur identifiant
+    """
+    uniques = {}
+    for alerte in alertes:
+        alerte.empreinte = alerte.calculer_empreinte()
+        uniques[alerte.empreinte] = alerte
+    if not uniques:
+        return [], []
+    
+    # Empreintes déjà ouvertes (mises à jour) ou déjà regroupées dans un incident ouvert (ignorées)
+    ouvertes = set(Alerte.objects.filter(empreinte__in=list(uniques)).values_list('empreinte', flat=True))
+    regroupees = set(OccurrenceIncident.objects.filter(empreinte__in=list(uniques))
+                     .values_list('empreinte', flat=True))
+    nouvelles, incidents = regrouper_alertes(
+        [alerte for empreinte, alerte in uniques.items() if empreinte not in ouvertes | regroupees]
+    )
+    mises_a_jour, fermees = _mettre_a_jour_alertes(
+        [alerte for empreinte, alerte in uniques.items() if empreinte in ouvertes], taille_lot
+    )
+    creees, concurrentes = _inserer_alertes(nouvelles + fermees, taille_lot)
+    mises_a_jour += concurrentes
+    creees += enregistrer_incidents(incidents)
+    if creees:
+        # Flux SSE des nouvelles alertes de ce processus
+        transaction.on_commit(reveiller_flux)
+        
+        # Instantanés des tableaux de bord des projets alertés
+        from ..recalculs import demander_recalcul, differer_recalculs
+        with differer_recalculs():
+            demander_recalcul('INSTANTANES_PROJET', {alerte.projet_id for alerte in creees})
+            demander_recalcul('INSTANTANES_PHASE', {alerte.phase_id for alerte in creees})
+            demander_recalcul('INSTANTANES_OPERATION', {alerte.operation_id for alerte in creees})
+    return creees, mises_a_jour
+
+
+def _mettre_a_jour_alertes(alertes, taille_lot):
+    """
+    Met à jour en une requête le niveau et le message des alertes ouvertes de
+    même empreinte que des alertes détectées
+    
+    Returns:
+        (alertes existantes, alertes détectées dont l'alerte a été fermée entre-temps, à insérer)
+    """
+    if not alertes:
+        return [], []
+    
+    existantes = {alerte.empreinte: alerte
+                  for alerte in Alerte.objects.filter(empreinte__in=[alerte.empreinte for alerte in alertes])}
+    modifiees, fermees = [], []
+    for alerte in alertes:
+        existante = existantes.get(alerte.empreinte)
+        if existante is None:
+            fermees.append(alerte)
+        elif (existante.niveau, existante.message) != (alerte.niveau, alerte.message):
+            existante.niveau, existante.message = alerte.niveau, alerte.message
+            modifiees.append(existante)
+    if modifiees:
+        Alerte.objects.bulk_update(modifiees, ['niveau', 'message'], batch_size=taille_lot)
+    return list(existantes.values()), fermees
+
+
+def _inserer_alertes(alertes, taille_lot):
+    if not alertes:
+        return [], []
     
+    # Cas courant : aucune alerte ouverte entre-temps par un détecteur concurrent, une seule insertion
     try:
-        # Vérifier tous les projets actifs
-        projets_actifs = Projet.objects.filter(
-            statut__in=['EN_COURS', 'PLANIFIE']
+        with transaction.atomic():
+            Alerte.objects.bulk_create(alertes, batch_size=taille_lot)
+        return _recharger_identifiants(alertes), []
+    except IntegrityError:
+        pass
+    
+    creees, mises_a_jour = [], []
+    for alerte in alertes:
+        alerte.pk = None
+        alerte._state.adding = True
+        try:
+            with transaction.atomic():
+                alerte.save(force_insert=True)
+            creees.append(alerte)
+        except IntegrityError:
+            existante = Alerte.objects.filter(empreinte=alerte.empreinte).first()
+            if existante is None:
+                continue
+            if (existante.niveau, existante.message) != (alerte.niveau, alerte.message):
+                Alerte.objects.filter(pk=existante.pk).update(niveau=alerte.niveau, message=alerte.message)
+                existante.niveau, existante.message = alerte.niveau, alerte.message
+            mises_a_jour.append(existante)
+    return creees, mises_a_jour
+
+
+# Ordre des niveaux d'alerte, pour le niveau d'un incident
+RANG_NIVEAUX = {'INFO': 0, 'WARNING': 1, 'CRITIQUE': 2}
+
+
+def regrouper_alertes(alertes):
+    """
+    Limitation des tempêtes d'alertes, avant leur enregistrement : sur la fenêtre
+    glissante (PETROMONITORE_FENETRE_LIMITATION), au-delà de
+    PETROMONITORE_INCIDENT_SEUIL alertes d'un même projet et d'un même type, ou de
+    PETROMONITORE_LIMITE_ALERTES_ENTITE alertes d'une même entité, les nouvelles
+    alertes sont regroupées dans un incident du projet au lieu d'être créées et
+    notifiées une à une ; tant que cet incident est ouvert, il regroupe toutes
+    les nouvelles alertes de ce projet et de ce type
+    
+    Args:
+        alertes: Nouvelles alertes (empreinte calculée)
+    
+    Returns:
+        (alertes à créer, dictionnaire (projet_id, type_alerte) -> alertes à regrouper)
+    """
+    groupes = FenetreGlissante('groupe')
+    entites = FenetreGlissante('entite')
+    seuil_groupe = getattr(settings, 'PETROMONITORE_INCIDENT_SEUIL', 10)
+    limite_entite = getattr(settings, 'PETROMONITORE_LIMITE_ALERTES_ENTITE', 5)
+    
+    concernees = [alerte for alerte in alertes if alerte.projet_id]
+    if not concernees:
+        return list(alertes), {}
+    
+    def cle_groupe(alerte):
+        return f"{alerte.projet_id}:{alerte.type_alerte}"
+    
+    def cle_entite(alerte):
+        return alerte.empreinte.rsplit(':', 1)[0]
+    
+    incidents_ouverts = set(Alerte.objects.filter(
+        incident=True, statut__in=STATUTS_ALERTE_OUVERTE,
+        projet_id__in={alerte.projet_id for alerte in concernees}
+    ).values_list('projet_id', 'type_alerte'))
+    comptes_groupes = groupes.compter({cle_groupe(alerte) for alerte in concernees})
+    comptes_entites = entites.compter({cle_entite(alerte) for alerte in concernees})
+    
+    a_creer, regroupees = [], {}
+    ajouts_groupes, ajouts_entites = {}, {}
+    for alerte in alertes:
+        if not alerte.projet_id:
+            a_creer.append(alerte)
+            continue
+        
+        groupe, entite = cle_groupe(alerte), cle_entite(alerte)
+        cle_incident = (alerte.projet_id, alerte.type_alerte)
+        if (cle_incident in incidents_ouverts or comptes_groupes[groupe] >= seuil_groupe
+                or comptes_entites[entite] >= limite_entite):
+            incidents_ouverts.add(cle_incident)
+            regroupees.setdefault(cle_incident, []).append(alerte)
+            continue
+        
+        a_creer.append(alerte)
+        comptes_groupes[groupe] += 1
+        comptes_entites[entite] += 1
+        ajouts_groupes[groupe] = ajouts_groupes.get(groupe, 0) + 1
+        ajouts_entites[entite] = ajouts_entites.get(entite, 0) + 1
+    
+    groupes.ajouter(ajouts_groupes)
+    entites.ajouter(ajouts_entites)
+    if regroupees:
+        logger.warning(f"Tempête d'alertes: {sum(len(liste) for liste in regroupees.values())} alerte(s) "
+                       f"regroupée(s) dans {len(regroupees)} incident(s)")
+    return a_creer, regroupees
+
+
+def enregistrer_incidents(regroupees):
+    """
+    Enregistre les alertes regroupées comme occurrences de l'incident ouvert de
+    leur projet et de leur type (créé au besoin), et met à jour son compteur,
+    son niveau (le plus élevé) et son message
+    
+    Args:
+        regroupees: Dictionnaire (projet_id, type_alerte) -> alertes, de regrouper_alertes
+    
+    Returns:
+        Les incidents créés (à notifier ; un incident existant n'est pas renotifié)
+    """
+    crees = []
+    for (projet_id, type_alerte), alertes in regroupees.items():
+        niveau = max((alerte.niveau for alerte in alertes), key=lambda niveau: RANG_NIVEAUX.get(niveau, 0))
+        incident = Alerte(projet_id=projet_id, type_alerte=type_alerte, niveau=niveau, incident=True,
+                          message=f"Incident: alertes {type_alerte} regroupées")
+        incident.empreinte = incident.calculer_empreinte()
+        try:
+            with transaction.atomic():
+                incident.save(force_insert=True)
+            crees.append(incident)
+        except IntegrityError:
+            incident = Alerte.objects.get(empreinte=incident.empreinte)
+        
+        occurrences = [
+            OccurrenceIncident(incident=incident, phase_id=alerte.phase_id, operation_id=alerte.operation_id,
+                               niveau=alerte.niveau, message=alerte.message, empreinte=alerte.empreinte)
+            for alerte in alertes
+        ]
+        try:
+            with transaction.atomic():
+                OccurrenceIncident.objects.bulk_create(occurrences)
+            ajoutees = len(occurrences)
+        except IntegrityError:
+            # Alerte regroupée entre-temps par un détecteur concurrent
+            ajoutees = 0
+            for occurrence in occurrences:
+                _, creee = OccurrenceIncident.objects.get_or_create(
+                    empreinte=occurrence.empreinte,
+                    defaults={'incident': incident, 'phase_id': occurrence.phase_id,
+                              'operation_id': occurrence.operation_id, 'niveau': occurrence.niveau,
+                              'message': occurrence.message}
+                )
+                ajoutees += creee
+        
+        incident.nombre_occurrences += ajoutees
+        if RANG_NIVEAUX.get(niveau, 0) > RANG_NIVEAUX.get(incident.niveau, 0):
+            incident.niveau = niveau
+        incident.message = (f"Incident: {incident.nombre_occurrences} alerte(s) {type_alerte} regroupée(s) "
+                            f"- dernière: {alertes[-1].message}")[:500]
+        Alerte.objects.filter(pk=incident.pk).update(
+            nombre_occurrences=F('nombre_occurrences') + ajoutees, niveau=incident.niveau, message=incident.message
         )
+    return crees
+
+
+def upsert_alerte(alerte):
+    """
+    Enregistre une alerte ouverte dédoublonnée par son empreinte
+    
+    Returns:
+        (alerte, True si elle a été créée)
+    """
+    creees, mises_a_jour = upsert_alertes([alerte])
+    if creees:
+        return creees[0], True
+    return (mises_a_jour[0] if mises_a_jour else alerte), False
+
+
+def _recharger_identifiants(alertes):
+    """
+    Relit par empreinte les alertes insérées en lot si la base ne renvoie pas leur identifiant (Oracle)
+    """
+    if all(alerte.pk for alerte in alertes):
+        return alertes
+    return list(Alerte.objects.filter(empreinte__in=[alerte.empreinte for alerte in alertes]))
+
+
+def notifier_alertes(alertes):
+    """
+    Ajoute à la boîte d'envoi les notifications d'alertes déjà enregistrées ;
+    elles sont envoyées par la tâche envoyer_notifications_alertes après la validation
+    
+    Returns:
+        Les notifications ajoutées
+    """
+    if not alertes:
+        return []
+    
+    alertes = list(Alerte.objects.filter(pk__in=[alerte.pk for alerte in alertes]).select_related(
+        'operation__responsable'
+    ))
+    destinataires = resoudre_destinataires(alertes)
+    notifications = [
+        NotificationAlerte(alerte=alerte, destinataire=email)
+        for alerte in alertes for email in sorted(destinataires[alerte.pk])
+    ]
+    if not notifications:
+        return []
+    
+    try:
+        with transaction.atomic():
+            NotificationAlerte.objects.bulk_create(notifications)
+    except IntegrityError:
+        # Notification déjà en file pour ce destinataire
+        for notification in notifications:
+            NotificationAlerte.objects.get_or_create(alerte=notification.alerte,
+                                                     destinataire=notification.destinataire)
+    
+    transaction.on_commit(_planifier_envoi_notifications)
+    return notifications
+
+
+def _planifier_envoi_notifications():
+    from .tasks import envoyer_notifications_alertes
+    try:
+        envoyer_notifications_alertes.delay()
+    except Exception as e:
+        # La tâche périodique videra la boîte d'envoi
+        logger.error(f"Impossible de planifier l'envoi des notifications: {str(e)}")
+
+
+def decouper_detection(taille_tranche=None):
+    """
+    Découpe la détection en tranches indépendantes, dimensionnées par nombre
+    d'opérations et non par projet : un très gros projet est réparti sur
+    plusieurs tranches au lieu de retarder toute la détection
+    
+    - {'type': 'projets', 'ids': [...]} : règles de projet pour ces projets
+    - {'type': 'operations', 'debut': id, 'fin': id} : règles d'opération pour
+      les opérations actives dont l'identifiant est dans l'intervalle
+    
+    Args:
+        taille_tranche: Nombre maximal de projets ou d'opérations par tranche
+                        (par défaut PETROMONITORE_TAILLE_TRANCHE_ALERTES)
+    
+    Returns:
+        La liste des tranches
+    """
+    taille = taille_tranche or getattr(settings, 'PETROMONITORE_TAILLE_TRANCHE_ALERTES', 2000)
+    tranches = []
+    
+    projet_ids = list(
+        Projet.objects.filter(statut__in=STATUTS_ACTIFS).order_by('pk').values_list('pk', flat=True)
+    )
+    for debut in range(0, len(projet_ids), taille):
+        tranches.append({'type': 'projets', 'ids': projet_ids[debut:debut + taille]})
+    
+    operation_ids = list(
+        Operation.objects.filter(statut__in=STATUTS_ACTIFS, phase__projet__statut__in=STATUTS_ACTIFS)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    for debut in range(0, len(operation_ids), taille):
+        lot = operation_ids[debut:debut + taille]
+        tranches.append({'type': 'operations', 'debut': lot[0], 'fin': lot[-1]})
+    
+    return tranches
+
+
+def detecter_toutes_alertes(statistiques=None, notifier=True, tranche=None, lever=False):
+    """
+    Détecter toutes les alertes automatiquement, de façon ensembliste : chaque
+    règle du registre (alerts.regles) est évaluée par la base en une requête qui
+    ne renvoie que les objets en violation, les alertes déjà ouvertes sont
+    écartées, puis les nouvelles alertes insérées en lot et notifiées
+    
+    Args:
+        statistiques: Dictionnaire optionnel, rempli pour chaque règle et étape
+                      avec sa durée (secondes), le nombre d'objets en violation
+                      (règles) et le nombre d'alertes créées
+        notifier: False pour ne pas envoyer les notifications
+        tranche: Tranche optionnelle (voir decouper_detection) limitant la
+                 détection aux règles et aux objets de cette tranche ; une
+                 tranche d'opérations peut aussi lister ses 'ids', et toute
+                 tranche restreindre ses 'regles' (REGLES_ALERTES_PROJET
+                 ou REGLES_ALERTES_OPERATION)
+        lever: True pour propager les erreurs au lieu de les journaliser
+               (détections suivies par DetectionAlertes)
+    
+    Returns:
+        La liste des alertes créées
+    """
+    statistiques = {} if statistiques is None else statistiques
+    type_tranche = tranche['type'] if tranche else None
+    regles = set((tranche or {}).get('regles') or REGLES)
+    if type_tranche == 'projets':
+        regles.difference_update(REGLES_ALERTES_OPERATION)
+    elif type_tranche == 'operations':
+        regles.difference_update(REGLES_ALERTES_PROJET)
+    
+    try:
+        aujourd_hui = timezone.now().date()
+        nouvelles = []
         
-        for projet in projets_actifs:
-            # Vérifier les seuils du projet
-            alertes_creees.extend(verifier_seuils_projet(projet))
-            
-            # Vérifier la progression
-            alertes_creees.extend(verifier_progression_anormale(projet))
-            
-            # Vérifier les opérations du projet
-            operations = Operation.objects.filter(
-                phase__projet=projet,
-                statut__in=['EN_COURS', 'PLANIFIE']
-            )
+        # Périmètre de la tranche
+        filtres, filtre_cles = {}, None
+        if type_tranche == 'projets':
+            filtres[Projet] = Q(pk__in=tranche['ids'])
+            filtre_cles = Q(type_alerte__in=TYPES_ALERTES_PROJET, projet_id__in=tranche['ids'])
+        elif type_tranche == 'operations' and 'ids' in tranche:
+            filtres[Operation] = Q(pk__in=tranche['ids'])
+            filtre_cles = Q(type_alerte__in=TYPES_ALERTES_OPERATION, operation__id__in=tranche['ids'])
+        elif type_tranche == 'operations':
+            filtres[Operation] = Q(pk__range=(tranche['debut'], tranche['fin']))
+            filtre_cles = Q(type_alerte__in=TYPES_ALERTES_OPERATION,
+                            operation__id__range=(tranche['debut'], tranche['fin']))
+        
+        with _mesurer(statistiques, 'chargement'):
+            cles_ouvertes = charger_cles_alertes_ouvertes(filtre_cles)
+        
+        for regle in REGLES.values():
+            if regle.nom not in regles:
+                continue
             
-            for operation in operations:
-                alertes_creees.extend(verifier_seuils_operation(operation))
+            with _mesurer(statistiques, regle.nom.lower()) as entree:
+                violations = regle.alertes(aujourd_hui, filtres.get(regle.modele))
+                entree['violations'] = entree.get('violations', 0) + len(violations)
+                for cible_id, alerte in violations:
+                    cle = (regle.cible, cible_id, alerte.type_alerte)
+                    if cle in cles_ouvertes:
+                        continue
+                    cles_ouvertes.add(cle)
+                    nouvelles.append(alerte)
+                    entree['alertes'] += 1
+        
+        with _mesurer(statistiques, 'ecriture') as entree:
+            # Upsert : une alerte ouverte entre-temps par un détecteur concurrent n'est pas dupliquée
+            alertes_creees, _ = upsert_alertes(nouvelles)
+            entree['alertes'] = len(alertes_creees)
+        
+        # Notifications envoyées une fois toutes les alertes écrites
+        if notifier:
+            with _mesurer(statistiques, 'notification'):
+                notifier_alertes(alertes_creees)
         
         logger.info(f"Détection automatique terminée: {len(alertes_creees)} alertes créées")
+        for etape, entree in statistiques.items():
+            violations = f", {entree['violations']} violation(s)" if 'violations' in entree else ""
+            logger.info(f"Détection - {etape}: {entree['duree'] * 1000:.1f} ms{violations}, "
+                        f"{entree['alertes']} alerte(s)")
         return alertes_creees
         
     except Exception as e:
+        if lever:
+            raise
         logger.error(f"Erreur lors de la détection automatique: {str(e)}")
         return []
 
 
-def envoyer_notification_alerte(alerte):
+def demander_detection(utilisateur=None):
     """
-    Envoyer une notification par email pour une alerte
+    Demande une détection complète des alertes en tâche de fond ; si une
+    détection est déjà en attente ou en cours, la demande la rejoint
+    
+    Returns:
+        (détection, True si elle vient d'être créée)
     """
+    maintenant = timezone.now()
+    expiration = getattr(settings, 'PETROMONITORE_DETECTION_EXPIRATION', 3600)
+    # Détection abandonnée (worker arrêté) : elle ne bloque plus les nouvelles demandes
+    DetectionAlertes.objects.filter(
+        active__isnull=False, date_maj__lt=maintenant - timedelta(seconds=expiration)
+    ).update(active=None, statut='ECHEC', erreur='Détection abandonnée', date_fin=maintenant)
+    
+    for _ in range(2):
+        detection = DetectionAlertes.objects.filter(active=DetectionAlertes.ACTIVE).first()
+        if detection:
+            DetectionAlertes.objects.filter(pk=detection.pk).update(nombre_demandes=F('nombre_demandes') + 1)
+            detection.nombre_demandes += 1
+            return detection, False
+        try:
+            with transaction.atomic():
+                detection = DetectionAlertes.objects.create(active=DetectionAlertes.ACTIVE, demandee_par=utilisateur)
+        except IntegrityError:
+            # Détection créée entre-temps par une demande concurrente
+            continue
+        transaction.on_commit(lambda: _planifier_detection(detection.pk))
+        return detection, True
+    raise RuntimeError("Impossible de demander la détection des alertes")
+
+
+def _planifier_detection(detection_id):
+    from .tasks import executer_detection_alertes
     try:
-        # Déterminer les destinataires
-        destinataires = set()
-        
-        if alerte.projet:
-            # Responsable du projet
-            if alerte.projet.responsable and alerte.projet.responsable.email:
-                destinataires.add(alerte.projet.responsable.email)
-            
-            # Membres de l'équipe projet avec des rôles spécifiques
-            equipe_emails = alerte.projet.membres_equipe.filter(
-                role_projet__in=['CHEF_PROJET', 'RESPONSABLE_TECHNIQUE']
-            ).values_list('utilisateur__email', flat=True)
-            destinataires.update(equipe_emails)
-        
-        if alerte.operation and alerte.operation.responsable:
-            destinataires.add(alerte.operation.responsable.email)
+        executer_detection_alertes.delay(detection_id)
+    except Exception as e:
+        # Détection libérée : une nouvelle demande pourra la relancer
+        logger.error(f"Impossible de planifier la détection des alertes: {str(e)}")
+        DetectionAlertes.objects.filter(pk=detection_id, statut='EN_ATTENTE').update(
+            active=None, statut='ECHEC', erreur=str(e)[:500], date_fin=timezone.now()
+        )
+
+
+def executer_detection(detection_id):
+    """
+    Exécute une détection demandée (demander_detection), tranche par tranche
+    (decouper_detection), en enregistrant sa progression après chaque tranche
+    
+    Returns:
+        La détection, ou None si elle n'est plus en attente
+    """
+    maintenant = timezone.now()
+    if not DetectionAlertes.objects.filter(pk=detection_id, statut='EN_ATTENTE').update(
+        statut='EN_COURS', date_debut=maintenant, date_maj=maintenant
+    ):
+        return None
+    detections = DetectionAlertes.objects.filter(pk=detection_id)
+    
+    try:
+        tranches = decouper_detection()
+        detections.update(tranches=len(tranches))
+        statistiques = {}
+        for tranche in tranches:
+            statistiques_tranche = {}
+            alertes_creees = detecter_toutes_alertes(statistiques=statistiques_tranche, tranche=tranche,
+                                                     lever=True)
+            for etape, entree in statistiques_tranche.items():
+                cumul = statistiques.setdefault(etape, {})
+                for cle, valeur in entree.items():
+                    cumul[cle] = cumul.get(cle, 0) + valeur
+            detections.update(
+                tranches_terminees=F('tranches_terminees') + 1,
+                alertes_creees=F('alertes_creees') + len(alertes_creees),
+                statistiques=statistiques, date_maj=timezone.now()
+            )
+        detections.update(statut='TERMINEE', active=None, date_fin=timezone.now(), date_maj=timezone.now())
         
-        # Ajouter les experts pour les alertes critiques
-        if alerte.niveau == 'CRITIQUE':
-            from ..models import Utilisateur
-            experts_emails = Utilisateur.objects.filter(
-                role='EXPERT',
-                statut='ACTIF'
-            ).values_list('email', flat=True)
-            destinataires.update(experts_emails)
+    except Exception as e:
+        logger.error(f"Erreur lors de la détection {detection_id}: {str(e)}")
+        detections.update(statut='ECHEC', active=None, erreur=str(e)[:500], date_fin=timezone.now(),
+                          date_maj=timezone.now())
+    
+    return detections.first()
+
+
+def marquer_alertes_modifiees(instance, ajout, update_fields=None):
+    """
+    Demande l'évaluation des seules règles d'alerte qui dépendent des champs
+    modifiés d'un projet, d'une phase, d'une opération ou d'un seuil sauvegardé
+    (DEPENDANCES_ALERTES du modèle), par rapport aux valeurs chargées depuis la base
+    
+    Args:
+        instance: L'objet sauvegardé
+        ajout: True si l'objet vient d'être créé
+        update_fields: Les champs sauvegardés (None pour tous)
+    """
+    from ..recalculs import demander_recalcul
+    
+    initiales = getattr(instance, '_alertes_initiales', None) or {}
+    regles = set()
+    for champ, dependantes in instance.DEPENDANCES_ALERTES.items():
+        if update_fields is not None and champ not in update_fields and champ.removesuffix('_id') not in update_fields:
+            continue
+        if not ajout and champ in initiales and initiales[champ] == instance.__dict__.get(champ):
+            continue
+        regles.update(dependantes)
+    instance._alertes_initiales = {**initiales, **valeurs_alertes(instance)}
+    
+    for regle in regles:
+        demander_recalcul(regle, _cibles_evaluation(instance, regle, initiales))
+
+
+def _cibles_evaluation(instance, regle, initiales):
+    """
+    Projets (règles de projet) ou opérations (règles d'opération) à réévaluer
+    après la sauvegarde d'un objet, y compris son ancien parent s'il a changé
+    """
+    if isinstance(instance, Projet):
+        if regle in REGLES_ALERTES_PROJET:
+            return [instance.pk]
+        return Operation.objects.filter(phase__projet_id=instance.pk).values_list('pk', flat=True)
+    if isinstance(instance, Phase):
+        return [instance.projet_id, initiales.get('projet_id')]
+    if isinstance(instance, Seuil):
+        return [instance.operation_id, initiales.get('operation_id')]
+    return [instance.pk]
+
+
+def evaluer_alertes_en_attente(taille_lot=500, statistiques=None, notifier=True):
+    """
+    Évalue les règles d'alerte marquées par les écritures (EvaluationAlerteEnAttente),
+    seulement pour les projets et opérations modifiés, par lots ; les marques
+    ajoutées pendant l'évaluation sont laissées au passage suivant
+    
+    Args:
+        taille_lot: Nombre de marques retirées de la file par lot
+        statistiques: Dictionnaire optionnel, rempli comme par detecter_toutes_alertes
+        notifier: False pour ne pas envoyer les notifications
+    
+    Returns:
+        La liste des alertes créées
+    """
+    statistiques = {} if statistiques is None else statistiques
+    alertes_creees = []
+    dernier_pk = EvaluationAlerteEnAttente.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if dernier_pk is None:
+        return alertes_creees
+    
+    while True:
+        lot = list(EvaluationAlerteEnAttente.objects.filter(pk__lte=dernier_pk).order_by('pk')
+                   .values_list('pk', 'regle', 'objet_id')[:taille_lot])
+        if not lot:
+            return alertes_creees
         
-        # Nettoyer les emails vides
-        destinataires = list(filter(None, destinataires))
+        # Supprimer avant d'évaluer : une modification concurrente remarque l'objet
+        EvaluationAlerteEnAttente.objects.filter(pk__in=[pk for pk, _, _ in lot]).delete()
+        marques = {}
+        for _, regle, objet_id in lot:
+            marques.setdefault(regle, set()).add(objet_id)
         
-        if destinataires:
-            sujet = f"🚨 Alerte {alerte.niveau}: {alerte.type_alerte}"
-            
-            # Construire le message
-            contexte = []
-            if alerte.projet:
-                contexte.append(f"Projet: {alerte.projet.nom}")
-            if alerte.phase:
-                contexte.append(f"Phase: {alerte.phase.nom}")
-            if alerte.operation:
-                contexte.append(f"Opération: {alerte.operation.nom}")
-            
-            message = f"""
-Une nouvelle alerte a été détectée dans le système de monitoring:
+        # Une détection par règle, limitée aux objets marqués
+        for regle, objet_ids in marques.items():
+            tranche = {
+                'type': 'projets' if regle in REGLES_ALERTES_PROJET else 'operations',
+                'ids': sorted(objet_ids),
+                'regles': [regle],
+            }
+            alertes_creees.extend(detecter_toutes_alertes(statistiques, notifier=notifier, tranche=tranche))
 
+
+def envoyer_notification_alerte(alerte):
+    """
+    Ajouter à la boîte d'envoi la notification par email d'une alerte
+    """
+    try:
+        notifier_alertes([alerte])
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise en file de la notification de l'alerte {alerte.id}: {str(e)}")
+
+
+def _corps_alerte(alerte):
+    """
+    Détails et contexte d'une alerte dans un email
+    """
+    contexte = []
+    if alerte.projet:
+        contexte.append(f"Projet: {alerte.projet.nom}")
+    if alerte.phase:
+        contexte.append(f"Phase: {alerte.phase.nom}")
+    if alerte.operation:
+        contexte.append(f"Opération: {alerte.operation.nom}")
+    
+    return f"""
 📋 DÉTAILS DE L'ALERTE
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -343,55 +788,252 @@ Date/Heure: {alerte.date_alerte.strftime('%d/%m/%Y à %H:%M')}
 
 📍 CONTEXTE
 {chr(10).join(contexte) if contexte else 'Aucun contexte spécifique'}
+"""
 
+
+def _composer_message(destinataire, alertes):
+    """
+    Un seul email pour toutes les alertes en attente d'un destinataire
+    """
+    if len(alertes) == 1:
+        sujet = f"🚨 Alerte {alertes[0].niveau}: {alertes[0].type_alerte}"
+        introduction = "Une nouvelle alerte a été détectée dans le système de monitoring:"
+    else:
+        critiques = sum(1 for alerte in alertes if alerte.niveau == 'CRITIQUE')
+        sujet = f"🚨 {len(alertes)} nouvelles alertes ({critiques} critique(s))"
+        introduction = f"{len(alertes)} nouvelles alertes ont été détectées dans le système de monitoring:"
+    
+    message = f"""
+{introduction}
+{''.join(_corps_alerte(alerte) for alerte in alertes)}
 🔗 ACTIONS
-Pour traiter cette alerte, connectez-vous au système de monitoring.
+Pour traiter ces alertes, connectez-vous au système de monitoring.
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 Ce message est généré automatiquement par le système de monitoring.
-            """
-            
-            send_mail(
-                subject=sujet,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=destinataires,
-                fail_silently=True
-            )
-            
-            logger.info(f"Notification envoyée pour l'alerte {alerte.id} à {len(destinataires)} destinataires")
-            
+"""
+    return EmailMessage(subject=sujet, body=message, from_email=settings.DEFAULT_FROM_EMAIL, to=[destinataire])
+
+
+def _reserver_notifications(taille_lot, maintenant):
+    """
+    Réserve un lot de notifications en attente en repoussant leur prochaine
+    tentative (bail) : un envoi concurrent ne les reprend pas, et elles sont
+    retentées à l'expiration du bail si le worker s'arrête pendant l'envoi
+    """
+    en_attente = Q(statut='EN_ATTENTE', prochaine_tentative__lte=maintenant)
+    ids = list(NotificationAlerte.objects.filter(en_attente).order_by('prochaine_tentative', 'pk')
+               .values_list('pk', flat=True)[:taille_lot])
+    if not ids:
+        return []
+    
+    bail = maintenant + timedelta(seconds=getattr(settings, 'PETROMONITORE_NOTIFICATIONS_BAIL', 300))
+    with transaction.atomic():
+        reservees = list(NotificationAlerte.objects.select_for_update(skip_locked=True)
+                         .filter(en_attente, pk__in=ids).values_list('pk', flat=True))
+        NotificationAlerte.objects.filter(pk__in=reservees).update(prochaine_tentative=bail)
+    
+    return list(NotificationAlerte.objects.filter(pk__in=reservees).select_related(
+        'alerte__projet', 'alerte__phase', 'alerte__operation'
+    ).order_by('destinataire', 'pk'))
+
+
+def _echec_notification(notification, erreur, maintenant):
+    """
+    Reprogramme une notification non envoyée avec un délai croissant
+    (PETROMONITORE_NOTIFICATIONS_DELAI, doublé à chaque tentative), ou la
+    marque en échec après PETROMONITORE_NOTIFICATIONS_TENTATIVES tentatives
+    """
+    notification.tentatives += 1
+    notification.derniere_erreur = str(erreur)[:500]
+    if notification.tentatives >= getattr(settings, 'PETROMONITORE_NOTIFICATIONS_TENTATIVES', 5):
+        notification.statut = 'ECHEC'
+        return
+    
+    delai = getattr(settings, 'PETROMONITORE_NOTIFICATIONS_DELAI', 60) * 2 ** (notification.tentatives - 1)
+    notification.prochaine_tentative = maintenant + timedelta(seconds=delai)
+
+
+def envoyer_notifications_en_attente(taille_lot=None, connexion=None):
+    """
+    Envoie un lot de notifications de la boîte d'envoi : un seul email par
+    destinataire pour toutes ses alertes, tous envoyés sur une même connexion ;
+    un envoi échoué est retenté plus tard, et l'état de chaque notification enregistré.
+    Au-delà de PETROMONITORE_LIMITE_EMAILS_DESTINATAIRE emails sur la fenêtre
+    glissante, les notifications d'un destinataire sont différées à la fenêtre
+    suivante, où elles sont regroupées dans un seul email
+    
+    Args:
+        taille_lot: Nombre maximal de notifications du lot (PETROMONITORE_NOTIFICATIONS_LOT par défaut)
+        connexion: Connexion email à utiliser (get_connection() par défaut)
+    
+    Returns:
+        Dictionnaire {'messages': emails envoyés, 'notifications': notifications envoyées,
+        'echecs': notifications non envoyées, 'differees': notifications différées}
+    """
+    taille_lot = taille_lot or getattr(settings, 'PETROMONITORE_NOTIFICATIONS_LOT', 200)
+    maintenant = timezone.now()
+    bilan = {'messages': 0, 'notifications': 0, 'echecs': 0, 'differees': 0}
+    
+    notifications = _reserver_notifications(taille_lot, maintenant)
+    if not notifications:
+        return bilan
+    
+    par_destinataire = {}
+    for notification in notifications:
+        par_destinataire.setdefault(notification.destinataire, []).append(notification)
+    
+    # Limite d'emails par destinataire
+    fenetre = FenetreGlissante('destinataire')
+    limite = getattr(settings, 'PETROMONITORE_LIMITE_EMAILS_DESTINATAIRE', 10)
+    for destinataire, envoyes in fenetre.compter(par_destinataire, maintenant).items():
+        if envoyes >= limite:
+            for notification in par_destinataire.pop(destinataire):
+                notification.prochaine_tentative = fenetre.fin_fenetre(maintenant)
+                bilan['differees'] += 1
+    
+    envoyes = {}
+    connexion = connexion or get_connection()
+    try:
+        connexion.open()
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi de notification pour l'alerte {alerte.id}: {str(e)}")
+        logger.error(f"Connexion au serveur email impossible: {str(e)}")
+        # Les notifications différées gardent leur tentative et la fin de leur fenêtre
+        for groupe in par_destinataire.values():
+            for notification in groupe:
+                _echec_notification(notification, e, maintenant)
+        par_destinataire = {}
+    
+    try:
+        for destinataire, groupe in par_destinataire.items():
+            try:
+                connexion.send_messages([_composer_message(destinataire, [n.alerte for n in groupe])])
+            except Exception as e:
+                logger.error(f"Erreur lors de l'envoi des notifications à {destinataire}: {str(e)}")
+                for notification in groupe:
+                    _echec_notification(notification, e, maintenant)
+                continue
+            
+            for notification in groupe:
+                notification.statut = 'ENVOYEE'
+                notification.tentatives += 1
+                notification.date_envoi = timezone.now()
+            bilan['messages'] += 1
+            envoyes[destinataire] = 1
+    finally:
+        connexion.close()
+        fenetre.ajouter(envoyes, maintenant)
+    
+    NotificationAlerte.objects.bulk_update(
+        notifications, ['statut', 'tentatives', 'prochaine_tentative', 'date_envoi', 'derniere_erreur']
+    )
+    bilan['notifications'] = sum(1 for notification in notifications if notification.statut == 'ENVOYEE')
+    bilan['echecs'] = len(notifications) - bilan['notifications'] - bilan['differees']
+    logger.info(f"Notifications: {bilan['messages']} email(s) envoyé(s) pour {bilan['notifications']} "
+                f"notification(s), {bilan['echecs']} échec(s), {bilan['differees']} différée(s)")
+    return bilan
 
 
 def nettoyer_anciennes_alertes(jours=30):
     """
-    Nettoyer les anciennes alertes traitées
+    Nettoyer les anciennes alertes traitées, archivées puis supprimées par
+    tranches (PetroMonitore.alerts.archivage)
     """
     try:
-        date_limite = timezone.now() - timedelta(days=jours)
+        bilan = archiver_alertes(jours)
         
-        anciennes_alertes = Alerte.objects.filter(
-            statut='TRAITEE',
-            date_alerte__lt=date_limite
+        logger.info(
+            f"Nettoyage terminé: {bilan['alertes']} anciennes alertes archivées et supprimées "
+            f"en {bilan['tranches']} tranches ({bilan['debit']:.0f} alertes/s, "
+            f"verrou maximal {bilan['verrou_max'] * 1000:.1f} ms)"
         )
-        
-        count = anciennes_alertes.count()
-        anciennes_alertes.delete()
-        
-        logger.info(f"Nettoyage terminé: {count} anciennes alertes supprimées")
-        return count
+        return bilan['alertes']
         
     except Exception as e:
         logger.error(f"Erreur lors du nettoyage des alertes: {str(e)}")
         return 0
 
 
+# Axes des agrégats d'alertes du rapport
+AXES_RAPPORT = ('projet_id', 'projet__nom', 'type_alerte', 'niveau')
+
+
+def _debut_semaine(instant):
+    """
+    Lundi 0h (fuseau horaire courant) de la semaine d'un instant
+    """
+    local = timezone.localtime(instant)
+    return (local - timedelta(days=local.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _semaines_terminees(date_debut, date_fin):
+    """
+    Débuts des semaines terminées entièrement comprises dans la période
+    """
+    semaine = _debut_semaine(date_debut)
+    if semaine < date_debut:
+        semaine += timedelta(days=7)
+    limite = min(date_fin, _debut_semaine(timezone.now()))
+    
+    semaines = []
+    while semaine + timedelta(days=7) <= limite:
+        semaines.append(semaine)
+        semaine += timedelta(days=7)
+    return semaines
+
+
+def agreger_semaines(semaines):
+    """
+    Agrégats persistés des alertes de semaines terminées : ceux des semaines
+    pas encore calculées sont calculés en une requête groupée et enregistrés
+    
+    Args:
+        semaines: Débuts des semaines (voir _semaines_terminees)
+    
+    Returns:
+        Lignes d'agrégats (AXES_RAPPORT, projet_nom et nombre)
+    """
+    jours = [semaine.date() for semaine in semaines]
+    calculees = set(SemaineAlertesAgregee.objects.filter(semaine__in=jours).values_list('semaine', flat=True))
+    manquantes = [semaine for semaine in semaines if semaine.date() not in calculees]
+    
+    if manquantes:
+        periodes = Q()
+        for semaine in manquantes:
+            periodes |= Q(date_alerte__gte=semaine, date_alerte__lt=semaine + timedelta(days=7))
+        lignes = Alerte.objects.filter(periodes).annotate(semaine=TruncWeek('date_alerte')).order_by().values(
+            'semaine', *AXES_RAPPORT
+        ).annotate(nombre=Count('pk'))
+        agregats = [
+            AgregatAlertesSemaine(
+                semaine=timezone.localtime(ligne['semaine']).date(), projet_id=ligne['projet_id'],
+                projet_nom=ligne['projet__nom'], type_alerte=ligne['type_alerte'], niveau=ligne['niveau'],
+                nombre=ligne['nombre']
+            )
+            for ligne in lignes
+        ]
+        try:
+            with transaction.atomic():
+                SemaineAlertesAgregee.objects.bulk_create(
+                    [SemaineAlertesAgregee(semaine=semaine.date()) for semaine in manquantes]
+                )
+                AgregatAlertesSemaine.objects.bulk_create(agregats, batch_size=500)
+        except IntegrityError:
+            # Semaines enregistrées entre-temps par un calcul concurrent
+            pass
+    
+    return AgregatAlertesSemaine.objects.filter(semaine__in=jours).values(*AXES_RAPPORT, 'projet_nom', 'nombre')
+
+
 def generer_rapport_alertes(date_debut=None, date_fin=None):
     """
-    Générer un rapport des alertes pour une période donnée
+    Générer un rapport des alertes pour une période donnée, à partir d'une
+    agrégation groupée par projet (identifiant), type et niveau, cumulée
+    ensuite sur chaque axe : les semaines terminées sont lues depuis leurs
+    agrégats persistés, seules les bornes de la période sont comptées. Le
+    statut, modifié après coup, est compté sur toute la période par une
+    requête groupée
     """
     try:
         if not date_debut:
@@ -399,36 +1041,41 @@ def generer_rapport_alertes(date_debut=None, date_fin=None):
         if not date_fin:
             date_fin = timezone.now()
         
-        alertes = Alerte.objects.filter(
-            date_alerte__range=[date_debut, date_fin]
-        ).select_related('projet', 'phase', 'operation')
+        alertes = Alerte.objects.filter(date_alerte__range=[date_debut, date_fin])
+        
+        # Semaines terminées (agrégats persistés), puis le reste de la période
+        semaines = _semaines_terminees(date_debut, date_fin)
+        lignes = list(agreger_semaines(semaines)) if semaines else []
+        restantes = alertes
+        if semaines:
+            restantes = alertes.exclude(date_alerte__gte=semaines[0],
+                                        date_alerte__lt=semaines[-1] + timedelta(days=7))
+        lignes += restantes.order_by().values(*AXES_RAPPORT).annotate(nombre=Count('pk'))
         
         # Statistiques générales
         stats = {
-            'total': alertes.count(),
-            'par_niveau': {},
+            'total': 0,
+            'par_niveau': dict.fromkeys(['INFO', 'WARNING', 'CRITIQUE'], 0),
             'par_type': {},
-            'par_statut': {},
+            'par_statut': dict.fromkeys(['NON_LU', 'LU', 'TRAITEE'], 0),
             'par_projet': {}
         }
+        for ligne in lignes:
+            nombre = ligne['nombre']
+            stats['total'] += nombre
+            if ligne['niveau'] in stats['par_niveau']:
+                stats['par_niveau'][ligne['niveau']] += nombre
+            stats['par_type'][ligne['type_alerte']] = stats['par_type'].get(ligne['type_alerte'], 0) + nombre
+            
+            # Projets regroupés par identifiant, présentés par nom
+            projet_nom = ligne['projet__nom'] or ligne.get('projet_nom')
+            if projet_nom is not None:
+                stats['par_projet'][projet_nom] = stats['par_projet'].get(projet_nom, 0) + nombre
         
-        # Compter par niveau
-        for niveau in ['INFO', 'WARNING', 'CRITIQUE']:
-            stats['par_niveau'][niveau] = alertes.filter(niveau=niveau).count()
-        
-        # Compter par type
-        types_alertes = alertes.values_list('type_alerte', flat=True).distinct()
-        for type_alerte in types_alertes:
-            stats['par_type'][type_alerte] = alertes.filter(type_alerte=type_alerte).count()
-        
-        # Compter par statut
-        for statut in ['NON_LU', 'LU', 'TRAITEE']:
-            stats['par_statut'][statut] = alertes.filter(statut=statut).count()
-        
-        # Compter par projet
-        projets = alertes.filter(projet__isnull=False).values_list('projet__nom', flat=True)
-        for projet_nom in set(projets):
-            stats['par_projet'][projet_nom] = alertes.filter(projet__nom=projet_nom).count()
+        # Statut courant des alertes de la période
+        for ligne in alertes.order_by().values('statut').annotate(nombre=Count('pk')):
+            if ligne['statut'] in stats['par_statut']:
+                stats['par_statut'][ligne['statut']] += ligne['nombre']
         
         return {
             'periode': {
@@ -443,4 +1090,4 @@ def generer_rapport_alertes(date_debut=None, date_fin=None):
         
     except Exception as e:
         logger.error(f"Erreur lors de la génération du rapport: {str(e)}")
-        return None
\ No newline at end of file
+        return None
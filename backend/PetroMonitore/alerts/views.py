@@ -3,15 +3,22 @@ from rest_framework import status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.views.decorators.http import require_GET
 from django.db.models import Q, Count, Case, When, IntegerField
-from django.core.mail import send_mail
-from django.conf import settings
 from datetime import datetime, timedelta
 import logging
 
-from ..models import Alerte, Projet, Phase, Operation, Utilisateur, Seuil
-from .serializers import AlerteSerializer, AlerteCreateSerializer, AlerteUpdateSerializer
+from ..models import Alerte, DetectionAlertes, Utilisateur
+from .serializers import AlerteSerializer, AlerteCreateSerializer, AlerteUpdateSerializer, DetectionAlertesSerializer
+from .flux import flux_evenements
+from .utils import demander_detection
 
 logger = logging.getLogger(__name__)
 
@@ -220,84 +227,21 @@ def historique_alertes(request):
 @permission_classes([IsAuthenticated])
 def detecter_alertes_automatiques(request):
     """
-    Détection automatique des dépassements de seuils
+    Détection automatique des dépassements de seuils, par les règles du registre
+    (alerts.regles), exécutée en tâche de fond : renvoie immédiatement la
+    détection, dont l'état est suivi par detection_alertes. Si une détection
+    est déjà en attente ou en cours, la demande la rejoint
     """
-    alertes_detectees = []
-    
     try:
-        # Vérification des projets
-        projets = Projet.objects.filter(statut__in=['EN_COURS', 'PLANIFIE'])
-        
-        for projet in projets:
-            # Alerte dépassement budget
-            if (projet.budget_initial and projet.cout_actuel and 
-                projet.cout_actuel > projet.budget_initial * (projet.seuil_alerte_cout / 100)):
-                
-                alerte, created = Alerte.objects.get_or_create(
-                    projet=projet,
-                    type_alerte='DEPASSEMENT_BUDGET',
-                    defaults={
-                        'niveau': 'CRITIQUE' if projet.cout_actuel > projet.budget_initial else 'WARNING',
-                        'message': f'Dépassement de budget détecté: {projet.cout_actuel}€ / {projet.budget_initial}€'
-                    }
-                )
-                
-                if created:
-                    alertes_detectees.append(alerte)
-                    _envoyer_notification_alerte(alerte)
-            
-            # Alerte dépassement délai
-            if projet.date_fin_prevue and timezone.now().date() > projet.date_fin_prevue:
-                alerte, created = Alerte.objects.get_or_create(
-                    projet=projet,
-                    type_alerte='DEPASSEMENT_DELAI',
-                    defaults={
-                        'niveau': 'CRITIQUE',
-                        'message': f'Projet en retard: Date prévue {projet.date_fin_prevue}'
-                    }
-                )
-                
-                if created:
-                    alertes_detectees.append(alerte)
-                    _envoyer_notification_alerte(alerte)
-        
-        # Vérification des opérations avec seuils
-        operations_ids = Operation.objects.filter(
-            statut__in=['EN_COURS', 'PLANIFIE'],
-            seuils__isnull=False
-        ).values_list('id', flat=True).distinct()
-
-        operations = Operation.objects.filter(id__in=operations_ids)
+        detection, nouvelle = demander_detection(request.user)
         
-        for operation in operations:
-            seuils = operation.seuils.first()
-            if seuils and operation.cout_reel:
-                niveau_alerte = None
-                
-                if operation.cout_reel >= seuils.valeur_rouge:
-                    niveau_alerte = 'CRITIQUE'
-                elif operation.cout_reel >= seuils.valeur_jaune:
-                    niveau_alerte = 'WARNING'
-                
-                if niveau_alerte:
-                    alerte, created = Alerte.objects.get_or_create(
-                        operation=operation,
-                        type_alerte='DEPASSEMENT_SEUIL',
-                        defaults={
-                            'niveau': niveau_alerte,
-                            'message': f'Seuil dépassé pour {operation.nom}: {operation.cout_reel}€'
-                        }
-                    )
-                    
-                    if created:
-                        alertes_detectees.append(alerte)
-                        _envoyer_notification_alerte(alerte)
-        
-        serializer = AlerteSerializer(alertes_detectees, many=True)
         return Response({
-            'message': f'{len(alertes_detectees)} nouvelles alertes détectées',
-            'alertes': serializer.data
-        })
+            'message': 'Détection des alertes planifiée' if nouvelle else 'Détection des alertes déjà en cours',
+            'detection': DetectionAlertesSerializer(detection).data,
+            'url_statut': request.build_absolute_uri(
+                reverse('alerts:detection-alertes', kwargs={'pk': detection.pk})
+            ),
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         logger.error(f"Erreur lors de la détection d'alertes: {str(e)}")
@@ -307,56 +251,22 @@ def detecter_alertes_automatiques(request):
         )
 
 
-def _envoyer_notification_alerte(alerte):
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def detection_alertes(request, pk):
     """
-    Envoyer une notification par email pour une alerte
+    État d'une détection d'alertes : progression (tranches terminées),
+    alertes créées, statistiques par règle et durées
     """
     try:
-        # Déterminer les destinataires
-        destinataires = []
-        
-        if alerte.projet:
-            # Responsable du projet
-            if alerte.projet.responsable and alerte.projet.responsable.email:
-                destinataires.append(alerte.projet.responsable.email)
-            
-            # Membres de l'équipe projet
-            equipe_emails = alerte.projet.membres_equipe.values_list(
-                'utilisateur__email', flat=True
-            )
-            destinataires.extend(list(equipe_emails))
-        
-        if alerte.operation and alerte.operation.responsable:
-            destinataires.append(alerte.operation.responsable.email)
-        
-        # Supprimer les doublons
-        destinataires = list(set(filter(None, destinataires)))
-        
-        if destinataires:
-            sujet = f"Alerte {alerte.niveau}: {alerte.type_alerte}"
-            message = f"""
-            Une nouvelle alerte a été détectée:
-            
-            Type: {alerte.type_alerte}
-            Niveau: {alerte.niveau}
-            Message: {alerte.message}
-            Date: {alerte.date_alerte}
-            
-            Projet: {alerte.projet.nom if alerte.projet else 'N/A'}
-            Phase: {alerte.phase.nom if alerte.phase else 'N/A'}
-            Opération: {alerte.operation.nom if alerte.operation else 'N/A'}
-            """
-            
-            send_mail(
-                subject=sujet,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=destinataires,
-                fail_silently=True
-            )
-            
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi de notification: {str(e)}")
+        detection = DetectionAlertes.objects.select_related('demandee_par').get(pk=pk)
+    except DetectionAlertes.DoesNotExist:
+        return Response(
+            {'error': 'Détection non trouvée'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    return Response(DetectionAlertesSerializer(detection).data)
 
 
 @api_view(['GET'])
@@ -388,4 +298,56 @@ def alertes_tableau_bord(request):
         'alertes_non_lues': AlerteSerializer(alertes_non_lues, many=True).data,
         'resume_niveaux': resume_niveaux,
         'total_non_lues': alertes_non_lues.count()
-    })
\ No newline at end of file
+    })
+
+
+def _authentifier_flux(request):
+    """
+    Utilisateur authentifié par le jeton JWT de l'en-tête Authorization ou,
+    EventSource ne pouvant pas envoyer d'en-tête, du paramètre token
+    """
+    authentification = JWTAuthentication()
+    try:
+        resultat = authentification.authenticate(request)
+        if resultat is None and request.GET.get('token'):
+            jeton = authentification.get_validated_token(request.GET['token'])
+            resultat = (authentification.get_user(jeton), jeton)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return resultat[0] if resultat else None
+
+
+@require_GET
+async def flux_alertes(request):
+    """
+    Flux Server-Sent Events des nouvelles alertes (servi en ASGI)
+    
+    Paramètres :
+        projet: Identifiants de projets séparés par des virgules
+        niveau: Niveaux séparés par des virgules
+        En-tête Last-Event-ID (ou paramètre last_event_id) : reprendre après cette alerte
+    """
+    utilisateur = await sync_to_async(_authentifier_flux)(request)
+    if utilisateur is None:
+        return JsonResponse({'error': 'Authentification requise'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    try:
+        projet_ids = [int(valeur) for valeur in request.GET.get('projet', '').split(',') if valeur]
+        dernier = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        apres_id = int(dernier) if dernier else None
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres projet ou Last-Event-ID invalides'},
+                            status=status.HTTP_400_BAD_REQUEST)
+    
+    niveaux = [valeur for valeur in request.GET.get('niveau', '').split(',') if valeur]
+    niveaux_valides = dict(Alerte.NIVEAU_CHOICES)
+    if any(niveau not in niveaux_valides for niveau in niveaux):
+        return JsonResponse({'error': f"Niveau invalide. Valeurs acceptées: {', '.join(niveaux_valides)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(flux_evenements(apres_id, projet_ids, niveaux),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Pas de mise en tampon par un proxy nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
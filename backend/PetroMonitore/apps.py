@@ -9,3 +9,4 @@ class PetromonitoreConfig(AppConfig):
     def ready(self):
         # Force l'import de tasks au démarrage de Django
         import PetroMonitore.alerts.tasks
+        import PetroMonitore.tasks
@@ -0,0 +1,420 @@
+"""
+Données des tableaux de bord, calculées hors des vues : elles sont servies
+par les instantanés (PetroMonitore.dashboard.instantanes).
+
+Les statistiques générales et les indicateurs de performance sont des
+agrégations conditionnelles (Count/Sum/Avg filtrés, durées calculées par la
+base) : les indicateurs des projets sont calculés ensemble, en un nombre fixe
+de requêtes, quel que soit le nombre de projets ou la taille de l'historique.
+"""
+from decimal import Decimal
+
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Func, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+from django.utils import timezone
+
+from ..alerts.regles import JoursEntre
+from ..models import Alerte, EquipeProjet, Operation, Phase, Probleme, Projet
+from ..utils import evaluer_statut_couleur_projet
+
+
+def statistiques_generales():
+    """
+    Statistiques globales du tableau de bord général (DashboardGeneralSerializer),
+    en deux requêtes : une agrégation conditionnelle sur les projets et la
+    progression moyenne des projets ayant au moins une phase
+    """
+    today = timezone.now().date()
+    retard_termine = Q(statut='TERMINE', date_fin_reelle__gt=F('date_fin_prevue'))
+    agregats = Projet.objects.aggregate(
+        total_projets=Count('pk'),
+        projets_planifies=Count('pk', filter=Q(statut='PLANIFIE')),
+        projets_en_cours=Count('pk', filter=Q(statut='EN_COURS')),
+        projets_termines=Count('pk', filter=Q(statut='TERMINE')),
+        projets_suspendus=Count('pk', filter=Q(statut='SUSPENDU')),
+        budget_initial_total=Sum('budget_initial'),
+        cout_actuel_total=Sum('cout_actuel'),
+        projets_en_retard=Count('pk', filter=Q(
+            date_fin_prevue__lt=today, date_fin_reelle__isnull=True, statut='EN_COURS'
+        )),
+        # Retard moyen (en jours entiers) des projets terminés en retard
+        retard_moyen=Avg(JoursEntre('date_fin_reelle', 'date_fin_prevue'), filter=retard_termine),
+        # Projets terminés dans les délais et le budget
+        projets_reussis=Count('pk', filter=Q(
+            statut='TERMINE', date_fin_reelle__lte=F('date_fin_prevue'), cout_actuel__lte=F('budget_initial')
+        )),
+    )
+    
+    # Progression moyenne (persistée) des projets ayant au moins une phase
+    progression_moyenne = Projet.objects.filter(
+        pk__in=Phase.objects.values('projet_id')
+    ).aggregate(moyenne=Avg('progression'))['moyenne'] or 0
+    
+    budget_initial_total = agregats['budget_initial_total'] or Decimal('0.00')
+    cout_actuel_total = agregats['cout_actuel_total'] or Decimal('0.00')
+    projets_termines = agregats['projets_termines']
+    
+    return {
+        'total_projets': agregats['total_projets'],
+        'projets_planifies': agregats['projets_planifies'],
+        'projets_en_cours': agregats['projets_en_cours'],
+        'projets_termines': projets_termines,
+        'projets_suspendus': agregats['projets_suspendus'],
+        'budget_initial_total': budget_initial_total,
+        'cout_actuel_total': cout_actuel_total,
+        'ecart_budgetaire': cout_actuel_total - budget_initial_total,
+        'projets_en_retard': agregats['projets_en_retard'],
+        'retard_moyen_jours': int(agregats['retard_moyen'] or 0),
+        'progression_moyenne': progression_moyenne,
+        'taux_reussite': (agregats['projets_reussis'] / projets_termines) * 100 if projets_termines else 0,
+    }
+
+
+class JoursDecimaux(Func):
+    """
+    Durée en jours (décimaux) entre deux dates-heures (fin - début), calculée par la base
+    """
+    arity = 2
+    output_field = FloatField()
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL : la différence de deux horodatages est un intervalle
+        return super().as_sql(compiler, connection, template='(EXTRACT(EPOCH FROM (%(expressions)s)) / 86400.0)',
+                              arg_joiner=' - ', **extra_context)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(julianday(%(expressions)s))',
+                              arg_joiner=') - julianday(', **extra_context)
+    
+    def as_oracle(self, compiler, connection, **extra_context):
+        # La différence de deux DATE Oracle est un nombre de jours
+        return super().as_sql(compiler, connection, template='(CAST(%(expressions)s AS DATE))',
+                              arg_joiner=' AS DATE) - CAST(', **extra_context)
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        # TIMESTAMPDIFF(unité, début, fin)
+        inverse = self.copy()
+        inverse.set_source_expressions(self.get_source_expressions()[::-1])
+        return super(JoursDecimaux, inverse).as_sql(
+            compiler, connection, template='(TIMESTAMPDIFF(MICROSECOND, %(expressions)s) / 86400000000.0)',
+            **extra_context
+        )
+
+
+def _agreger(queryset, cle, **agregats):
+    # Agrégats de tout le queryset (clé None), ou par projet
+    if cle is None:
+        return {None: queryset.aggregate(**agregats)}
+    return {ligne.pop('cle_projet'): ligne for ligne in queryset.values(cle_projet=cle).annotate(**agregats)}
+
+
+def _agreger_indicateurs(projet_ids=None, debut=None, fin=None, par_projet=False):
+    """
+    Moteur des indicateurs de performance : trois agrégations conditionnelles
+    (projets, opérations, problèmes), globales ou groupées par projet
+    
+    Returns:
+        Dictionnaire clé -> agrégats de chaque source (clé None sans groupement)
+    """
+    aujourd_hui = timezone.now().date()
+    projets = Projet.objects.all()
+    operations = Operation.objects.all()
+    problemes = Probleme.objects.all()
+    if projet_ids is not None or par_projet:
+        # Projet d'un problème : directement, ou par sa phase ou son opération
+        problemes = problemes.alias(
+            cle_projet=Coalesce('projet_id', 'phase__projet_id', 'operation__phase__projet_id')
+        )
+    if projet_ids is not None:
+        projets = projets.filter(pk__in=projet_ids)
+        operations = operations.filter(phase__projet_id__in=projet_ids)
+        problemes = problemes.filter(cle_projet__in=projet_ids)
+    
+    # Fenêtre de temps : opérations terminées, problèmes signalés et résolus dans la fenêtre
+    terminees, signales, resolus = Q(), Q(), Q()
+    if debut:
+        terminees &= Q(date_fin_reelle__gte=debut)
+        signales &= Q(date_signalement__date__gte=debut)
+        resolus &= Q(date_resolution__date__gte=debut)
+    if fin:
+        terminees &= Q(date_fin_reelle__lte=fin)
+        signales &= Q(date_signalement__date__lte=fin)
+        resolus &= Q(date_resolution__date__lte=fin)
+    
+    # Efficacité (progression / pourcentage de temps écoulé) des projets actifs commencés,
+    # le temps écoulé étant plafonné à la durée totale
+    duree_totale = JoursEntre('date_fin_prevue', 'date_debut')
+    temps_ecoule = Least(JoursEntre(aujourd_hui, 'date_debut'), duree_totale)
+    efficacite = Avg(
+        ExpressionWrapper(
+            Cast('progression', FloatField()) * duree_totale / (temps_ecoule * Value(100.0)),
+            output_field=FloatField()
+        ),
+        filter=Q(statut__in=['PLANIFIE', 'EN_COURS'], date_debut__lt=aujourd_hui,
+                 date_fin_prevue__gt=F('date_debut'))
+    )
+    
+    cout = Q(statut='TERMINE', cout_reel__gt=0) & terminees
+    dates = Q(statut='TERMINE', date_debut_reelle__isnull=False, date_fin_reelle__isnull=False) & terminees
+    return {
+        'projets': _agreger(projets, F('pk') if par_projet else None, efficacite=efficacite),
+        'operations': _agreger(
+            operations, F('phase__projet_id') if par_projet else None,
+            operations_cout=Count('pk', filter=cout),
+            total_cout=Sum('cout_reel', filter=cout),
+            operations_dates=Count('pk', filter=dates),
+            # Au moins 1 jour par opération
+            total_jours=Sum(Greatest(JoursEntre('date_fin_reelle', 'date_debut_reelle'), Value(1)), filter=dates),
+            total_operations=Count('pk'),
+        ),
+        'problemes': _agreger(
+            problemes, F('cle_projet') if par_projet else None,
+            total_problemes=Count('pk', filter=signales),
+            temps_resolution_moyen=Avg(JoursDecimaux('date_resolution', 'date_signalement'), filter=Q(
+                statut='RESOLU', date_signalement__isnull=False, date_resolution__isnull=False
+            ) & resolus),
+        ),
+    }
+
+
+def _indicateurs(projets, operations, problemes):
+    # Indicateurs (IndicateursPerformanceSerializer) à partir des agrégats d'une clé
+    total_cout = operations.get('total_cout') or Decimal('0.00')
+    total_jours = operations.get('total_jours') or 0
+    total_operations = operations.get('total_operations') or 0
+    return {
+        'efficacite': projets.get('efficacite') or 0,
+        # Productivité coût (travail réalisé / coût)
+        'productivite_cout': operations['operations_cout'] / total_cout if total_cout > 0 else Decimal('0.00'),
+        # Productivité temps (nombre d'opérations terminées / temps total)
+        'productivite_temps': operations['operations_dates'] / total_jours if total_jours > 0 else 0,
+        # Qualité (nombre de problèmes par opération)
+        'qualite_problemes': (problemes.get('total_problemes') or 0) / total_operations if total_operations else 0,
+        # Temps de résolution moyen des problèmes (en jours)
+        'temps_resolution_moyen': problemes.get('temps_resolution_moyen') or 0,
+    }
+
+
+def indicateurs_performance(projet_ids=None, debut=None, fin=None):
+    """
+    Indicateurs de performance (IndicateursPerformanceSerializer), calculés par
+    la base en trois requêtes quel que soit l'historique
+    
+    Args:
+        projet_ids: Projets optionnels (tout le portefeuille par défaut)
+        debut: Début optionnel de la fenêtre de temps (date incluse)
+        fin: Fin optionnelle de la fenêtre de temps (date incluse)
+    
+    La fenêtre porte sur les opérations terminées, les problèmes signalés et
+    les problèmes résolus ; l'efficacité est celle des projets actifs à la
+    date du jour
+    """
+    agregats = _agreger_indicateurs(projet_ids, debut, fin)
+    return _indicateurs(agregats['projets'][None], agregats['operations'][None], agregats['problemes'][None])
+
+
+def indicateurs_performance_par_projet(projet_ids=None, debut=None, fin=None):
+    """
+    Indicateurs de performance de chaque projet (mêmes paramètres et mêmes
+    trois requêtes que indicateurs_performance, groupées par projet)
+    
+    Returns:
+        Liste des indicateurs avec l'identifiant de chaque projet, par identifiant
+    """
+    agregats = _agreger_indicateurs(projet_ids, debut, fin, par_projet=True)
+    return [
+        {'projet_id': projet_id, **_indicateurs(
+            projets, agregats['operations'].get(projet_id, {'operations_cout': 0, 'operations_dates': 0}),
+            agregats['problemes'].get(projet_id, {})
+        )}
+        for projet_id, projets in sorted(agregats['projets'].items())
+    ]
+
+
+def indicateurs_equipes(projet_ids):
+    """
+    Indicateurs des équipes de plusieurs projets, en deux requêtes quel que
+    soit le nombre de projets et de membres : les affectations (avec leur
+    utilisateur) et les opérations groupées par projet et par responsable
+    
+    Args:
+        projet_ids: Projets dont les équipes sont calculées
+    
+    Returns:
+        Dictionnaire identifiant de projet -> statistiques de l'équipe
+        (StatistiquesEquipeProjetSerializer) et indicateurs de chaque membre
+        (IndicateursEquipeSerializer), pour chacun des projets demandés
+    """
+    membres = EquipeProjet.objects.filter(projet_id__in=projet_ids).select_related('utilisateur').only(
+        'projet_id', 'role_projet', 'utilisateur__id', 'utilisateur__prenom', 'utilisateur__nom', 'utilisateur__role'
+    ).order_by('projet_id', 'pk')
+    
+    # Nombre d'opérations et progression moyenne par (projet, responsable)
+    operations = {
+        (ligne['phase__projet_id'], ligne['responsable_id']): ligne
+        for ligne in Operation.objects.filter(
+            phase__projet_id__in=projet_ids, responsable__isnull=False
+        ).values('phase__projet_id', 'responsable_id').annotate(
+            operations_assignees=Count('pk'), progression_moyenne=Avg('progression')
+        ).order_by()
+    }
+    
+    equipes = {
+        projet_id: {
+            'statistiques_generales': {'nombre_membres': 0, 'ingenieur_terrain': 0, 'expert': 0, 'top_management': 0},
+            'indicateurs_membres': [],
+        }
+        for projet_id in projet_ids
+    }
+    for membre in membres:
+        equipe = equipes[membre.projet_id]
+        utilisateur = membre.utilisateur
+        
+        # Compter par rôle
+        statistiques = equipe['statistiques_generales']
+        statistiques['nombre_membres'] += 1
+        if utilisateur.role in ('INGENIEUR_TERRAIN', 'EXPERT', 'TOP_MANAGEMENT'):
+            statistiques[utilisateur.role.lower()] += 1
+        
+        assignees = operations.get((membre.projet_id, utilisateur.id), {})
+        equipe['indicateurs_membres'].append({
+            'id': utilisateur.id,
+            'nom_complet': utilisateur.get_full_name(),
+            'role_projet': membre.role_projet,
+            'operations_assignees': assignees.get('operations_assignees', 0),
+            'progression_moyenne': assignees.get('progression_moyenne') or 0,
+        })
+    return equipes
+
+
+def matrice_charge(equipes):
+    """
+    Matrice de charge du portefeuille (membres × projets) à partir des
+    indicateurs de indicateurs_equipes
+    
+    Returns:
+        Liste des membres, par nom complet, avec leur nombre d'opérations
+        assignées dans chaque projet dont ils sont membres et au total
+    """
+    lignes = {}
+    for projet_id, equipe in equipes.items():
+        for membre in equipe['indicateurs_membres']:
+            ligne = lignes.setdefault(membre['id'], {
+                'id': membre['id'], 'nom_complet': membre['nom_complet'], 'projets': {}, 'operations_assignees': 0
+            })
+            ligne['projets'][projet_id] = membre['operations_assignees']
+            ligne['operations_assignees'] += membre['operations_assignees']
+    return sorted(lignes.values(), key=lambda ligne: (ligne['nom_complet'], ligne['id']))
+
+
+def tableau_bord_projet(projet_id):
+    """
+    Données du tableau de bord d'un projet (ProjetDashboardSerializer)
+    
+    Returns:
+        Les données, ou None si le projet n'existe pas
+    """
+    try:
+        projet = Projet.objects.get(pk=projet_id)
+    except Projet.DoesNotExist:
+        return None
+    
+    # Progression du projet
+    progression = projet.progression
+    
+    # Statut couleur du projet
+    statut_couleur = evaluer_statut_couleur_projet(projet)
+    
+    # Budget
+    budget_initial = projet.budget_initial or Decimal('0.00')
+    cout_actuel = projet.cout_actuel or Decimal('0.00')
+    
+    if budget_initial > 0:
+        pourcentage_budget_consomme = (cout_actuel / budget_initial) * 100
+    else:
+        pourcentage_budget_consomme = 0
+    
+    # Délais
+    today = timezone.now().date()
+    retard_jours = 0
+    retard_pourcentage = 0
+    
+    if projet.date_fin_prevue:
+        if projet.date_fin_reelle:
+            # Projet terminé, calcul du retard réel
+            retard_jours = max(0, (projet.date_fin_reelle - projet.date_fin_prevue).days)
+        elif today > projet.date_fin_prevue:
+            # Projet en cours et en retard
+            retard_jours = (today - projet.date_fin_prevue).days
+        
+        # Calculer le pourcentage de retard par rapport à la durée prévue
+        if projet.date_debut:
+            duree_prevue = (projet.date_fin_prevue - projet.date_debut).days
+            if duree_prevue > 0:
+                retard_pourcentage = (retard_jours / duree_prevue) * 100
+    
+    # Risques (alertes et problèmes)
+    alertes_critiques = Alerte.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        niveau='CRITIQUE'
+    ).count()
+    
+    alertes_avertissements = Alerte.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        niveau='WARNING'
+    ).count()
+    
+    alertes_informations = Alerte.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        niveau='INFO'
+    ).count()
+    
+    problemes_non_resolus_critiques = Probleme.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        statut__in=['OUVERT', 'EN_COURS'],
+        gravite='CRITIQUE'
+    ).count()
+    
+    problemes_non_resolus_eleves = Probleme.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        statut__in=['OUVERT', 'EN_COURS'],
+        gravite='ELEVEE'
+    ).count()
+    
+    problemes_non_resolus_moyens = Probleme.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        statut__in=['OUVERT', 'EN_COURS'],
+        gravite='MOYENNE'
+    ).count()
+    
+    problemes_non_resolus_faibles = Probleme.objects.filter(
+        Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
+        statut__in=['OUVERT', 'EN_COURS'],
+        gravite='FAIBLE'
+    ).count()
+    
+    # Préparer les données pour le sérialiseur
+    data = {
+        'id': projet.id,
+        'nom': projet.nom,
+        'progression': progression,
+        'statut_cout': statut_couleur['statut_cout'],
+        'statut_delai': statut_couleur['statut_delai'],
+        'statut_global': statut_couleur['statut_global'],
+        'budget_initial': budget_initial,
+        'cout_actuel': cout_actuel,
+        'pourcentage_budget_consomme': pourcentage_budget_consomme,
+        'date_debut': projet.date_debut,
+        'date_fin_prevue': projet.date_fin_prevue,
+        'date_fin_reelle': projet.date_fin_reelle,
+        'retard_jours': retard_jours,
+        'retard_pourcentage': retard_pourcentage,
+        'alertes_critiques': alertes_critiques,
+        'alertes_avertissements': alertes_avertissements,
+        'alertes_informations': alertes_informations,
+        'problemes_non_resolus_critiques': problemes_non_resolus_critiques,
+        'problemes_non_resolus_eleves': problemes_non_resolus_eleves,
+        'problemes_non_resolus_moyens': problemes_non_resolus_moyens,
+        'problemes_non_resolus_faibles': problemes_non_resolus_faibles
+    }
+    return data
@@ -0,0 +1,193 @@
+"""
+Instantanés des tableaux de bord.
+
+Les données sérialisées du tableau de bord général, des indicateurs de
+performance et du tableau de bord de chaque projet sont enregistrées dans
+InstantaneTableauBord : une lecture est une seule requête. Un instantané est
+régénéré à la lecture s'il est absent ou plus ancien que l'âge maximal demandé,
+et périodiquement par PetroMonitore.tasks.rafraichir_instantanes_tableau_bord.
+Un instantané périmé reste servi : sa lecture demande une seule régénération
+en tâche de fond, partagée par toutes les lectures concurrentes.
+
+Les écritures (projets, phases, opérations, problèmes, alertes) marquent les
+instantanés concernés comme périmés, une fois par requête, via la file des
+recalculs (PetroMonitore.recalculs, types INSTANTANES).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+from ..models import InstantaneTableauBord, Operation, Phase
+from .indicateurs import indicateurs_performance, statistiques_generales, tableau_bord_projet
+from .serializers import DashboardGeneralSerializer, IndicateursPerformanceSerializer, ProjetDashboardSerializer
+
+logger = logging.getLogger(__name__)
+
+# Type d'instantané -> (sérialiseur, calcul des données à partir de l'identifiant de l'objet)
+CALCULS = {
+    'GENERAL': (DashboardGeneralSerializer, lambda objet_id: statistiques_generales()),
+    'PERFORMANCE': (IndicateursPerformanceSerializer, lambda objet_id: indicateurs_performance()),
+    'PROJET': (ProjetDashboardSerializer, tableau_bord_projet),
+}
+
+# Instantanés du portefeuille, périmés par toute écriture
+GLOBAUX = ('GENERAL', 'PERFORMANCE')
+
+# Type d'invalidation -> (modèle, chemin vers le projet), None pour des identifiants de projets
+INVALIDATIONS = {
+    'INSTANTANES_PROJET': None,
+    'INSTANTANES_PHASE': (Phase, 'projet_id'),
+    'INSTANTANES_OPERATION': (Operation, 'phase__projet_id'),
+}
+
+
+def age_maximal():
+    """
+    Âge maximal (en secondes) d'un instantané servi sans être régénéré
+    (PETROMONITORE_INSTANTANES_AGE_MAX)
+    """
+    return getattr(settings, 'PETROMONITORE_INSTANTANES_AGE_MAX', 900)
+
+
+def delai_rafraichissement():
+    """
+    Délai (en secondes) après lequel une régénération demandée mais non effectuée
+    peut être demandée à nouveau (PETROMONITORE_INSTANTANES_DELAI_RAFRAICHISSEMENT)
+    """
+    return getattr(settings, 'PETROMONITORE_INSTANTANES_DELAI_RAFRAICHISSEMENT', 60)
+
+
+def generer_instantane(type_instantane, objet_id=0):
+    """
+    Calcule et enregistre l'instantané d'un tableau de bord
+
+    Returns:
+        L'instantané, ou None si son objet n'existe plus (l'instantané est alors supprimé)
+    """
+    serializer, calcul = CALCULS[type_instantane]
+    instantanes = InstantaneTableauBord.objects.filter(type_instantane=type_instantane, objet_id=objet_id)
+    debut = timezone.now()
+    donnees = calcul(objet_id)
+    if donnees is None:
+        instantanes.delete()
+        return None
+    donnees = dict(serializer(donnees).data)
+
+    # Une invalidation pendant le calcul laisse l'instantané périmé
+    if not instantanes.update(
+        donnees=donnees, date_generation=debut, date_demande_rafraichissement=None,
+        perime=Case(When(date_invalidation__gte=debut, then=Value(True)), default=Value(False))
+    ):
+        try:
+            with transaction.atomic():
+                InstantaneTableauBord.objects.create(
+                    type_instantane=type_instantane, objet_id=objet_id, donnees=donnees, date_generation=debut
+                )
+        except IntegrityError:
+            # Instantané créé entre-temps par une lecture concurrente
+            instantanes.update(donnees=donnees, date_generation=debut)
+    return InstantaneTableauBord(type_instantane=type_instantane, objet_id=objet_id, donnees=donnees,
+                                 date_generation=debut)
+
+
+def lire_instantane(type_instantane, objet_id=0, max_age=None):
+    """
+    Instantané d'un tableau de bord, régénéré s'il est absent ou plus ancien
+    que max_age secondes (age_maximal() par défaut, 0 pour le recalculer) ;
+    périmé, il est servi et sa régénération demandée en tâche de fond
+
+    Returns:
+        L'instantané, ou None si son objet n'existe pas
+    """
+    max_age = age_maximal() if max_age is None else max_age
+    instantane = InstantaneTableauBord.objects.filter(type_instantane=type_instantane, objet_id=objet_id).first()
+    if instantane is None or instantane.date_generation < timezone.now() - timedelta(seconds=max_age):
+        instantane = generer_instantane(type_instantane, objet_id)
+    elif instantane.perime:
+        demander_rafraichissement(instantane)
+    return instantane
+
+
+def demander_rafraichissement(instantane):
+    """
+    Demande la régénération en tâche de fond d'un instantané périmé : la
+    première lecture la planifie, les suivantes la rejoignent tant qu'elle
+    date de moins de delai_rafraichissement() secondes
+    """
+    expiration = timezone.now() - timedelta(seconds=delai_rafraichissement())
+    demande = instantane.date_demande_rafraichissement
+    if demande is not None and demande >= expiration:
+        return
+    # Mise à jour conditionnelle : une seule des lectures concurrentes obtient la demande
+    if InstantaneTableauBord.objects.filter(
+        Q(date_demande_rafraichissement__isnull=True) | Q(date_demande_rafraichissement__lt=expiration),
+        pk=instantane.pk
+    ).update(date_demande_rafraichissement=timezone.now()):
+        type_instantane, objet_id = instantane.type_instantane, instantane.objet_id
+        transaction.on_commit(lambda: _planifier_rafraichissement(type_instantane, objet_id))
+
+
+def _planifier_rafraichissement(type_instantane, objet_id):
+    from ..tasks import rafraichir_instantane_tableau_bord
+    try:
+        rafraichir_instantane_tableau_bord.delay(type_instantane, objet_id)
+    except Exception as e:
+        # Demande libérée : la lecture suivante la renouvellera
+        logger.error(f"Impossible de planifier la régénération de l'instantané {type_instantane} {objet_id}: {str(e)}")
+        InstantaneTableauBord.objects.filter(type_instantane=type_instantane, objet_id=objet_id).update(
+            date_demande_rafraichissement=None
+        )
+
+
+def invalider_instantanes(marques):
+    """
+    Marque comme périmés, en une requête, les instantanés du portefeuille et
+    ceux des projets concernés
+
+    Args:
+        marques: Dictionnaire type d'invalidation (INVALIDATIONS) -> identifiants
+    """
+    projets = Q(pk__in=[])
+    for type_invalidation, objet_ids in marques.items():
+        objet_ids = [objet_id for objet_id in objet_ids if objet_id is not None]
+        if not objet_ids:
+            continue
+        source = INVALIDATIONS[type_invalidation]
+        if source is None:
+            projets |= Q(objet_id__in=objet_ids)
+        else:
+            modele, chemin = source
+            projets |= Q(objet_id__in=modele.objects.filter(pk__in=objet_ids).values(chemin))
+
+    InstantaneTableauBord.objects.filter(
+        Q(type_instantane__in=GLOBAUX) | (Q(type_instantane='PROJET') & projets)
+    ).update(perime=True, date_invalidation=timezone.now())
+
+
+def rafraichir_instantanes(max_age=None):
+    """
+    Régénère les instantanés du portefeuille, et ceux des projets périmés ou
+    plus anciens que max_age secondes (age_maximal() par défaut)
+
+    Returns:
+        Le nombre d'instantanés régénérés
+    """
+    max_age = age_maximal() if max_age is None else max_age
+    a_regenerer = [(type_instantane, 0) for type_instantane in GLOBAUX]
+    a_regenerer += InstantaneTableauBord.objects.filter(
+        Q(perime=True) | Q(date_generation__lt=timezone.now() - timedelta(seconds=max_age)),
+        type_instantane='PROJET'
+    ).order_by('objet_id').values_list('type_instantane', 'objet_id')
+
+    nombre = 0
+    for type_instantane, objet_id in a_regenerer:
+        try:
+            generer_instantane(type_instantane, objet_id)
+            nombre += 1
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération de l'instantané {type_instantane} {objet_id}: {str(e)}")
+    return nombre
@@ -0,0 +1,264 @@
+"""
+Moteur vectorisé (NumPy) des statuts couleur du portefeuille.
+
+Les champs nécessaires à l'évaluation de toutes les opérations actives sont
+chargés en colonnes (un tableau par champ), puis les statuts coût et délai sont
+calculés en une seule passe vectorisée, avec les mêmes règles que
+evaluer_statut_couleur_operation.
+
+Les calculs flottants reproduisent ceux de l'évaluation unitaire ; seules les
+comparaisons aux bornes des seuils (Decimal) peuvent différer d'un arrondi.
+Les opérations dont la valeur est à une tolérance près d'une borne sont donc
+réévaluées exactement par _calculer_statut_couleur_operation, ce qui garantit
+un résultat identique à l'évaluation unitaire.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+from django.utils import timezone
+
+from ..models import Projet, Phase, Operation, Seuil
+from ..utils import _calculer_statut_couleur_operation
+
+COULEURS = ('VERT', 'JAUNE', 'ROUGE')
+CODES_COULEUR = {couleur: code for code, couleur in enumerate(COULEURS)}
+VERT, JAUNE, ROUGE = 0, 1, 2
+
+# Écart relatif sous lequel une comparaison flottante à une borne de seuil est
+# jugée ambiguë et recalculée exactement
+TOLERANCE_RELATIVE = 1e-9
+
+CHAMPS_OPERATION = (
+    'id', 'phase_id', 'cout_reel', 'cout_prevue', 'progression',
+    'date_debut_prevue', 'date_fin_prevue', 'date_debut_reelle', 'date_fin_reelle'
+)
+
+
+def _colonne_decimale(valeurs):
+    """
+    Convertit une liste de Decimal (ou None) en un tableau float64 et un masque de présence
+    """
+    presentes = np.fromiter((v is not None for v in valeurs), dtype=bool, count=len(valeurs))
+    colonne = np.fromiter((float(v) if v is not None else 0.0 for v in valeurs),
+                          dtype=np.float64, count=len(valeurs))
+    return colonne, presentes
+
+
+def _colonne_date(valeurs):
+    """
+    Convertit une liste de dates (ou None) en numéros de jour (int64) et un masque de présence
+    """
+    presentes = np.fromiter((v is not None for v in valeurs), dtype=bool, count=len(valeurs))
+    colonne = np.fromiter((v.toordinal() if v is not None else 0 for v in valeurs),
+                          dtype=np.int64, count=len(valeurs))
+    return colonne, presentes
+
+
+def _classer(valeurs, masque, verte, jaune, codes, ambigus):
+    """
+    Classe les valeurs masquées par rapport aux bornes verte et jaune et
+    marque comme ambiguës celles trop proches d'une borne
+    """
+    classement = np.where(valeurs <= verte, VERT, np.where(valeurs <= jaune, JAUNE, ROUGE))
+    codes[masque] = classement[masque]
+
+    for borne in (verte, jaune):
+        echelle = np.maximum(1.0, np.maximum(np.abs(valeurs), np.abs(borne)))
+        ambigus |= masque & (np.abs(valeurs - borne) <= TOLERANCE_RELATIVE * echelle)
+
+
+def charger_colonnes_operations(operations):
+    """
+    Charge les champs d'évaluation d'un queryset d'opérations et le premier seuil
+    de chacune (même règle que operation.seuils.first()) en deux requêtes.
+
+    Returns:
+        Un dictionnaire de colonnes NumPy alignées (une ligne par opération),
+        avec les lignes brutes pour le recalcul exact des cas ambigus
+    """
+    lignes = list(operations.order_by('pk').values_list(*CHAMPS_OPERATION))
+
+    seuils = {}
+    valeurs_seuils = (Seuil.objects
+                      .filter(operation__in=operations.order_by().values('pk'))
+                      .order_by('operation_id', 'pk')
+                      .values_list('operation_id', 'valeur_verte', 'valeur_jaune'))
+    for operation_id, valeur_verte, valeur_jaune in valeurs_seuils:
+        seuils.setdefault(operation_id, (valeur_verte, valeur_jaune))
+
+    colonnes = list(zip(*lignes)) if lignes else [()] * len(CHAMPS_OPERATION)
+    (ids, phase_ids, couts_reels, couts_prevus, progressions,
+     debuts_prevus, fins_prevues, debuts_reels, fins_reelles) = colonnes
+
+    seuils_operations = [seuils.get(operation_id) for operation_id in ids]
+
+    return {
+        'lignes': lignes,
+        'seuils': seuils_operations,
+        'id': np.array(ids, dtype=np.int64),
+        'phase_id': np.array(phase_ids, dtype=np.int64),
+        'cout_reel': _colonne_decimale(couts_reels),
+        'cout_prevue': _colonne_decimale(couts_prevus),
+        'progression': _colonne_decimale(progressions)[0],
+        'date_debut_prevue': _colonne_date(debuts_prevus),
+        'date_fin_prevue': _colonne_date(fins_prevues),
+        'date_debut_reelle': _colonne_date(debuts_reels),
+        'date_fin_reelle': _colonne_date(fins_reelles),
+        'seuil_present': np.array([s is not None for s in seuils_operations], dtype=bool),
+        'valeur_verte': np.array([float(s[0]) if s else 0.0 for s in seuils_operations], dtype=np.float64),
+        'valeur_jaune': np.array([float(s[1]) if s else 0.0 for s in seuils_operations], dtype=np.float64),
+    }
+
+
+def calculer_statuts_vectorises(colonnes, aujourd_hui=None):
+    """
+    Calcule en une passe vectorisée les statuts coût et délai de toutes les opérations.
+
+    Args:
+        colonnes: Colonnes retournées par charger_colonnes_operations
+        aujourd_hui: Date d'évaluation (aujourd'hui par défaut)
+
+    Returns:
+        Un tuple (codes_cout, codes_delai, codes_global) de tableaux d'entiers
+        0 (VERT), 1 (JAUNE), 2 (ROUGE)
+    """
+    if aujourd_hui is None:
+        aujourd_hui = timezone.now().date()
+
+    nombre = len(colonnes['id'])
+    codes_cout = np.zeros(nombre, dtype=np.int8)
+    codes_delai = np.zeros(nombre, dtype=np.int8)
+    ambigus = np.zeros(nombre, dtype=bool)
+    seuil = colonnes['seuil_present']
+    verte, jaune = colonnes['valeur_verte'], colonnes['valeur_jaune']
+
+    # Coût : cout_reel / cout_prevue en pourcentage
+    cout_reel, cout_reel_present = colonnes['cout_reel']
+    cout_prevue, cout_prevue_present = colonnes['cout_prevue']
+    masque_cout = seuil & cout_reel_present & cout_prevue_present & (cout_prevue > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pourcentage_cout = (cout_reel / np.where(masque_cout, cout_prevue, 1.0)) * 100
+    _classer(pourcentage_cout, masque_cout, verte, jaune, codes_cout, ambigus)
+
+    debut_prevu, debut_prevu_present = colonnes['date_debut_prevue']
+    fin_prevue, fin_prevue_present = colonnes['date_fin_prevue']
+    debut_reel, debut_reel_present = colonnes['date_debut_reelle']
+    fin_reelle, fin_reelle_present = colonnes['date_fin_reelle']
+    duree_prevue = fin_prevue - debut_prevu
+    diviseur = np.where(duree_prevue > 0, duree_prevue, 1).astype(np.float64)
+
+    # Délai d'une opération en cours : écart entre temps écoulé et progression
+    en_cours = seuil & debut_reel_present & fin_prevue_present & ~fin_reelle_present
+    masque_en_cours = en_cours & debut_prevu_present & (duree_prevue > 0)
+    duree_ecoulee = (aujourd_hui.toordinal() - debut_reel).astype(np.float64)
+    ecart_progression = (duree_ecoulee / diviseur) * 100 - colonnes['progression']
+    _classer(ecart_progression, masque_en_cours, verte, jaune, codes_delai, ambigus)
+
+    # Délai d'une opération terminée : dépassement rapporté à la durée prévue
+    terminee = seuil & ~en_cours & fin_reelle_present & fin_prevue_present
+    masque_terminee = terminee & debut_prevu_present & (duree_prevue > 0)
+    retard = (fin_reelle - fin_prevue).astype(np.float64)
+    pourcentage_retard = (retard / diviseur) * 100
+    _classer(pourcentage_retard, masque_terminee, verte, jaune, codes_delai, ambigus)
+
+    # Recalcul exact (Decimal) des opérations proches d'une borne
+    for index in np.flatnonzero(ambigus):
+        operation = SimpleNamespace(**dict(zip(CHAMPS_OPERATION, colonnes['lignes'][index])))
+        valeur_verte, valeur_jaune = colonnes['seuils'][index]
+        statut = _calculer_statut_couleur_operation(
+            operation,
+            SimpleNamespace(valeur_verte=valeur_verte, valeur_jaune=valeur_jaune),
+            aujourd_hui
+        )
+        codes_cout[index] = CODES_COULEUR[statut['statut_cout']]
+        codes_delai[index] = CODES_COULEUR[statut['statut_delai']]
+
+    return codes_cout, codes_delai, np.maximum(codes_cout, codes_delai)
+
+
+def _agreger(codes, index_parent, nombre_parents):
+    """
+    Couleur la plus grave des enfants de chaque parent (VERT si aucun enfant)
+    """
+    resultat = np.zeros(nombre_parents, dtype=np.int8)
+    np.maximum.at(resultat, index_parent, codes)
+    return resultat
+
+
+def _statut(codes_cout, codes_delai, codes_global, index):
+    return {
+        'statut_cout': COULEURS[codes_cout[index]],
+        'statut_delai': COULEURS[codes_delai[index]],
+        'statut_global': COULEURS[codes_global[index]],
+    }
+
+
+def generer_heatmap_portefeuille(projet_ids=None, aujourd_hui=None):
+    """
+    Génère la carte de chaleur projets × phases du portefeuille.
+
+    Args:
+        projet_ids: Projets à inclure (par défaut, tous les projets non terminés)
+        aujourd_hui: Date d'évaluation (aujourd'hui par défaut)
+
+    Returns:
+        Un dictionnaire avec la répartition des opérations par couleur et, pour
+        chaque projet, son statut couleur et celui de chacune de ses phases
+        (dans l'ordre des phases) avec le nombre d'opérations par couleur
+    """
+    if aujourd_hui is None:
+        aujourd_hui = timezone.now().date()
+
+    projets = Projet.objects.order_by('pk')
+    if projet_ids is None:
+        projets = projets.exclude(statut='TERMINE')
+    else:
+        projets = projets.filter(pk__in=list(projet_ids))
+    projets = list(projets.values_list('id', 'nom'))
+    ids_projets = [projet_id for projet_id, _ in projets]
+
+    phases = list(Phase.objects.filter(projet_id__in=ids_projets)
+                  .order_by('projet_id', 'ordre', 'pk')
+                  .values_list('id', 'projet_id', 'nom', 'ordre'))
+
+    colonnes = charger_colonnes_operations(Operation.objects.filter(phase__projet_id__in=ids_projets))
+    codes_cout, codes_delai, codes_global = calculer_statuts_vectorises(colonnes, aujourd_hui)
+
+    # Index de la phase de chaque opération et du projet de chaque phase
+    ids_phases = np.array([phase[0] for phase in phases], dtype=np.int64)
+    ordre_phases = np.argsort(ids_phases)
+    index_phase = ordre_phases[np.searchsorted(ids_phases, colonnes['phase_id'], sorter=ordre_phases)]
+    ids_projets_tries = np.array(ids_projets, dtype=np.int64)
+    index_projet = np.searchsorted(ids_projets_tries, np.array([phase[1] for phase in phases], dtype=np.int64))
+
+    nombre_phases = len(phases)
+    phases_cout = _agreger(codes_cout, index_phase, nombre_phases)
+    phases_delai = _agreger(codes_delai, index_phase, nombre_phases)
+    phases_global = np.maximum(phases_cout, phases_delai)
+
+    operations_par_couleur = np.zeros((nombre_phases, len(COULEURS)), dtype=np.int64)
+    np.add.at(operations_par_couleur, (index_phase, codes_global), 1)
+
+    projets_cout = _agreger(phases_cout, index_projet, len(projets))
+    projets_delai = _agreger(phases_delai, index_projet, len(projets))
+    projets_global = np.maximum(projets_cout, projets_delai)
+
+    resultat = [
+        dict(id=projet_id, nom=nom, phases=[],
+             **_statut(projets_cout, projets_delai, projets_global, index))
+        for index, (projet_id, nom) in enumerate(projets)
+    ]
+    for index, (phase_id, _, nom, ordre) in enumerate(phases):
+        resultat[index_projet[index]]['phases'].append(dict(
+            id=phase_id, nom=nom, ordre=ordre,
+            operations_par_couleur=dict(zip(COULEURS, operations_par_couleur[index].tolist())),
+            **_statut(phases_cout, phases_delai, phases_global, index)
+        ))
+
+    repartition = np.bincount(codes_global, minlength=len(COULEURS))
+    return {
+        'date_evaluation': aujourd_hui,
+        'nombre_operations': int(len(codes_global)),
+        'repartition_operations': dict(zip(COULEURS, repartition.tolist())),
+        'projets': resultat,
+    }
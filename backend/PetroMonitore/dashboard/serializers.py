@@ -152,6 +152,13 @@ class IndicateursPerformanceSerializer(serializers.Serializer):
     temps_resolution_moyen = serializers.FloatField()
 
 
+class IndicateursPerformanceProjetSerializer(IndicateursPerformanceSerializer):
+    """
+    Sérialiseur pour les indicateurs de performance d'un projet
+    """
+    projet_id = serializers.IntegerField()
+
+
 class IndicateursEquipeSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     nom_complet = serializers.CharField()
@@ -197,4 +204,15 @@ class StatistiquesEquipeProjetSerializer(serializers.Serializer):
     nombre_membres = serializers.IntegerField()
     ingenieur_terrain = serializers.IntegerField()
     expert = serializers.IntegerField()
-    top_management = serializers.IntegerField()
\ No newline at end of file
+    top_management = serializers.IntegerField()
+
+
+class ChargeMembreSerializer(serializers.Serializer):
+    """
+    Sérialiseur pour une ligne de la matrice de charge du portefeuille
+    (opérations assignées à un membre, par projet)
+    """
+    id = serializers.IntegerField()
+    nom_complet = serializers.CharField()
+    projets = serializers.DictField(child=serializers.IntegerField())
+    operations_assignees = serializers.IntegerField()
\ No newline at end of file
@@ -6,10 +6,21 @@ from rest_framework import status
 from datetime import date, timedelta
 from decimal import Decimal
 import json
+from unittest import mock
 
 from ..models import (
     Utilisateur, Projet, Phase, Operation, Probleme, 
-    EquipeProjet, Alerte, Solution
+    EquipeProjet, Alerte, Solution, Seuil, InstantaneTableauBord
+)
+from ..recalculs import differer_recalculs
+from ..tasks import rafraichir_instantane_tableau_bord
+from ..utils import evaluer_statut_couleur_operation
+from .indicateurs import (
+    indicateurs_equipes, indicateurs_performance, indicateurs_performance_par_projet, statistiques_generales
+)
+from .instantanes import rafraichir_instantanes
+from .portefeuille import (
+    COULEURS, charger_colonnes_operations, calculer_statuts_vectorises, generer_heatmap_portefeuille
 )
 from .serializers import (
     DashboardGeneralSerializer, ResponsableProjectCountSerializer,
@@ -307,6 +318,336 @@ class SerializerTestCase(TestCase):
         self.assertEqual(serializer.data['top_management'], 1)
 
 
+class IndicateursPortefeuilleTestCase(TestCase):
+    """Tests des indicateurs du portefeuille calculés par la base"""
+    
+    def setUp(self):
+        aujourd_hui = timezone.now().date()
+        echeance = aujourd_hui - timedelta(days=10)
+        self.projets = [
+            # Terminé en retard de 3 jours et hors budget
+            Projet.objects.create(nom="Terminé en retard", statut='TERMINE', budget_initial=Decimal('100.00'),
+                                  cout_actuel=Decimal('120.00'), date_fin_prevue=echeance,
+                                  date_fin_reelle=echeance + timedelta(days=3)),
+            # Terminé dans les délais et le budget
+            Projet.objects.create(nom="Terminé réussi", statut='TERMINE', budget_initial=Decimal('100.00'),
+                                  cout_actuel=Decimal('80.00'), date_fin_prevue=echeance,
+                                  date_fin_reelle=echeance - timedelta(days=1)),
+            # En cours, échéance dépassée
+            Projet.objects.create(nom="En retard", statut='EN_COURS', budget_initial=Decimal('50.00'),
+                                  date_fin_prevue=echeance),
+            Projet.objects.create(nom="Planifié", statut='PLANIFIE'),
+            Projet.objects.create(nom="Suspendu", statut='SUSPENDU'),
+        ]
+        Phase.objects.create(projet=self.projets[2], nom="Phase", ordre=1, statut='EN_COURS')
+        Projet.objects.filter(pk=self.projets[2].pk).update(progression=Decimal('40.00'))
+    
+    def test_statistiques_generales(self):
+        """Test des statistiques globales, en deux requêtes"""
+        with self.assertNumQueries(2):
+            statistiques = statistiques_generales()
+        
+        self.assertEqual(
+            {cle: statistiques[cle] for cle in ('total_projets', 'projets_planifies', 'projets_en_cours',
+                                                'projets_termines', 'projets_suspendus', 'projets_en_retard')},
+            {'total_projets': 5, 'projets_planifies': 1, 'projets_en_cours': 1, 'projets_termines': 2,
+             'projets_suspendus': 1, 'projets_en_retard': 1}
+        )
+        self.assertEqual(statistiques['budget_initial_total'], Decimal('250.00'))
+        self.assertEqual(statistiques['cout_actuel_total'], Decimal('200.00'))
+        self.assertEqual(statistiques['ecart_budgetaire'], Decimal('-50.00'))
+        self.assertEqual(statistiques['retard_moyen_jours'], 3)
+        self.assertEqual(statistiques['taux_reussite'], 50)
+        self.assertEqual(float(statistiques['progression_moyenne']), 40.0)
+    
+    def test_nombre_requetes_constant(self):
+        """Test que le nombre de requêtes ne dépend pas du nombre de projets"""
+        Projet.objects.bulk_create([
+            Projet(nom=f"Projet {i}", statut='EN_COURS', budget_initial=Decimal('10.00')) for i in range(30)
+        ])
+        with self.assertNumQueries(2):
+            statistiques = statistiques_generales()
+        self.assertEqual(statistiques['total_projets'], 35)
+
+
+class IndicateursPerformanceTestCase(APITestCase):
+    """Tests des indicateurs de performance calculés par la base"""
+    
+    def setUp(self):
+        self.aujourd_hui = timezone.now().date()
+        self.utilisateur = Utilisateur.objects.create(
+            nom="Bernard", prenom="Luc", email="luc.bernard@example.com", role="TOP_MANAGEMENT"
+        )
+        self.client.force_authenticate(user=self.utilisateur)
+        # Moitié du temps écoulé
+        self.en_cours = Projet.objects.create(nom="En cours", statut='EN_COURS',
+                                              date_debut=self.aujourd_hui - timedelta(days=10),
+                                              date_fin_prevue=self.aujourd_hui + timedelta(days=10))
+        # Échéance dépassée : temps écoulé plafonné à la durée totale
+        self.en_retard = Projet.objects.create(nom="En retard", statut='PLANIFIE',
+                                               date_debut=self.aujourd_hui - timedelta(days=30),
+                                               date_fin_prevue=self.aujourd_hui - timedelta(days=10))
+        # Pas encore commencé : exclu de l'efficacité
+        self.futur = Projet.objects.create(nom="Futur", statut='EN_COURS',
+                                           date_debut=self.aujourd_hui + timedelta(days=5),
+                                           date_fin_prevue=self.aujourd_hui + timedelta(days=50))
+        phase_en_cours = Phase.objects.create(projet=self.en_cours, nom="Forage", ordre=1, statut='EN_COURS')
+        phase_en_retard = Phase.objects.create(projet=self.en_retard, nom="Forage", ordre=1, statut='EN_COURS')
+        # Opérations terminées de 4 jours et de 0 jour (compté 1 jour)
+        Operation.objects.create(phase=phase_en_cours, nom="Tubage", statut='TERMINE', cout_reel=Decimal('100.00'),
+                                 date_debut_reelle=self.aujourd_hui - timedelta(days=10),
+                                 date_fin_reelle=self.aujourd_hui - timedelta(days=6))
+        operation = Operation.objects.create(phase=phase_en_retard, nom="Cimentation", statut='TERMINE',
+                                             cout_reel=Decimal('300.00'),
+                                             date_debut_reelle=self.aujourd_hui - timedelta(days=20),
+                                             date_fin_reelle=self.aujourd_hui - timedelta(days=20))
+        Operation.objects.create(phase=phase_en_cours, nom="Complétion", statut='EN_COURS')
+        Projet.objects.filter(pk=self.en_cours.pk).update(progression=Decimal('25.00'))
+        Projet.objects.filter(pk=self.en_retard.pk).update(progression=Decimal('80.00'))
+        
+        # Problème résolu en un jour et demi, et problème ouvert rattaché par son opération
+        maintenant = timezone.now()
+        resolu = Probleme.objects.create(projet=self.en_cours, titre="Fuite", gravite='ELEVEE', statut='RESOLU')
+        ouvert = Probleme.objects.create(operation=operation, titre="Perte", gravite='FAIBLE')
+        Probleme.objects.filter(pk=resolu.pk).update(date_signalement=maintenant - timedelta(days=3),
+                                                     date_resolution=maintenant - timedelta(days=1.5))
+        Probleme.objects.filter(pk=ouvert.pk).update(date_signalement=maintenant - timedelta(days=30))
+    
+    def test_indicateurs_globaux(self):
+        """Test des indicateurs du portefeuille, en trois requêtes"""
+        with self.assertNumQueries(3):
+            indicateurs = indicateurs_performance()
+        
+        self.assertAlmostEqual(indicateurs['efficacite'], (0.5 + 0.8) / 2)
+        self.assertEqual(indicateurs['productivite_cout'], Decimal(2) / Decimal('400.00'))
+        self.assertAlmostEqual(indicateurs['productivite_temps'], 2 / 5)
+        self.assertAlmostEqual(indicateurs['qualite_problemes'], 2 / 3)
+        self.assertAlmostEqual(indicateurs['temps_resolution_moyen'], 1.5, places=4)
+    
+    def test_indicateurs_par_projet(self):
+        """Test des indicateurs groupés par projet, avec les mêmes trois requêtes"""
+        with self.assertNumQueries(3):
+            indicateurs = {ligne['projet_id']: ligne for ligne in indicateurs_performance_par_projet()}
+        
+        self.assertEqual(set(indicateurs), {self.en_cours.id, self.en_retard.id, self.futur.id})
+        en_cours = indicateurs[self.en_cours.id]
+        self.assertAlmostEqual(en_cours['efficacite'], 0.5)
+        self.assertEqual(en_cours['productivite_cout'], Decimal(1) / Decimal('100.00'))
+        self.assertAlmostEqual(en_cours['productivite_temps'], 1 / 4)
+        self.assertAlmostEqual(en_cours['qualite_problemes'], 1 / 2)
+        self.assertAlmostEqual(en_cours['temps_resolution_moyen'], 1.5, places=4)
+        en_retard = indicateurs[self.en_retard.id]
+        self.assertAlmostEqual(en_retard['efficacite'], 0.8)
+        self.assertAlmostEqual(en_retard['productivite_temps'], 1)
+        self.assertAlmostEqual(en_retard['qualite_problemes'], 1)
+        self.assertEqual(indicateurs[self.futur.id], {
+            'projet_id': self.futur.id, 'efficacite': 0, 'productivite_cout': Decimal('0.00'),
+            'productivite_temps': 0, 'qualite_problemes': 0, 'temps_resolution_moyen': 0
+        })
+    
+    def test_fenetre_de_temps(self):
+        """Test de la fenêtre de temps sur les opérations terminées et les problèmes"""
+        indicateurs = indicateurs_performance(debut=self.aujourd_hui - timedelta(days=8))
+        self.assertEqual(indicateurs['productivite_cout'], Decimal(1) / Decimal('100.00'))
+        self.assertAlmostEqual(indicateurs['productivite_temps'], 1 / 4)
+        self.assertAlmostEqual(indicateurs['qualite_problemes'], 1 / 3)
+        
+        indicateurs = indicateurs_performance(projet_ids=[self.en_retard.id],
+                                              fin=self.aujourd_hui - timedelta(days=8))
+        self.assertEqual(indicateurs['productivite_cout'], Decimal(1) / Decimal('300.00'))
+        self.assertAlmostEqual(indicateurs['qualite_problemes'], 1)
+        self.assertEqual(indicateurs['temps_resolution_moyen'], 0)
+    
+    def test_vue_filtree(self):
+        """Test de la vue filtrée par projets et fenêtre, calculée à la demande"""
+        url = reverse('dashboard-performance')
+        response = self.client.get(url, {'projets': f"{self.en_cours.id}", 'par_projet': 'true',
+                                         'debut': (self.aujourd_hui - timedelta(days=8)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(response.data['efficacite'], 0.5)
+        self.assertEqual([ligne['projet_id'] for ligne in response.data['projets']], [self.en_cours.id])
+        self.assertFalse(InstantaneTableauBord.objects.exists())
+        
+        self.assertEqual(self.client.get(url, {'debut': '2024-13-45'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'projets': 'a,b'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IndicateursEquipesTestCase(APITestCase):
+    """Tests des indicateurs des équipes, groupés sur plusieurs projets"""
+    
+    def setUp(self):
+        self.ingenieur = Utilisateur.objects.create(nom="Durand", prenom="Paul", email="paul.durand@example.com",
+                                                    role="INGENIEUR_TERRAIN")
+        self.expert = Utilisateur.objects.create(nom="Petit", prenom="Anne", email="anne.petit@example.com",
+                                                 role="EXPERT")
+        self.client.force_authenticate(user=self.expert)
+        self.projets = [Projet.objects.create(nom=f"Projet {i}", statut='EN_COURS') for i in range(2)]
+        for projet in self.projets:
+            EquipeProjet.objects.create(projet=projet, utilisateur=self.ingenieur, role_projet="Foreur")
+        EquipeProjet.objects.create(projet=self.projets[0], utilisateur=self.expert, role_projet="Géologue")
+        
+        phases = [Phase.objects.create(projet=projet, nom="Forage", ordre=1, statut='EN_COURS')
+                  for projet in self.projets]
+        for progression in ('20.00', '60.00'):
+            Operation.objects.create(phase=phases[0], nom="Tubage", statut='EN_COURS', responsable=self.ingenieur,
+                                     progression=Decimal(progression))
+        Operation.objects.create(phase=phases[1], nom="Tubage", statut='EN_COURS', responsable=self.ingenieur,
+                                 progression=Decimal('10.00'))
+        # Responsable hors équipe : ignoré
+        Operation.objects.create(phase=phases[1], nom="Audit", statut='EN_COURS', responsable=self.expert)
+    
+    def test_indicateurs_equipes(self):
+        """Test des statistiques et indicateurs des membres, en deux requêtes"""
+        with self.assertNumQueries(2):
+            equipes = indicateurs_equipes([projet.id for projet in self.projets])
+        
+        premiere = equipes[self.projets[0].id]
+        self.assertEqual(premiere['statistiques_generales'],
+                         {'nombre_membres': 2, 'ingenieur_terrain': 1, 'expert': 1, 'top_management': 0})
+        membres = {membre['id']: membre for membre in premiere['indicateurs_membres']}
+        self.assertEqual(membres[self.ingenieur.id]['operations_assignees'], 2)
+        self.assertEqual(float(membres[self.ingenieur.id]['progression_moyenne']), 40.0)
+        self.assertEqual(membres[self.expert.id]['nom_complet'], "Anne Petit")
+        self.assertEqual(membres[self.expert.id]['operations_assignees'], 0)
+        self.assertEqual(membres[self.expert.id]['progression_moyenne'], 0)
+        
+        seconde = equipes[self.projets[1].id]
+        self.assertEqual(seconde['statistiques_generales']['nombre_membres'], 1)
+        self.assertEqual([membre['operations_assignees'] for membre in seconde['indicateurs_membres']], [1])
+    
+    def test_matrice_charge(self):
+        """Test de la vue sur plusieurs projets, sans requête par projet ni par membre"""
+        url = reverse('dashboard-equipe')
+        projets = ','.join(str(projet.id) for projet in self.projets)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'projets': projets})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([equipe['projet_id'] for equipe in response.data['projets']],
+                         [projet.id for projet in self.projets])
+        matrice = {ligne['id']: ligne for ligne in response.data['matrice_charge']}
+        # Clés JSON : identifiants des projets en chaînes
+        self.assertEqual(matrice[self.ingenieur.id]['projets'],
+                         {str(self.projets[0].id): 2, str(self.projets[1].id): 1})
+        self.assertEqual(matrice[self.ingenieur.id]['operations_assignees'], 3)
+        self.assertEqual(matrice[self.expert.id]['projets'], {str(self.projets[0].id): 0})
+        
+        self.assertEqual(self.client.get(url, {'projets': '1,x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class InstantanesTableauBordTestCase(APITestCase):
+    """Tests des instantanés des tableaux de bord"""
+    
+    def setUp(self):
+        self.utilisateur = Utilisateur.objects.create(
+            nom="Martin", prenom="Claire", email="claire.martin@example.com", role="TOP_MANAGEMENT"
+        )
+        self.client.force_authenticate(user=self.utilisateur)
+        self.projet = Projet.objects.create(nom="Projet Instantané", statut='EN_COURS',
+                                            budget_initial=Decimal('1000.00'), cout_actuel=Decimal('100.00'))
+    
+    def test_lecture_depuis_instantane(self):
+        """Test qu'un tableau de bord est servi depuis son instantané, en une requête"""
+        url = reverse('dashboard-general')
+        premiere = self.client.get(url)
+        self.assertEqual(premiere.status_code, status.HTTP_200_OK)
+        self.assertEqual(premiere.data['total_projets'], 1)
+        self.assertIn('date_generation', premiere.data)
+        
+        with self.assertNumQueries(1):
+            seconde = self.client.get(url)
+        self.assertEqual(seconde.data, premiere.data)
+    
+    def test_invalidation_par_ecriture(self):
+        """Test que les écritures périment les instantanés concernés, une fois par requête"""
+        url_general = reverse('dashboard-general')
+        url_projet = reverse('dashboard-projet', args=[self.projet.id])
+        autre = Projet.objects.create(nom="Autre Projet", statut='PLANIFIE')
+        self.client.get(url_general)
+        self.client.get(url_projet)
+        self.client.get(reverse('dashboard-projet', args=[autre.id]))
+        
+        # Plusieurs écritures d'un bloc (une requête) : une seule invalidation
+        with differer_recalculs():
+            Projet.objects.create(nom="Nouveau Projet", statut='EN_COURS')
+            Probleme.objects.create(projet=self.projet, titre="Fuite", gravite='CRITIQUE')
+        
+        perimes = dict(InstantaneTableauBord.objects.values_list('objet_id', 'perime').filter(
+            type_instantane='PROJET'
+        ))
+        self.assertEqual(perimes, {self.projet.id: True, autre.id: False})
+        
+        # Instantanés périmés servis, puis régénérés en tâche de fond
+        app = rafraichir_instantane_tableau_bord.app
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.get(url_general).data['total_projets'], 2)
+                self.assertEqual(self.client.get(url_projet).data['problemes_non_resolus_critiques'], 0)
+        finally:
+            app.conf.task_always_eager = eager
+        self.assertEqual(self.client.get(url_general).data['total_projets'], 3)
+        self.assertEqual(self.client.get(url_projet).data['problemes_non_resolus_critiques'], 1)
+    
+    def test_rafraichissement_perime_regroupe(self):
+        """Test que les lectures concurrentes d'un instantané périmé demandent une seule régénération"""
+        url = reverse('dashboard-general')
+        self.client.get(url)
+        Projet.objects.create(nom="Nouveau Projet", statut='EN_COURS')
+        
+        with mock.patch.object(rafraichir_instantane_tableau_bord, 'delay') as planification:
+            with self.captureOnCommitCallbacks(execute=True):
+                lectures = [self.client.get(url) for _ in range(3)]
+        
+        self.assertEqual([lecture.data['total_projets'] for lecture in lectures], [1, 1, 1])
+        planification.assert_called_once_with('GENERAL', 0)
+        
+        # Demande non effectuée après le délai (worker arrêté) : renouvelée
+        InstantaneTableauBord.objects.update(date_demande_rafraichissement=timezone.now() - timedelta(minutes=5))
+        with mock.patch.object(rafraichir_instantane_tableau_bord, 'delay') as planification:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(url)
+        planification.assert_called_once_with('GENERAL', 0)
+        
+        # Instantané trop ancien : régénéré à la lecture
+        InstantaneTableauBord.objects.update(date_generation=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.client.get(url).data['total_projets'], 2)
+    
+    def test_max_age(self):
+        """Test du paramètre max_age"""
+        url = reverse('dashboard-general')
+        premiere = self.client.get(url)
+        # Écriture hors invalidation : l'instantané reste servi tant qu'il est assez récent
+        Projet.objects.bulk_create([Projet(nom="Projet en lot", statut='EN_COURS')])
+        self.assertEqual(self.client.get(url).data['total_projets'], 1)
+        
+        recente = self.client.get(url, {'max_age': 0})
+        self.assertEqual(recente.data['total_projets'], 2)
+        self.assertGreater(recente.data['date_generation'], premiere.data['date_generation'])
+        
+        self.assertEqual(self.client.get(url, {'max_age': 'hier'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('dashboard-projet', args=[9999])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+    
+    def test_rafraichissement_periodique(self):
+        """Test de la régénération périodique des instantanés périmés"""
+        self.client.get(reverse('dashboard-projet', args=[self.projet.id]))
+        Projet.objects.filter(pk=self.projet.pk).update(cout_actuel=Decimal('500.00'))
+        InstantaneTableauBord.objects.update(perime=True)
+        
+        # Portefeuille (général et performance) et projet périmé
+        self.assertEqual(rafraichir_instantanes(), 3)
+        instantane = InstantaneTableauBord.objects.get(type_instantane='PROJET')
+        self.assertFalse(instantane.perime)
+        self.assertEqual(instantane.donnees['cout_actuel'], '500.00')
+        
+        # Projet supprimé : son instantané l'est aussi
+        self.projet.delete()
+        rafraichir_instantanes()
+        self.assertFalse(InstantaneTableauBord.objects.filter(type_instantane='PROJET').exists())
+
+
 class ViewsTestCase(APITestCase):
     """Tests pour les vues API"""
     
@@ -576,4 +917,141 @@ class ViewsTestCase(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
-        self.assertIn('detail', response.data)
\ No newline at end of file
+        self.assertIn('detail', response.data)
+
+
+class PortefeuilleVectoriseTestCase(APITestCase):
+    """Tests pour le moteur vectorisé des statuts couleur du portefeuille"""
+    
+    def setUp(self):
+        """Générer un portefeuille varié, avec des valeurs exactement sur les bornes"""
+        import random
+        generateur = random.Random(42)
+        aujourd_hui = date.today()
+        
+        self.utilisateur = Utilisateur.objects.create(
+            nom="Dupont", prenom="Jean", email="jean.dupont@example.com", role="TOP_MANAGEMENT"
+        )
+        self.projets = [
+            Projet.objects.create(nom=f"Projet {i}", statut="EN_COURS", responsable=self.utilisateur)
+            for i in range(3)
+        ]
+        self.projet_termine = Projet.objects.create(nom="Projet terminé", statut="TERMINE")
+        self.phases = [
+            Phase.objects.create(projet=projet, nom=f"Phase {ordre}", ordre=ordre, statut="EN_COURS")
+            for projet in self.projets for ordre in (2, 1)
+        ]
+        self.phase_vide = Phase.objects.create(projet=self.projets[0], nom="Phase vide", ordre=3, statut="PLANIFIE")
+        
+        def date_aleatoire():
+            if generateur.random() < 0.15:
+                return None
+            return aujourd_hui + timedelta(days=generateur.randint(-120, 60))
+        
+        operations = []
+        for i in range(200):
+            operations.append(Operation(
+                phase=generateur.choice(self.phases),
+                nom=f"Op {i}",
+                statut="EN_COURS",
+                cout_prevue=generateur.choice([None, Decimal('0.00'), Decimal('10000.00'),
+                                               Decimal(generateur.randint(1, 10**7)) / 100]),
+                cout_reel=generateur.choice([None, Decimal(generateur.randint(0, 2 * 10**6)) / 100]),
+                progression=Decimal(generateur.randint(0, 10000)) / 100,
+                date_debut_prevue=date_aleatoire(),
+                date_fin_prevue=date_aleatoire(),
+                date_debut_reelle=date_aleatoire(),
+                date_fin_reelle=generateur.choice([None, date_aleatoire()]),
+            ))
+        
+        # Cas limites : valeurs exactement égales aux bornes des seuils
+        phase = self.phases[0]
+        operations += [
+            # Coût à exactement 60 % du prévu
+            Operation(phase=phase, nom="Borne coût", statut="EN_COURS",
+                      cout_prevue=Decimal('10000.00'), cout_reel=Decimal('6000.00')),
+            # Écart temps/progression de 61 - 0.9 = 60.1 en flottant
+            Operation(phase=phase, nom="Borne délai", statut="EN_COURS",
+                      date_debut_prevue=aujourd_hui - timedelta(days=61),
+                      date_fin_prevue=aujourd_hui + timedelta(days=39),
+                      date_debut_reelle=aujourd_hui - timedelta(days=61),
+                      progression=Decimal('0.90')),
+            # Retard de 10 jours sur 100 prévus, soit exactement 10 %
+            Operation(phase=phase, nom="Borne retard", statut="TERMINE",
+                      date_debut_prevue=aujourd_hui - timedelta(days=200),
+                      date_fin_prevue=aujourd_hui - timedelta(days=100),
+                      date_fin_reelle=aujourd_hui - timedelta(days=90)),
+        ]
+        Operation.objects.bulk_create(operations)
+        
+        bornes = [(Decimal('60.00'), Decimal('95.00')), (Decimal('60.10'), Decimal('80.00')),
+                  (Decimal('10.00'), Decimal('10.00')), (Decimal('0.00'), Decimal('33.33'))]
+        seuils = []
+        for operation in Operation.objects.order_by('pk'):
+            if operation.nom.startswith('Borne'):
+                verte, jaune = bornes[0] if operation.nom == "Borne coût" else (
+                    bornes[1] if operation.nom == "Borne délai" else bornes[2])
+            elif generateur.random() < 0.1:
+                continue
+            else:
+                verte, jaune = generateur.choice(bornes)
+            seuils.append(Seuil(operation=operation, valeur_verte=verte, valeur_jaune=jaune,
+                                valeur_rouge=Decimal('100.00')))
+        Seuil.objects.bulk_create(seuils)
+    
+    def test_parite_avec_evaluation_unitaire(self):
+        """Le calcul vectorisé donne exactement les statuts de evaluer_statut_couleur_operation"""
+        colonnes = charger_colonnes_operations(Operation.objects.all())
+        codes_cout, codes_delai, codes_global = calculer_statuts_vectorises(colonnes)
+        
+        operations = Operation.objects.in_bulk()
+        self.assertEqual(len(colonnes['id']), len(operations))
+        for index, operation_id in enumerate(colonnes['id'].tolist()):
+            attendu = evaluer_statut_couleur_operation(operations[operation_id])
+            self.assertEqual({
+                'statut_cout': COULEURS[codes_cout[index]],
+                'statut_delai': COULEURS[codes_delai[index]],
+                'statut_global': COULEURS[codes_global[index]],
+            }, attendu, f"Écart pour l'opération {operations[operation_id].nom}")
+    
+    def test_heatmap_agregation(self):
+        """La carte de chaleur agrège les opérations par phase et par projet"""
+        heatmap = generer_heatmap_portefeuille()
+        
+        # Le projet terminé est exclu par défaut
+        self.assertEqual([projet['id'] for projet in heatmap['projets']], [projet.id for projet in self.projets])
+        self.assertEqual(heatmap['nombre_operations'], Operation.objects.count())
+        self.assertEqual(sum(heatmap['repartition_operations'].values()), Operation.objects.count())
+        
+        gravite = {couleur: code for code, couleur in enumerate(COULEURS)}
+        for projet in heatmap['projets']:
+            # Phases dans l'ordre
+            self.assertEqual([phase['ordre'] for phase in projet['phases']],
+                             sorted(phase['ordre'] for phase in projet['phases']))
+            pire = max((gravite[phase['statut_global']] for phase in projet['phases']), default=0)
+            self.assertEqual(gravite[projet['statut_global']], pire)
+            
+            for phase in projet['phases']:
+                operations = Operation.objects.filter(phase_id=phase['id'])
+                self.assertEqual(sum(phase['operations_par_couleur'].values()), operations.count())
+                statuts = [evaluer_statut_couleur_operation(operation)['statut_global'] for operation in operations]
+                self.assertEqual(phase['statut_global'], COULEURS[max((gravite[s] for s in statuts), default=0)])
+        
+        phase_vide = next(phase for phase in heatmap['projets'][0]['phases'] if phase['id'] == self.phase_vide.id)
+        self.assertEqual(phase_vide['statut_global'], 'VERT')
+    
+    def test_heatmap_view(self):
+        """Test pour la vue HeatmapPortefeuilleView"""
+        client = APIClient()
+        client.force_authenticate(user=self.utilisateur)
+        url = reverse('dashboard-heatmap-portefeuille')
+        
+        response = client.get(url, {'projets': f"{self.projets[1].id},{self.projet_termine.id}"})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([projet['id'] for projet in response.data['projets']],
+                         [self.projets[1].id, self.projet_termine.id])
+        
+        response = client.get(url, {'projets': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
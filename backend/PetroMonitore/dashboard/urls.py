@@ -14,6 +14,9 @@ urlpatterns = [
     # Indicateurs d'équipe
     path('equipe/', views.IndicateurEquipeView.as_view(), name='dashboard-equipe'),
     
+    # Carte de chaleur projets × phases des statuts couleur
+    path('portefeuille/heatmap/', views.HeatmapPortefeuilleView.as_view(), name='dashboard-heatmap-portefeuille'),
+    
     # Alertes récentes
     path('alertes-recentes/', views.AlertesRecentesView.as_view(), name='dashboard-alertes-recentes'),
     
@@ -2,206 +2,109 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Sum, Avg, F, ExpressionWrapper, DurationField, Q, Case, When, Value, IntegerField
+from django.db.models import Count, Sum, Q, Case, When, Value, IntegerField
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
 from decimal import Decimal
 
 from ..models import (
     Projet, Phase, Operation, Utilisateur, 
-    Probleme, EquipeProjet, Alerte
+    Probleme, Alerte
 )
 from .serializers import (
-    DashboardGeneralSerializer, ResponsableProjectCountSerializer,
-    ProjetDashboardSerializer, PhaseDashboardSerializer, OperationDashboardSerializer,
-    IndicateursPerformanceSerializer, IndicateursEquipeSerializer, StatistiquesEquipeProjetSerializer
+    ResponsableProjectCountSerializer, PhaseDashboardSerializer, OperationDashboardSerializer,
+    IndicateursEquipeSerializer, StatistiquesEquipeProjetSerializer, IndicateursPerformanceSerializer,
+    IndicateursPerformanceProjetSerializer, ChargeMembreSerializer
 )
-from ..utils import (
-    evaluer_statut_couleur_projet, evaluer_statut_couleur_phase,
-    evaluer_statut_couleur_operation, calculate_project_progress
+from ..utils import evaluer_statut_couleur_phase, evaluer_statut_couleur_operation
+from .indicateurs import (
+    indicateurs_equipes, indicateurs_performance, indicateurs_performance_par_projet, matrice_charge
 )
+from .instantanes import lire_instantane
+from .portefeuille import generer_heatmap_portefeuille
+
+
+def reponse_instantane(request, type_instantane, objet_id=0):
+    """
+    Réponse servie depuis l'instantané d'un tableau de bord, avec sa date de
+    génération ; le paramètre max_age (en secondes) borne son ancienneté
+    """
+    max_age = request.query_params.get('max_age')
+    if max_age is not None:
+        try:
+            max_age = int(max_age)
+            if max_age < 0:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": "Le paramètre max_age doit être un nombre entier de secondes positif"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    instantane = lire_instantane(type_instantane, objet_id, max_age)
+    if instantane is None:
+        return Response(
+            {"error": "Le projet spécifié n'existe pas"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response({**instantane.donnees, 'date_generation': instantane.date_generation})
 
 class DashboardGeneralView(APIView):
     """
     Vue pour le tableau de bord général montrant les statistiques globales
+    (PetroMonitore.dashboard.indicateurs.statistiques_generales), servies
+    depuis leur instantané
     """
     def get(self, request):
-        # Comptage des projets par statut
-        total_projets = Projet.objects.count()
-        projets_planifies = Projet.objects.filter(statut='PLANIFIE').count()
-        projets_en_cours = Projet.objects.filter(statut='EN_COURS').count()
-        projets_termines = Projet.objects.filter(statut='TERMINE').count()
-        projets_suspendus = Projet.objects.filter(statut='SUSPENDU').count()
-        
-        # Budget global
-        budget_initial_total = Projet.objects.aggregate(Sum('budget_initial'))['budget_initial__sum'] or Decimal('0.00')
-        cout_actuel_total = Projet.objects.aggregate(Sum('cout_actuel'))['cout_actuel__sum'] or Decimal('0.00')
-        ecart_budgetaire = cout_actuel_total - budget_initial_total
-        
-        # Délais
-        today = timezone.now().date()
-        projets_en_retard = Projet.objects.filter(
-            date_fin_prevue__lt=today,
-            date_fin_reelle__isnull=True,
-            statut='EN_COURS'
-        ).count()
-        
-        # Calcul du retard moyen pour les projets terminés en retard
-        projets_termines_retard = Projet.objects.filter(
-            date_fin_reelle__gt=F('date_fin_prevue'),
-            statut='TERMINE'
-        ).annotate(
-            retard=ExpressionWrapper(
-                F('date_fin_reelle') - F('date_fin_prevue'),
-                output_field=DurationField()
-            )
-        )
-        
-        if projets_termines_retard.exists():
-            retard_moyen_jours = projets_termines_retard.aggregate(
-                avg_retard=Avg('retard')
-            )['avg_retard'].days
-        else:
-            retard_moyen_jours = 0
-        
-        # Progression moyenne des projets
-        projets_avec_phases = Projet.objects.filter(phases__isnull=False).only('id')
-        if projets_avec_phases.exists():
-            progression_moyenne = 0
-            for projet in projets_avec_phases:
-                progression_moyenne += calculate_project_progress(projet.id)
-            progression_moyenne = progression_moyenne / projets_avec_phases.count()
-        else:
-            progression_moyenne = 0
-        
-        # Taux de réussite (projets terminés dans les délais et le budget)
-        if projets_termines > 0:
-            projets_reussis = Projet.objects.filter(
-                statut='TERMINE',
-                date_fin_reelle__lte=F('date_fin_prevue'),
-                cout_actuel__lte=F('budget_initial')
-            ).count()
-            taux_reussite = (projets_reussis / projets_termines) * 100
-        else:
-            taux_reussite = 0
-        
-        data = {
-            'total_projets': total_projets,
-            'projets_planifies': projets_planifies,
-            'projets_en_cours': projets_en_cours,
-            'projets_termines': projets_termines,
-            'projets_suspendus': projets_suspendus,
-            'budget_initial_total': budget_initial_total,
-            'cout_actuel_total': cout_actuel_total,
-            'ecart_budgetaire': ecart_budgetaire,
-            'projets_en_retard': projets_en_retard,
-            'retard_moyen_jours': retard_moyen_jours,
-            'progression_moyenne': progression_moyenne,
-            'taux_reussite': taux_reussite
-        }
-        
-        serializer = DashboardGeneralSerializer(data)
-        return Response(serializer.data)
+        return reponse_instantane(request, 'GENERAL')
 
 
 class IndicateurPerformanceGeneralView(APIView):
     """
     Vue pour les indicateurs de performance globaux
+    (PetroMonitore.dashboard.indicateurs.indicateurs_performance), servis
+    depuis leur instantané ; filtrés par projets (?projets=1,2,3) ou par
+    fenêtre de temps (?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ), ils sont calculés à
+    la demande, et détaillés par projet avec ?par_projet=true
     """
     def get(self, request):
-        # Filtrer les projets actifs (planifiés ou en cours)
-        projets_actifs = Projet.objects.filter(statut__in=['PLANIFIE', 'EN_COURS'])
-        
-        # Efficacité (Progression moyenne / Pourcentage de temps écoulé)
-        efficacite = 0
-        projets_avec_progression = 0
-        
-        for projet in projets_actifs:
-            if projet.date_debut and projet.date_fin_prevue:
-                aujourd_hui = timezone.now().date()
-                
-                # Ne calculer que pour les projets déjà commencés
-                if aujourd_hui >= projet.date_debut:
-                    duree_totale = (projet.date_fin_prevue - projet.date_debut).days
-                    if duree_totale > 0:
-                        temps_ecoule = min((aujourd_hui - projet.date_debut).days, duree_totale)
-                        pourcentage_temps_ecoule = (temps_ecoule / duree_totale) * 100
-                        
-                        progression = calculate_project_progress(projet.id)
-                        
-                        if pourcentage_temps_ecoule > 0:
-                            rapport_efficacite = float(progression) / pourcentage_temps_ecoule
-                            efficacite += rapport_efficacite
-                            projets_avec_progression += 1
-        
-        if projets_avec_progression > 0:
-            efficacite = efficacite / projets_avec_progression
-        
-        # Productivité coût (Travail réalisé / Coût)
-        operations_terminees = Operation.objects.filter(statut='TERMINE', cout_reel__gt=0)
-        
-        if operations_terminees.exists():
-            total_cout_operations = operations_terminees.aggregate(Sum('cout_reel'))['cout_reel__sum'] or Decimal('0.00')
-            if total_cout_operations > 0:
-                productivite_cout = operations_terminees.count() / total_cout_operations
-            else:
-                productivite_cout = Decimal('0.00')
-        else:
-            productivite_cout = Decimal('0.00')
-        
-        # Productivité temps (Nombre d'opérations terminées / Temps total)
-        operations_avec_dates = Operation.objects.filter(
-            statut='TERMINE',
-            date_debut_reelle__isnull=False,
-            date_fin_reelle__isnull=False
-        )
-        
-        if operations_avec_dates.exists():
-            total_jours = 0
-            for op in operations_avec_dates:
-                duree = (op.date_fin_reelle - op.date_debut_reelle).days
-                total_jours += max(duree, 1)  # Au moins 1 jour par opération
-            
-            productivite_temps = operations_avec_dates.count() / total_jours if total_jours > 0 else 0
-        else:
-            productivite_temps = 0
-        
-        # Qualité (Nombre de problèmes par opération)
-        total_operations = Operation.objects.count()
-        total_problemes = Probleme.objects.count()
-        
-        if total_operations > 0:
-            qualite_problemes = total_problemes / total_operations
-        else:
-            qualite_problemes = 0
-        
-        # Temps de résolution moyen des problèmes
-        problemes_resolus = Probleme.objects.filter(
-            statut='RESOLU',
-            date_signalement__isnull=False,
-            date_resolution__isnull=False
-        )
-        
-        if problemes_resolus.exists():
-            temps_resolution_total = 0
-            for probleme in problemes_resolus:
-                duree = (probleme.date_resolution - probleme.date_signalement).total_seconds() / 86400  # en jours
-                temps_resolution_total += duree
-            
-            temps_resolution_moyen = temps_resolution_total / problemes_resolus.count()
-        else:
-            temps_resolution_moyen = 0
-        
-        data = {
-            'efficacite': efficacite,
-            'productivite_cout': productivite_cout,
-            'productivite_temps': productivite_temps,
-            'qualite_problemes': qualite_problemes,
-            'temps_resolution_moyen': temps_resolution_moyen
-        }
+        projets = request.query_params.get('projets', None)
+        debut = request.query_params.get('debut', None)
+        fin = request.query_params.get('fin', None)
+        par_projet = request.query_params.get('par_projet', '').lower() in ('1', 'true', 'oui')
+        if not (projets or debut or fin or par_projet):
+            return reponse_instantane(request, 'PERFORMANCE')
+        
+        projet_ids = None
+        if projets:
+            try:
+                projet_ids = [int(projet_id) for projet_id in projets.split(',') if projet_id.strip()]
+            except ValueError:
+                return Response(
+                    {"error": "Le paramètre projets doit être une liste d'identifiants séparés par des virgules"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
-        serializer = IndicateursPerformanceSerializer(data)
-        return Response(serializer.data)
+        dates = {}
+        for nom, valeur in (('debut', debut), ('fin', fin)):
+            if valeur:
+                try:
+                    dates[nom] = parse_date(valeur)
+                except ValueError:
+                    dates[nom] = None
+                if dates[nom] is None:
+                    return Response(
+                        {"error": f"Le paramètre {nom} doit être une date au format AAAA-MM-JJ"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        
+        data = IndicateursPerformanceSerializer(indicateurs_performance(projet_ids, **dates)).data
+        if par_projet:
+            data['projets'] = IndicateursPerformanceProjetSerializer(
+                indicateurs_performance_par_projet(projet_ids, **dates), many=True
+            ).data
+        return Response(data)
 
 
 class ProjetParResponsableView(APIView):
@@ -233,80 +136,69 @@ class ProjetParResponsableView(APIView):
 class IndicateurEquipeView(APIView):
     """
     Vue pour obtenir les indicateurs sur les équipes des projets
+    (PetroMonitore.dashboard.indicateurs.indicateurs_equipes) : d'un projet
+    (?projet_id=1), ou de plusieurs (?projets=1,2,3) avec la matrice de
+    charge des membres sur ces projets
     """
     def get(self, request):
         projet_id = request.query_params.get('projet_id', None)
+        projets = request.query_params.get('projets', None)
         
-        if projet_id:
-            # Récupérer l'équipe pour un projet spécifique
-            membres_equipe = EquipeProjet.objects.filter(projet_id=projet_id)
-            
-            # Statistiques générales de l'équipe
-            nombre_membres = membres_equipe.count()
-            
-            # Compter par rôle
-            ingenieur_terrain = 0
-            expert = 0
-            top_management = 0
-            
-            for membre in membres_equipe:
-                if membre.utilisateur.role == 'INGENIEUR_TERRAIN':
-                    ingenieur_terrain += 1
-                elif membre.utilisateur.role == 'EXPERT':
-                    expert += 1
-                elif membre.utilisateur.role == 'TOP_MANAGEMENT':
-                    top_management += 1
-            
-            stats_equipe = {
-                'nombre_membres': nombre_membres,
-                'ingenieur_terrain': ingenieur_terrain,
-                'expert': expert,
-                'top_management': top_management
-            }
-            
-            stats_serializer = StatistiquesEquipeProjetSerializer(stats_equipe)
-            
-            # Détails par membre d'équipe
-            indicateurs_membres = []
-            
-            for membre in membres_equipe:
-                # Opérations assignées à ce membre
-                operations_assignees = Operation.objects.filter(
-                    responsable=membre.utilisateur,
-                    phase__projet_id=projet_id
-                )
-                
-                nombre_operations = operations_assignees.count()
-                
-                # Progression moyenne des opérations assignées
-                if nombre_operations > 0:
-                    progression_moyenne = operations_assignees.aggregate(
-                        avg_prog=Avg('progression')
-                    )['avg_prog'] or 0
-                else:
-                    progression_moyenne = 0
-                
-                data = {
-                    'id': membre.utilisateur.id,
-                    'nom_complet': membre.utilisateur.get_full_name(),
-                    'role_projet': membre.role_projet,
-                    'operations_assignees': nombre_operations,
-                    'progression_moyenne': progression_moyenne
-                }
-                
-                serializer = IndicateursEquipeSerializer(data)
-                indicateurs_membres.append(serializer.data)
-            
-            # Retourner les deux ensembles de données
-            return Response({
-                'statistiques_generales': stats_serializer.data,
-                'indicateurs_membres': indicateurs_membres
-            })
-        else:
+        if not (projet_id or projets):
             return Response(
                 {"error": "Un ID de projet est requis pour cette vue"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        try:
+            if projet_id:
+                projet_ids = [int(projet_id)]
+            else:
+                projet_ids = list(dict.fromkeys(
+                    int(identifiant) for identifiant in projets.split(',') if identifiant.strip()
+                ))
+        except ValueError:
+            return Response(
+                {"error": "Les projets doivent être désignés par leurs identifiants séparés par des virgules"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        equipes = indicateurs_equipes(projet_ids)
+        donnees = {
+            identifiant: {
+                'statistiques_generales': StatistiquesEquipeProjetSerializer(equipe['statistiques_generales']).data,
+                'indicateurs_membres': IndicateursEquipeSerializer(equipe['indicateurs_membres'], many=True).data,
+            }
+            for identifiant, equipe in equipes.items()
+        }
+        
+        if projet_id:
+            # Retourner les deux ensembles de données
+            return Response(donnees[projet_ids[0]])
+        return Response({
+            'projets': [{'projet_id': identifiant, **equipe} for identifiant, equipe in donnees.items()],
+            'matrice_charge': ChargeMembreSerializer(matrice_charge(equipes), many=True).data
+        })
+
+
+class HeatmapPortefeuilleView(APIView):
+    """
+    Vue pour la carte de chaleur projets × phases des statuts couleur du portefeuille
+    """
+    def get(self, request):
+        # Filtrage optionnel par projets (?projets=1,2,3), sinon tous les projets non terminés
+        projets = request.query_params.get('projets', None)
+        projet_ids = None
+        if projets:
+            try:
+                projet_ids = [int(projet_id) for projet_id in projets.split(',') if projet_id.strip()]
+            except ValueError:
+                return Response(
+                    {"error": "Le paramètre projets doit être une liste d'identifiants séparés par des virgules"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        return Response(generer_heatmap_portefeuille(projet_ids=projet_ids))
 
 
 class AlertesRecentesView(APIView):
@@ -428,117 +320,11 @@ class ProblemesRecentsView(APIView):
 class ProjetDashboardView(APIView):
     """
     Vue pour le tableau de bord d'un projet spécifique
+    (PetroMonitore.dashboard.indicateurs.tableau_bord_projet), servi depuis
+    son instantané
     """
     def get(self, request, projet_id):
-        try:
-            projet = Projet.objects.get(pk=projet_id)
-        except Projet.DoesNotExist:
-            return Response(
-                {"error": "Le projet spécifié n'existe pas"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        # Progression du projet
-        progression = calculate_project_progress(projet_id)
-        
-        # Statut couleur du projet
-        statut_couleur = evaluer_statut_couleur_projet(projet)
-        
-        # Budget
-        budget_initial = projet.budget_initial or Decimal('0.00')
-        cout_actuel = projet.cout_actuel or Decimal('0.00')
-        
-        if budget_initial > 0:
-            pourcentage_budget_consomme = (cout_actuel / budget_initial) * 100
-        else:
-            pourcentage_budget_consomme = 0
-        
-        # Délais
-        today = timezone.now().date()
-        retard_jours = 0
-        retard_pourcentage = 0
-        
-        if projet.date_fin_prevue:
-            if projet.date_fin_reelle:
-                # Projet terminé, calcul du retard réel
-                retard_jours = max(0, (projet.date_fin_reelle - projet.date_fin_prevue).days)
-            elif today > projet.date_fin_prevue:
-                # Projet en cours et en retard
-                retard_jours = (today - projet.date_fin_prevue).days
-            
-            # Calculer le pourcentage de retard par rapport à la durée prévue
-            if projet.date_debut:
-                duree_prevue = (projet.date_fin_prevue - projet.date_debut).days
-                if duree_prevue > 0:
-                    retard_pourcentage = (retard_jours / duree_prevue) * 100
-        
-        # Risques (alertes et problèmes)
-        alertes_critiques = Alerte.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            niveau='CRITIQUE'
-        ).count()
-        
-        alertes_avertissements = Alerte.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            niveau='WARNING'
-        ).count()
-        
-        alertes_informations = Alerte.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            niveau='INFO'
-        ).count()
-        
-        problemes_non_resolus_critiques = Probleme.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            statut__in=['OUVERT', 'EN_COURS'],
-            gravite='CRITIQUE'
-        ).count()
-        
-        problemes_non_resolus_eleves = Probleme.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            statut__in=['OUVERT', 'EN_COURS'],
-            gravite='ELEVEE'
-        ).count()
-        
-        problemes_non_resolus_moyens = Probleme.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            statut__in=['OUVERT', 'EN_COURS'],
-            gravite='MOYENNE'
-        ).count()
-        
-        problemes_non_resolus_faibles = Probleme.objects.filter(
-            Q(projet=projet) | Q(phase__projet=projet) | Q(operation__phase__projet=projet),
-            statut__in=['OUVERT', 'EN_COURS'],
-            gravite='FAIBLE'
-        ).count()
-        
-        # Préparer les données pour le sérialiseur
-        data = {
-            'id': projet.id,
-            'nom': projet.nom,
-            'progression': progression,
-            'statut_cout': statut_couleur['statut_cout'],
-            'statut_delai': statut_couleur['statut_delai'],
-            'statut_global': statut_couleur['statut_global'],
-            'budget_initial': budget_initial,
-            'cout_actuel': cout_actuel,
-            'pourcentage_budget_consomme': pourcentage_budget_consomme,
-            'date_debut': projet.date_debut,
-            'date_fin_prevue': projet.date_fin_prevue,
-            'date_fin_reelle': projet.date_fin_reelle,
-            'retard_jours': retard_jours,
-            'retard_pourcentage': retard_pourcentage,
-            'alertes_critiques': alertes_critiques,
-            'alertes_avertissements': alertes_avertissements,
-            'alertes_informations': alertes_informations,
-            'problemes_non_resolus_critiques': problemes_non_resolus_critiques,
-            'problemes_non_resolus_eleves': problemes_non_resolus_eleves,
-            'problemes_non_resolus_moyens': problemes_non_resolus_moyens,
-            'problemes_non_resolus_faibles': problemes_non_resolus_faibles
-        }
-        
-        serializer = ProjetDashboardSerializer(data)
-        return Response(serializer.data)
+        return reponse_instantane(request, 'PROJET', projet_id)
 
 
 class PhaseDashboardView(APIView):
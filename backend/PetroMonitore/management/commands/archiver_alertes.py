@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from PetroMonitore.alerts.archivage import archiver_alertes
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive dans des fichiers compressés par date, puis supprime par tranches, "
+        "les alertes traitées plus anciennes que le délai de rétention"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jours', type=int, default=60,
+                            help="Ancienneté minimale (en jours) des alertes archivées")
+        parser.add_argument('--taille-tranche', type=int,
+                            help="Nombre maximal d'alertes par tranche (une transaction)")
+        parser.add_argument('--repertoire', help="Répertoire des archives")
+
+    def handle(self, *args, **options):
+        bilan = archiver_alertes(options['jours'], options['taille_tranche'], options['repertoire'])
+        self.stdout.write(
+            f"{bilan['alertes']} alerte(s) et {bilan['occurrences']} occurrence(s) archivées "
+            f"en {bilan['tranches']} tranche(s) dans {len(bilan['fichiers'])} fichier(s)"
+        )
+        self.stdout.write(
+            f"Durée : {bilan['duree']:.2f} s, débit : {bilan['debit']:.0f} alertes/s, "
+            f"verrou maximal d'une tranche : {bilan['verrou_max'] * 1000:.1f} ms"
+        )
@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from PetroMonitore.dashboard.views import DashboardGeneralView
+from PetroMonitore.models import Phase, Projet, Utilisateur
+
+STATUTS = ('PLANIFIE', 'EN_COURS', 'TERMINE', 'SUSPENDU')
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le nombre de requêtes et la latence du tableau de bord général pour des "
+        "portefeuilles de différentes tailles, générés puis annulés (aucune donnée conservée)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', type=int, nargs='+', default=[10, 1000, 10000],
+                            help="Nombres de projets des portefeuilles générés")
+        parser.add_argument('--repetitions', type=int, default=5,
+                            help="Nombre d'appels mesurés par taille")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Projets':>10} {'Requêtes':>10} {'Médiane (ms)':>14} {'Max (ms)':>10}")
+        for taille in options['tailles']:
+            requetes, durees = self.mesurer(taille, options['repetitions'])
+            self.stdout.write(
+                f"{taille:>10} {requetes:>10} {statistics.median(durees) * 1000:>14.1f} {max(durees) * 1000:>10.1f}"
+            )
+
+    def mesurer(self, taille, repetitions):
+        with transaction.atomic():
+            self.generer_portefeuille(taille)
+            utilisateur = Utilisateur.objects.create(nom="Banc", prenom="Essai", email="banc.essai@example.com",
+                                                     role='TOP_MANAGEMENT')
+            vue = DashboardGeneralView.as_view()
+            # max_age=0 : statistiques recalculées à chaque appel, et non lues depuis l'instantané
+            requete = APIRequestFactory().get('/api/dashboard/', {'max_age': 0})
+            force_authenticate(requete, user=utilisateur)
+
+            requetes, durees = 0, []
+            for _ in range(repetitions):
+                with CaptureQueriesContext(connection) as contexte:
+                    debut = time.perf_counter()
+                    reponse = vue(requete)
+                    durees.append(time.perf_counter() - debut)
+                assert reponse.status_code == 200, reponse.data
+                requetes = len(contexte.captured_queries)
+
+            # Portefeuille généré annulé
+            transaction.set_rollback(True)
+        return requetes, durees
+
+    def generer_portefeuille(self, taille):
+        aujourd_hui = timezone.now().date()
+        Projet.objects.bulk_create([
+            Projet(
+                nom=f"Banc {taille}-{i}", statut=STATUTS[i % len(STATUTS)],
+                budget_initial=Decimal('100000.00'), cout_actuel=Decimal(80000 + (i % 50) * 1000),
+                date_debut=aujourd_hui - timedelta(days=200),
+                date_fin_prevue=aujourd_hui + timedelta(days=(i % 60) - 30),
+                date_fin_reelle=aujourd_hui - timedelta(days=i % 20) if STATUTS[i % len(STATUTS)] == 'TERMINE' else None,
+            )
+            for i in range(taille)
+        ], batch_size=1000)
+        # Une phase pour un projet sur deux (identifiants relus : bulk_create ne les renvoie pas sous Oracle)
+        projet_ids = Projet.objects.filter(nom__startswith=f"Banc {taille}-").values_list('pk', flat=True)
+        Phase.objects.bulk_create([
+            Phase(projet_id=projet_id, nom="Phase 1", ordre=1, statut='EN_COURS')
+            for projet_id in list(projet_ids)[::2]
+        ], batch_size=1000)
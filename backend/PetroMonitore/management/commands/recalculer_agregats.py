@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from PetroMonitore.utils import rafraichir_statuts_couleur, recalculer_progressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule entièrement les agrégats persistés (progressions et statuts couleur) "
+        "à partir des opérations, pour les initialiser ou les réparer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projet', type=int, action='append', dest='projets',
+                            help="Limiter le recalcul à ce projet (option répétable)")
+        parser.add_argument('--sans-statuts', action='store_true',
+                            help="Ne pas recalculer les statuts couleur")
+
+    def handle(self, *args, **options):
+        nombre_projets = recalculer_progressions(options['projets'])
+        self.stdout.write(f"Progressions recalculées pour {nombre_projets} projet(s)")
+        
+        if not options['sans_statuts']:
+            modifies = rafraichir_statuts_couleur(complet=True)
+            self.stdout.write(f"Statuts couleur recalculés : {modifies} ligne(s) modifiée(s)")
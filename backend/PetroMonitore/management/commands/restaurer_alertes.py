@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from PetroMonitore.alerts.archivage import repertoire_archives, restaurer_archives
+
+
+class Command(BaseCommand):
+    help = (
+        "Réimporte des archives d'alertes (fichiers .jsonl.gz ou répertoires) ; "
+        "les alertes déjà présentes sont ignorées"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('chemins', nargs='*',
+                            help="Fichiers d'archive ou répertoires (toutes les archives par défaut)")
+        parser.add_argument('--taille-lot', type=int, help="Nombre d'alertes par transaction")
+
+    def handle(self, *args, **options):
+        bilan = restaurer_archives(options['chemins'] or [repertoire_archives()], options['taille_lot'])
+        self.stdout.write(
+            f"{bilan['fichiers']} fichier(s) lu(s) : {bilan['alertes']} alerte(s) et "
+            f"{bilan['occurrences']} occurrence(s) restaurées, {bilan['existantes']} déjà présente(s), "
+            f"{bilan['ignorees']} ignorée(s) (projet, phase ou opération supprimé)"
+        )
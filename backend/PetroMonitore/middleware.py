@@ -0,0 +1,15 @@
+# PetroMonitore/middleware.py
+from .recalculs import differer_recalculs
+
+
+class RecalculsDifferesMiddleware:
+    """
+    Regroupe les recalculs d'agrégats demandés pendant une requête pour
+    recalculer chaque phase et chaque projet une seule fois en fin de requête
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with differer_recalculs():
+            return self.get_response(request)
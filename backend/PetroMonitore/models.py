@@ -2,6 +2,92 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.utils import timezone
+
+
+STATUT_COULEUR_CHOICES = (
+    ('VERT', 'Vert'),
+    ('JAUNE', 'Jaune'),
+    ('ROUGE', 'Rouge'),
+)
+
+
+def champ_statut_couleur():
+    """
+    Colonne persistée et indexée d'un statut couleur, maintenue par
+    PetroMonitore.utils.mettre_a_jour_statuts_couleur
+    """
+    return models.CharField(max_length=10, choices=STATUT_COULEUR_CHOICES, default='VERT',
+                            editable=False, db_index=True)
+
+
+CHAMPS_SOMMES_PROGRESSION = ('nombre_enfants', 'nombre_enfants_budget', 'somme_progression',
+                             'somme_progression_ponderee', 'somme_budget')
+
+
+def valeurs_contribution(instance):
+    """
+    Valeurs chargées des champs de contribution d'une opération ou d'une phase,
+    ou None si l'un d'eux n'a pas été chargé (queryset .only()/.defer())
+    """
+    valeurs = {}
+    for champ in instance.CHAMPS_CONTRIBUTION:
+        if champ not in instance.__dict__:
+            return None
+        valeurs[champ] = instance.__dict__[champ]
+    return valeurs
+
+
+def valeurs_routage(instance):
+    """
+    Valeurs chargées des champs d'un utilisateur utilisés par le routage des notifications
+    """
+    return {champ: instance.__dict__[champ] for champ in ('email', 'role', 'statut') if champ in instance.__dict__}
+
+
+def marquer_instantanes_perimes(instance):
+    """
+    Marque comme périmés les instantanés des tableaux de bord du projet, de la
+    phase ou de l'opération d'un problème ou d'une alerte
+    """
+    from .recalculs import demander_recalcul, differer_recalculs
+    # Une seule invalidation pour les trois
+    with differer_recalculs():
+        demander_recalcul('INSTANTANES_PROJET', [instance.projet_id])
+        demander_recalcul('INSTANTANES_PHASE', [instance.phase_id])
+        demander_recalcul('INSTANTANES_OPERATION', [instance.operation_id])
+
+
+def valeurs_alertes(instance):
+    """
+    Valeurs chargées des champs dont dépendent les règles d'alerte
+    (les champs différés ne sont pas capturés)
+    """
+    return {champ: instance.__dict__[champ] for champ in instance.DEPENDANCES_ALERTES
+            if champ in instance.__dict__}
+
+
+# Règles d'alerte, évaluées de façon incrémentale par PetroMonitore.alerts.utils.evaluer_alertes_en_attente
+REGLES_ALERTES_PROJET = ('BUDGET_PROJET', 'DELAI_PROJET', 'PROGRESSION_PROJET')
+REGLES_ALERTES_OPERATION = ('SEUIL_OPERATION', 'DELAI_OPERATION')
+
+
+class SommesProgression(models.Model):
+    """
+    Sommes persistées sur les enfants d'un parent (opérations d'une phase, phases
+    d'un projet) à partir desquelles sa progression pondérée est dérivée.
+    Elles sont maintenues par deltas arithmétiques (PetroMonitore.utils.propager_delta_progression).
+    """
+    nombre_enfants = models.PositiveIntegerField(default=0, editable=False)
+    # Enfants dont le budget est renseigné et non nul
+    nombre_enfants_budget = models.PositiveIntegerField(default=0, editable=False)
+    somme_progression = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    # Somme des progressions pondérées par le budget de chaque enfant
+    somme_progression_ponderee = models.DecimalField(max_digits=24, decimal_places=4, default=0, editable=False)
+    somme_budget = models.DecimalField(max_digits=20, decimal_places=2, default=0, editable=False)
+    
+    class Meta:
+        abstract = True
 
 class UtilisateurManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -77,8 +163,39 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.prenom} {self.nom}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs en base, pour n'invalider le routage des notifications que si elles changent
+        instance._routage_initial = valeurs_routage(instance)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to invalidate the cached notification routing
+        tables when the email, role or status of the user changes
+        """
+        ajout = self._state.adding
+        initial = getattr(self, '_routage_initial', {})
+        super().save(*args, **kwargs)
+        
+        actuel = valeurs_routage(self)
+        if ajout or actuel != initial:
+            from .alerts.destinataires import invalider_utilisateur
+            invalider_utilisateur(self, roles={initial.get('role'), actuel.get('role')}, projets=not ajout)
+        self._routage_initial = actuel
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to invalidate the cached notification routing
+        tables in which the user appears
+        """
+        from .alerts.destinataires import invalider_utilisateur
+        invalider_utilisateur(self, roles={self.role})
+        return super().delete(*args, **kwargs)
+    
 
-class Projet(models.Model):
+class Projet(SommesProgression):
     STATUT_CHOICES = (
         ('PLANIFIE', 'Planifié'),
         ('EN_COURS', 'En cours'),
@@ -99,12 +216,67 @@ class Projet(models.Model):
     seuil_alerte_cout = models.DecimalField(max_digits=5, decimal_places=2, default=80)
     seuil_alerte_delai = models.DecimalField(max_digits=5, decimal_places=2, default=80)
     date_creation = models.DateTimeField(auto_now_add=True)
+    statut_cout = champ_statut_couleur()
+    statut_delai = champ_statut_couleur()
+    statut_global = champ_statut_couleur()
+    progression = models.DecimalField(max_digits=5, decimal_places=2, default=0, editable=False,
+                                      validators=[MinValueValidator(0), MaxValueValidator(100)])
     
     def __str__(self):
         return self.nom
+    
+    # Règles d'alerte à réévaluer quand chaque champ change
+    DEPENDANCES_ALERTES = {
+        'statut': REGLES_ALERTES_PROJET + REGLES_ALERTES_OPERATION,
+        'budget_initial': ('BUDGET_PROJET',),
+        'cout_actuel': ('BUDGET_PROJET',),
+        'seuil_alerte_cout': ('BUDGET_PROJET',),
+        'date_debut': ('PROGRESSION_PROJET',),
+        'date_fin_prevue': ('DELAI_PROJET', 'PROGRESSION_PROJET'),
+    }
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs en base, pour ne réévaluer que les règles d'alerte des champs modifiés
+        instance._alertes_initiales = valeurs_alertes(instance)
+        instance._responsable_initial = instance.__dict__.get('responsable_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to request the evaluation of the alert rules
+        that depend on the modified fields, to invalidate the cached
+        notification routing table when the responsable changes, and to
+        mark the dashboard snapshots as stale
+        """
+        ajout = self._state.adding
+        super().save(*args, **kwargs)
+        
+        from .alerts.utils import marquer_alertes_modifiees
+        marquer_alertes_modifiees(self, ajout, kwargs.get('update_fields'))
+        
+        if not ajout and self.responsable_id != getattr(self, '_responsable_initial', None):
+            from .alerts.destinataires import invalider_projets
+            invalider_projets([self.pk])
+        self._responsable_initial = self.responsable_id
+        
+        from .recalculs import demander_recalcul
+        demander_recalcul('INSTANTANES_PROJET', [self.pk])
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to mark the dashboard snapshots as stale
+        """
+        projet_id = self.pk
+        resultat = super().delete(*args, **kwargs)
+        
+        from .recalculs import demander_recalcul
+        demander_recalcul('INSTANTANES_PROJET', [projet_id])
+        return resultat
 
 
-class Phase(models.Model):
+class Phase(SommesProgression):
     STATUT_CHOICES = (
         ('PLANIFIE', 'Planifié'),
         ('EN_COURS', 'En cours'),
@@ -125,10 +297,30 @@ class Phase(models.Model):
     progression = models.DecimalField(max_digits=5, decimal_places=2, default=0, 
                                      validators=[MinValueValidator(0), MaxValueValidator(100)])
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES)
+    statut_cout = champ_statut_couleur()
+    statut_delai = champ_statut_couleur()
+    statut_global = champ_statut_couleur()
     
     def __str__(self):
         return f"{self.projet.nom} - {self.nom}"
     
+    # Champs dont dépend la contribution de la phase à la progression du projet
+    CHAMPS_CONTRIBUTION = ('projet_id', 'progression', 'budget_alloue')
+    
+    # Règles d'alerte à réévaluer quand chaque champ change
+    DEPENDANCES_ALERTES = {
+        'projet_id': ('PROGRESSION_PROJET',),
+        'progression': ('PROGRESSION_PROJET',),
+    }
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valeurs en base, pour propager au projet le delta de la prochaine sauvegarde
+        instance._contribution_initiale = valeurs_contribution(instance)
+        instance._alertes_initiales = valeurs_alertes(instance)
+        return instance
+    
     def save(self, *args, **kwargs):
         """
         Override save method to update phase progress after saving
@@ -136,14 +328,40 @@ class Phase(models.Model):
         """
         # Check if we should skip the update_phase_progress call
         skip_update = kwargs.pop('skip_update', False)
+        ajout = self._state.adding
         
         # Call the "real" save method
         super().save(*args, **kwargs)
         
+        # Propagate the change of this phase's contribution to the project progression
+        from .utils import propager_sauvegarde_enfant
+        from .alerts.utils import marquer_alertes_modifiees
+        propager_sauvegarde_enfant(self, ajout, kwargs.get('update_fields'))
+        marquer_alertes_modifiees(self, ajout, kwargs.get('update_fields'))
+        
         # Only update phase progress if not explicitly skipped
+        # (deferred and coalesced inside a request, see PetroMonitore.recalculs)
+        from .recalculs import demander_recalcul
         if not skip_update:
-            from .utils import update_phase_progress
-            update_phase_progress(self.id)
+            demander_recalcul('PHASE_PROGRESSION', [self.id])
+        demander_recalcul('INSTANTANES_PROJET', [self.projet_id])
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to refresh the stored colour status and
+        progression of the project
+        """
+        projet_id = self.projet_id
+        initiale = getattr(self, '_contribution_initiale', None) or valeurs_contribution(self)
+        resultat = super().delete(*args, **kwargs)
+        
+        from .utils import mettre_a_jour_statuts_couleur, propager_suppression_enfant
+        from .recalculs import demander_recalcul
+        mettre_a_jour_statuts_couleur(projet_ids=[projet_id])
+        propager_suppression_enfant(self, initiale)
+        demander_recalcul('PROGRESSION_PROJET', [projet_id])
+        demander_recalcul('INSTANTANES_PROJET', [projet_id])
+        return resultat
     
     class Meta:
         ordering = ['ordre']
@@ -171,9 +389,92 @@ class Operation(models.Model):
                                      validators=[MinValueValidator(0), MaxValueValidator(100)])
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES)
     responsable = models.ForeignKey(Utilisateur, on_delete=models.SET_NULL, blank=True, null=True, related_name='operations_responsable')
+    statut_cout = champ_statut_couleur()
+    statut_delai = champ_statut_couleur()
+    statut_global = champ_statut_couleur()
+    
+    # Champs dont dépend le statut couleur
+    CHAMPS_STATUT_COULEUR = {'phase', 'phase_id', 'cout_prevue', 'cout_reel', 'progression',
+                             'date_debut_prevue', 'date_fin_prevue', 'date_debut_reelle', 'date_fin_reelle'}
     
     def __str__(self):
         return f"{self.phase.nom} - {self.nom}"
+    
+    # Champs dont dépend la contribution de l'opération à la progression de la phase
+    CHAMPS_CONTRIBUTION = ('phase_id', 'progression', 'cout_prevue')
+    
+    # Règles d'alerte à réévaluer quand chaque champ change (coût et progression
+    # atteignent aussi les règles du projet via les recalculs d'agrégats)
+    DEPENDANCES_ALERTES = {
+        'phase_id': REGLES_ALERTES_OPERATION,
+        'statut': REGLES_ALERTES_OPERATION,
+        'cout_reel': ('SEUIL_OPERATION',),
+        'date_fin_prevue': ('DELAI_OPERATION',),
+    }
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Phase d'origine, pour recalculer aussi son statut si l'opération est déplacée
+        instance._phase_id_initiale = instance.__dict__.get('phase_id')
+        # Valeurs en base, pour propager à la phase le delta de la prochaine sauvegarde
+        instance._contribution_initiale = valeurs_contribution(instance)
+        instance._alertes_initiales = valeurs_alertes(instance)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to refresh the stored colour status of the operation
+        and of its ancestors, with a skip_statut_couleur flag to disable it, and
+        to keep the progression and cost rollups of the phase up to date
+        """
+        skip_statut_couleur = kwargs.pop('skip_statut_couleur', False)
+        ajout = self._state.adding
+        
+        super().save(*args, **kwargs)
+        
+        update_fields = kwargs.get('update_fields')
+        
+        # Propager le changement de contribution à la progression de la phase et du projet
+        from .utils import propager_sauvegarde_enfant
+        from .alerts.utils import marquer_alertes_modifiees
+        propager_sauvegarde_enfant(self, ajout, update_fields)
+        marquer_alertes_modifiees(self, ajout, update_fields)
+        
+        # Mark the cost rollups of the phase (and of the previous one if moved) as stale
+        from .recalculs import demander_recalcul
+        if update_fields is None or {'cout_reel', 'phase', 'phase_id'}.intersection(update_fields):
+            demander_recalcul('PHASE_COUTS', [self.phase_id, getattr(self, '_phase_id_initiale', None)])
+        demander_recalcul('INSTANTANES_PHASE', [self.phase_id, getattr(self, '_phase_id_initiale', None)])
+        
+        if skip_statut_couleur or (update_fields is not None and
+                                   not self.CHAMPS_STATUT_COULEUR.intersection(update_fields)):
+            return
+        
+        from .utils import mettre_a_jour_statuts_couleur
+        phase_initiale = getattr(self, '_phase_id_initiale', None)
+        mettre_a_jour_statuts_couleur(
+            operation_ids=[self.id],
+            phase_ids=[phase_initiale] if phase_initiale and phase_initiale != self.phase_id else None
+        )
+        self._phase_id_initiale = self.phase_id
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to refresh the stored colour status,
+        progression and costs of the phase
+        """
+        phase_id = self.phase_id
+        initiale = getattr(self, '_contribution_initiale', None) or valeurs_contribution(self)
+        resultat = super().delete(*args, **kwargs)
+        
+        from .utils import mettre_a_jour_statuts_couleur, propager_suppression_enfant
+        from .recalculs import demander_recalcul
+        mettre_a_jour_statuts_couleur(phase_ids=[phase_id])
+        propager_suppression_enfant(self, initiale)
+        demander_recalcul('PHASE_COUTS', [phase_id])
+        demander_recalcul('INSTANTANES_PHASE', [phase_id])
+        return resultat
 
 
 class Seuil(models.Model):
@@ -188,6 +489,43 @@ class Seuil(models.Model):
     
     def __str__(self):
         return f"{self.operation.nom} - {self.type_seuil}"
+    
+    # Règles d'alerte à réévaluer quand chaque champ change
+    DEPENDANCES_ALERTES = {
+        'operation_id': ('SEUIL_OPERATION',),
+        'valeur_jaune': ('SEUIL_OPERATION',),
+        'valeur_rouge': ('SEUIL_OPERATION',),
+    }
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._alertes_initiales = valeurs_alertes(instance)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to refresh the stored colour status of the operation
+        and to request the evaluation of its threshold alert rule
+        """
+        ajout = self._state.adding
+        super().save(*args, **kwargs)
+        
+        from .utils import mettre_a_jour_statuts_couleur
+        from .alerts.utils import marquer_alertes_modifiees
+        mettre_a_jour_statuts_couleur(operation_ids=[self.operation_id])
+        marquer_alertes_modifiees(self, ajout, kwargs.get('update_fields'))
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to refresh the stored colour status of the operation
+        """
+        operation_id = self.operation_id
+        resultat = super().delete(*args, **kwargs)
+        
+        from .utils import mettre_a_jour_statuts_couleur
+        mettre_a_jour_statuts_couleur(operation_ids=[operation_id])
+        return resultat
 
 
 class Rapport(models.Model):
@@ -241,6 +579,21 @@ class Probleme(models.Model):
     
     def __str__(self):
         return self.titre
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to mark the dashboard snapshots as stale
+        """
+        super().save(*args, **kwargs)
+        marquer_instantanes_perimes(self)
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to mark the dashboard snapshots as stale
+        """
+        resultat = super().delete(*args, **kwargs)
+        marquer_instantanes_perimes(self)
+        return resultat
 
 
 class Solution(models.Model):
@@ -276,6 +629,34 @@ class EquipeProjet(models.Model):
     def __str__(self):
         return f"{self.utilisateur.prenom} {self.utilisateur.nom} - {self.projet.nom}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._projet_initial = instance.__dict__.get('projet_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to invalidate the cached notification routing
+        table of the project (and of its previous project)
+        """
+        super().save(*args, **kwargs)
+        
+        from .alerts.destinataires import invalider_projets
+        invalider_projets({self.projet_id, getattr(self, '_projet_initial', None)})
+        self._projet_initial = self.projet_id
+    
+    def delete(self, *args, **kwargs):
+        """
+        Override delete method to invalidate the cached notification routing table of the project
+        """
+        projet_id = self.projet_id
+        resultat = super().delete(*args, **kwargs)
+        
+        from .alerts.destinataires import invalider_projets
+        invalider_projets([projet_id])
+        return resultat
+    
     class Meta:
         unique_together = ('projet', 'utilisateur')
 
@@ -302,9 +683,204 @@ class Alerte(models.Model):
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES, default='NON_LU')
     lue_par = models.ForeignKey(Utilisateur, on_delete=models.SET_NULL, blank=True, null=True, related_name='alertes_lues')
     date_lecture = models.DateTimeField(blank=True, null=True)
+    # Empreinte (entité, type) des alertes détectées encore ouvertes, NULL une fois
+    # traitée : l'index unique empêche deux alertes ouvertes identiques
+    empreinte = models.CharField(max_length=150, blank=True, null=True, unique=True, editable=False)
+    # Incident : alertes d'un même projet et d'un même type regroupées pendant une
+    # tempête (PetroMonitore.alerts.utils.regrouper_alertes), comptées dans nombre_occurrences
+    incident = models.BooleanField(default=False, editable=False)
+    nombre_occurrences = models.PositiveIntegerField(default=0, editable=False)
     
     def __str__(self):
         return f"{self.type_alerte} - {self.projet.nom if self.projet else 'N/A'}"
+    
+    def calculer_empreinte(self):
+        """
+        Empreinte de dédoublonnage : entité la plus précise visée par l'alerte et type
+        """
+        if self.operation_id:
+            cible = f"operation:{self.operation_id}"
+        elif self.phase_id:
+            cible = f"phase:{self.phase_id}"
+        elif self.projet_id:
+            cible = f"projet:{self.projet_id}"
+        else:
+            cible = "global"
+        if self.incident:
+            cible = f"incident:{cible}"
+        return f"{cible}:{self.type_alerte}"
+    
+    def save(self, *args, **kwargs):
+        """
+        Override save method to release the dedup fingerprint once the alert is closed
+        (and, for an incident, the fingerprints of its grouped alerts), and to mark
+        the dashboard snapshots as stale when the alert is created
+        """
+        ajout = self._state.adding
+        liberer = self.statut == 'TRAITEE' and self.empreinte
+        if liberer:
+            self.empreinte = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'empreinte'}
+        super().save(*args, **kwargs)
+        
+        if liberer and self.incident:
+            liberer_empreintes_incidents([self.pk])
+        if ajout:
+            marquer_instantanes_perimes(self)
+
+
+class OccurrenceIncident(models.Model):
+    """
+    Alerte regroupée dans un incident au lieu d'être créée : son empreinte reste
+    réservée tant que l'incident est ouvert, pour ne pas la regrouper à nouveau
+    """
+    incident = models.ForeignKey(Alerte, on_delete=models.CASCADE, related_name='occurrences_incident')
+    phase = models.ForeignKey(Phase, on_delete=models.CASCADE, blank=True, null=True)
+    operation = models.ForeignKey(Operation, on_delete=models.CASCADE, blank=True, null=True)
+    niveau = models.CharField(max_length=20, choices=Alerte.NIVEAU_CHOICES)
+    message = models.CharField(max_length=500)
+    date_occurrence = models.DateTimeField(auto_now_add=True)
+    empreinte = models.CharField(max_length=150, blank=True, null=True, unique=True, editable=False)
+    
+    def __str__(self):
+        return f"{self.incident_id} - {self.empreinte}"
+
+
+def liberer_empreintes_incidents(alerte_ids):
+    """
+    Libère les empreintes des alertes regroupées dans les incidents traités
+    parmi les alertes alerte_ids
+    """
+    OccurrenceIncident.objects.filter(incident_id__in=alerte_ids, empreinte__isnull=False).update(empreinte=None)
+
+
+def traiter_alertes(alertes, **champs):
+    """
+    Marque les alertes d'un queryset comme traitées en une requête, sans
+    passer par Alerte.save : leurs empreintes de dédoublonnage et celles des
+    alertes regroupées dans leurs incidents sont libérées
+    
+    Args:
+        alertes: Queryset des alertes à traiter
+        champs: Autres champs mis à jour (lecteur, date de lecture)
+    
+    Returns:
+        Le nombre d'alertes traitées
+    """
+    alerte_ids = list(alertes.values_list('pk', flat=True))
+    nombre = Alerte.objects.filter(pk__in=alerte_ids).update(statut='TRAITEE', empreinte=None, **champs)
+    liberer_empreintes_incidents(alerte_ids)
+    return nombre
+
+
+class CompteurFenetre(models.Model):
+    """
+    Compteur d'une fenêtre fixe d'un limiteur à fenêtre glissante
+    (PetroMonitore.alerts.limitation.FenetreGlissante), partagé par les workers
+    """
+    cle = models.CharField(max_length=200)
+    fenetre = models.BigIntegerField()
+    nombre = models.PositiveIntegerField(default=0)
+    expiration = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.cle} - {self.fenetre}: {self.nombre}"
+    
+    class Meta:
+        unique_together = ('cle', 'fenetre')
+
+
+class NotificationAlerte(models.Model):
+    """
+    Notification email d'une alerte pour un destinataire (boîte d'envoi), envoyée
+    par lots par PetroMonitore.alerts.tasks.envoyer_notifications_alertes
+    """
+    STATUT_CHOICES = (
+        ('EN_ATTENTE', 'En attente'),
+        ('ENVOYEE', 'Envoyée'),
+        ('ECHEC', 'Échec'),
+    )
+    
+    alerte = models.ForeignKey(Alerte, on_delete=models.CASCADE, related_name='notifications')
+    destinataire = models.EmailField()
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    tentatives = models.PositiveIntegerField(default=0)
+    # Date à partir de laquelle la notification peut être (r)envoyée : repoussée
+    # pendant un envoi (bail) puis après chaque échec (délai croissant)
+    prochaine_tentative = models.DateTimeField(default=timezone.now)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(blank=True, null=True)
+    derniere_erreur = models.CharField(max_length=500, blank=True, null=True)
+    
+    def __str__(self):
+        return f"{self.alerte_id} - {self.destinataire} - {self.statut}"
+    
+    class Meta:
+        unique_together = ('alerte', 'destinataire')
+        indexes = [models.Index(fields=['statut', 'prochaine_tentative'])]
+
+
+class SemaineAlertesAgregee(models.Model):
+    """
+    Semaine dont les agrégats d'alertes (AgregatAlertesSemaine) ont été calculés
+    et enregistrés : une semaine terminée n'est jamais recalculée
+    """
+    # Lundi de la semaine (fuseau horaire courant)
+    semaine = models.DateField(unique=True)
+    date_calcul = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.semaine}"
+
+
+class AgregatAlertesSemaine(models.Model):
+    """
+    Nombre d'alertes d'une semaine terminée par projet, type et niveau, lu par
+    PetroMonitore.alerts.utils.generer_rapport_alertes (le statut, modifié après
+    coup, n'est pas figé : il est compté à chaque rapport)
+    """
+    semaine = models.DateField(db_index=True)
+    projet = models.ForeignKey(Projet, on_delete=models.SET_NULL, blank=True, null=True,
+                               related_name='agregats_alertes')
+    # Nom du projet au moment du calcul, conservé si le projet est supprimé
+    projet_nom = models.CharField(max_length=200, blank=True, null=True)
+    type_alerte = models.CharField(max_length=100)
+    niveau = models.CharField(max_length=20, choices=Alerte.NIVEAU_CHOICES)
+    nombre = models.PositiveIntegerField()
+    
+    def __str__(self):
+        return f"{self.semaine} - {self.projet_nom} - {self.type_alerte}: {self.nombre}"
+
+
+class InstantaneTableauBord(models.Model):
+    """
+    Données sérialisées d'un tableau de bord (PetroMonitore.dashboard.instantanes),
+    servies sans recalcul tant qu'elles ne sont ni périmées ni trop anciennes
+    """
+    TYPE_CHOICES = (
+        ('GENERAL', 'Tableau de bord général'),
+        ('PERFORMANCE', 'Indicateurs de performance'),
+        ('PROJET', 'Tableau de bord de projet'),
+    )
+    
+    type_instantane = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    # Projet pour un instantané PROJET, 0 sinon
+    objet_id = models.BigIntegerField(default=0)
+    donnees = models.JSONField(default=dict)
+    date_generation = models.DateTimeField()
+    # Marqué par les écritures qui le concernent, servi puis régénéré en tâche de fond
+    perime = models.BooleanField(default=False)
+    date_invalidation = models.DateTimeField(blank=True, null=True)
+    # Régénération demandée en tâche de fond par une lecture de l'instantané périmé
+    date_demande_rafraichissement = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"{self.type_instantane} {self.objet_id} - {self.date_generation}"
+    
+    class Meta:
+        unique_together = ('type_instantane', 'objet_id')
 
 
 class HistoriqueModification(models.Model):
@@ -319,3 +895,87 @@ class HistoriqueModification(models.Model):
     
     def __str__(self):
         return f"{self.table_modifiee} - {self.id_enregistrement} - {self.champ_modifie}"
+
+
+class RecalculEnAttente(models.Model):
+    """
+    Marque d'un agrégat (phase ou projet) à recalculer, dédoublonnée par
+    (type_recalcul, objet_id) et vidée par PetroMonitore.tasks.vider_recalculs_en_attente
+    """
+    TYPE_CHOICES = (
+        ('PHASE_PROGRESSION', 'Progression de phase'),
+        ('PHASE_COUTS', 'Coûts de phase'),
+        ('PROJET_COUTS', 'Coûts de projet'),
+    )
+    
+    type_recalcul = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    objet_id = models.BigIntegerField()
+    date_marquage = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.type_recalcul} - {self.objet_id}"
+    
+    class Meta:
+        unique_together = ('type_recalcul', 'objet_id')
+
+
+class EvaluationAlerteEnAttente(models.Model):
+    """
+    Marque d'une règle d'alerte à réévaluer pour un projet ou une opération modifié,
+    dédoublonnée par (regle, objet_id) et vidée par
+    PetroMonitore.alerts.tasks.evaluer_alertes_modifiees
+    """
+    REGLE_CHOICES = (
+        ('BUDGET_PROJET', 'Budget du projet'),
+        ('DELAI_PROJET', 'Délai du projet'),
+        ('PROGRESSION_PROJET', 'Progression du projet'),
+        ('SEUIL_OPERATION', "Seuil de l'opération"),
+        ('DELAI_OPERATION', "Délai de l'opération"),
+    )
+    
+    regle = models.CharField(max_length=20, choices=REGLE_CHOICES)
+    objet_id = models.BigIntegerField()
+    date_marquage = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.regle} - {self.objet_id}"
+    
+    class Meta:
+        unique_together = ('regle', 'objet_id')
+
+
+class DetectionAlertes(models.Model):
+    """
+    Détection complète des alertes déclenchée manuellement, exécutée en tâche de
+    fond par PetroMonitore.alerts.tasks.executer_detection_alertes ; les
+    déclenchements concurrents rejoignent la détection active
+    """
+    ACTIVE = 'detection'
+    STATUT_CHOICES = (
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINEE', 'Terminée'),
+        ('ECHEC', 'Échec'),
+    )
+    
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    # ACTIVE tant que la détection est en attente ou en cours, NULL ensuite :
+    # l'index unique empêche deux détections actives
+    active = models.CharField(max_length=20, blank=True, null=True, unique=True, editable=False)
+    demandee_par = models.ForeignKey(Utilisateur, on_delete=models.SET_NULL, blank=True, null=True,
+                                     related_name='detections_alertes')
+    nombre_demandes = models.PositiveIntegerField(default=1)
+    tranches = models.PositiveIntegerField(default=0)
+    tranches_terminees = models.PositiveIntegerField(default=0)
+    alertes_creees = models.PositiveIntegerField(default=0)
+    # Durée (secondes), violations et alertes créées de chaque règle, cumulées sur les tranches
+    statistiques = models.JSONField(default=dict, blank=True)
+    erreur = models.CharField(max_length=500, blank=True, null=True)
+    date_demande = models.DateTimeField(auto_now_add=True)
+    date_debut = models.DateTimeField(blank=True, null=True)
+    date_fin = models.DateTimeField(blank=True, null=True)
+    # Dernière progression : une détection active sans progression est considérée abandonnée
+    date_maj = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Détection {self.pk} - {self.statut}"
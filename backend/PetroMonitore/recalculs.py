@@ -0,0 +1,281 @@
+# PetroMonitore/recalculs.py
+"""
+File d'attente des recalculs d'agrégats (progression et coûts des phases et projets).
+
+Les demandes faites dans un bloc differer_recalculs() (chaque requête HTTP via
+RecalculsDifferesMiddleware) sont dédoublonnées puis exécutées une seule fois par
+nœud à la sortie du bloc, ou, si PETROMONITORE_DELAI_RECALCUL est positif,
+enregistrées dans RecalculEnAttente et vidées par une tâche Celery au plus tard
+après ce délai (en secondes).
+
+Les règles d'alerte (REGLES_ALERTES_PROJET et REGLES_ALERTES_OPERATION) passent
+par la même file : elles ne sont jamais évaluées dans la requête mais
+enregistrées dans EvaluationAlerteEnAttente, puis évaluées par une tâche Celery
+planifiée PETROMONITORE_DELAI_ALERTES secondes après la validation.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import (
+    EvaluationAlerteEnAttente, Phase, RecalculEnAttente, REGLES_ALERTES_OPERATION, REGLES_ALERTES_PROJET
+)
+from .utils import update_phase_costs, update_phase_progress, update_project_costs
+
+logger = logging.getLogger(__name__)
+
+# Ordre d'exécution : les coûts des phases alimentent ceux des projets
+TYPES_RECALCUL = ('PHASE_PROGRESSION', 'PHASE_COUTS', 'PROJET_COUTS')
+
+# Évaluations d'alertes : identifiants de projets ou d'opérations
+REGLES_ALERTES = REGLES_ALERTES_PROJET + REGLES_ALERTES_OPERATION
+
+# Invalidations des instantanés des tableaux de bord : identifiants de projets, de phases ou d'opérations
+INSTANTANES = ('INSTANTANES_PROJET', 'INSTANTANES_PHASE', 'INSTANTANES_OPERATION')
+
+_recalculs_differes = ContextVar('recalculs_differes', default=None)
+
+
+def demander_recalcul(type_recalcul, objet_ids):
+    """
+    Demande le recalcul d'agrégats : différé et dédoublonné dans un bloc
+    differer_recalculs(), immédiat sinon ; ou l'évaluation d'une règle
+    d'alerte, toujours confiée à la tâche Celery ; ou l'invalidation des
+    instantanés des tableaux de bord
+    
+    Args:
+        type_recalcul: L'un des TYPES_RECALCUL, des REGLES_ALERTES ou des INSTANTANES
+        objet_ids: Les identifiants des phases, projets ou opérations concernés
+    """
+    objet_ids = {objet_id for objet_id in objet_ids if objet_id is not None}
+    if not objet_ids:
+        return
+    
+    marques = _recalculs_differes.get()
+    if marques is not None:
+        marques.setdefault(type_recalcul, set()).update(objet_ids)
+    elif type_recalcul in REGLES_ALERTES:
+        planifier_evaluation_alertes({type_recalcul: objet_ids})
+    elif type_recalcul in INSTANTANES:
+        invalider_instantanes({type_recalcul: objet_ids})
+    else:
+        executer_recalculs({type_recalcul: objet_ids})
+
+
+@contextmanager
+def differer_recalculs(delai=None):
+    """
+    Regroupe les recalculs demandés dans le bloc et les vide à sa sortie
+    (les blocs imbriqués sont vidés par le bloc le plus externe)
+    
+    Args:
+        delai: Délai maximal en secondes avant le recalcul
+               (PETROMONITORE_DELAI_RECALCUL par défaut, 0 pour un recalcul immédiat)
+    """
+    if _recalculs_differes.get() is not None:
+        yield
+        return
+    
+    marques = {}
+    jeton = _recalculs_differes.set(marques)
+    try:
+        yield
+    finally:
+        _recalculs_differes.reset(jeton)
+    vider_recalculs(marques, delai)
+
+
+def vider_recalculs(marques, delai=None):
+    """
+    Exécute les recalculs marqués, ou les enregistre pour la tâche Celery si un
+    délai est configuré ; les évaluations d'alertes sont toujours enregistrées,
+    les instantanés invalidés en une requête après les recalculs
+    """
+    marques = {type_recalcul: ids for type_recalcul, ids in marques.items() if ids}
+    alertes = {regle: marques.pop(regle) for regle in REGLES_ALERTES if regle in marques}
+    instantanes = {type_recalcul: marques.pop(type_recalcul) for type_recalcul in INSTANTANES
+                   if type_recalcul in marques}
+    
+    if delai is None:
+        delai = getattr(settings, 'PETROMONITORE_DELAI_RECALCUL', 0)
+    if marques and delai <= 0:
+        # Les recalculs (coûts, progressions) demandent eux-mêmes des évaluations
+        # d'alertes : elles sont regroupées avec celles du bloc
+        suivantes = {}
+        jeton = _recalculs_differes.set(suivantes)
+        try:
+            executer_recalculs(marques)
+        finally:
+            _recalculs_differes.reset(jeton)
+        for type_recalcul, ids in [*alertes.items(), *instantanes.items()]:
+            suivantes.setdefault(type_recalcul, set()).update(ids)
+        vider_recalculs(suivantes, delai)
+        return
+    
+    if marques:
+        enregistrer_recalculs(marques)
+        transaction.on_commit(lambda: _planifier_vidage(delai))
+    if alertes:
+        planifier_evaluation_alertes(alertes)
+    if instantanes:
+        invalider_instantanes(instantanes)
+
+
+def invalider_instantanes(marques):
+    """
+    Marque comme périmés les instantanés des tableaux de bord concernés
+    (PetroMonitore.dashboard.instantanes)
+    """
+    from .dashboard.instantanes import invalider_instantanes as invalider
+    invalider(marques)
+
+
+def _planifier_vidage(delai):
+    from .tasks import vider_recalculs_en_attente
+    try:
+        vider_recalculs_en_attente.apply_async(countdown=delai)
+    except Exception as e:
+        # La tâche périodique videra la file
+        logger.error(f"Impossible de planifier le vidage des recalculs: {str(e)}")
+
+
+def planifier_evaluation_alertes(marques):
+    """
+    Enregistre des évaluations de règles d'alerte et planifie leur tâche Celery après la validation
+    """
+    _enregistrer_marques(EvaluationAlerteEnAttente, 'regle', marques)
+    transaction.on_commit(_planifier_evaluation_alertes)
+
+
+def _planifier_evaluation_alertes():
+    from .alerts.tasks import evaluer_alertes_modifiees
+    try:
+        evaluer_alertes_modifiees.apply_async(countdown=getattr(settings, 'PETROMONITORE_DELAI_ALERTES', 5))
+    except Exception as e:
+        # La tâche périodique videra la file
+        logger.error(f"Impossible de planifier l'évaluation des alertes: {str(e)}")
+
+
+def enregistrer_recalculs(marques):
+    """
+    Enregistre les marques dans RecalculEnAttente, sans doublon
+    """
+    _enregistrer_marques(RecalculEnAttente, 'type_recalcul', marques)
+
+
+def _enregistrer_marques(modele, champ, marques):
+    for valeur, objet_ids in marques.items():
+        existants = set(modele.objects.filter(
+            **{champ: valeur}, objet_id__in=list(objet_ids)
+        ).values_list('objet_id', flat=True))
+        nouveaux = [
+            modele(**{champ: valeur}, objet_id=objet_id)
+            for objet_id in sorted(set(objet_ids) - existants)
+        ]
+        try:
+            with transaction.atomic():
+                modele.objects.bulk_create(nouveaux)
+        except IntegrityError:
+            # Marque ajoutée entre-temps par une autre requête
+            for marque in nouveaux:
+                modele.objects.get_or_create(**{champ: valeur}, objet_id=marque.objet_id)
+
+
+def executer_recalculs(marques):
+    """
+    Recalcule une seule fois chaque nœud marqué, phases avant projets
+    
+    Args:
+        marques: Dictionnaire type_recalcul -> identifiants
+        
+    Returns:
+        Le nombre de nœuds recalculés
+    """
+    nombre = 0
+    
+    for phase_id in sorted(marques.get('PHASE_PROGRESSION', ())):
+        update_phase_progress(phase_id)
+        nombre += 1
+    
+    projet_ids = set(marques.get('PROJET_COUTS', ()))
+    phase_ids = sorted(marques.get('PHASE_COUTS', ()))
+    for phase_id in phase_ids:
+        update_phase_costs(phase_id, mettre_a_jour_projet=False)
+        nombre += 1
+    if phase_ids:
+        projet_ids.update(Phase.objects.filter(pk__in=phase_ids).values_list('projet_id', flat=True))
+    
+    for projet_id in sorted(projet_ids):
+        update_project_costs(projet_id)
+        nombre += 1
+    
+    # Instantanés des tableaux de bord des projets recalculés
+    demander_recalcul('INSTANTANES_PHASE', marques.get('PHASE_PROGRESSION', ()))
+    demander_recalcul('INSTANTANES_PROJET', projet_ids)
+    return nombre
+
+
+def _executer_lot(lot):
+    """
+    Retire de la file un lot de marques (pk, type_recalcul, objet_id) puis l'exécute
+    """
+    # Supprimer avant de recalculer : une modification concurrente remarque le nœud
+    RecalculEnAttente.objects.filter(pk__in=[pk for pk, _, _ in lot]).delete()
+    marques = {}
+    for _, type_recalcul, objet_id in lot:
+        marques.setdefault(type_recalcul, set()).add(objet_id)
+    return executer_recalculs(marques)
+
+
+def executer_recalculs_en_attente(taille_lot=500):
+    """
+    Vide la file RecalculEnAttente par lots ; les marques ajoutées pendant le
+    vidage sont laissées au passage suivant
+    
+    Returns:
+        Le nombre de nœuds recalculés
+    """
+    dernier_pk = RecalculEnAttente.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if dernier_pk is None:
+        return 0
+    
+    nombre = 0
+    while True:
+        lot = list(RecalculEnAttente.objects.filter(pk__lte=dernier_pk).order_by('pk')
+                   .values_list('pk', 'type_recalcul', 'objet_id')[:taille_lot])
+        if not lot:
+            return nombre
+        
+        # Évaluations d'alertes demandées par le lot enregistrées en une fois
+        with differer_recalculs(delai=0):
+            nombre += _executer_lot(lot)
+
+
+def recalculer_si_perime(phase_ids=None, projet_ids=None):
+    """
+    Exécute les recalculs encore en attente pour ces phases et projets, et
+    seulement ceux-là : sans marque, une seule requête en lecture
+    
+    Args:
+        phase_ids: Identifiants (ou sous-requête) des phases à lire
+        projet_ids: Identifiants des projets à lire
+        
+    Returns:
+        Le nombre de nœuds recalculés
+    """
+    filtre = Q(pk__in=[])
+    if phase_ids is not None:
+        filtre |= Q(type_recalcul__in=('PHASE_PROGRESSION', 'PHASE_COUTS'), objet_id__in=phase_ids)
+    if projet_ids is not None:
+        filtre |= Q(type_recalcul='PROJET_COUTS', objet_id__in=projet_ids)
+    
+    lot = list(RecalculEnAttente.objects.filter(filtre).values_list('pk', 'type_recalcul', 'objet_id'))
+    if not lot:
+        return 0
+    
+    with differer_recalculs(delai=0):
+        return _executer_lot(lot)
@@ -1,8 +1,8 @@
 from datetime import timezone
 from rest_framework import serializers
-from .models import HistoriqueModification, Projet, Phase, Operation, Utilisateur, EquipeProjet, Seuil
+from .models import HistoriqueModification, Projet, Phase, Operation, Utilisateur, EquipeProjet, Seuil, CHAMPS_SOMMES_PROGRESSION
 from django.contrib.auth.hashers import make_password
-from .utils import evaluer_statut_couleur_phase, evaluer_statut_couleur_projet
+from .utils import CHAMPS_STATUT_COULEUR
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -41,7 +41,7 @@ class ProjetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projet
         fields = ['id', 'nom', 'description', 'localisation', 'budget_initial', 
-                 'cout_actuel', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
+                 'cout_actuel', 'progression', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
                  'statut', 'responsable', 'responsable_nom', 'date_creation']
     
     def get_responsable_nom(self, obj):
@@ -114,7 +114,7 @@ class ProjetDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projet
         fields = ['id', 'nom', 'description', 'localisation', 'budget_initial', 
-                 'cout_actuel', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
+                 'cout_actuel', 'progression', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
                  'statut', 'responsable', 'responsable_details', 'seuil_alerte_cout', 
                  'seuil_alerte_delai', 'date_creation', 'phases', 'membres_equipe']
         
@@ -125,7 +125,8 @@ class OperationSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Operation
-        fields = '__all__'
+        # Les statuts couleur sont exposés par OperationStatusSerializer
+        exclude = CHAMPS_STATUT_COULEUR
         read_only_fields = ['id', 'date_creation']
 
 class OperationCreateSerializer(serializers.ModelSerializer):
@@ -147,6 +148,17 @@ class OperationUpdateSerializer(serializers.ModelSerializer):
         model = Operation
         exclude = ['id', 'phase']
 
+class OperationProgressionLotSerializer(serializers.Serializer):
+    """
+    Serializer pour un élément de mise à jour en lot de la progression et du coût des opérations
+    """
+    operation_id = serializers.IntegerField()
+    progression = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100,
+                                           required=False)
+    cout_reel = serializers.DecimalField(max_digits=15, decimal_places=2, required=False, allow_null=True)
+    date_debut_reelle = serializers.DateField(required=False, allow_null=True)
+    date_fin_reelle = serializers.DateField(required=False, allow_null=True)
+
 class PhaseSerializer(serializers.ModelSerializer):
     """
     Serializer for Phase model with operations
@@ -155,7 +167,9 @@ class PhaseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Phase
-        fields = '__all__'
+        # Les statuts couleur sont exposés par PhaseStatusSerializer, les sommes
+        # de progression sont internes à la propagation
+        exclude = CHAMPS_STATUT_COULEUR + CHAMPS_SOMMES_PROGRESSION
         read_only_fields = ['id', 'date_creation']
 
 class PhaseCreateSerializer(serializers.ModelSerializer):
@@ -327,7 +341,21 @@ class HistoriqueModificationSeuilSerializer(serializers.ModelSerializer):
         return None
 
 
-class PhaseStatusSerializer(serializers.ModelSerializer):
+class StatutCouleurMixin:
+    """
+    Lit le statut couleur depuis les colonnes persistées de l'objet
+    (statut_cout, statut_delai, statut_global), maintenues à chaque écriture
+    par mettre_a_jour_statuts_couleur : aucune évaluation de l'arbre à la lecture.
+    """
+    
+    def get_statut_couleur(self, obj):
+        """
+        Retourne le statut couleur de l'objet
+        """
+        return {champ: getattr(obj, champ) for champ in CHAMPS_STATUT_COULEUR}
+
+
+class PhaseStatusSerializer(StatutCouleurMixin, serializers.ModelSerializer):
     """
     Serializer pour les phases avec informations de statut couleur
     """
@@ -338,15 +366,9 @@ class PhaseStatusSerializer(serializers.ModelSerializer):
         fields = ['id', 'nom', 'description', 'ordre', 'date_debut_prevue', 'date_fin_prevue', 
                  'date_debut_reelle', 'date_fin_reelle', 'budget_alloue', 'cout_actuel',
                  'progression', 'statut', 'statut_couleur']
-    
-    def get_statut_couleur(self, obj):
-        """
-        Calcule le statut couleur de la phase
-        """
-        return evaluer_statut_couleur_phase(obj)
 
 
-class OperationStatusSerializer(serializers.ModelSerializer):
+class OperationStatusSerializer(StatutCouleurMixin, serializers.ModelSerializer):
     """
     Serializer pour les opérations avec informations de statut couleur
     """
@@ -357,16 +379,9 @@ class OperationStatusSerializer(serializers.ModelSerializer):
         fields = ['id', 'nom', 'description', 'type_operation', 'date_debut_prevue', 'date_fin_prevue', 
                  'date_debut_reelle', 'date_fin_reelle', 'cout_prevue', 'cout_reel',
                  'progression', 'statut', 'responsable', 'statut_couleur']
-    
-    def get_statut_couleur(self, obj):
-        """
-        Calcule le statut couleur de l'opération
-        """
-        from .utils import evaluer_statut_couleur_operation
-        return evaluer_statut_couleur_operation(obj)
 
 
-class PhaseDetailStatusSerializer(serializers.ModelSerializer):
+class PhaseDetailStatusSerializer(StatutCouleurMixin, serializers.ModelSerializer):
     """
     Serializer détaillé pour les phases avec opérations et statut couleur
     """
@@ -378,15 +393,9 @@ class PhaseDetailStatusSerializer(serializers.ModelSerializer):
         fields = ['id', 'nom', 'description', 'ordre', 'date_debut_prevue', 'date_fin_prevue', 
                  'date_debut_reelle', 'date_fin_reelle', 'budget_alloue', 'cout_actuel',
                  'progression', 'statut', 'statut_couleur', 'operations']
-    
-    def get_statut_couleur(self, obj):
-        """
-        Calcule le statut couleur de la phase
-        """
-        return evaluer_statut_couleur_phase(obj)
 
 
-class ProjetStatusSerializer(serializers.ModelSerializer):
+class ProjetStatusSerializer(StatutCouleurMixin, serializers.ModelSerializer):
     """
     Serializer pour les projets avec informations de statut couleur
     """
@@ -400,12 +409,6 @@ class ProjetStatusSerializer(serializers.ModelSerializer):
                  'cout_actuel', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
                  'statut', 'responsable', 'responsable_nom', 'progression', 'statut_couleur']
     
-    def get_statut_couleur(self, obj):
-        """
-        Calcule le statut couleur du projet
-        """
-        return evaluer_statut_couleur_projet(obj)
-    
     def get_responsable_nom(self, obj):
         if obj.responsable:
             return f"{obj.responsable.prenom} {obj.responsable.nom}"
@@ -413,13 +416,12 @@ class ProjetStatusSerializer(serializers.ModelSerializer):
     
     def get_progression(self, obj):
         """
-        Calcule la progression du projet
+        Progression du projet, persistée et maintenue par propagation
         """
-        from .utils import calculate_project_progress
-        return calculate_project_progress(obj.id)
+        return obj.progression
 
 
-class ProjetDetailStatusSerializer(serializers.ModelSerializer):
+class ProjetDetailStatusSerializer(StatutCouleurMixin, serializers.ModelSerializer):
     """
     Serializer détaillé pour les projets avec phases et statut couleur
     """
@@ -434,12 +436,6 @@ class ProjetDetailStatusSerializer(serializers.ModelSerializer):
                  'cout_actuel', 'date_debut', 'date_fin_prevue', 'date_fin_reelle', 
                  'statut', 'responsable', 'responsable_nom', 'progression', 'statut_couleur', 'phases']
     
-    def get_statut_couleur(self, obj):
-        """
-        Calcule le statut couleur du projet
-        """
-        return evaluer_statut_couleur_projet(obj)
-    
     def get_responsable_nom(self, obj):
         if obj.responsable:
             return f"{obj.responsable.prenom} {obj.responsable.nom}"
@@ -447,8 +443,7 @@ class ProjetDetailStatusSerializer(serializers.ModelSerializer):
     
     def get_progression(self, obj):
         """
-        Calcule la progression du projet
+        Progression du projet, persistée et maintenue par propagation
         """
-        from .utils import calculate_project_progress
-        return calculate_project_progress(obj.id)
+        return obj.progression
     
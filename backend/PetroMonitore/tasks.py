@@ -0,0 +1,76 @@
+# PetroMonitore/tasks.py
+from celery import shared_task
+import logging
+
+from .utils import rafraichir_statuts_couleur
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rafraichir_statuts_couleur_quotidien(complet=False):
+    """
+    Tâche quotidienne pour rafraîchir les statuts couleur persistés dépendant
+    de la date du jour (délai des opérations en cours)
+    """
+    try:
+        logger.info("Début du rafraîchissement des statuts couleur")
+        count = rafraichir_statuts_couleur(complet=complet)
+        logger.info(f"Rafraîchissement terminé: {count} statuts couleur modifiés")
+        return f"Rafraîchissement terminé: {count} statuts couleur modifiés"
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du rafraîchissement des statuts couleur: {str(e)}")
+        return f"Erreur: {str(e)}"
+
+
+@shared_task
+def vider_recalculs_en_attente():
+    """
+    Tâche pour recalculer les progressions et coûts marqués dans RecalculEnAttente
+    """
+    from .recalculs import executer_recalculs_en_attente
+    
+    try:
+        count = executer_recalculs_en_attente()
+        logger.info(f"Vidage des recalculs terminé: {count} agrégats recalculés")
+        return f"Vidage des recalculs terminé: {count} agrégats recalculés"
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du vidage des recalculs: {str(e)}")
+        return f"Erreur: {str(e)}"
+
+
+@shared_task
+def rafraichir_instantane_tableau_bord(type_instantane, objet_id=0):
+    """
+    Tâche pour régénérer un instantané périmé, demandée par sa lecture
+    (une seule demande en attente par instantané)
+    """
+    from .dashboard.instantanes import generer_instantane
+    
+    try:
+        generer_instantane(type_instantane, objet_id)
+        return f"Instantané {type_instantane} {objet_id} régénéré"
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de la régénération de l'instantané {type_instantane} {objet_id}: {str(e)}")
+        return f"Erreur: {str(e)}"
+
+
+@shared_task
+def rafraichir_instantanes_tableau_bord():
+    """
+    Tâche périodique pour régénérer les instantanés des tableaux de bord
+    (portefeuille, et projets périmés ou trop anciens)
+    """
+    from .dashboard.instantanes import rafraichir_instantanes
+    
+    try:
+        count = rafraichir_instantanes()
+        logger.info(f"Rafraîchissement des instantanés terminé: {count} instantanés régénérés")
+        return f"Rafraîchissement des instantanés terminé: {count} instantanés régénérés"
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du rafraîchissement des instantanés: {str(e)}")
+        return f"Erreur: {str(e)}"
@@ -1,11 +1,15 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
 from decimal import Decimal
 from datetime import date, timedelta
+from unittest import mock
 
+from PetroMonitore import recalculs
 from PetroMonitore.models import Projet, Phase, Operation, Utilisateur
 from PetroMonitore.serializers import (
     PhaseSerializer, 
@@ -539,6 +543,67 @@ class OperationAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+    def test_update_operations_progression_lot(self):
+        """
+        Test updating the progression and cost of several operations in one request
+        """
+        operations = [
+            Operation.objects.create(phase=self.phase, nom=f'Operation {i}', statut='EN_COURS',
+                                     cout_prevue=Decimal('100.00'), responsable=self.user)
+            for i in range(3)
+        ]
+        url = reverse('operation-progression-lot')
+        data = {'operations': [
+            {'operation_id': operations[0].id, 'progression': 100, 'cout_reel': '80.00'},
+            {'operation_id': operations[1].id, 'progression': 50, 'cout_reel': '20.00'},
+            {'operation_id': operations[2].id, 'progression': 150},
+            {'operation_id': 9999, 'progression': 10},
+        ]}
+        
+        with mock.patch.object(recalculs, 'update_phase_progress', wraps=recalculs.update_phase_progress) as progression:
+            response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['modifiees'], 2)
+        self.assertEqual([r['statut'] for r in response.data['resultats']],
+                         ['MODIFIEE', 'MODIFIEE', 'INVALIDE', 'INTROUVABLE'])
+        self.assertEqual(progression.call_count, 1)
+        
+        operations[0].refresh_from_db()
+        self.assertEqual(operations[0].progression, 100)
+        self.assertIsNotNone(operations[0].date_fin_reelle)
+        
+        # Chaque phase et chaque projet touché est recalculé
+        self.phase.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(self.phase.progression, Decimal('50.00'))
+        self.assertEqual(self.phase.cout_actuel, Decimal('100.00'))
+        self.assertEqual(self.projet.progression, Decimal('50.00'))
+        self.assertEqual(self.projet.cout_actuel, Decimal('100.00'))
+    
+    def test_update_operations_progression_lot_permissions(self):
+        """
+        Test that operations of projects the user is not responsible for are refused
+        """
+        ingenieur = Utilisateur.objects.create_user(
+            email='ingenieur@example.com', password='testpassword',
+            nom='Terrain', prenom='Ingenieur', role='INGENIEUR_TERRAIN'
+        )
+        operation = Operation.objects.create(phase=self.phase, nom='Operation', statut='EN_COURS')
+        self.client.force_authenticate(user=ingenieur)
+        
+        response = self.client.post(reverse('operation-progression-lot'),
+                                    [{'operation_id': operation.id, 'progression': 30}], format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['resultats'][0]['statut'], 'REFUSEE')
+        operation.refresh_from_db()
+        self.assertEqual(operation.progression, 0)
+        
+        response = self.client.post(reverse('operation-progression-lot'), {'operations': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class PhaseOrderingAPITest(APITestCase):
     def setUp(self):
         # Create a test user
@@ -597,6 +662,40 @@ class PhaseOrderingAPITest(APITestCase):
         self.assertEqual(phase2.ordre, 1)
         self.assertEqual(phase1.ordre, 2)
 
+    
+    def test_phase_ordering_constant_queries(self):
+        """
+        Test that reordering phases costs the same number of queries whatever their number
+        """
+        def reordonner(nombre):
+            projet = Projet.objects.create(nom=f'Projet {nombre}', statut='PLANIFIE', responsable=self.user)
+            phases = [Phase.objects.create(projet=projet, nom=f'Phase {i}', ordre=i, statut='PLANIFIE')
+                      for i in range(nombre)]
+            url = reverse('phase-ordering', kwargs={'projet_id': projet.id})
+            data = {'phases': [{'id': phase.id, 'ordre': nombre - i} for i, phase in enumerate(phases)]}
+            with CaptureQueriesContext(connection) as requetes:
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([p['id'] for p in response.data], [phase.id for phase in reversed(phases)])
+            return len(requetes)
+        
+        self.assertEqual(reordonner(2), reordonner(12))
+    
+    def test_phase_ordering_other_project(self):
+        """
+        Test that a phase of another project is rejected without any change
+        """
+        autre_projet = Projet.objects.create(nom='Autre', statut='PLANIFIE')
+        phase = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='PLANIFIE')
+        autre_phase = Phase.objects.create(projet=autre_projet, nom='Phase 2', ordre=1, statut='PLANIFIE')
+        
+        url = reverse('phase-ordering', kwargs={'projet_id': self.projet.id})
+        data = {'phases': [{'id': phase.id, 'ordre': 5}, {'id': autre_phase.id, 'ordre': 6}]}
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        phase.refresh_from_db()
+        self.assertEqual(phase.ordre, 1)
 
 class OperationOrderingAPITest(APITestCase):
     def setUp(self):
@@ -670,4 +769,33 @@ class OperationOrderingAPITest(APITestCase):
         
         # Verify new dates
         self.assertEqual(str(operation2.date_debut_prevue), str(date.today()))
-        self.assertEqual(str(operation1.date_debut_prevue), str(date.today() + timedelta(days=1)))
\ No newline at end of file
+        self.assertEqual(str(operation1.date_debut_prevue), str(date.today() + timedelta(days=1)))
+    
+    def test_operation_ordering_constant_queries(self):
+        """
+        Test that rescheduling operations costs the same number of queries whatever their number
+        """
+        def reordonner(nombre):
+            phase = Phase.objects.create(projet=self.projet, nom=f'Phase {nombre}', ordre=nombre, statut='PLANIFIE')
+            operations = [Operation.objects.create(phase=phase, nom=f'Operation {i}', statut='PLANIFIE',
+                                                   date_debut_prevue=date.today())
+                          for i in range(nombre)]
+            url = reverse('operation-ordering', kwargs={'phase_id': phase.id})
+            data = {'operations': [
+                {'id': operation.id, 'date_debut_prevue': str(date.today() + timedelta(days=nombre - i))}
+                for i, operation in enumerate(operations)
+            ]}
+            with CaptureQueriesContext(connection) as requetes:
+                response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([o['id'] for o in response.data], [operation.id for operation in reversed(operations)])
+            return len(requetes)
+        
+        self.assertEqual(reordonner(2), reordonner(12))
+        
+        # Une date invalide est refusée
+        operation = Operation.objects.filter(phase__projet=self.projet).first()
+        url = reverse('operation-ordering', kwargs={'phase_id': operation.phase_id})
+        response = self.client.post(url, {'operations': [{'id': operation.id, 'date_debut_prevue': 'demain'}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -14,7 +14,12 @@ from PetroMonitore.utils import (
     get_tokens_for_user, 
     update_project_costs, 
     update_phase_costs, 
-    calculate_project_progress
+    calculate_project_progress,
+    calculate_phase_progress,
+    calculer_progressions_phases,
+    calculer_progressions_projets,
+    annoter_progression_projets,
+    recalculer_progressions
 )
 
 class ProjetManagementTestCase(TestCase):
@@ -172,4 +177,141 @@ class ProjetManagementTestCase(TestCase):
         
         # Vérifier que la progression est correcte
         # (50 + 75) / 2
-        self.assertEqual(progress, Decimal('62.50'))
\ No newline at end of file
+        self.assertEqual(progress, Decimal('62.50'))
+
+    def test_project_progress_weighted_by_budget(self):
+        """
+        Test la moyenne pondérée par le budget quand toutes les phases ont un budget
+        """
+        phase1 = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS',
+                                      budget_alloue=Decimal('1000.00'))
+        phase2 = Phase.objects.create(projet=self.projet, nom='Phase 2', ordre=2, statut='EN_COURS',
+                                      budget_alloue=Decimal('3000.00'))
+        Phase.objects.filter(id=phase1.id).update(progression=Decimal('20.00'))
+        Phase.objects.filter(id=phase2.id).update(progression=Decimal('60.00'))
+        
+        # (20 * 1000 + 60 * 3000) / 4000
+        self.assertEqual(calculate_project_progress(self.projet.id), Decimal('50.00'))
+        
+        # Une phase sans budget : retour à la moyenne simple
+        Phase.objects.filter(id=phase2.id).update(budget_alloue=None)
+        self.assertEqual(calculate_project_progress(self.projet.id), Decimal('40.00'))
+
+    def test_phase_progress_weighted_by_budget(self):
+        """
+        Test la progression d'une phase pondérée par le coût prévu de ses opérations
+        """
+        phase = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS')
+        self.assertEqual(calculate_phase_progress(phase.id), Decimal('0'))
+        
+        Operation.objects.create(phase=phase, nom='Op 1', statut='EN_COURS',
+                                 progression=Decimal('100.00'), cout_prevue=Decimal('100.00'))
+        operation = Operation.objects.create(phase=phase, nom='Op 2', statut='EN_COURS',
+                                             progression=Decimal('0.00'), cout_prevue=Decimal('200.00'))
+        self.assertEqual(calculate_phase_progress(phase.id), Decimal('33.33'))
+        
+        # Un coût prévu nul : retour à la moyenne simple
+        Operation.objects.filter(id=operation.id).update(cout_prevue=Decimal('0.00'))
+        self.assertEqual(calculate_phase_progress(phase.id), Decimal('50.00'))
+
+    def test_phase_progress_arrondi_au_pair(self):
+        """
+        Test l'arrondi au pair d'une progression à égalité, identique en base et en Python
+        """
+        phase = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS')
+        Operation.objects.create(phase=phase, nom='Op 1', statut='EN_COURS',
+                                 progression=Decimal('10.00'), cout_prevue=Decimal('100.00'))
+        operation = Operation.objects.create(phase=phase, nom='Op 2', statut='EN_COURS',
+                                             progression=Decimal('10.01'), cout_prevue=Decimal('100.00'))
+        phase.refresh_from_db()
+        self.assertEqual(phase.progression, Decimal('10.00'))
+        self.assertEqual(calculate_phase_progress(phase.id), Decimal('10.00'))
+        
+        # Un coût prévu nul : même arrondi sur la moyenne simple
+        Operation.objects.filter(id=operation.id).update(cout_prevue=Decimal('0.00'))
+        self.assertEqual(calculate_phase_progress(phase.id), Decimal('10.00'))
+
+    def test_batch_progress_single_query(self):
+        """
+        Test le calcul en lot des progressions en une seule requête
+        """
+        autre_projet = Projet.objects.create(nom='Projet vide', statut='PLANIFIE')
+        phases = [
+            Phase.objects.create(projet=self.projet, nom=f'Phase {i}', ordre=i, statut='EN_COURS')
+            for i in range(1, 4)
+        ]
+        for phase, progression in zip(phases, ('10.00', '20.00', '60.00')):
+            Phase.objects.filter(id=phase.id).update(progression=Decimal(progression))
+        
+        with self.assertNumQueries(1):
+            progressions = calculer_progressions_projets([self.projet.id, autre_projet.id])
+        self.assertEqual(progressions, {self.projet.id: Decimal('30.00'), autre_projet.id: Decimal('0.00')})
+        
+        with self.assertNumQueries(1):
+            progressions = calculer_progressions_phases([phase.id for phase in phases])
+        self.assertEqual(set(progressions), {phase.id for phase in phases})
+        
+        with self.assertNumQueries(1):
+            projets = list(annoter_progression_projets(Projet.objects.filter(id=self.projet.id)))
+        self.assertEqual(projets[0].progression_calculee, Decimal('30.00'))
+
+    def test_progression_propagee_par_delta(self):
+        """
+        Test la propagation des progressions persistées d'une opération vers sa phase et son projet
+        """
+        phase1 = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS',
+                                      budget_alloue=Decimal('1000.00'))
+        phase2 = Phase.objects.create(projet=self.projet, nom='Phase 2', ordre=2, statut='EN_COURS',
+                                      budget_alloue=Decimal('3000.00'))
+        
+        op1 = Operation.objects.create(phase=phase1, nom='Op 1', statut='EN_COURS',
+                                       progression=Decimal('100.00'), cout_prevue=Decimal('100.00'))
+        op2 = Operation.objects.create(phase=phase1, nom='Op 2', statut='EN_COURS',
+                                       progression=Decimal('0.00'), cout_prevue=Decimal('200.00'))
+        phase1.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(phase1.progression, Decimal('33.33'))
+        # (33.33 * 1000 + 0 * 3000) / 4000
+        self.assertEqual(self.projet.progression, Decimal('8.33'))
+        
+        # Mise à jour partielle : seule la variation est propagée
+        op2.progression = Decimal('50.00')
+        op2.save(update_fields=['progression'])
+        phase1.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(phase1.progression, Decimal('66.67'))
+        self.assertEqual(self.projet.progression, Decimal('16.67'))
+        
+        # Déplacement vers une autre phase puis suppression
+        op1.phase = phase2
+        op1.save()
+        phase1.refresh_from_db()
+        phase2.refresh_from_db()
+        self.assertEqual(phase1.progression, Decimal('50.00'))
+        self.assertEqual(phase2.progression, Decimal('100.00'))
+        
+        op2.delete()
+        phase1.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(phase1.progression, Decimal('0'))
+        self.assertEqual(self.projet.progression, Decimal('75.00'))
+        
+        # Les sommes maintenues par deltas sont identiques à un recalcul complet
+        self.assertEqual(calculate_phase_progress(phase1.id), phase1.progression)
+        self.assertEqual(calculate_project_progress(self.projet.id), self.projet.progression)
+
+    def test_recalcul_complet_repare_progression(self):
+        """
+        Test la réparation des progressions après des mises à jour qui contournent la propagation
+        """
+        phase = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS')
+        operation = Operation.objects.create(phase=phase, nom='Op 1', statut='EN_COURS',
+                                             progression=Decimal('40.00'))
+        Operation.objects.filter(id=operation.id).update(progression=Decimal('90.00'))
+        self.projet.refresh_from_db()
+        self.assertEqual(self.projet.progression, Decimal('40.00'))
+        
+        self.assertEqual(recalculer_progressions([self.projet.id]), 1)
+        self.projet.refresh_from_db()
+        self.assertEqual(self.projet.progression, Decimal('90.00'))
+        self.assertEqual(ProjetSerializer(self.projet).data['progression'], '90.00')
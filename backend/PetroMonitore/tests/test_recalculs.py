@@ -0,0 +1,95 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from PetroMonitore import recalculs
+from PetroMonitore.models import Projet, Utilisateur, Phase, Operation, RecalculEnAttente
+from PetroMonitore.recalculs import (
+    demander_recalcul,
+    differer_recalculs,
+    executer_recalculs_en_attente
+)
+from PetroMonitore.utils import get_tokens_for_user
+
+
+class RecalculsDifferesTestCase(TestCase):
+    def setUp(self):
+        """
+        Configuration initiale pour les tests
+        """
+        self.admin = Utilisateur.objects.create(
+            email='admin@example.com',
+            nom='Admin',
+            prenom='Super',
+            role='TOP_MANAGEMENT',
+            statut='ACTIF',
+            mot_de_passe='testpassword123'
+        )
+        self.projet = Projet.objects.create(nom='Projet Test', statut='EN_COURS', responsable=self.admin)
+        self.phase = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS')
+        
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_tokens_for_user(self.admin)["access"]}')
+
+    def test_recalculs_regroupes_dans_un_bloc(self):
+        """
+        Test que chaque phase et chaque projet n'est recalculé qu'une fois par bloc
+        """
+        with mock.patch.object(recalculs, 'update_phase_progress', wraps=recalculs.update_phase_progress) as progression, \
+             mock.patch.object(recalculs, 'update_phase_costs', wraps=recalculs.update_phase_costs) as couts_phase, \
+             mock.patch.object(recalculs, 'update_project_costs', wraps=recalculs.update_project_costs) as couts_projet:
+            with differer_recalculs():
+                for i in range(5):
+                    Operation.objects.create(phase=self.phase, nom=f'Op {i}', statut='EN_COURS',
+                                             cout_reel=Decimal('10.00'))
+                    self.phase.save()
+                    demander_recalcul('PHASE_COUTS', [self.phase.id])
+                
+                # Rien n'est recalculé avant la sortie du bloc
+                self.assertEqual(progression.call_count, 0)
+            
+            self.assertEqual(progression.call_count, 1)
+            self.assertEqual(couts_phase.call_count, 1)
+            self.assertEqual(couts_projet.call_count, 1)
+        
+        self.projet.refresh_from_db()
+        self.assertEqual(self.projet.cout_actuel, Decimal('50.00'))
+
+    @override_settings(PETROMONITORE_DELAI_RECALCUL=30)
+    def test_recalculs_enregistres_avec_delai(self):
+        """
+        Test l'enregistrement dédoublonné des recalculs puis leur exécution par la tâche
+        """
+        with differer_recalculs():
+            demander_recalcul('PHASE_COUTS', [self.phase.id])
+        with differer_recalculs():
+            Operation.objects.create(phase=self.phase, nom='Op', statut='EN_COURS', cout_reel=Decimal('25.00'))
+            demander_recalcul('PHASE_COUTS', [self.phase.id])
+        
+        self.assertEqual(RecalculEnAttente.objects.filter(type_recalcul='PHASE_COUTS').count(), 1)
+        self.projet.refresh_from_db()
+        self.assertEqual(self.projet.cout_actuel, None)
+        
+        executer_recalculs_en_attente()
+        self.assertFalse(RecalculEnAttente.objects.exists())
+        self.projet.refresh_from_db()
+        self.assertEqual(self.projet.cout_actuel, Decimal('25.00'))
+
+    def test_requete_recalcule_en_fin_de_requete(self):
+        """
+        Test que les coûts sont à jour à la fin d'une requête de modification
+        """
+        operation = Operation.objects.create(phase=self.phase, nom='Op', statut='EN_COURS')
+        url = reverse('operation-detail', kwargs={'pk': operation.id})
+        
+        response = self.client.put(url, {'cout_reel': '40.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.phase.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(self.phase.cout_actuel, Decimal('40.00'))
+        self.assertEqual(self.projet.cout_actuel, Decimal('40.00'))
@@ -1,17 +1,23 @@
 import json
 from decimal import Decimal
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from datetime import date, timedelta
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
-from ..models import Utilisateur, Projet, Phase, Operation
+from unittest import mock
+from .. import recalculs, views
+from ..models import Utilisateur, Projet, Phase, Operation, Seuil, RecalculEnAttente
+from ..recalculs import demander_recalcul, differer_recalculs
 from ..serializers import (
     PhaseDetailStatusSerializer,
     ProjetDetailStatusSerializer,
     OperationStatusSerializer
 )
+from ..utils import evaluer_statut_couleur_operation, evaluer_statuts_couleur_arbre, rafraichir_statuts_couleur
 
 
 class PhaseStatusViewTests(APITestCase):
@@ -108,6 +114,40 @@ class PhaseStatusViewTests(APITestCase):
         # Vérifier que les opérations sont incluses
         self.assertEqual(len(response.data['operations']), 2)
     
+    def test_phase_status_lecture_seule(self):
+        """Tester que la lecture du statut n'écrit pas en base et porte un ETag"""
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ecritures = [q['sql'] for q in requetes.captured_queries
+                     if q['sql'].lstrip().upper().startswith(('UPDATE', 'INSERT', 'DELETE'))]
+        self.assertEqual(ecritures, [])
+        
+        # Une version déjà connue du client donne un 304 sans corps
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        # Une modification change l'ETag
+        self.operation1.progression = Decimal('80.00')
+        self.operation1.save()
+        response_modifiee = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response_modifiee.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response_modifiee['ETag'], response['ETag'])
+    
+    @override_settings(PETROMONITORE_DELAI_RECALCUL=60)
+    def test_phase_status_recalcule_si_perime(self):
+        """Tester le recalcul des agrégats encore en attente avant la lecture"""
+        with differer_recalculs():
+            Operation.objects.filter(pk=self.operation1.pk).update(cout_reel=Decimal('15000.00'))
+            demander_recalcul('PHASE_COUTS', [self.phase.id])
+        self.assertTrue(RecalculEnAttente.objects.exists())
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(RecalculEnAttente.objects.exists())
+        self.phase.refresh_from_db()
+        self.assertEqual(self.phase.cout_actuel, Decimal('25000.00'))
+    
     def test_phase_status_not_found(self):
         """Tester la réponse quand la phase n'existe pas"""
         url = reverse('phase-status', kwargs={'phase_id': 999})  # ID inexistant
@@ -367,6 +407,27 @@ class OperationStatusUpdateViewTests(APITestCase):
         self.projet.refresh_from_db()
         self.assertTrue(self.projet.cout_actuel > 0)
     
+    def test_update_operation_recalculs_uniques(self):
+        """Tester que la phase et le projet ne sont recalculés qu'une fois par requête"""
+        update_data = {'progression': 50.0, 'cout_reel': 10000.00}
+        
+        with mock.patch.object(recalculs, 'update_phase_progress', wraps=recalculs.update_phase_progress) as progression, \
+                mock.patch.object(recalculs, 'update_phase_costs', wraps=recalculs.update_phase_costs) as couts_phase, \
+                mock.patch.object(recalculs, 'update_project_costs', wraps=recalculs.update_project_costs) as couts_projet, \
+                mock.patch.object(views, 'update_phase_progress') as progression_directe, \
+                mock.patch.object(views, 'update_phase_costs') as couts_phase_directs, \
+                mock.patch.object(views, 'update_project_costs') as couts_projet_directs:
+            response = self.client.post(self.url, update_data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((progression.call_count, couts_phase.call_count, couts_projet.call_count), (1, 1, 1))
+        self.assertFalse(progression_directe.called or couts_phase_directs.called or couts_projet_directs.called)
+        
+        self.phase.refresh_from_db()
+        self.projet.refresh_from_db()
+        self.assertEqual(self.phase.cout_actuel, Decimal('10000.00'))
+        self.assertEqual(self.projet.cout_actuel, Decimal('10000.00'))
+    
     def test_update_operation_invalid_data(self):
         """Tester la mise à jour avec des données invalides"""
         # Données invalides (progression > 100)
@@ -670,4 +731,181 @@ class ProjetProgressUpdateViewTests(APITestCase):
         response = client.post(self.url)
         
         # Vérifier que l'accès est refusé
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StatutsCouleurArbreTests(TestCase):
+    """Tests pour l'évaluation en lot des statuts couleur"""
+    
+    def setUp(self):
+        self.user = Utilisateur.objects.create_user(
+            email='test@example.com',
+            password='password123',
+            nom='Test',
+            prenom='User',
+            role='EXPERT'
+        )
+        
+        self.projet = Projet.objects.create(
+            nom='Projet Test',
+            statut='EN_COURS',
+            responsable=self.user
+        )
+        self.projet_vide = Projet.objects.create(nom='Projet Vide', statut='PLANIFIE')
+        
+        self.phase1 = Phase.objects.create(projet=self.projet, nom='Phase 1', ordre=1, statut='EN_COURS')
+        self.phase2 = Phase.objects.create(projet=self.projet, nom='Phase 2', ordre=2, statut='EN_COURS')
+        self.phase_vide = Phase.objects.create(projet=self.projet, nom='Phase 3', ordre=3, statut='PLANIFIE')
+        
+        # Opération dans le budget
+        self.operation_verte = self._creer_operation(self.phase1, 'Op verte', Decimal('5000.00'))
+        # Opération au-dessus du seuil vert
+        self.operation_jaune = self._creer_operation(self.phase1, 'Op jaune', Decimal('9000.00'))
+        # Opération terminée en retard
+        self.operation_rouge = self._creer_operation(
+            self.phase2, 'Op rouge', Decimal('1000.00'),
+            date_debut_reelle=date.today() - timedelta(days=40),
+            date_fin_reelle=date.today() + timedelta(days=30)
+        )
+        # Opération en cours avec une progression inférieure au temps écoulé
+        self.operation_en_cours = self._creer_operation(
+            self.phase2, 'Op en cours', None,
+            date_debut_reelle=date.today() - timedelta(days=28)
+        )
+        # Opération sans seuil
+        Operation.objects.create(phase=self.phase2, nom='Op sans seuil', statut='EN_COURS',
+                                 cout_prevue=Decimal('100.00'), cout_reel=Decimal('500.00'))
+    
+    def _creer_operation(self, phase, nom, cout_reel, **dates):
+        operation = Operation.objects.create(
+            phase=phase,
+            nom=nom,
+            statut='EN_COURS',
+            date_debut_prevue=date.today() - timedelta(days=30),
+            date_fin_prevue=date.today() - timedelta(days=10),
+            cout_prevue=Decimal('10000.00'),
+            cout_reel=cout_reel,
+            progression=Decimal('20.00'),
+            **dates
+        )
+        Seuil.objects.create(
+            operation=operation,
+            valeur_verte=Decimal('60.00'),
+            valeur_jaune=Decimal('95.00'),
+            valeur_rouge=Decimal('100.00'),
+            defini_par=self.user
+        )
+        return operation
+    
+    def test_statuts_operations_identiques_a_l_evaluation_unitaire(self):
+        """Le calcul en lot doit donner le même résultat que l'évaluation unitaire"""
+        statuts = evaluer_statuts_couleur_arbre(projet_ids=[self.projet.id])
+        
+        operations = Operation.objects.filter(phase__projet=self.projet)
+        self.assertEqual(len(statuts['operations']), operations.count())
+        for operation in operations:
+            self.assertEqual(statuts['operations'][operation.id], evaluer_statut_couleur_operation(operation))
+        
+        self.assertEqual(statuts['operations'][self.operation_verte.id]['statut_global'], 'VERT')
+        self.assertEqual(statuts['operations'][self.operation_jaune.id]['statut_cout'], 'JAUNE')
+        self.assertEqual(statuts['operations'][self.operation_rouge.id]['statut_delai'], 'ROUGE')
+        self.assertEqual(statuts['operations'][self.operation_en_cours.id]['statut_delai'], 'ROUGE')
+    
+    def test_agregation_phases_et_projets(self):
+        """Les phases et projets prennent la couleur la plus grave de leurs enfants"""
+        statuts = evaluer_statuts_couleur_arbre(projet_ids=[self.projet.id, self.projet_vide.id])
+        
+        self.assertEqual(statuts['phases'][self.phase1.id], {
+            'statut_cout': 'JAUNE', 'statut_delai': 'VERT', 'statut_global': 'JAUNE'
+        })
+        self.assertEqual(statuts['phases'][self.phase2.id]['statut_global'], 'ROUGE')
+        self.assertEqual(statuts['phases'][self.phase_vide.id]['statut_global'], 'VERT')
+        self.assertEqual(statuts['projets'][self.projet.id], {
+            'statut_cout': 'JAUNE', 'statut_delai': 'ROUGE', 'statut_global': 'ROUGE'
+        })
+        self.assertEqual(statuts['projets'][self.projet_vide.id]['statut_global'], 'VERT')
+    
+    def test_nombre_de_requetes_constant(self):
+        """L'évaluation d'un arbre complet se fait en trois requêtes"""
+        with self.assertNumQueries(3):
+            evaluer_statuts_couleur_arbre(projet_ids=[self.projet.id, self.projet_vide.id])
+    
+    def test_statuts_persistes_identiques_a_l_evaluation(self):
+        """Les colonnes persistées correspondent à l'évaluation de l'arbre"""
+        statuts = evaluer_statuts_couleur_arbre(projet_ids=[self.projet.id])
+        
+        for operation in Operation.objects.filter(phase__projet=self.projet):
+            self.assertEqual(self._statut_persiste(operation), statuts['operations'][operation.id])
+        for phase in Phase.objects.filter(projet=self.projet):
+            self.assertEqual(self._statut_persiste(phase), statuts['phases'][phase.id])
+        self.assertEqual(self._statut_persiste(Projet.objects.get(pk=self.projet.id)),
+                         statuts['projets'][self.projet.id])
+    
+    def test_modification_operation_propagee_aux_ancetres(self):
+        """La modification d'une opération ne recalcule que sa branche"""
+        operation = Operation.objects.get(pk=self.operation_jaune.id)
+        operation.cout_reel = Decimal('12000.00')
+        operation.save()
+        
+        self.assertEqual(Operation.objects.get(pk=operation.id).statut_cout, 'ROUGE')
+        self.assertEqual(Phase.objects.get(pk=self.phase1.id).statut_global, 'ROUGE')
+        self.assertEqual(Projet.objects.get(pk=self.projet.id).statut_cout, 'ROUGE')
+        self.assertEqual(Phase.objects.get(pk=self.phase_vide.id).statut_global, 'VERT')
+    
+    def test_modification_seuil_propagee(self):
+        """La modification du seuil d'une opération met à jour sa couleur"""
+        seuil = Seuil.objects.get(operation=self.operation_jaune)
+        seuil.valeur_verte = Decimal('95.00')
+        seuil.save()
+        
+        self.assertEqual(Operation.objects.get(pk=self.operation_jaune.id).statut_global, 'VERT')
+        self.assertEqual(Phase.objects.get(pk=self.phase1.id).statut_global, 'VERT')
+    
+    def test_suppression_operation_recalcule_la_phase(self):
+        """La suppression d'une opération recalcule la couleur de sa phase"""
+        Operation.objects.get(pk=self.operation_jaune.id).delete()
+        
+        self.assertEqual(Phase.objects.get(pk=self.phase1.id).statut_global, 'VERT')
+    
+    def test_rafraichissement_quotidien_du_delai(self):
+        """Le rafraîchissement réévalue le délai des opérations en cours"""
+        # Simule un statut calculé un jour où l'opération n'était pas encore en retard
+        Operation.objects.filter(pk=self.operation_en_cours.id).update(statut_delai='VERT', statut_global='VERT')
+        Phase.objects.filter(pk=self.phase2.id).update(statut_delai='VERT', statut_global='VERT')
+        
+        self.assertGreater(rafraichir_statuts_couleur(), 0)
+        
+        self.assertEqual(Operation.objects.get(pk=self.operation_en_cours.id).statut_delai, 'ROUGE')
+        self.assertEqual(Phase.objects.get(pk=self.phase2.id).statut_global, 'ROUGE')
+    
+    def test_serializer_lit_les_statuts_persistes(self):
+        """Le serializer détaillé lit les colonnes persistées sans réévaluer l'arbre"""
+        projet = Projet.objects.prefetch_related('phases').get(pk=self.projet.id)
+        
+        with CaptureQueriesContext(connection) as requetes:
+            data = ProjetDetailStatusSerializer(projet).data
+        
+        tables_lues = ' '.join(requete['sql'] for requete in requetes.captured_queries)
+        self.assertNotIn(Operation._meta.db_table, tables_lues)
+        self.assertNotIn(Seuil._meta.db_table, tables_lues)
+        self.assertEqual(data['statut_couleur']['statut_global'], 'ROUGE')
+        statuts_phases = {phase['id']: phase['statut_couleur']['statut_global'] for phase in data['phases']}
+        self.assertEqual(statuts_phases[self.phase1.id], 'JAUNE')
+        self.assertEqual(statuts_phases[self.phase_vide.id], 'VERT')
+    
+    def test_liste_operations_filtree_par_statut_couleur(self):
+        """Les opérations rouges sont filtrées en base"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        
+        response = client.get(reverse('operation-status-list'), {'statut_couleur': 'ROUGE'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {operation['id'] for operation in response.data},
+            {self.operation_rouge.id, self.operation_en_cours.id}
+        )
+    
+    def _statut_persiste(self, obj):
+        return {'statut_cout': obj.statut_cout, 'statut_delai': obj.statut_delai,
+                'statut_global': obj.statut_global}
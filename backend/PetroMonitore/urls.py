@@ -8,7 +8,9 @@ from .views import (
     OperationDetailView,
     OperationListView,
     OperationOrderingView,
+    OperationProgressionLotView,
     OperationProgressionView,
+    OperationStatusListView,
     OperationStatusUpdateView,
     PhaseDetailView,
     PhaseListView,
@@ -63,6 +65,7 @@ urlpatterns = [
     path('operations/<int:pk>/', OperationDetailView.as_view(), name='operation-detail'),
     path('phases/<int:phase_id>/operations/order/', OperationOrderingView.as_view(), name='operation-ordering'),
     path('operations/<int:pk>/progression/', OperationProgressionView.as_view(), name='operation-progression'),
+    path('operations/progression/lot/', OperationProgressionLotView.as_view(), name='operation-progression-lot'),
     
     # Endpoints pour la gestion des équipes
     path('', EquipeProjetListCreate.as_view(), name='equipe-list-create'),
@@ -86,6 +89,7 @@ urlpatterns = [
     # URLs pour les opérations de statut et de progression - vues basées sur des classes
     path('phases/<int:phase_id>/status/', PhaseStatusView.as_view(), name='phase-status'),
     path('projets/<int:projet_id>/status/', ProjetStatusView.as_view(), name='projet-status'),
+    path('operations/status/', OperationStatusListView.as_view(), name='operation-status-list'),
     path('operations/<int:operation_id>/update-status/', OperationStatusUpdateView.as_view(), name='operation-update-status'),
     path('phases/<int:phase_id>/update-progress/', PhaseProgressUpdateView.as_view(), name='phase-update-progress'),
     path('projets/<int:projet_id>/update-progress/', ProjetProgressUpdateView.as_view(), name='projet-update-progress'),
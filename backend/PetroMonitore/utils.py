@@ -1,7 +1,9 @@
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Projet, Phase, Operation,Seuil
-from decimal import Decimal
-from django.db.models import Sum
+from .models import Projet, Phase, Operation,Seuil, CHAMPS_SOMMES_PROGRESSION, valeurs_contribution
+from decimal import ROUND_HALF_EVEN, Decimal
+from django.db.models import Avg, Case, Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact, GreaterThan
 from django.utils import timezone
 from django.db import transaction
 
@@ -33,9 +35,10 @@ def update_project_costs(project_id):
         return False
 
 
-def update_phase_costs(phase_id):
+def update_phase_costs(phase_id, mettre_a_jour_projet=True):
     """
     Met à jour le coût actuel d'une phase en fonction des coûts de ses opérations
+    (et celui de son projet, sauf si mettre_a_jour_projet est False)
     """
     try:
         phase = Phase.objects.get(pk=phase_id)
@@ -45,10 +48,11 @@ def update_phase_costs(phase_id):
         
         # Mise à jour du coût actuel de la phase
         phase.cout_actuel = cout_operations
-        phase.save(update_fields=['cout_actuel'])
+        phase.save(update_fields=['cout_actuel'], skip_update=True)
         
         # Mise à jour du coût du projet parent
-        update_project_costs(phase.projet.id)
+        if mettre_a_jour_projet:
+            update_project_costs(phase.projet_id)
         
         return True
     except Phase.DoesNotExist:
@@ -56,6 +60,90 @@ def update_phase_costs(phase_id):
 
 
     
+def _statut_selon_seuil(valeur, seuil):
+    """
+    Classe une valeur (pourcentage) par rapport aux bornes verte et jaune d'un seuil
+    """
+    if valeur <= seuil.valeur_verte:
+        return 'VERT'
+    elif valeur <= seuil.valeur_jaune:
+        return 'JAUNE'
+    return 'ROUGE'
+
+
+def _statut_le_plus_grave(*statuts):
+    """
+    Retourne le statut le plus critique parmi ceux fournis ('VERT' si aucun)
+    """
+    if 'ROUGE' in statuts:
+        return 'ROUGE'
+    if 'JAUNE' in statuts:
+        return 'JAUNE'
+    return 'VERT'
+
+
+def _calculer_statut_couleur_operation(operation, seuil, aujourd_hui):
+    """
+    Calcule les statuts couleur d'une opération pour un seuil déjà chargé.
+    Partagé entre l'évaluation unitaire et l'évaluation en lot.
+    """
+    # Initialiser les statuts
+    statut_cout = 'VERT'
+    statut_delai = 'VERT'
+    
+    # Évaluer le statut pour le coût
+    if operation.cout_reel is not None and operation.cout_prevue is not None and operation.cout_prevue > 0:
+        pourcentage_cout = (operation.cout_reel / operation.cout_prevue) * 100
+        statut_cout = _statut_selon_seuil(pourcentage_cout, seuil)
+    
+    # Évaluer le statut pour le délai
+    if (operation.date_debut_reelle and operation.date_fin_prevue and 
+        operation.date_fin_reelle is None):  # L'opération est en cours
+        
+        if operation.date_debut_prevue:
+            duree_totale = (operation.date_fin_prevue - operation.date_debut_prevue).days
+            
+            if duree_totale > 0:
+                duree_ecoulee = (aujourd_hui - operation.date_debut_reelle).days
+                pourcentage_temps_ecoule = (duree_ecoulee / duree_totale) * 100
+                pourcentage_progression = float(operation.progression or 0)
+                
+                # Si la progression est en retard par rapport au temps écoulé
+                ecart_progression = pourcentage_temps_ecoule - pourcentage_progression
+                statut_delai = _statut_selon_seuil(ecart_progression, seuil)
+    
+    elif operation.date_fin_reelle and operation.date_fin_prevue:  # L'opération est terminée
+        if operation.date_debut_prevue:
+            # Calculer le dépassement de délai
+            retard = (operation.date_fin_reelle - operation.date_fin_prevue).days
+            duree_prevue = (operation.date_fin_prevue - operation.date_debut_prevue).days
+            
+            if duree_prevue > 0:
+                pourcentage_retard = (retard / duree_prevue) * 100
+                statut_delai = _statut_selon_seuil(pourcentage_retard, seuil)
+    
+    return {
+        'statut_cout': statut_cout,
+        'statut_delai': statut_delai,
+        # Le statut global est le plus grave des deux
+        'statut_global': _statut_le_plus_grave(statut_cout, statut_delai)
+    }
+
+
+def _agreger_statuts_couleur(statuts):
+    """
+    Agrège une liste de statuts couleur enfants en un statut parent :
+    chaque dimension prend la couleur la plus grave de ses enfants
+    """
+    statut_cout = _statut_le_plus_grave(*(s['statut_cout'] for s in statuts))
+    statut_delai = _statut_le_plus_grave(*(s['statut_delai'] for s in statuts))
+    return {
+        'statut_cout': statut_cout,
+        'statut_delai': statut_delai,
+        'statut_global': _statut_le_plus_grave(statut_cout, statut_delai)
+    }
+
+
 def evaluer_statut_couleur_operation(operation, seuil=None):
     """
     Évalue le statut couleur (vert/jaune/rouge) d'une opération 
@@ -92,70 +180,196 @@ def evaluer_statut_couleur_operation(operation, seuil=None):
             'statut_global': 'VERT'
         }
     
-    # Initialiser les statuts
-    statut_cout = 'VERT'
-    statut_delai = 'VERT'
+    return _calculer_statut_couleur_operation(operation, seuil, timezone.now().date())
+
+
+def evaluer_statuts_couleur_arbre(projet_ids=None, phase_ids=None, operation_ids=None):
+    """
+    Évalue en lot les statuts couleur de toutes les opérations, phases et projets
+    d'une portée donnée, en un nombre fixe de requêtes (phases, opérations, seuils)
+    quel que soit le nombre d'éléments.
     
-    # Évaluer le statut pour le coût
-    if operation.cout_reel is not None and operation.cout_prevue is not None and operation.cout_prevue > 0:
-        pourcentage_cout = (operation.cout_reel / operation.cout_prevue) * 100
+    Args:
+        projet_ids: Identifiants des projets dont tout l'arbre est évalué
+        phase_ids: Identifiants des phases évaluées (avec leurs opérations)
+        operation_ids: Identifiants d'opérations évaluées isolément
         
-        if pourcentage_cout <= seuil.valeur_verte:
-            statut_cout = 'VERT'
-        elif pourcentage_cout <= seuil.valeur_jaune:
-            statut_cout = 'JAUNE'
+    Returns:
+        Un dictionnaire {'operations': {id: statut}, 'phases': {id: statut}, 'projets': {id: statut}}
+        où chaque statut a la même forme que celui de evaluer_statut_couleur_operation.
+        Les phases et projets ne sont renseignés que pour les portées qui les incluent.
+    """
+    resultat = {'operations': {}, 'phases': {}, 'projets': {}}
+    
+    if projet_ids is not None:
+        projet_ids = list(projet_ids)
+        filtre_phases = {'projet_id__in': projet_ids}
+        filtre_operations = {'phase__projet_id__in': projet_ids}
+    elif phase_ids is not None:
+        phase_ids = list(phase_ids)
+        filtre_phases = {'id__in': phase_ids}
+        filtre_operations = {'phase_id__in': phase_ids}
+    elif operation_ids is not None:
+        filtre_phases = None
+        filtre_operations = {'id__in': list(operation_ids)}
+    else:
+        return resultat
+    
+    # 1. Phases de la portée (y compris celles sans opération, qui restent vertes)
+    phases = []
+    if filtre_phases is not None:
+        phases = list(Phase.objects.filter(**filtre_phases).values_list('id', 'projet_id'))
+    
+    # 2. Opérations avec uniquement les champs nécessaires à l'évaluation
+    operations = list(Operation.objects.filter(**filtre_operations).only(
+        'id', 'phase_id', 'cout_reel', 'cout_prevue', 'progression',
+        'date_debut_prevue', 'date_fin_prevue', 'date_debut_reelle', 'date_fin_reelle'
+    ))
+    
+    # 3. Premier seuil de chaque opération (même règle que operation.seuils.first())
+    seuils = {}
+    filtre_seuils = {f'operation__{cle}': valeur for cle, valeur in filtre_operations.items()}
+    for seuil in Seuil.objects.filter(**filtre_seuils).order_by('operation_id', 'pk'):
+        seuils.setdefault(seuil.operation_id, seuil)
+    
+    vert = {'statut_cout': 'VERT', 'statut_delai': 'VERT', 'statut_global': 'VERT'}
+    aujourd_hui = timezone.now().date()
+    statuts_par_phase = {}
+    
+    for operation in operations:
+        seuil = seuils.get(operation.id)
+        if seuil is None:
+            statut = dict(vert)
         else:
-            statut_cout = 'ROUGE'
+            statut = _calculer_statut_couleur_operation(operation, seuil, aujourd_hui)
+        resultat['operations'][operation.id] = statut
+        statuts_par_phase.setdefault(operation.phase_id, []).append(statut)
     
-    # Évaluer le statut pour le délai
-    if (operation.date_debut_reelle and operation.date_fin_prevue and 
-        operation.date_fin_reelle is None):  # L'opération est en cours
-        
-        aujourd_hui = timezone.now().date()
-        duree_totale = (operation.date_fin_prevue - operation.date_debut_prevue).days
-        
-        if duree_totale > 0:
-            duree_ecoulee = (aujourd_hui - operation.date_debut_reelle).days
-            pourcentage_temps_ecoule = (duree_ecoulee / duree_totale) * 100
-            pourcentage_progression = operation.progression
-            
-            # Si la progression est en retard par rapport au temps écoulé
-            ecart_progression = pourcentage_temps_ecoule - pourcentage_progression
-            
-            if ecart_progression <= seuil.valeur_verte:
-                statut_delai = 'VERT'
-            elif ecart_progression <= seuil.valeur_jaune:
-                statut_delai = 'JAUNE'
-            else:
-                statut_delai = 'ROUGE'
+    statuts_par_projet = {}
+    for phase_id, projet_id in phases:
+        statut = _agreger_statuts_couleur(statuts_par_phase.get(phase_id, []))
+        resultat['phases'][phase_id] = statut
+        statuts_par_projet.setdefault(projet_id, []).append(statut)
     
-    elif operation.date_fin_reelle and operation.date_fin_prevue:  # L'opération est terminée
-        # Calculer le dépassement de délai
-        retard = (operation.date_fin_reelle - operation.date_fin_prevue).days
-        duree_prevue = (operation.date_fin_prevue - operation.date_debut_prevue).days
+    if projet_ids is not None:
+        for projet_id in projet_ids:
+            resultat['projets'][projet_id] = _agreger_statuts_couleur(statuts_par_projet.get(projet_id, []))
+    
+    return resultat
+
+
+CHAMPS_STATUT_COULEUR = ('statut_cout', 'statut_delai', 'statut_global')
+
+
+def _enregistrer_statuts_couleur(modele, objets, statuts):
+    """
+    Persiste les statuts couleur calculés, uniquement pour les objets dont
+    au moins une couleur a changé. Retourne la liste des objets modifiés.
+    """
+    modifies = []
+    for obj in objets:
+        statut = statuts[obj.pk]
+        if any(getattr(obj, champ) != statut[champ] for champ in CHAMPS_STATUT_COULEUR):
+            for champ in CHAMPS_STATUT_COULEUR:
+                setattr(obj, champ, statut[champ])
+            modifies.append(obj)
+    
+    if modifies:
+        modele.objects.bulk_update(modifies, CHAMPS_STATUT_COULEUR)
+    return modifies
+
+
+def _recalculer_statuts_couleur_parents(modele, parent_ids, modele_enfant, champ_parent, champs_lus=()):
+    """
+    Recalcule le statut couleur persisté de parents (phases ou projets) à partir
+    des couleurs déjà persistées de leurs enfants, sans réévaluer les opérations.
+    """
+    couleurs_enfants = {parent_id: [] for parent_id in parent_ids}
+    combinaisons = (modele_enfant.objects
+                    .filter(**{f'{champ_parent}__in': parent_ids})
+                    .order_by()
+                    .values_list(champ_parent, 'statut_cout', 'statut_delai')
+                    .distinct())
+    for parent_id, statut_cout, statut_delai in combinaisons:
+        couleurs_enfants[parent_id].append({'statut_cout': statut_cout, 'statut_delai': statut_delai})
+    
+    statuts = {parent_id: _agreger_statuts_couleur(couleurs)
+               for parent_id, couleurs in couleurs_enfants.items()}
+    parents = modele.objects.filter(pk__in=parent_ids).only('id', *champs_lus, *CHAMPS_STATUT_COULEUR)
+    return _enregistrer_statuts_couleur(modele, parents, statuts)
+
+
+def mettre_a_jour_statuts_couleur(operation_ids=None, phase_ids=None, projet_ids=None):
+    """
+    Met à jour les statuts couleur persistés de façon incrémentale : les opérations
+    données sont réévaluées, puis seuls les ancêtres dont un enfant a changé de
+    couleur sont recalculés à partir des couleurs persistées de leurs enfants.
+    
+    Args:
+        operation_ids: Opérations à réévaluer (modification d'une opération ou de son seuil)
+        phase_ids: Phases à recalculer même sans changement d'opération (suppression, déplacement)
+        projet_ids: Projets à recalculer même sans changement de phase (suppression d'une phase)
         
-        if duree_prevue > 0:
-            pourcentage_retard = (retard / duree_prevue) * 100
-            
-            if pourcentage_retard <= seuil.valeur_verte:
-                statut_delai = 'VERT'
-            elif pourcentage_retard <= seuil.valeur_jaune:
-                statut_delai = 'JAUNE'
-            else:
-                statut_delai = 'ROUGE'
-    
-    # Déterminer le statut global (le plus grave des deux)
-    statut_global = 'VERT'
-    if statut_cout == 'ROUGE' or statut_delai == 'ROUGE':
-        statut_global = 'ROUGE'
-    elif statut_cout == 'JAUNE' or statut_delai == 'JAUNE':
-        statut_global = 'JAUNE'
+    Returns:
+        Le nombre d'objets (opérations, phases, projets) dont la couleur a changé
+    """
+    phase_ids = {pk for pk in (phase_ids or []) if pk is not None}
+    projet_ids = {pk for pk in (projet_ids or []) if pk is not None}
+    nombre_modifies = 0
+    
+    operation_ids = [pk for pk in (operation_ids or []) if pk is not None]
+    if operation_ids:
+        statuts = evaluer_statuts_couleur_arbre(operation_ids=operation_ids)['operations']
+        operations = Operation.objects.filter(pk__in=list(statuts)).only('id', 'phase_id', *CHAMPS_STATUT_COULEUR)
+        modifiees = _enregistrer_statuts_couleur(Operation, operations, statuts)
+        phase_ids.update(operation.phase_id for operation in modifiees)
+        nombre_modifies += len(modifiees)
+    
+    if phase_ids:
+        modifiees = _recalculer_statuts_couleur_parents(Phase, phase_ids, Operation, 'phase_id', ('projet_id',))
+        projet_ids.update(phase.projet_id for phase in modifiees)
+        nombre_modifies += len(modifiees)
+    
+    if projet_ids:
+        nombre_modifies += len(_recalculer_statuts_couleur_parents(Projet, projet_ids, Phase, 'projet_id'))
+    
+    return nombre_modifies
+
+
+def rafraichir_statuts_couleur(complet=False, taille_lot=500):
+    """
+    Rafraîchit les statuts couleur persistés qui dépendent de la date du jour.
+    Seul le délai d'une opération en cours évolue avec le temps : par défaut,
+    seules ces opérations (et leurs ancêtres) sont réévaluées.
     
-    return {
-        'statut_cout': statut_cout,
-        'statut_delai': statut_delai,
-        'statut_global': statut_global
-    }
+    Args:
+        complet: Réévalue toutes les opérations, phases et projets (réparation)
+        taille_lot: Nombre d'opérations réévaluées par lot
+        
+    Returns:
+        Le nombre d'objets dont la couleur a changé
+    """
+    operations = Operation.objects.order_by('pk')
+    if not complet:
+        operations = operations.filter(
+            date_debut_reelle__isnull=False,
+            date_fin_reelle__isnull=True,
+            date_fin_prevue__isnull=False
+        )
+    operation_ids = list(operations.values_list('pk', flat=True))
+    
+    nombre_modifies = 0
+    for debut in range(0, len(operation_ids), taille_lot):
+        nombre_modifies += mettre_a_jour_statuts_couleur(operation_ids=operation_ids[debut:debut + taille_lot])
+    
+    if complet:
+        # Les phases et projets sans opération modifiée sont aussi recalculés
+        nombre_modifies += mettre_a_jour_statuts_couleur(
+            phase_ids=Phase.objects.values_list('pk', flat=True),
+            projet_ids=Projet.objects.values_list('pk', flat=True)
+        )
+    
+    return nombre_modifies
 
 def creer_alerte_seuil(operation, statut_precedent, statut_actuel):
     """
@@ -205,56 +419,108 @@ def creer_alerte_seuil(operation, statut_precedent, statut_actuel):
     return None
 
 
+def _expression_progression(relation, champ_budget):
+    """
+    Construit l'agrégation conditionnelle de la progression d'un parent à partir
+    de ses enfants (relation inverse) : moyenne pondérée par le budget si tous les
+    enfants ont un budget non nul et que le budget total est positif, moyenne
+    simple sinon, 0 si le parent n'a aucun enfant. La valeur n'est pas arrondie
+    en base : l'arrondi est fait par _arrondir_progression, comme en Python.
+    """
+    progression = f'{relation}__progression'
+    budget = f'{relation}__{champ_budget}'
+    avec_budget = Q(**{f'{budget}__isnull': False}) & ~Q(**{budget: 0})
+    sortie = DecimalField(max_digits=5, decimal_places=2)
+    
+    nombre_enfants = Count(f'{relation}__id')
+    nombre_avec_budget = Count(f'{relation}__id', filter=avec_budget)
+    budget_total = Sum(budget)
+    moyenne_simple = Avg(progression, output_field=sortie)
+    # Quotient calculé en flottant : certains backends (SQLite) convertissent un
+    # décimal entier en INTEGER et tronqueraient la division
+    moyenne_ponderee = ExpressionWrapper(
+        Cast(Sum(F(progression) * F(budget), output_field=DecimalField()), FloatField())
+        / Cast(budget_total, FloatField()),
+        output_field=sortie
+    )
+    
+    # Sortie sans nombre de décimales : le backend ne doit pas arrondir la valeur
+    return Case(
+        When(Exact(nombre_enfants, 0), then=Value(Decimal('0'))),
+        When(Exact(nombre_avec_budget, nombre_enfants), then=Case(
+            When(GreaterThan(budget_total, 0), then=moyenne_ponderee),
+            default=moyenne_simple,
+        )),
+        default=moyenne_simple,
+        output_field=DecimalField()
+    )
+
+
+def _arrondir_progression(progression):
+    """
+    Ramène une progression lue en base à deux décimales, en arrondissant au pair
+    comme round() sur un Decimal dans _progression_depuis_sommes (l'arrondi SQL
+    des cas à égalité s'éloigne de zéro)
+    """
+    return Decimal(str(progression or 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+
+def annoter_progression_phases(queryset, nom='progression_calculee'):
+    """
+    Annote un queryset de phases avec la progression calculée à partir de
+    leurs opérations (pondérée par cout_prevue), en une seule requête
+    """
+    return queryset.annotate(**{nom: _expression_progression('operations', 'cout_prevue')})
+
+
+def annoter_progression_projets(queryset, nom='progression_calculee'):
+    """
+    Annote un queryset de projets avec la progression calculée à partir de
+    leurs phases (pondérée par budget_alloue), en une seule requête
+    """
+    return queryset.annotate(**{nom: _expression_progression('phases', 'budget_alloue')})
+
+
+def calculer_progressions_phases(phase_ids):
+    """
+    Calcule en une requête la progression de plusieurs phases
+    
+    Args:
+        phase_ids: Les identifiants des phases
+        
+    Returns:
+        Un dictionnaire {phase_id: progression}
+    """
+    phases = annoter_progression_phases(Phase.objects.filter(pk__in=list(phase_ids)).order_by().values('pk'))
+    return {pk: _arrondir_progression(progression)
+            for pk, progression in phases.values_list('pk', 'progression_calculee')}
+
+
+def calculer_progressions_projets(projet_ids):
+    """
+    Calcule en une requête la progression de plusieurs projets
+    
+    Args:
+        projet_ids: Les identifiants des projets
+        
+    Returns:
+        Un dictionnaire {projet_id: progression}
+    """
+    projets = annoter_progression_projets(Projet.objects.filter(pk__in=list(projet_ids)).order_by().values('pk'))
+    return {pk: _arrondir_progression(progression)
+            for pk, progression in projets.values_list('pk', 'progression_calculee')}
+
+
 def calculate_project_progress(project_id):
     """
     Calcule la progression globale d'un projet basée sur la progression de ses phases
     """
-    from django.db.models import Avg
-    from decimal import Decimal
-    from .models import Projet, Phase
     import logging
     
     logger = logging.getLogger(__name__)
     
     try:
-        # 1. Get the project
-        projet = Projet.objects.get(pk=project_id)
-        
-        # 2. Get all phases
-        phases = Phase.objects.filter(projet_id=project_id)
-        
-        if not phases.exists():
-            return Decimal('0')
-        
-        # Collect phase progressions
-        phase_progresses = []
-        for phase in phases:
-            phase_progresses.append(phase.progression or Decimal('0'))
-        
-        # 3. Check phases with budget
-        phases_with_budget = phases.exclude(budget_alloue__isnull=True).exclude(budget_alloue=0)
-        
-        # 4. Try weighted average if all phases have budget
-        if phases_with_budget.count() == phases.count() and phases_with_budget.count() > 0:
-            total_budget = sum(phase.budget_alloue for phase in phases)
-            
-            if total_budget > 0:
-                weighted_sum = sum((phase.progression * phase.budget_alloue) for phase in phases)
-                progress = weighted_sum / total_budget
-                return round(progress, 2)
-        
-        # 5. Calculate direct average from our collected values
-        if phase_progresses:
-            avg_progress = sum(phase_progresses) / len(phase_progresses)
-            return round(avg_progress, 2)
-        
-        # 6. Fall back to simple average via Django ORM
-        avg_result = phases.aggregate(avg_progress=Avg('progression'))
-        progress = avg_result['avg_progress'] or Decimal('0')
-        return round(progress, 2)
-        
-    except Projet.DoesNotExist:
-        return Decimal('0')
+        return calculer_progressions_projets([project_id]).get(project_id, Decimal('0'))
     except Exception as e:
         logger.error(f"Unexpected error calculating progress: {str(e)}", exc_info=True)
         return Decimal('0')
@@ -273,74 +539,8 @@ def evaluer_statut_couleur_phase(phase):
         - statut_delai: Le statut couleur pour le délai ('VERT', 'JAUNE', 'ROUGE')
         - statut_global: Le statut couleur global (le plus grave des deux)
     """
-    from .models import Operation
-    
-    # Récupérer toutes les opérations de la phase
-    operations = phase.operations.all()
-    
-    if not operations:
-        return {
-            'statut_cout': 'VERT',
-            'statut_delai': 'VERT',
-            'statut_global': 'VERT'
-        }
-    
-    # Compter le nombre d'opérations par statut pour le coût
-    cout_rouge = 0
-    cout_jaune = 0
-    cout_vert = 0
-    
-    # Compter le nombre d'opérations par statut pour le délai
-    delai_rouge = 0
-    delai_jaune = 0
-    delai_vert = 0
-    
-    # Évaluer chaque opération
-    for operation in operations:
-        statut = evaluer_statut_couleur_operation(operation)
-        
-        # Comptage pour le coût
-        if statut['statut_cout'] == 'ROUGE':
-            cout_rouge += 1
-        elif statut['statut_cout'] == 'JAUNE':
-            cout_jaune += 1
-        else:
-            cout_vert += 1
-        
-        # Comptage pour le délai
-        if statut['statut_delai'] == 'ROUGE':
-            delai_rouge += 1
-        elif statut['statut_delai'] == 'JAUNE':
-            delai_jaune += 1
-        else:
-            delai_vert += 1
-    
-    # Déterminer le statut global pour le coût
-    statut_cout = 'VERT'
-    if cout_rouge > 0:
-        statut_cout = 'ROUGE'
-    elif cout_jaune > 0:
-        statut_cout = 'JAUNE'
-    
-    # Déterminer le statut global pour le délai
-    statut_delai = 'VERT'
-    if delai_rouge > 0:
-        statut_delai = 'ROUGE'
-    elif delai_jaune > 0:
-        statut_delai = 'JAUNE'
-    
-    # Déterminer le statut global (le plus grave des deux)
-    statut_global = 'VERT'
-    if statut_cout == 'ROUGE' or statut_delai == 'ROUGE':
-        statut_global = 'ROUGE'
-    elif statut_cout == 'JAUNE' or statut_delai == 'JAUNE':
-        statut_global = 'JAUNE'
-    
-    return {
-        'statut_cout': statut_cout,
-        'statut_delai': statut_delai,
-        'statut_global': statut_global
-    }
+    statuts = evaluer_statuts_couleur_arbre(phase_ids=[phase.id])
+    return statuts['phases'][phase.id]
 
 def evaluer_statut_couleur_projet(projet):
     """
@@ -356,72 +556,8 @@ def evaluer_statut_couleur_projet(projet):
         - statut_delai: Le statut couleur pour le délai ('VERT', 'JAUNE', 'ROUGE')
         - statut_global: Le statut couleur global (le plus grave des deux)
     """
-    # Récupérer toutes les phases du projet
-    phases = projet.phases.all()
-    
-    if not phases:
-        return {
-            'statut_cout': 'VERT',
-            'statut_delai': 'VERT',
-            'statut_global': 'VERT'
-        }
-    
-    # Compter le nombre de phases par statut pour le coût
-    cout_rouge = 0
-    cout_jaune = 0
-    cout_vert = 0
-    
-    # Compter le nombre de phases par statut pour le délai
-    delai_rouge = 0
-    delai_jaune = 0
-    delai_vert = 0
-    
-    # Évaluer chaque phase
-    for phase in phases:
-        statut = evaluer_statut_couleur_phase(phase)
-        
-        # Comptage pour le coût
-        if statut['statut_cout'] == 'ROUGE':
-            cout_rouge += 1
-        elif statut['statut_cout'] == 'JAUNE':
-            cout_jaune += 1
-        else:
-            cout_vert += 1
-        
-        # Comptage pour le délai
-        if statut['statut_delai'] == 'ROUGE':
-            delai_rouge += 1
-        elif statut['statut_delai'] == 'JAUNE':
-            delai_jaune += 1
-        else:
-            delai_vert += 1
-    
-    # Déterminer le statut global pour le coût
-    statut_cout = 'VERT'
-    if cout_rouge > 0:
-        statut_cout = 'ROUGE'
-    elif cout_jaune > 0:
-        statut_cout = 'JAUNE'
-    
-    # Déterminer le statut global pour le délai
-    statut_delai = 'VERT'
-    if delai_rouge > 0:
-        statut_delai = 'ROUGE'
-    elif delai_jaune > 0:
-        statut_delai = 'JAUNE'
-    
-    # Déterminer le statut global (le plus grave des deux)
-    statut_global = 'VERT'
-    if statut_cout == 'ROUGE' or statut_delai == 'ROUGE':
-        statut_global = 'ROUGE'
-    elif statut_cout == 'JAUNE' or statut_delai == 'JAUNE':
-        statut_global = 'JAUNE'
-    
-    return {
-        'statut_cout': statut_cout,
-        'statut_delai': statut_delai,
-        'statut_global': statut_global
-    }
+    statuts = evaluer_statuts_couleur_arbre(projet_ids=[projet.id])
+    return statuts['projets'][projet.id]
 
 
 def calculate_phase_progress(phase_id):
@@ -434,35 +570,208 @@ def calculate_phase_progress(phase_id):
     Returns:
         La progression calculée (valeur entre 0 et 100)
     """
-    from django.db.models import Avg, Count
-    from .models import Phase, Operation
+    return calculer_progressions_phases([phase_id]).get(phase_id, 0)
     
-    try:
-        phase = Phase.objects.get(pk=phase_id)
-        operations = phase.operations.all()
-        
-        if not operations.exists():
-            return 0
-        
-        # Si toutes les opérations ont un budget défini, on utilise une moyenne pondérée par budget
-        operations_with_budget = operations.exclude(cout_prevue__isnull=True).exclude(cout_prevue=0)
-        if operations_with_budget.count() == operations.count():
-            # Moyenne pondérée par le budget
-            total_budget = sum(op.cout_prevue for op in operations)
-            if total_budget > 0:
-                progress = sum((op.progression * op.cout_prevue) for op in operations) / total_budget
-                return round(progress, 2)
-        
-        # Sinon, utiliser une moyenne simple
-        progress = operations.aggregate(avg_progress=Avg('progression'))['avg_progress'] or 0
-        return round(progress, 2)
-    except Phase.DoesNotExist:
-        return 0
+
+# Pour chaque type d'enfant : modèle parent, clé vers le parent et champ budget de l'enfant
+HIERARCHIE_PROGRESSION = {
+    Operation: (Phase, 'phase_id', 'cout_prevue'),
+    Phase: (Projet, 'projet_id', 'budget_alloue'),
+}
+
+
+def _decimal(valeur, quantum='0.01'):
+    """
+    Convertit une valeur (Decimal, float, int ou chaîne) en Decimal arrondi
+    comme en base, None restant None
+    """
+    if valeur is None:
+        return None
+    return Decimal(str(valeur)).quantize(Decimal(quantum))
+
+
+def _contribution(progression, budget):
+    """
+    Contribution d'un enfant aux sommes de progression de son parent,
+    dans l'ordre de CHAMPS_SOMMES_PROGRESSION
+    """
+    progression = _decimal(progression) or Decimal('0')
+    budget = _decimal(budget)
+    return (
+        1,
+        1 if budget else 0,
+        progression,
+        progression * budget if budget is not None else Decimal('0'),
+        budget or Decimal('0'),
+    )
+
+
+def _difference(nouvelle, ancienne):
+    return tuple(n - a for n, a in zip(nouvelle, ancienne))
+
+
+def _progression_depuis_sommes(nombre_enfants, nombre_enfants_budget, somme_progression,
+                               somme_progression_ponderee, somme_budget):
+    """
+    Progression d'un parent à partir des sommes sur ses enfants : moyenne pondérée
+    par le budget si tous les enfants ont un budget non nul et que le budget total
+    est positif, moyenne simple sinon, 0 sans enfant
+    """
+    if nombre_enfants <= 0:
+        return Decimal('0')
+    if nombre_enfants_budget == nombre_enfants and somme_budget > 0:
+        return round(somme_progression_ponderee / somme_budget, 2)
+    return round(somme_progression / nombre_enfants, 2)
+
+
+def propager_delta_progression(modele, pk, delta):
+    """
+    Ajoute un delta aux sommes de progression d'un parent (phase ou projet), en
+    déduit sa nouvelle progression puis propage à son propre parent la variation
+    de sa contribution. Aucun enfant frère n'est relu.
+    
+    Args:
+        modele: Phase ou Projet
+        pk: L'identifiant du parent
+        delta: Variation des sommes, dans l'ordre de CHAMPS_SOMMES_PROGRESSION
+    """
+    if pk is None or not any(delta):
+        return
+    
+    with transaction.atomic():
+        parent = modele.objects.select_for_update().filter(pk=pk).first()
+        if parent is None:
+            return
+        
+        ancienne_progression = parent.progression
+        for champ, valeur in zip(CHAMPS_SOMMES_PROGRESSION, delta):
+            setattr(parent, champ, getattr(parent, champ) + valeur)
+        parent.progression = _progression_depuis_sommes(
+            *(getattr(parent, champ) for champ in CHAMPS_SOMMES_PROGRESSION)
+        )
+        modele.objects.filter(pk=pk).update(
+            **{champ: getattr(parent, champ) for champ in ('progression',) + CHAMPS_SOMMES_PROGRESSION}
+        )
+        
+        if modele in HIERARCHIE_PROGRESSION and parent.progression != ancienne_progression:
+            # La règle de progression du projet dépend de la progression de ses phases
+            if modele is Phase:
+                from .recalculs import demander_recalcul
+                demander_recalcul('PROGRESSION_PROJET', [parent.projet_id])
+            
+            grand_parent, cle, champ_budget = HIERARCHIE_PROGRESSION[modele]
+            budget = getattr(parent, champ_budget)
+            propager_delta_progression(grand_parent, getattr(parent, cle), _difference(
+                _contribution(parent.progression, budget),
+                _contribution(ancienne_progression, budget)
+            ))
+
+
+def _recalculer_progression_parent(modele, pk):
+    if modele is Phase:
+        update_phase_progress(pk)
+    else:
+        update_project_progress(pk)
+
+
+def propager_sauvegarde_enfant(enfant, ajout, update_fields=None):
+    """
+    Propage au parent la variation de contribution d'une opération ou d'une phase
+    qui vient d'être sauvegardée, par rapport aux valeurs chargées depuis la base
+    
+    Args:
+        enfant: L'opération ou la phase sauvegardée
+        ajout: True si l'enfant vient d'être créé
+        update_fields: Les champs sauvegardés (None pour tous)
+    """
+    modele_parent, cle, champ_budget = HIERARCHIE_PROGRESSION[type(enfant)]
+    
+    if update_fields is not None:
+        update_fields = set(update_fields)
+        if not any(champ in update_fields or champ.removesuffix('_id') in update_fields
+                   for champ in enfant.CHAMPS_CONTRIBUTION):
+            return
+    
+    actuelle = valeurs_contribution(enfant)
+    initiale = getattr(enfant, '_contribution_initiale', None)
+    
+    if actuelle is None or (not ajout and initiale is None):
+        # Valeurs en base inconnues : recalcul complet du parent
+        _recalculer_progression_parent(modele_parent, getattr(enfant, cle))
+        enfant._contribution_initiale = None
+        return
+    
+    if ajout:
+        propager_delta_progression(modele_parent, actuelle[cle],
+                                   _contribution(actuelle['progression'], actuelle[champ_budget]))
+        enfant._contribution_initiale = actuelle
+        return
+    
+    # Les champs non sauvegardés gardent leur valeur en base
+    if update_fields is not None:
+        actuelle = {
+            champ: actuelle[champ] if champ in update_fields or champ.removesuffix('_id') in update_fields
+            else initiale[champ]
+            for champ in enfant.CHAMPS_CONTRIBUTION
+        }
+    
+    contribution_initiale = _contribution(initiale['progression'], initiale[champ_budget])
+    contribution_actuelle = _contribution(actuelle['progression'], actuelle[champ_budget])
+    
+    if actuelle[cle] != initiale[cle]:
+        # Changement de parent : retrait de l'ancien, ajout au nouveau
+        propager_delta_progression(modele_parent, initiale[cle], _difference((0,) * 5, contribution_initiale))
+        propager_delta_progression(modele_parent, actuelle[cle], contribution_actuelle)
+    else:
+        propager_delta_progression(modele_parent, actuelle[cle],
+                                   _difference(contribution_actuelle, contribution_initiale))
+    enfant._contribution_initiale = actuelle
+
+
+def propager_suppression_enfant(enfant, initiale):
+    """
+    Retire du parent la contribution d'une opération ou d'une phase supprimée
+    
+    Args:
+        enfant: L'opération ou la phase supprimée
+        initiale: Ses valeurs de contribution en base (None si inconnues)
+    """
+    modele_parent, cle, champ_budget = HIERARCHIE_PROGRESSION[type(enfant)]
+    
+    if initiale is None:
+        _recalculer_progression_parent(modele_parent, getattr(enfant, cle))
+        return
     
+    propager_delta_progression(modele_parent, initiale[cle], _difference(
+        (0,) * 5, _contribution(initiale['progression'], initiale[champ_budget])
+    ))
+
+
+def _sommes_progression(enfants, champ_budget):
+    """
+    Recalcule en une requête les sommes de progression à partir de tous les enfants
+    """
+    avec_budget = Q(**{f'{champ_budget}__isnull': False}) & ~Q(**{champ_budget: 0})
+    agregats = enfants.order_by().aggregate(
+        nombre_enfants=Count('id'),
+        nombre_enfants_budget=Count('id', filter=avec_budget),
+        somme_progression=Sum('progression'),
+        somme_progression_ponderee=Sum(F('progression') * F(champ_budget), output_field=DecimalField()),
+        somme_budget=Sum(champ_budget),
+    )
+    return (
+        agregats['nombre_enfants'],
+        agregats['nombre_enfants_budget'],
+        _decimal(agregats['somme_progression'] or 0),
+        _decimal(agregats['somme_progression_ponderee'] or 0, '0.0001'),
+        _decimal(agregats['somme_budget'] or 0),
+    )
+
 
 def update_phase_progress(phase_id):
     """
     Met à jour la progression d'une phase en fonction de ses opérations
+    (recalcul complet, qui sert aussi à réparer les sommes maintenues par deltas)
     
     Args:
         phase_id: L'identifiant de la phase
@@ -475,12 +784,15 @@ def update_phase_progress(phase_id):
     try:
         phase = Phase.objects.get(pk=phase_id)
         
-        # Calculer la progression
-        progression = calculate_phase_progress(phase_id)
+        # Recalculer les sommes et la progression
+        sommes = _sommes_progression(phase.operations.all(), 'cout_prevue')
+        for champ, valeur in zip(CHAMPS_SOMMES_PROGRESSION, sommes):
+            setattr(phase, champ, valeur)
+        phase.progression = _progression_depuis_sommes(*sommes)
         
         # Mettre à jour la phase avec le flag skip_update pour éviter la récursion
-        phase.progression = progression
-        phase.save(update_fields=['progression'], skip_update=True)
+        # (la variation de progression est propagée au projet par Phase.save)
+        phase.save(update_fields=['progression', *CHAMPS_SOMMES_PROGRESSION], skip_update=True)
         
         return True
     except Phase.DoesNotExist:
@@ -490,7 +802,8 @@ def update_phase_progress(phase_id):
     
 def update_project_progress(project_id):
     """
-    Met à jour la progression d'un projet en fonction de ses phases
+    Met à jour la progression persistée d'un projet en fonction de ses phases
+    (recalcul complet, qui sert aussi à réparer les sommes maintenues par deltas)
     
     Args:
         project_id: L'identifiant du projet
@@ -498,8 +811,39 @@ def update_project_progress(project_id):
     Returns:
         True si la mise à jour a réussi, False sinon
     """
-    # Note: Comme le modèle Projet n'a pas de champ progression,
-    # cette fonction ne fait que calculer la valeur sans la persister
-    # Elle pourrait être utilisée dans des sérialiseurs ou des vues
-    progression = calculate_project_progress(project_id)
-    return progression > 0  # Retourne True si la progression a pu être calculée
\ No newline at end of file
+    try:
+        projet = Projet.objects.get(pk=project_id)
+    except Projet.DoesNotExist:
+        return False
+    
+    sommes = _sommes_progression(projet.phases.all(), 'budget_alloue')
+    for champ, valeur in zip(CHAMPS_SOMMES_PROGRESSION, sommes):
+        setattr(projet, champ, valeur)
+    projet.progression = _progression_depuis_sommes(*sommes)
+    projet.save(update_fields=['progression', *CHAMPS_SOMMES_PROGRESSION])
+    
+    return True
+
+
+def recalculer_progressions(projet_ids=None):
+    """
+    Recalcule entièrement les progressions persistées des phases puis des projets
+    (réparation ou initialisation des sommes maintenues par deltas)
+    
+    Args:
+        projet_ids: Les projets à recalculer (tous par défaut)
+        
+    Returns:
+        Le nombre de projets recalculés
+    """
+    projets = Projet.objects.order_by('pk')
+    if projet_ids is not None:
+        projets = projets.filter(pk__in=list(projet_ids))
+    projet_ids = list(projets.values_list('pk', flat=True))
+    
+    for phase_id in Phase.objects.filter(projet_id__in=projet_ids).values_list('pk', flat=True):
+        update_phase_progress(phase_id)
+    for projet_id in projet_ids:
+        update_project_progress(projet_id)
+    
+    return len(projet_ids)
@@ -5,12 +5,19 @@ from rest_framework import status, generics, permissions,viewsets, filters
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView, ListAPIView, RetrieveAPIView
 from decimal import Decimal
-from django.db.models import Avg,Sum
+from django.db.models import Sum
 from django.http import Http404  
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+import hashlib
+import json
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
 from rest_framework.parsers import MultiPartParser
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import date
 from rest_framework.decorators import action
 from django.db import transaction
 from django.shortcuts import get_object_or_404
@@ -31,12 +38,15 @@ from .serializers import (
     OperationSerializer, 
     OperationCreateSerializer, 
     OperationUpdateSerializer,
+    OperationProgressionLotSerializer,
     SeuilSerializer, 
     HistoriqueModificationSeuilSerializer,
     PhaseDetailStatusSerializer,
     ProjetDetailStatusSerializer,
+    OperationStatusSerializer,
 )
 from .permissions import IsAdminUser
+from .recalculs import demander_recalcul, recalculer_si_perime
 from .authentication import UtilisateurBackend
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
@@ -48,6 +58,7 @@ from .utils import (
     update_phase_costs,
     evaluer_statut_couleur_phase,
     evaluer_statut_couleur_projet,
+    mettre_a_jour_statuts_couleur,
     get_tokens_for_user
 )
 
@@ -191,6 +202,41 @@ class LogoutView(APIView):
             )
             
             
+def reponse_conditionnelle(request, data):
+    """
+    Réponse portant un ETag calculé sur les données sérialisées, ou 304 si le
+    client (ou un cache HTTP) possède déjà cette version
+    """
+    contenu = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    etag = quote_etag(hashlib.sha1(contenu.encode('utf-8')).hexdigest())
+    
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    # Données propres à l'utilisateur authentifié, toujours revalidées
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def filtrer_par_statut_couleur(queryset, query_params):
+    """
+    Filtre un queryset de projets, phases ou opérations sur les colonnes de statut
+    couleur persistées (indexées) : statut_couleur (global), statut_cout, statut_delai
+    """
+    filtres = {
+        'statut_couleur': 'statut_global',
+        'statut_cout': 'statut_cout',
+        'statut_delai': 'statut_delai',
+    }
+    for parametre, champ in filtres.items():
+        valeur = query_params.get(parametre, None)
+        if valeur:
+            queryset = queryset.filter(**{champ: valeur.upper()})
+    return queryset
+
+
 class ProjetListView(APIView):
     """
     Liste tous les projets ou crée un nouveau projet
@@ -223,6 +269,9 @@ class ProjetListView(APIView):
         if date_fin_avant:
             projets = projets.filter(date_fin_prevue__lte=date_fin_avant)
         
+        # Filtrage par statut couleur (VERT, JAUNE, ROUGE)
+        projets = filtrer_par_statut_couleur(projets, request.query_params)
+        
         serializer = ProjetSerializer(projets, many=True)
         return Response(serializer.data)
     
@@ -432,6 +481,7 @@ class PhaseListView(APIView):
             )
         
         phases = Phase.objects.filter(projet=projet).order_by('ordre')
+        phases = filtrer_par_statut_couleur(phases, request.query_params)
         serializer = PhaseSerializer(phases, many=True)
         return Response(serializer.data)
     
@@ -534,17 +584,9 @@ class PhaseDetailView(APIView):
     
     def update_projet_progression(self, projet):
         """
-        Calcule et met à jour la progression globale du projet
+        Demande la mise à jour du coût actuel du projet (une seule fois par requête)
         """
-        # Calcul de la progression moyenne des phases
-        phases_progression = projet.phases.aggregate(
-            avg_progression=Avg('progression'),
-            total_cout_actuel=Sum('cout_actuel') or Decimal('0.00'),
-            total_budget_alloue=Sum('budget_alloue') or Decimal('0.00')
-        )
-        
-        projet.cout_actuel = phases_progression['total_cout_actuel']
-        projet.save(update_fields=['cout_actuel'])
+        demander_recalcul('PROJET_COUTS', [projet.id])
 
 
 class PhaseOrderingView(APIView):
@@ -563,7 +605,7 @@ class PhaseOrderingView(APIView):
             return Response({'error': 'Projet non trouvé'}, status=status.HTTP_404_NOT_FOUND)
         
         # Vérification des permissions
-        if not request.user.role in ['TOP_MANAGEMENT', 'EXPERT'] and request.user != projet.responsable:
+        if not request.user.role in ['TOP_MANAGEMENT', 'EXPERT'] and request.user.id != projet.responsable_id:
             return Response(
                 {'error': 'Vous n\'avez pas la permission de réordonner les phases'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -572,19 +614,31 @@ class PhaseOrderingView(APIView):
         # Format attendu : [{'id': phase_id, 'ordre': new_ordre}, ...]
         phases_order = request.data.get('phases', [])
         
-        # Validation et mise à jour des ordres
+        # Validation du format, puis de l'appartenance au projet en mémoire
+        nouveaux_ordres = {}
         for phase_data in phases_order:
             try:
-                phase = Phase.objects.get(pk=phase_data['id'], projet=projet)
-                phase.ordre = phase_data['ordre']
-                phase.save(update_fields=['ordre'])
-            except (Phase.DoesNotExist, KeyError):
+                nouveaux_ordres[int(phase_data['id'])] = int(phase_data['ordre'])
+            except (KeyError, TypeError, ValueError):
                 return Response({
                     'error': f'Phase invalide : {phase_data}'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
+        phases = Phase.objects.only('id', 'projet_id', 'ordre').in_bulk(list(nouveaux_ordres))
+        for phase_data in phases_order:
+            phase = phases.get(int(phase_data['id']))
+            if phase is None or phase.projet_id != projet.id:
+                return Response({
+                    'error': f'Phase invalide : {phase_data}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Mise à jour des ordres en une requête (sans recalcul de progression)
+        for phase_id, ordre in nouveaux_ordres.items():
+            phases[phase_id].ordre = ordre
+        Phase.objects.bulk_update(list(phases.values()), ['ordre'])
+        
         # Récupération des phases mises à jour
-        phases = Phase.objects.filter(projet=projet).order_by('ordre')
+        phases = Phase.objects.filter(projet=projet).prefetch_related('operations').order_by('ordre')
         serializer = PhaseSerializer(phases, many=True)
         return Response(serializer.data)
 
@@ -612,6 +666,7 @@ class OperationListView(APIView):
             )
         
         operations = Operation.objects.filter(phase=phase).order_by('date_debut_prevue')
+        operations = filtrer_par_statut_couleur(operations, request.query_params)
         serializer = OperationSerializer(operations, many=True)
         return Response(serializer.data)
     
@@ -647,22 +702,10 @@ class OperationListView(APIView):
     
     def update_phase_progression(self, phase):
         """
-        Calcule et met à jour la progression globale de la phase
+        Demande la mise à jour du coût actuel de la phase et de son projet, une
+        seule fois par requête (la progression est propagée par Operation.save)
         """
-        operations = Operation.objects.filter(phase=phase)
-        
-        # Calcul de la progression moyenne des opérations
-        total_progression = operations.aggregate(
-            avg_progression=Avg('progression'),
-            total_cout_reel=Sum('cout_reel') or Decimal('0.00')
-        )
-        
-        phase.progression = total_progression['avg_progression'] or Decimal('0.00')
-        phase.cout_actuel = total_progression['total_cout_reel']
-        phase.save(update_fields=['progression', 'cout_actuel'])
-        
-        # Mise à jour de la progression du projet
-        PhaseDetailView().update_projet_progression(phase.projet)
+        demander_recalcul('PHASE_COUTS', [phase.id])
 
 
 
@@ -754,12 +797,12 @@ class OperationOrderingView(APIView):
         Réordonne les opérations d'une phase
         """
         try:
-            phase = Phase.objects.get(pk=phase_id)
+            phase = Phase.objects.select_related('projet').get(pk=phase_id)
         except Phase.DoesNotExist:
             return Response({'error': 'Phase non trouvée'}, status=status.HTTP_404_NOT_FOUND)
         
         # Vérification des permissions
-        if not request.user.role in ['TOP_MANAGEMENT', 'EXPERT'] and request.user != phase.projet.responsable:
+        if not request.user.role in ['TOP_MANAGEMENT', 'EXPERT'] and request.user.id != phase.projet.responsable_id:
             return Response(
                 {'error': 'Vous n\'avez pas la permission de réordonner les opérations'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -768,25 +811,45 @@ class OperationOrderingView(APIView):
         # Format attendu : [{'id': operation_id, 'date_debut_prevue': new_date}, ...]
         operations_order = request.data.get('operations', [])
         
-        # Validation et mise à jour des dates/ordres
+        # Validation du format, puis de l'appartenance à la phase en mémoire
+        nouvelles_dates = {}
         for operation_data in operations_order:
             try:
-                operation = Operation.objects.get(pk=operation_data['id'], phase=phase)
-                
-                # Mettre à jour la date de début si fournie
+                operation_id = int(operation_data['id'])
                 if 'date_debut_prevue' in operation_data:
-                    operation.date_debut_prevue = operation_data['date_debut_prevue']
-                
-                # Mettre à jour l'ordre si fourni
-                if 'ordre' in operation_data:
-                    operation.ordre = operation_data['ordre']
-                
-                operation.save()
-            except (Operation.DoesNotExist, KeyError):
+                    date_debut = operation_data['date_debut_prevue']
+                    if date_debut is not None and not isinstance(date_debut, date):
+                        date_debut = parse_date(date_debut)
+                        if date_debut is None:
+                            raise ValueError(operation_data['date_debut_prevue'])
+                    nouvelles_dates[operation_id] = date_debut
+                else:
+                    nouvelles_dates.setdefault(operation_id, None)
+            except (KeyError, TypeError, ValueError):
+                return Response({
+                    'error': f'Opération invalide : {operation_data}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        operations = Operation.objects.only('id', 'phase_id', 'date_debut_prevue').in_bulk(list(nouvelles_dates))
+        for operation_data in operations_order:
+            operation = operations.get(int(operation_data['id']))
+            if operation is None or operation.phase_id != phase.id:
                 return Response({
                     'error': f'Opération invalide : {operation_data}'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
+        # Mise à jour des dates en une requête, puis des statuts couleur qui en dépendent
+        modifiees = []
+        for operation_data in operations_order:
+            if 'date_debut_prevue' in operation_data:
+                operation = operations[int(operation_data['id'])]
+                operation.date_debut_prevue = nouvelles_dates[operation.id]
+                modifiees.append(operation)
+        if modifiees:
+            with transaction.atomic():
+                Operation.objects.bulk_update(modifiees, ['date_debut_prevue'])
+                mettre_a_jour_statuts_couleur(operation_ids=[operation.id for operation in modifiees])
+        
         # Récupération des opérations mises à jour
         operations = Operation.objects.filter(phase=phase).order_by('date_debut_prevue')
         serializer = OperationSerializer(operations, many=True)
@@ -844,6 +907,103 @@ class OperationProgressionView(APIView):
         
         return Response(OperationSerializer(operation).data)
     
+class OperationProgressionLotView(APIView):
+    """
+    Mise à jour en lot de la progression, du coût réel et des dates réelles d'opérations
+    """
+    permission_classes = [IsAuthenticated]
+    
+    CHAMPS_MODIFIABLES = ('progression', 'cout_reel', 'date_debut_reelle', 'date_fin_reelle')
+    
+    def post(self, request):
+        """
+        Applique une liste de mises à jour {operation_id, progression, cout_reel,
+        date_debut_reelle, date_fin_reelle} en une transaction et retourne le
+        résultat de chaque élément
+        """
+        elements = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(elements, list) or not elements:
+            return Response({'error': 'Une liste d\'opérations est requise'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        resultats = [None] * len(elements)
+        valides = {}
+        for index, element in enumerate(elements):
+            serializer = OperationProgressionLotSerializer(data=element)
+            if not serializer.is_valid():
+                resultats[index] = {'operation_id': element.get('operation_id') if isinstance(element, dict) else None,
+                                    'statut': 'INVALIDE', 'erreurs': serializer.errors}
+                continue
+            operation_id = serializer.validated_data['operation_id']
+            if operation_id in valides:
+                resultats[index] = {'operation_id': operation_id, 'statut': 'INVALIDE',
+                                    'erreurs': 'Opération présente plusieurs fois dans le lot'}
+                continue
+            valides[operation_id] = (index, serializer.validated_data)
+        
+        with transaction.atomic():
+            # Charger et verrouiller toutes les opérations, avec leur projet, en une requête :
+            # une mise à jour concurrente n'est pas écrasée par les valeurs lues
+            operations = Operation.objects.select_related('phase__projet').select_for_update(
+                of=('self',)
+            ).in_bulk(list(valides))
+            acces_total = request.user.role in ['TOP_MANAGEMENT', 'EXPERT']
+            aujourd_hui = timezone.now().date()
+            
+            modifiees = []
+            champs = set()
+            for operation_id, (index, donnees) in valides.items():
+                operation = operations.get(operation_id)
+                if operation is None:
+                    resultats[index] = {'operation_id': operation_id, 'statut': 'INTROUVABLE',
+                                        'error': 'Opération non trouvée'}
+                    continue
+                
+                # Vérification des permissions
+                if not acces_total and request.user.id != operation.phase.projet.responsable_id:
+                    resultats[index] = {'operation_id': operation_id, 'statut': 'REFUSEE',
+                                        'error': 'Vous n\'avez pas la permission de modifier cette opération'}
+                    continue
+                
+                for champ in self.CHAMPS_MODIFIABLES:
+                    if champ in donnees:
+                        setattr(operation, champ, donnees[champ])
+                        champs.add(champ)
+                
+                # Mettre à jour les dates réelles si la progression change
+                if 'progression' in donnees:
+                    if donnees['progression'] > 0 and not operation.date_debut_reelle:
+                        operation.date_debut_reelle = aujourd_hui
+                        champs.add('date_debut_reelle')
+                    if donnees['progression'] == 100 and not operation.date_fin_reelle:
+                        operation.date_fin_reelle = aujourd_hui
+                        champs.add('date_fin_reelle')
+                
+                modifiees.append(operation)
+                resultats[index] = {
+                    'operation_id': operation_id,
+                    'statut': 'MODIFIEE',
+                    **{champ: getattr(operation, champ) for champ in self.CHAMPS_MODIFIABLES}
+                }
+            
+            if modifiees and champs:
+                phase_ids = {operation.phase_id for operation in modifiees}
+                Operation.objects.bulk_update(modifiees, sorted(champs), batch_size=500)
+                
+                # Un seul recalcul par phase et par projet touchés
+                mettre_a_jour_statuts_couleur(operation_ids=[operation.id for operation in modifiees])
+                if 'progression' in champs:
+                    demander_recalcul('PHASE_PROGRESSION', phase_ids)
+                if 'cout_reel' in champs:
+                    demander_recalcul('PHASE_COUTS', phase_ids)
+                    demander_recalcul('SEUIL_OPERATION', [operation.id for operation in modifiees])
+        
+        return Response({
+            'modifiees': len(modifiees),
+            'echecs': len(elements) - len(modifiees),
+            'resultats': resultats
+        })
+
+
 class EquipeProjetListCreate(generics.ListCreateAPIView):
     """
     API endpoint pour lister tous les membres d'équipe ou en créer un nouveau.
@@ -1250,6 +1410,7 @@ class HistoriqueSeuilDetailView(RetrieveAPIView):
 class PhaseStatusView(APIView):
     """
     Vue pour récupérer les informations de statut d'une phase
+    (en lecture seule, à partir des agrégats persistés)
     """
     permission_classes = [IsAuthenticated]
     
@@ -1258,19 +1419,15 @@ class PhaseStatusView(APIView):
         Retourne les informations de statut pour une phase spécifique
         """
         try:
-            phase = Phase.objects.get(pk=phase_id)
-            
-            # Mettre à jour la progression et le coût de la phase
-            update_phase_progress(phase_id)
-            update_phase_costs(phase_id)
+            # Recalculer seulement les agrégats de la phase encore en attente
+            recalculer_si_perime(phase_ids=[phase_id])
             
-            # Récupérer la phase actualisée
             phase = Phase.objects.get(pk=phase_id)
             
             # Sérialiser les données
             serializer = PhaseDetailStatusSerializer(phase)
             
-            return Response(serializer.data)
+            return reponse_conditionnelle(request, serializer.data)
         except Phase.DoesNotExist:
             return Response(
                 {"error": f"Phase avec ID {phase_id} n'existe pas"},
@@ -1281,6 +1438,7 @@ class PhaseStatusView(APIView):
 class ProjetStatusView(APIView):
     """
     Vue pour récupérer les informations de statut d'un projet
+    (en lecture seule, à partir des agrégats persistés)
     """
     permission_classes = [IsAuthenticated]
     
@@ -1289,24 +1447,18 @@ class ProjetStatusView(APIView):
         Retourne les informations de statut pour un projet spécifique
         """
         try:
-            projet = Projet.objects.get(pk=projet_id)
-            
-            # Mettre à jour les coûts du projet
-            update_project_costs(projet_id)
-            
-            # Mettre à jour la progression pour chaque phase du projet
-            phases = projet.phases.all()
-            for phase in phases:
-                update_phase_progress(phase.id)
-                update_phase_costs(phase.id)
+            # Recalculer seulement les agrégats du projet et de ses phases encore en attente
+            recalculer_si_perime(
+                phase_ids=Phase.objects.filter(projet_id=projet_id).values('pk'),
+                projet_ids=[projet_id]
+            )
             
-            # Récupérer le projet actualisé
             projet = Projet.objects.get(pk=projet_id)
             
             # Sérialiser les données
             serializer = ProjetDetailStatusSerializer(projet)
             
-            return Response(serializer.data)
+            return reponse_conditionnelle(request, serializer.data)
         except Projet.DoesNotExist:
             return Response(
                 {"error": f"Projet avec ID {projet_id} n'existe pas"},
@@ -1314,6 +1466,33 @@ class ProjetStatusView(APIView):
             )
 
 
+class OperationStatusListView(APIView):
+    """
+    Vue pour lister les opérations selon leur statut couleur persisté
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """
+        Retourne les opérations filtrées par statut couleur (ex: ?statut_couleur=ROUGE),
+        le filtrage étant fait en base sur les colonnes indexées
+        """
+        operations = Operation.objects.select_related('phase').order_by('phase__projet_id', 'phase__ordre', 'pk')
+        
+        # Hors Top Management, seules les opérations des projets dont l'utilisateur est responsable
+        if request.user.role != 'TOP_MANAGEMENT':
+            operations = operations.filter(phase__projet__responsable=request.user)
+        
+        projet_id = request.query_params.get('projet', None)
+        if projet_id:
+            operations = operations.filter(phase__projet_id=projet_id)
+        
+        operations = filtrer_par_statut_couleur(operations, request.query_params)
+        
+        serializer = OperationStatusSerializer(operations, many=True)
+        return Response(serializer.data)
+
+
 class OperationStatusUpdateView(APIView):
     """
     Vue pour mettre à jour une opération et propager les changements
@@ -1341,14 +1520,10 @@ class OperationStatusUpdateView(APIView):
                 # Sauvegarder les modifications de l'opération
                 serializer.save()
                 
-                # Mettre à jour la phase parente
-                phase_id = operation.phase.id
-                update_phase_progress(phase_id)
-                update_phase_costs(phase_id)
-                
-                # Mettre à jour le projet parent
-                projet_id = operation.phase.projet.id
-                update_project_costs(projet_id)
+                # Progression et coûts de la phase parente, puis de son projet : recalculés
+                # une seule fois par requête, avec ceux demandés par Operation.save
+                demander_recalcul('PHASE_PROGRESSION', [operation.phase_id])
+                demander_recalcul('PHASE_COUTS', [operation.phase_id])
                 
                 # Récupérer l'opération mise à jour
                 operation = Operation.objects.get(pk=operation_id)
@@ -16,12 +16,30 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Les notifications d'alertes sont envoyées par un worker dédié :
+#   celery -A backend worker -Q notifications --concurrency=1
+app.conf.task_routes = {
+    'PetroMonitore.alerts.tasks.envoyer_notifications_alertes': {'queue': 'notifications'},
+}
+
 # Periodic tasks configuration
 app.conf.beat_schedule = {
-    # Détecter les alertes toutes les 30 minutes
+    # Réconciliation nocturne des alertes (détection complète) à 1h00
     'detecter-alertes-periodique': {
         'task': 'PetroMonitore.alerts.tasks.detecter_alertes_periodique',
-        'schedule': 30.0 * 60,  # 30 minutes
+        'schedule': crontab(hour=1, minute=0),
+    },
+    
+    # Évaluer les alertes des objets modifiés (filet de sécurité si une planification est perdue)
+    'evaluer-alertes-modifiees': {
+        'task': 'PetroMonitore.alerts.tasks.evaluer_alertes_modifiees',
+        'schedule': 60.0,
+    },
+    
+    # Vider la boîte d'envoi des notifications (filet de sécurité, et nouvelles tentatives)
+    'envoyer-notifications-alertes': {
+        'task': 'PetroMonitore.alerts.tasks.envoyer_notifications_alertes',
+        'schedule': 60.0,
     },
     
     # Envoyer un résumé quotidien à 8h00
@@ -41,6 +59,24 @@ app.conf.beat_schedule = {
         'task': 'PetroMonitore.alerts.tasks.generer_rapport_hebdomadaire',
         'schedule': crontab(hour=9, minute=0, day_of_week=1),
     },
+    
+    # Rafraîchir les statuts couleur (délai des opérations en cours) chaque jour à 0h05
+    'rafraichir-statuts-couleur': {
+        'task': 'PetroMonitore.tasks.rafraichir_statuts_couleur_quotidien',
+        'schedule': crontab(hour=0, minute=5),
+    },
+    
+    # Vider la file des recalculs d'agrégats (filet de sécurité si une planification est perdue)
+    'vider-recalculs-en-attente': {
+        'task': 'PetroMonitore.tasks.vider_recalculs_en_attente',
+        'schedule': 60.0,
+    },
+    
+    # Régénérer les instantanés des tableaux de bord toutes les 5 minutes
+    'rafraichir-instantanes-tableau-bord': {
+        'task': 'PetroMonitore.tasks.rafraichir_instantanes_tableau_bord',
+        'schedule': 300.0,
+    },
 }
 
 app.conf.timezone = 'UTC'
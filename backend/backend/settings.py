@@ -55,8 +55,62 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
+    'PetroMonitore.middleware.RecalculsDifferesMiddleware',  # Recalculs d'agrégats regroupés par requête
 ]
 
+# Délai maximal (en secondes) avant le recalcul des progressions et coûts modifiés
+# pendant une requête : 0 pour recalculer en fin de requête, sinon via Celery
+PETROMONITORE_DELAI_RECALCUL = 0
+
+# Nombre maximal d'opérations (ou de projets) par tranche de la détection
+# périodique des alertes, répartie en parallèle sur les workers Celery
+PETROMONITORE_TAILLE_TRANCHE_ALERTES = 2000
+
+# Délai (en secondes) avant l'évaluation des règles d'alerte des objets modifiés
+PETROMONITORE_DELAI_ALERTES = 5
+
+# Durée (en secondes) sans progression au-delà de laquelle une détection d'alertes
+# demandée depuis l'API est considérée abandonnée (worker arrêté) et peut être relancée
+PETROMONITORE_DETECTION_EXPIRATION = 3600
+
+# Boîte d'envoi des notifications d'alertes : taille des lots, nombre maximal de
+# tentatives et délai (en secondes) avant la première nouvelle tentative, doublé ensuite
+PETROMONITORE_NOTIFICATIONS_LOT = 200
+PETROMONITORE_NOTIFICATIONS_TENTATIVES = 5
+PETROMONITORE_NOTIFICATIONS_DELAI = 60
+
+# Durée (en secondes) du cache des destinataires des notifications par projet et par rôle.
+# Les invalidations ne sont vues par les workers Celery que si CACHES est partagé (Redis, Memcached)
+PETROMONITORE_CACHE_DESTINATAIRES = 3600
+
+# Limitation des tempêtes d'alertes, sur une fenêtre glissante (en secondes) : au-delà
+# de PETROMONITORE_INCIDENT_SEUIL alertes d'un même projet et d'un même type, ou de
+# PETROMONITORE_LIMITE_ALERTES_ENTITE alertes d'une même entité, les alertes sont
+# regroupées en un incident ; un destinataire reçoit au plus
+# PETROMONITORE_LIMITE_EMAILS_DESTINATAIRE emails par fenêtre
+PETROMONITORE_FENETRE_LIMITATION = 3600
+PETROMONITORE_INCIDENT_SEUIL = 10
+PETROMONITORE_LIMITE_ALERTES_ENTITE = 5
+PETROMONITORE_LIMITE_EMAILS_DESTINATAIRE = 10
+
+# Flux SSE des nouvelles alertes (alerts/flux/) : intervalle (en secondes) d'interrogation
+# de la base par le diffuseur de chaque processus, et nombre maximal d'alertes rattrapées
+# à la reconnexion d'un client (Last-Event-ID)
+PETROMONITORE_FLUX_INTERVALLE = 2
+PETROMONITORE_FLUX_RATTRAPAGE = 500
+
+# Rétention des alertes traitées : répertoire des archives compressées (par date)
+# écrites avant suppression, et nombre maximal d'alertes par tranche (une transaction)
+PETROMONITORE_ARCHIVES_ALERTES = BASE_DIR / 'archives' / 'alertes'
+PETROMONITORE_TAILLE_TRANCHE_RETENTION = 1000
+
+# Âge maximal (en secondes) des instantanés des tableaux de bord servis sans être
+# régénérés (paramètre max_age des vues), et rafraîchis toutes les 5 minutes par Celery
+PETROMONITORE_INSTANTANES_AGE_MAX = 900
+# Délai (en secondes) après lequel une régénération d'instantané périmé demandée
+# mais non effectuée (worker arrêté) peut être demandée à nouveau
+PETROMONITORE_INSTANTANES_DELAI_RAFRAICHISSEMENT = 60
+
 # Configuration pour l'authentification personnalisée
 AUTH_USER_MODEL = 'PetroMonitore.Utilisateur'
 AUTHENTICATION_BACKENDS = [